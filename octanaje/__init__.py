@@ -0,0 +1,91 @@
+"""
+Núcleo de predicción de octanaje, independiente de Streamlit.
+
+Uso:
+    >>> import octanaje
+    >>> resultado = octanaje.predecir(octanaje.EJEMPLO)
+    >>> resultado['clasificacion']['categoria']
+    'GASOLINA 95 OCTANOS'
+
+Los nombres públicos se importan de forma perezosa: `import octanaje` no carga
+NumPy, pandas ni sklearn. Cada submódulo se importa la primera vez que se usa
+uno de sus nombres, y el modelo se carga en la primera predicción.
+
+Presupuesto de tiempo de importación (medido con `python -X importtime`):
+    - `import octanaje`: < 5 ms (medido ~0.5 ms)
+    - `from octanaje import clasificar_gasolina`: < 5 ms (medido ~0.7 ms)
+    - `from octanaje import predecir`: < 5 ms (medido ~2 ms, con octanaje.metricas)
+    - Primera predicción: ~0.1 s con el artefacto .octgb (sólo importa NumPy);
+      ~1.9 s si hay que deserializar el pickle, casi todo importando sklearn
+
+Módulos:
+    componentes: Componentes medidos, rangos típicos y cálculo de Ox
+    clasificacion: Clasificación fiscal según el octanaje
+    modelo: Búsqueda y carga del modelo
+    entrenamiento: Reentrenamiento con datos de laboratorio (búsqueda de hiperparámetros en un pool de procesos)
+    versiones: Versiones del modelo con recarga en caliente, prueba de humo y reversión
+    sombra: Modelo candidato que puntúa en segundo plano el mismo tráfico que producción
+    motor: Evaluación vectorizada del Gradient Boosting sobre arrays NumPy
+    anticipada: Clasificación con parada anticipada cuando la categoría ya está decidida
+    artefacto: Formato .octgb del modelo (arrays + cabecera JSON, abierto con mmap)
+    cache: Caché LRU de predicciones por composición cuantizada
+    intervalos: Intervalos de predicción por muestra
+    dominio: Dominio de aplicabilidad; las muestras fuera quedan sin clasificar
+    referencias: Muestras de laboratorio más parecidas (árbol k-d sobre las 9 variables, .octref con mmap)
+    deriva: Deriva de las muestras puntuadas frente a las de entrenamiento (PSI y KS por ventanas)
+    explicaciones: Contribución exacta de cada variable a la predicción (TreeSHAP vectorizado)
+    sensibilidad: Barridos ¿y si...? y mapas de respuesta 2-D sobre una composición base
+    mezclas: Mezcla de corrientes más barata que alcanza una categoría fiscal
+    prediccion: Predicción de muestras individuales
+    lotes: Predicción por lotes de archivos CSV/Parquet (requiere pandas)
+    historico: Puntuación de archivos históricos grandes con un pool de procesos
+    ingesta: Ingesta continua de los archivos de resultados de los cromatógrafos
+    historial: Historial persistente de predicciones en SQLite (sólo inserción)
+    informes: Informes fiscales mensuales (XLSX y ZIP de CSV) en memoria constante
+    metricas: Tiempos por etapa, contadores y exportación Prometheus; perfilado opcional
+    servicio: Servicio HTTP asyncio con agrupación dinámica de peticiones
+    carga: Generador de carga para el servicio HTTP
+    rendimiento: Banco de pruebas de rendimiento con línea base
+    sesiones: Simulación de sesiones de operadores contra un servidor Streamlit real
+"""
+
+import importlib
+
+_EXPORTACIONES = {
+    'COMPONENTES': 'octanaje.componentes',
+    'EJEMPLO': 'octanaje.componentes',
+    'RANGOS_TIPICOS': 'octanaje.componentes',
+    'completar_muestra': 'octanaje.componentes',
+    'clasificar_gasolina': 'octanaje.clasificacion',
+    'clasificar_lote': 'octanaje.clasificacion',
+    'CATEGORIAS': 'octanaje.clasificacion',
+    'cargar_modelo': 'octanaje.modelo',
+    'modelo_por_defecto': 'octanaje.modelo',
+    'MotorGB': 'octanaje.motor',
+    'CACHE': 'octanaje.cache',
+    'CachePredicciones': 'octanaje.cache',
+    'predecir': 'octanaje.prediccion',
+    'predecir_matriz': 'octanaje.prediccion',
+    'predecir_intervalos': 'octanaje.intervalos',
+    'leer_archivo_lote': 'octanaje.lotes',
+    'preparar_lote': 'octanaje.lotes',
+    'predecir_lote': 'octanaje.lotes',
+    'puntuar_lote': 'octanaje.lotes',
+    'clasificar_anticipado': 'octanaje.anticipada',
+}
+
+__all__ = sorted(_EXPORTACIONES)
+
+
+def __getattr__(nombre):
+    modulo = _EXPORTACIONES.get(nombre)
+    if modulo is None:
+        raise AttributeError(f"module 'octanaje' has no attribute '{nombre}'")
+
+    valor = getattr(importlib.import_module(modulo), nombre)
+    globals()[nombre] = valor
+    return valor
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,312 @@
+"""
+Clasificación fiscal anticipada: deja de recorrer árboles cuando la
+categoría ya está decidida.
+
+Da la misma categoría y la misma zona crítica que el camino de producción
+(predecir_intervalos, el dominio del modelo y clasificar_lote o
+clasificar_gasolina con `calibrado`):
+    - Dominio: no depende de los árboles. Las filas fuera del dominio
+      quedan SIN CLASIFICAR sin recorrer ninguno
+    - Predicción: los árboles se suman en orden. Tras cada tramo de `paso`
+      árboles, la predicción final sólo puede estar en
+          [suma parcial + mínimo restante, suma parcial + máximo restante]
+      (MotorGB.cotas_restantes)
+    - Semiamplitud: escala * sqrt(soporte) * (1 + extrapolación). La
+      extrapolación sale de la propia fila, y el soporte es la media sobre
+      los árboles de 1/n_hoja, que se acota igual que la predicción
+      (MotorGB.cotas_soporte_restantes). Sin calibrar, la zona crítica es
+      la banda fija de ±TOLERANCIA (ver octanaje.intervalos)
+    - Una fila se detiene cuando todas sus predicciones posibles tienen la
+      misma categoría y ningún límite fiscal puede caer en su intervalo con
+      la mayor semiamplitud posible
+
+Las filas que pueden acabar en zona crítica se evalúan siempre completas, de
+modo que su octanaje, su intervalo y el texto de la advertencia son los
+mismos que con una predicción completa.
+
+Medido con `python -m octanaje.anticipada` (20.000 composiciones dentro de
+los rangos típicos, paso 30, 1 núcleo, modelo entregado sin calibrar):
+    - Árboles evaluados por muestra: ~68 de 200 de media; el ~52% de estas
+      composiciones (que no suman 100) está fuera del dominio y no necesita
+      ninguno, y el ~18% cae en zona crítica y necesita todos
+    - Muestras decididas antes del último árbol: ~81%
+    - Rendimiento: ~2x el de predecir_intervalos, dominio y clasificar_lote,
+      sin ninguna discrepancia de categoría, zona crítica o intervalo
+    - Con intervalos calibrados (residuos sintéticos de σ = 0.4) el
+      intervalo es más ancho que la banda: ~87 árboles por muestra
+    - Una sola muestra: con una fila el recorrido completo ya es una sola
+      operación vectorizada y cada comprobación intermedia cuesta más que
+      los árboles que ahorra
+"""
+
+from octanaje.clasificacion import CATEGORIAS, LIMITES_FISCALES, TOLERANCIA, celdas_clasificacion
+from octanaje.intervalos import NIVEL_POR_DEFECTO
+
+# Árboles evaluados entre dos comprobaciones de las cotas. Con pasos cortos
+# el coste fijo de cada comprobación supera al de los árboles que se ahorran
+PASO_POR_DEFECTO = 30
+
+# Filas evaluadas a la vez: acota la matriz de hojas (filas x árboles) que
+# se guarda para calcular el soporte exacto de las filas completas
+BLOQUE_FILAS = 4096
+
+# Margen sobre las cotas para absorber diferencias de redondeo en la suma
+MARGEN_REDONDEO = 1e-9
+
+
+def clasificar_anticipado(motor, X, paso=PASO_POR_DEFECTO, nivel=NIVEL_POR_DEFECTO):
+    """
+    Clasifica un lote evaluando sólo los árboles necesarios para cada fila.
+
+    Args:
+        motor: MotorGB
+        X: DataFrame con las columnas de `motor.variables`, o matriz en ese orden
+        paso: Árboles evaluados entre dos comprobaciones de las cotas
+        nivel: Nivel de los intervalos de predicción (ver predecir_intervalos)
+
+    Returns:
+        dict de arrays columnares, con las mismas claves que clasificar_lote y:
+            octanaje, inferior, superior: predicción e intervalo exactos, o
+                NaN si la fila se detuvo antes
+            cota_inferior, cota_superior: intervalo garantizado del octanaje
+            arboles_evaluados: número de árboles recorridos por fila
+    """
+    import numpy as np
+
+    from octanaje.clasificacion import clasificar_lote
+    from octanaje.dominio import dominio_modelo
+    from octanaje.intervalos import calibracion_modelo, escala_intervalo, extrapolacion
+
+    if hasattr(X, 'columns'):
+        X = X[motor.variables].to_numpy(dtype=np.float64)
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    escala, calibrado = escala_intervalo(calibracion_modelo(motor), nivel)
+    # Dominio y extrapolación, como en producción, sobre la matriz float64
+    fuera = dominio_modelo(motor, motor.variables).evaluar(X)[0]
+    ampliacion = 1.0 + extrapolacion(X, motor.variables)
+
+    columnas = {nombre: np.empty(len(X)) for nombre in
+                ('octanaje', 'inferior', 'superior', 'cota_inferior', 'cota_superior')}
+    columnas['arboles_evaluados'] = np.empty(len(X), dtype=np.int32)
+    for inicio in range(0, len(X), BLOQUE_FILAS):
+        bloque = slice(inicio, inicio + BLOQUE_FILAS)
+        resultado = _clasificar_bloque(motor, X[bloque], fuera[bloque], ampliacion[bloque], escala, calibrado, paso)
+        for nombre, valores in resultado.items():
+            columnas[nombre][bloque] = valores
+
+    # Las filas detenidas toman la categoría de su cota inferior, que queda
+    # fuera de toda zona crítica; sin intervalo (NaN) no hay límite dentro
+    completas = ~np.isnan(columnas['octanaje'])
+    octanajes = np.where(completas, columnas['octanaje'], columnas['cota_inferior'])
+    return {
+        **clasificar_lote(octanajes, columnas['inferior'], columnas['superior'], fuera, calibrado),
+        **columnas
+    }
+
+
+def _clasificar_bloque(motor, X, fuera, ampliacion, escala, calibrado, paso):
+    """Recorrido por tramos de árboles de un bloque de filas (ver clasificar_anticipado)."""
+    import numpy as np
+
+    n = len(X)
+    X32 = motor._matriz(X)
+    resto_minimo, resto_maximo = motor.cotas_restantes
+    con_soporte = motor.muestras is not None
+    if con_soporte:
+        inverso, referencia = motor.inverso_muestras
+        _, resto_inverso = motor.cotas_soporte_restantes
+        hojas = np.empty((n, motor.n_arboles), dtype=np.int32)
+    limites = np.array([limite['valor'] for limite in LIMITES_FISCALES])
+
+    suma = np.full(n, motor.valor_inicial)
+    suma_inverso = np.zeros(n)
+    evaluados = np.zeros(n, dtype=np.int32)
+    completas = np.zeros(n, dtype=bool)
+    # Fuera del dominio la fila no se clasifica: no hace falta ningún árbol
+    activas = np.flatnonzero(~fuera)
+
+    for inicio in range(0, motor.n_arboles, paso):
+        if len(activas) == 0:
+            break
+        fin = min(inicio + paso, motor.n_arboles)
+        X_activas = X32 if len(activas) == n else X32[activas]
+        hojas_tramo = motor.hojas(X_activas, inicio, fin)
+        contribuciones = np.empty((len(activas), fin - inicio + 1))
+        contribuciones[:, 0] = suma[activas]
+        contribuciones[:, 1:] = motor.valor.take(hojas_tramo)
+        # Suma secuencial, como predict: las filas completas dan el valor exacto
+        suma[activas] = np.cumsum(contribuciones, axis=1)[:, -1]
+        evaluados[activas] = fin
+        if con_soporte:
+            hojas[activas, inicio:fin] = hojas_tramo
+            suma_inverso[activas] += inverso.take(hojas_tramo).sum(axis=1)
+
+        if fin == motor.n_arboles:
+            completas[activas] = True
+            break
+
+        inferior = suma[activas] + resto_minimo[fin] - MARGEN_REDONDEO
+        superior = suma[activas] + resto_maximo[fin] + MARGEN_REDONDEO
+        if not calibrado:
+            semiamplitud = TOLERANCIA
+        elif con_soporte:
+            soporte = (suma_inverso[activas] + resto_inverso[fin]) / motor.n_arboles / referencia
+            semiamplitud = escala * np.sqrt(soporte) * ampliacion[activas] * (1 + MARGEN_REDONDEO)
+        else:
+            semiamplitud = escala * ampliacion[activas] * (1 + MARGEN_REDONDEO)
+        semiamplitud = semiamplitud + MARGEN_REDONDEO
+        # Ningún límite puede quedar a la semiamplitud máxima de ninguna predicción posible
+        sin_limite = np.all((inferior - semiamplitud > limites[:, None])
+                            | (superior + semiamplitud < limites[:, None]), axis=0)
+        decidida = (celdas_clasificacion(inferior)[0] == celdas_clasificacion(superior)[0]) & sin_limite
+
+        activas = activas[~decidida]
+
+    cota_inferior = suma + resto_minimo[evaluados] - MARGEN_REDONDEO
+    cota_superior = suma + resto_maximo[evaluados] + MARGEN_REDONDEO
+    cota_inferior[completas] = cota_superior[completas] = suma[completas]
+
+    # Intervalo de las filas completas con las mismas operaciones que predecir_intervalos
+    octanaje = np.full(n, np.nan)
+    intervalo_inferior = np.full(n, np.nan)
+    intervalo_superior = np.full(n, np.nan)
+    octanaje[completas] = suma[completas]
+    if con_soporte:
+        soporte = inverso.take(hojas[completas]).mean(axis=1) / referencia
+    else:
+        soporte = 1.0
+    semiamplitud = escala * (np.sqrt(soporte) * ampliacion[completas])
+    intervalo_inferior[completas] = suma[completas] - semiamplitud
+    intervalo_superior[completas] = suma[completas] + semiamplitud
+
+    return {
+        'octanaje': octanaje,
+        'inferior': intervalo_inferior,
+        'superior': intervalo_superior,
+        'cota_inferior': cota_inferior,
+        'cota_superior': cota_superior,
+        'arboles_evaluados': evaluados
+    }
+
+
+def clasificar_muestra_anticipada(datos, motor=None, paso=PASO_POR_DEFECTO):
+    """
+    Clasifica una muestra con parada anticipada.
+
+    Args:
+        datos: dict con los 8 componentes medidos (%v/v); Ox se calcula
+        motor: MotorGB (por defecto, el modelo del proceso)
+        paso: Árboles evaluados entre dos comprobaciones de las cotas
+
+    Returns:
+        dict igual al de clasificar_gasolina sobre la predicción completa
+        (salvo 'intervalo', None si la evaluación se detuvo antes), más
+        'arboles_evaluados' y 'octanaje' (None si se detuvo antes)
+    """
+    from octanaje.clasificacion import CAMPOS_CLASIFICACION, clasificar_gasolina
+    from octanaje.componentes import completar_muestra
+    from octanaje.dominio import comprobar_dominio
+    from octanaje.intervalos import intervalo_calibrado, predecir_intervalos
+    from octanaje.modelo import modelo_por_defecto
+
+    if motor is None:
+        motor, _ = modelo_por_defecto()
+
+    muestra = completar_muestra(datos)
+    fila = [[muestra[v] for v in motor.variables]]
+    resultado = clasificar_anticipado(motor, fila, paso)
+    arboles = int(resultado['arboles_evaluados'][0])
+
+    if resultado['fuera_dominio'][0]:
+        # La advertencia lleva el octanaje y el motivo: se predice completa
+        prediccion, inferior, superior = predecir_intervalos(motor, motor.variables, fila)
+        _, motivos = comprobar_dominio(motor, motor.variables, fila)
+        octanaje = float(prediccion[0])
+        clasificacion = clasificar_gasolina(octanaje, (inferior[0], superior[0]), motivos[0],
+                                            intervalo_calibrado(motor))
+        arboles = motor.n_arboles
+    elif arboles == motor.n_arboles:
+        octanaje = float(resultado['octanaje'][0])
+        clasificacion = clasificar_gasolina(octanaje, (resultado['inferior'][0], resultado['superior'][0]),
+                                            calibrado=intervalo_calibrado(motor))
+    else:
+        octanaje = None
+        categoria = CATEGORIAS[resultado['indice_categoria'][0]]
+        clasificacion = {campo: categoria[campo] for campo in CAMPOS_CLASIFICACION}
+        clasificacion['advertencia'] = None
+        clasificacion['limite_critico'] = None
+        clasificacion['intervalo'] = None
+        clasificacion['fuera_dominio'] = None
+
+    clasificacion['octanaje'] = octanaje
+    clasificacion['arboles_evaluados'] = arboles
+    return clasificacion
+
+
+def medir(n=20_000, paso=PASO_POR_DEFECTO, semilla=0):
+    """
+    Compara la clasificación anticipada con el camino de producción.
+
+    Usa composiciones aleatorias dentro de los rangos típicos de entrenamiento,
+    redondeadas a 0.1 como las introduce el laboratorio.
+
+    Returns:
+        dict con árboles medios por muestra, fracción decidida antes del
+        final, tiempos de ambos métodos y número de discrepancias
+    """
+    import time
+
+    import numpy as np
+
+    from octanaje.clasificacion import clasificar_lote
+    from octanaje.componentes import COMPONENTES, RANGOS_TIPICOS
+    from octanaje.dominio import dominio_modelo
+    from octanaje.intervalos import intervalo_calibrado, predecir_intervalos
+    from octanaje.modelo import modelo_por_defecto
+
+    motor, variables = modelo_por_defecto()
+    rng = np.random.default_rng(semilla)
+    columnas = {c: rng.uniform(*RANGOS_TIPICOS[c], n).round(1) for c in COMPONENTES}
+    columnas['Ox'] = columnas['ETANOL'] + columnas['MTBE'] + columnas['ETBE']
+    X = np.column_stack([columnas[v] for v in variables])
+
+    inicio = time.perf_counter()
+    prediccion, inferior, superior = predecir_intervalos(motor, variables, X)
+    fuera = dominio_modelo(motor, variables).evaluar(X)[0]
+    completo = clasificar_lote(prediccion, inferior, superior, fuera, intervalo_calibrado(motor))
+    tiempo_completo = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    anticipado = clasificar_anticipado(motor, X, paso)
+    tiempo_anticipado = time.perf_counter() - inicio
+
+    discrepancias = int(np.sum(
+        (completo['indice_categoria'] != anticipado['indice_categoria'])
+        | (completo['en_zona_critica'] != anticipado['en_zona_critica'])
+    ))
+    return {
+        'muestras': n,
+        'arboles_medios': float(anticipado['arboles_evaluados'].mean()),
+        'fraccion_anticipada': float(np.mean(anticipado['arboles_evaluados'] < motor.n_arboles)),
+        'tiempo_completo_s': tiempo_completo,
+        'tiempo_anticipado_s': tiempo_anticipado,
+        'discrepancias': discrepancias
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mide la clasificación anticipada")
+    parser.add_argument('--muestras', type=int, default=20_000)
+    parser.add_argument('--paso', type=int, default=PASO_POR_DEFECTO)
+    argumentos = parser.parse_args()
+
+    r = medir(argumentos.muestras, argumentos.paso)
+    print(f"Árboles evaluados por muestra: {r['arboles_medios']:.1f}")
+    print(f"Muestras decididas antes del final: {r['fraccion_anticipada']:.1%}")
+    print(f"Completo: {r['tiempo_completo_s']:.3f} s | Anticipado: {r['tiempo_anticipado_s']:.3f} s "
+          f"({r['tiempo_completo_s'] / r['tiempo_anticipado_s']:.2f}x)")
+    print(f"Discrepancias de categoría o zona crítica: {r['discrepancias']}")
@@ -0,0 +1,191 @@
+"""
+Caché de predicciones por composición cuantizada.
+
+Los componentes se introducen y se miden con una resolución de 0.1 %v/v, así
+que las mismas composiciones (la mezcla de ejemplo, muestras de control
+repetidas) se predicen una y otra vez. La caché es compartida por todo el
+proceso, tiene capacidad limitada con desalojo LRU y se vacía sola cuando
+cambia el modelo cargado.
+
+Sólo se cachean composiciones que caen exactamente en la rejilla de
+resolución; el resto se predice siempre, de modo que la caché nunca cambia
+el resultado.
+"""
+
+import math
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from octanaje.componentes import COMPONENTES
+
+# Variable de entorno con la capacidad de la caché compartida (0 = desactivada)
+VARIABLE_ENTORNO_CAPACIDAD = 'OCTANAJE_CACHE_CAPACIDAD'
+
+CAPACIDAD_POR_DEFECTO = 10_000
+
+# Resolución de los instrumentos y del formulario (%v/v)
+RESOLUCION = 0.1
+
+# Caracteres de la firma que identifican una versión del modelo
+LONGITUD_VERSION = 12
+
+_VERSIONES = weakref.WeakKeyDictionary()
+
+
+def firma_modelo(modelo):
+    """
+    Identificador del contenido de un modelo cargado.
+
+    Args:
+        modelo: MotorGB (usa su atributo `firma`) o modelo sklearn
+
+    Returns:
+        str que cambia cuando cambia el modelo
+    """
+    firma = getattr(modelo, 'firma', None)
+    if firma is not None:
+        return firma
+
+    import hashlib
+    import pickle
+    return hashlib.sha256(pickle.dumps(modelo)).hexdigest()
+
+
+def version_modelo(modelo):
+    """
+    Identificador corto de la versión de un modelo cargado (octanaje.versiones).
+
+    Args:
+        modelo: MotorGB o modelo sklearn
+
+    Returns:
+        Los LONGITUD_VERSION primeros caracteres de firma_modelo. La firma de
+        un modelo sklearn se calcula una sola vez por objeto.
+    """
+    firma = getattr(modelo, 'firma', None)
+    if firma is not None:
+        return firma[:LONGITUD_VERSION]
+    version = _VERSIONES.get(modelo)
+    if version is None:
+        version = _VERSIONES[modelo] = firma_modelo(modelo)[:LONGITUD_VERSION]
+    return version
+
+
+class CachePredicciones:
+    """
+    Caché LRU de (octanaje, clasificación) indexada por composición cuantizada.
+
+    Es segura entre hilos (las sesiones de Streamlit y el servicio HTTP la
+    comparten). Los contadores `aciertos`, `fallos`, `desalojos` e
+    `invalidaciones` se exponen con `estadisticas()`.
+    """
+
+    def __init__(self, capacidad=CAPACIDAD_POR_DEFECTO, resolucion=RESOLUCION):
+        self.capacidad = int(capacidad)
+        self.resolucion = resolucion
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.invalidaciones = 0
+        self._entradas = OrderedDict()
+        self._bloqueo = threading.Lock()
+        self._modelo = None
+        self._firma = None
+
+    def clave(self, muestra):
+        """
+        Cuantiza una composición a la resolución de la caché.
+
+        Args:
+            muestra: dict con los 8 componentes medidos
+
+        Returns:
+            Tupla de enteros, o None si algún valor no cae en la rejilla o
+            no es finito (NaN, inf: la muestra se predice sin caché)
+        """
+        if self.capacidad <= 0:
+            return None
+
+        clave = []
+        for componente in COMPONENTES:
+            if not math.isfinite(muestra[componente]):
+                return None
+            escalado = muestra[componente] / self.resolucion
+            entero = round(escalado)
+            if abs(escalado - entero) > 1e-6:
+                return None
+            clave.append(entero)
+        return tuple(clave)
+
+    def _comprobar_modelo(self, modelo):
+        """Vacía la caché si el modelo no es el de las entradas guardadas."""
+        if modelo is self._modelo:
+            return
+        firma = firma_modelo(modelo)
+        if self._firma is not None and firma != self._firma:
+            self.invalidaciones += 1
+            self._entradas.clear()
+        self._modelo = modelo
+        self._firma = firma
+
+    def obtener(self, clave, modelo):
+        """
+        Busca una composición en la caché.
+
+        Args:
+            clave: Clave devuelta por `clave()` (None nunca acierta)
+            modelo: Modelo con el que se va a predecir
+
+        Returns:
+            Tupla (octanaje, clasificacion) o None si no está
+        """
+        if clave is None:
+            return None
+
+        with self._bloqueo:
+            self._comprobar_modelo(modelo)
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0], dict(entrada[1])
+
+    def guardar(self, clave, modelo, octanaje, clasificacion):
+        """Guarda una predicción, desalojando la menos usada si está llena."""
+        if clave is None:
+            return
+
+        with self._bloqueo:
+            self._comprobar_modelo(modelo)
+            self._entradas[clave] = (octanaje, dict(clasificacion))
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+                self.desalojos += 1
+
+    def limpiar(self):
+        with self._bloqueo:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        """Contadores y ocupación de la caché."""
+        with self._bloqueo:
+            consultas = self.aciertos + self.fallos
+            return {
+                'capacidad': self.capacidad,
+                'entradas': len(self._entradas),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'invalidaciones': self.invalidaciones,
+                'tasa_aciertos': self.aciertos / consultas if consultas else 0.0
+            }
+
+
+CACHE = CachePredicciones(
+    capacidad=int(os.environ.get(VARIABLE_ENTORNO_CAPACIDAD, CAPACIDAD_POR_DEFECTO))
+)
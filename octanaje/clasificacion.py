@@ -0,0 +1,307 @@
+"""
+Clasificación fiscal de la gasolina según normativa española.
+
+Las categorías, los límites fiscales y la tolerancia industrial están en una
+sola tabla (CATEGORIAS, LIMITES_FISCALES, TOLERANCIA) de la que salen la
+clasificación de una muestra, la clasificación vectorizada de lotes y las
+tablas de la interfaz.
+
+Las muestras fuera del dominio de aplicabilidad del modelo (octanaje.dominio)
+no reciben categoría fiscal automática: se marcan como SIN_CLASIFICAR.
+"""
+
+import functools
+
+# Tolerancia industrial alrededor de cada límite fiscal (RON)
+TOLERANCIA = 0.5
+
+# Límites entre categorías, en orden. Ambos límites pertenecen a la categoría
+# central: 95.0 y 98.0 exactos son GASOLINA 95 OCTANOS.
+LIMITES_FISCALES = [
+    {'valor': 95.0, 'categoria_del_limite': 1},
+    {'valor': 98.0, 'categoria_del_limite': 1},
+]
+
+CATEGORIAS = [
+    {
+        'categoria': 'GASOLINA <95 OCTANOS',
+        'codigo_nc': '2710.12.41',
+        'epigrafe': '1.2.2',
+        'descripcion': 'Inferior a 95 octanos',
+        'rango': '< 95',
+        'emoji': '⚡',
+        'clase': 'result-regular',
+        'clase_categoria': 'categoria-regular',
+        'imagen': '94.png'
+    },
+    {
+        'categoria': 'GASOLINA 95 OCTANOS',
+        'codigo_nc': '2710.12.45',
+        'epigrafe': '1.2.2',
+        'descripcion': '95 a 98 octanos',
+        'rango': '95 - 98',
+        'emoji': '🚗',
+        'clase': 'result-premium',
+        'clase_categoria': 'categoria-premium',
+        'imagen': '95.png'
+    },
+    {
+        'categoria': 'GASOLINA 98 OCTANOS',
+        'codigo_nc': '2710.12.49',
+        'epigrafe': '1.2.1',
+        'descripcion': 'Superior a 98 octanos',
+        'rango': '> 98',
+        'emoji': '🏎️',
+        'clase': 'result-super',
+        'clase_categoria': 'categoria-super',
+        'imagen': '98.png'
+    },
+]
+
+# Resultado para muestras fuera del dominio de aplicabilidad del modelo. En
+# clasificar_lote su índice de categoría es -1.
+SIN_CLASIFICAR = {
+    'categoria': 'SIN CLASIFICAR',
+    'codigo_nc': '-',
+    'epigrafe': '-',
+    'descripcion': 'Composición fuera del dominio del modelo: requiere ensayo de laboratorio',
+    'rango': '-',
+    'emoji': '🔬',
+    'clase': 'result-fuera',
+    'clase_categoria': 'categoria-fuera',
+    'imagen': None
+}
+
+# Campos de CATEGORIAS que devuelve clasificar_gasolina
+CAMPOS_CLASIFICACION = ['categoria', 'codigo_nc', 'epigrafe', 'descripcion',
+                        'emoji', 'clase', 'imagen']
+
+# Categoría central: cerca de cualquiera de sus límites se avisa del límite
+# "superior"; en las categorías de los extremos, del límite "inferior"
+CATEGORIA_CENTRAL = 1
+
+MENSAJE_ADVERTENCIA = (
+    "⚠️ ADVERTENCIA: Octanaje {octanaje:.1f} está muy cerca del límite {lado} ({limite:.1f}). "
+    "Dentro de tolerancia industrial (±{tolerancia}), podría reclasificarse."
+)
+
+MENSAJE_FUERA_DOMINIO = (
+    "🔬 FUERA DEL DOMINIO DEL MODELO: {motivo}. La predicción de {octanaje:.1f} RON es una "
+    "extrapolación; no se asigna categoría fiscal automática, determine el RON en laboratorio."
+)
+
+MENSAJE_ADVERTENCIA_INTERVALO = (
+    "⚠️ ADVERTENCIA: Octanaje {octanaje:.1f} está muy cerca del límite {lado} ({limite:.1f}). "
+    "El intervalo de predicción [{inferior:.2f}, {superior:.2f}] incluye el límite, podría reclasificarse."
+)
+
+
+def indice_categoria(octanaje_real):
+    """Posición en CATEGORIAS de un octanaje (sin redondear)."""
+    if octanaje_real != octanaje_real:
+        # NaN no cumple ninguna comparación; como el if/elif original, cae en la última
+        return len(CATEGORIAS) - 1
+
+    indice = 0
+    for i, limite in enumerate(LIMITES_FISCALES):
+        if limite['categoria_del_limite'] == i + 1:
+            supera = octanaje_real >= limite['valor']
+        else:
+            supera = octanaje_real > limite['valor']
+        if supera:
+            indice = i + 1
+    return indice
+
+
+def limite_cercano(octanaje_real):
+    """Límite fiscal a distancia <= TOLERANCIA (bordes incluidos), o None."""
+    for limite in LIMITES_FISCALES:
+        if limite['valor'] - TOLERANCIA <= octanaje_real <= limite['valor'] + TOLERANCIA:
+            return limite['valor']
+    return None
+
+
+def limite_en_intervalo(inferior, superior):
+    """Primer límite fiscal dentro de [inferior, superior] (bordes incluidos), o None."""
+    for limite in LIMITES_FISCALES:
+        if inferior <= limite['valor'] <= superior:
+            return limite['valor']
+    return None
+
+
+def clasificar_gasolina(octanaje_real, intervalo=None, fuera_dominio=None, calibrado=True):
+    """
+    Clasifica la gasolina según normativa fiscal española.
+
+    Args:
+        octanaje_real: Octanaje predicho con decimales (valor real sin redondear)
+        intervalo: Tupla (inferior, superior) del intervalo de predicción de
+            la muestra (ver octanaje.intervalos). Sin intervalo se usa la
+            banda fija de ±TOLERANCIA.
+        fuera_dominio: Motivo por el que la muestra está fuera del dominio
+            del modelo (ver octanaje.dominio), o None si está dentro
+        calibrado: False si el intervalo es la heurística sin calibrar
+            (octanaje.intervalos.intervalo_calibrado): se devuelve como
+            información, pero la zona crítica es la banda de ±TOLERANCIA
+
+    Returns:
+        dict con información de clasificación y advertencias; fuera del
+        dominio, SIN_CLASIFICAR con la advertencia del motivo
+    """
+    if fuera_dominio is not None:
+        clasificacion = {campo: SIN_CLASIFICAR[campo] for campo in CAMPOS_CLASIFICACION}
+        clasificacion['advertencia'] = MENSAJE_FUERA_DOMINIO.format(motivo=fuera_dominio, octanaje=octanaje_real)
+        clasificacion['limite_critico'] = None
+        clasificacion['intervalo'] = (
+            (octanaje_real - TOLERANCIA, octanaje_real + TOLERANCIA) if intervalo is None
+            else tuple(float(v) for v in intervalo)
+        )
+        clasificacion['fuera_dominio'] = fuera_dominio
+        return clasificacion
+
+    # IMPORTANTE: Clasificar con el valor REAL, no con el redondeado
+    indice = indice_categoria(octanaje_real)
+    clasificacion = {campo: CATEGORIAS[indice][campo] for campo in CAMPOS_CLASIFICACION}
+    lado = 'superior' if indice == CATEGORIA_CENTRAL else 'inferior'
+
+    advertencia = None
+    if intervalo is None or not calibrado:
+        # Detectar si está en zona crítica (límite ± tolerancia 0.5)
+        limite_critico = limite_cercano(octanaje_real)
+        if limite_critico is not None:
+            advertencia = MENSAJE_ADVERTENCIA.format(
+                octanaje=octanaje_real,
+                lado=lado,
+                limite=limite_critico,
+                tolerancia=TOLERANCIA
+            )
+        intervalo = (
+            (octanaje_real - TOLERANCIA, octanaje_real + TOLERANCIA) if intervalo is None
+            else tuple(float(v) for v in intervalo)
+        )
+    else:
+        # Zona crítica: el intervalo de predicción de la muestra incluye un límite
+        inferior, superior = (float(v) for v in intervalo)
+        intervalo = (inferior, superior)
+        limite_critico = limite_en_intervalo(inferior, superior)
+        if limite_critico is not None:
+            advertencia = MENSAJE_ADVERTENCIA_INTERVALO.format(
+                octanaje=octanaje_real,
+                lado=lado,
+                limite=limite_critico,
+                inferior=inferior,
+                superior=superior
+            )
+
+    clasificacion['advertencia'] = advertencia
+    clasificacion['limite_critico'] = limite_critico
+    clasificacion['intervalo'] = intervalo
+    clasificacion['fuera_dominio'] = None
+    return clasificacion
+
+
+def celdas_clasificacion(octanajes):
+    """
+    Localiza cada octanaje entre los bordes de categorías y zonas críticas.
+
+    Dos octanajes con la misma celda (índice de categoría y posición de zona)
+    reciben la misma categoría, límite crítico y sentido de la advertencia.
+
+    Args:
+        octanajes: ndarray float64
+
+    Returns:
+        Tupla (indice_categoria int8, posicion_zona); la posición de zona es
+        impar dentro de una zona crítica y posicion_zona // 2 es su límite
+    """
+    import numpy as np
+
+    bordes, zonas = _bordes_celdas()
+    indices = np.searchsorted(bordes, octanajes, side='right').astype(np.int8)
+    posicion_zona = np.searchsorted(zonas, octanajes, side='right')
+    return indices, posicion_zona
+
+
+@functools.lru_cache(maxsize=None)
+def _bordes_celdas():
+    """Bordes de categorías y de zonas críticas para búsqueda por intervalos."""
+    import numpy as np
+
+    # Un límite que pertenece a la categoría superior cuenta con p >= límite;
+    # si pertenece a la inferior, con p > límite, es decir p >= nextafter(límite)
+    bordes = np.array([
+        limite['valor'] if limite['categoria_del_limite'] == i + 1
+        else np.nextafter(limite['valor'], np.inf)
+        for i, limite in enumerate(LIMITES_FISCALES)
+    ])
+
+    # Zonas críticas [límite - tol, límite + tol] cerradas por ambos lados:
+    # un índice impar en los bordes intercalados indica que cae dentro de una
+    zonas = np.array([
+        borde
+        for limite in LIMITES_FISCALES
+        for borde in (limite['valor'] - TOLERANCIA, np.nextafter(limite['valor'] + TOLERANCIA, np.inf))
+    ])
+    return bordes, zonas
+
+
+def clasificar_lote(octanajes, inferior=None, superior=None, fuera_dominio=None, calibrado=True):
+    """
+    Clasifica un array de octanajes en una sola pasada vectorizada.
+
+    Da exactamente el mismo resultado que clasificar_gasolina fila a fila,
+    incluidos los bordes en 94.5, 95.0, 95.5, 97.5, 98.0 y 98.5.
+
+    Args:
+        octanajes: Array (o secuencia) de octanajes predichos sin redondear
+        inferior, superior: Intervalos de predicción por fila (opcionales);
+            si se dan, la zona crítica es un intervalo que incluye un límite
+        fuera_dominio: Array bool de filas fuera del dominio del modelo
+            (opcional); se clasifican como SIN_CLASIFICAR
+        calibrado: False si los intervalos son la heurística sin calibrar;
+            la zona crítica es entonces la banda de ±TOLERANCIA
+
+    Returns:
+        dict de arrays columnares:
+            indice_categoria: posición en CATEGORIAS (int8), -1 si SIN_CLASIFICAR
+            categoria, codigo_nc, epigrafe: textos de cada fila (object)
+            limite_critico: límite cercano o NaN si no está en zona crítica
+            en_zona_critica: True si está a <= TOLERANCIA de un límite
+            fuera_dominio: True si está fuera del dominio del modelo
+    """
+    import numpy as np
+
+    octanajes = np.asarray(octanajes, dtype=np.float64)
+    indices, posicion_zona = celdas_clasificacion(octanajes)
+    valores_limite = np.array([limite['valor'] for limite in LIMITES_FISCALES] + [np.nan])
+    if inferior is None or not calibrado:
+        en_zona = (posicion_zona % 2) == 1
+        limite_critico = np.where(en_zona, valores_limite[posicion_zona // 2], np.nan)
+    else:
+        # Primer límite >= inferior; está en zona si además es <= superior
+        primero = np.searchsorted(valores_limite[:-1], np.asarray(inferior, dtype=np.float64), side='left')
+        limite_critico = valores_limite[primero]
+        en_zona = limite_critico <= np.asarray(superior, dtype=np.float64)
+        limite_critico = np.where(en_zona, limite_critico, np.nan)
+
+    if fuera_dominio is None:
+        fuera_dominio = np.zeros(len(octanajes), dtype=bool)
+    else:
+        fuera_dominio = np.asarray(fuera_dominio, dtype=bool)
+        indices[fuera_dominio] = -1
+        en_zona = en_zona & ~fuera_dominio
+        limite_critico = np.where(fuera_dominio, np.nan, limite_critico)
+
+    def columna(campo):
+        # El índice -1 toma SIN_CLASIFICAR, el último de la tabla
+        return np.array([c[campo] for c in CATEGORIAS + [SIN_CLASIFICAR]], dtype=object)[indices]
+
+    return {
+        'indice_categoria': indices,
+        'categoria': columna('categoria'),
+        'codigo_nc': columna('codigo_nc'),
+        'epigrafe': columna('epigrafe'),
+        'limite_critico': limite_critico,
+        'en_zona_critica': en_zona,
+        'fuera_dominio': fuera_dominio
+    }
@@ -0,0 +1,61 @@
+"""
+Componentes del análisis cromatográfico y variables derivadas.
+
+Módulo ligero: no importa NumPy ni pandas.
+"""
+
+COMPONENTES = ['PARAFINAS', 'ISOPARAFINAS', 'OLEFINAS', 'NAFTENICOS',
+               'AROMATICOS', 'ETANOL', 'MTBE', 'ETBE']
+
+OXIGENADOS = ['ETANOL', 'MTBE', 'ETBE']
+
+# Rangos típicos de cada componente en el conjunto de entrenamiento (%v/v)
+RANGOS_TIPICOS = {
+    'PARAFINAS': (5.5, 16.2),
+    'ISOPARAFINAS': (22.5, 43.9),
+    'OLEFINAS': (2.3, 13.8),
+    'NAFTENICOS': (2.0, 14.5),
+    'AROMATICOS': (26.5, 48.9),
+    'ETANOL': (0.0, 4.9),
+    'MTBE': (0.0, 14.3),
+    'ETBE': (0.0, 7.9)
+}
+
+# Mezcla de ejemplo del botón "Cargar Datos de Ejemplo"
+EJEMPLO = {
+    'PARAFINAS': 10.5,
+    'ISOPARAFINAS': 32.0,
+    'OLEFINAS': 8.5,
+    'NAFTENICOS': 6.2,
+    'AROMATICOS': 38.0,
+    'ETANOL': 4.8,
+    'MTBE': 0.0,
+    'ETBE': 0.0
+}
+
+
+def completar_muestra(datos):
+    """
+    Devuelve los datos de una muestra con la variable Ox calculada.
+
+    Args:
+        datos: dict con los 8 componentes medidos (%v/v)
+
+    Returns:
+        dict con los componentes como float más 'Ox' = ETANOL + MTBE + ETBE
+    """
+    faltan = [c for c in COMPONENTES if c not in datos]
+    if faltan:
+        raise ValueError(f"Faltan componentes: {', '.join(faltan)}")
+
+    muestra = {c: float(datos[c]) for c in COMPONENTES}
+    muestra['Ox'] = muestra['ETANOL'] + muestra['MTBE'] + muestra['ETBE']
+    return muestra
+
+
+def normalizar_columnas(columnas):
+    """Nombres de columna en mayúsculas y sin tildes, como los de COMPONENTES."""
+    return [
+        str(c).strip().upper().replace('É', 'E').replace('Á', 'A')
+        for c in columnas
+    ]
@@ -0,0 +1,742 @@
+"""
+Deriva de los datos: composiciones y predicciones frente a las de entrenamiento.
+
+El modelo se validó con 77 muestras independientes (R² 0.8365). Si la carga
+de la refinería cambia poco a poco, las predicciones empeoran sin que nada
+falle. El monitor recibe cada muestra puntuada (formulario, lotes, servicio
+e ingesta) y compara la distribución reciente de cada variable y de la
+predicción con la de entrenamiento.
+
+- Referencia: para cada variable y para el octanaje predicho (OCTANAJE),
+  los bordes de sus deciles, la proporción de cada tramo, la media y la
+  varianza. Viaja con el modelo (`metadatos['deriva']`, también en el
+  artefacto .octgb) y se construye con construir_referencia a partir de
+  las composiciones de entrenamiento.
+- Por muestra, O(1) y memoria constante: un bisect por variable en sus
+  bordes fijos y una actualización de Welford de la media y la varianza.
+  Los lotes se acumulan con bincount y se combinan con la fórmula de Chan.
+- Cada VENTANA muestras se cierra una ventana y se compara con la
+  referencia:
+    - PSI: suma de (o - r) ln(o / r) por tramo. Hay alerta si supera
+      UMBRAL_PSI.
+    - KS: diferencia máxima entre las funciones de distribución en los
+      bordes. Hay alerta si supera el valor crítico de dos muestras al
+      nivel NIVEL_KS, con el tamaño de la referencia.
+  Cada alerta se cuenta en octanaje_deriva_alertas_total por variable y
+  estadístico, y queda en el estado del monitor (panel lateral de la app,
+  GET /deriva del servicio).
+
+Hay un monitor por modelo cargado: una versión nueva empieza con ventanas
+vacías y su propia referencia.
+
+El pickle entregado no incluye las composiciones de entrenamiento. Para ese
+modelo, referencia_desde_arboles reconstruye la referencia a partir del
+propio ensemble. La raíz de cada árbol separa las muestras de entrenamiento
+de su submuestra en x <= umbral. La fracción que va a la izquierda
+(MotorGB.muestras) es un punto de la función de distribución empírica de
+esa variable: los 200 árboles dan de 4 a 15 puntos por variable, y los
+bordes de los tramos son los más cercanos a los deciles. El octanaje de la
+referencia es el que predice el modelo para composiciones sacadas de esas
+distribuciones (predicciones_sinteticas): el monitor compara predicciones
+con predicciones, que encogen hacia la media (desviación ~0.95 frente a
+~1.3 del octanaje medido). Las variables se muestrean por separado y las
+composiciones reales están correlacionadas, así que con esa referencia el
+PSI y el KS de OCTANAJE se muestran pero no dan alerta.
+
+Uso:
+    python -m octanaje.deriva                        # referencia del modelo encontrado
+    python -m octanaje.deriva --historial RUTA       # reproduce el historial por ventanas
+    python -m octanaje.deriva --medir
+
+Medido con `python -m octanaje.deriva --medir` (1 núcleo):
+    - observar_muestra(): ~6 µs por muestra (predecir una muestra cuesta ~200 µs)
+    - Lotes (observar): ~1 millón de filas/s
+    - Composiciones de la propia referencia con su predicción: ninguna
+      alerta en 40 ventanas, PSI mediano de OCTANAJE ~0.15 (~0.63 con la
+      referencia anterior, sacada de las hojas del primer árbol). Con
+      AROMATICOS desplazado +3 %v/v: alerta en la primera ventana de 500
+      muestras, sólo en AROMATICOS.
+"""
+
+import bisect
+import math
+import sys
+import threading
+import time
+import weakref
+
+
+# Nombre del octanaje predicho entre las variables vigiladas
+OCTANAJE = 'OCTANAJE'
+
+# Tramos de cada histograma (deciles de la referencia)
+TRAMOS = 10
+
+# Muestras por ventana de comparación
+VENTANA = 500
+
+# Muestras mínimas de la ventana en curso para evaluarla antes de cerrarla
+MINIMO_VENTANA = 50
+
+# Umbral de PSI (0.1-0.25: cambio moderado; > 0.25: cambio importante)
+UMBRAL_PSI = 0.25
+
+# Nivel de significación de la prueba KS de dos muestras
+NIVEL_KS = 0.001
+
+# Proporción mínima de un tramo en el PSI (evita ln(0))
+PROPORCION_MINIMA = 1e-4
+
+# Origen de las referencias reconstruidas del ensemble (sin alertas de OCTANAJE)
+ORIGEN_ARBOLES = 'árboles del modelo'
+
+# Composiciones sintéticas para la referencia del octanaje predicho
+MUESTRAS_SINTETICAS = 20_000
+
+# Monitores por modelo (se liberan con el modelo, como octanaje.cache)
+_MONITORES = weakref.WeakKeyDictionary()
+_CERROJO_MONITORES = threading.Lock()
+
+
+class ReferenciaDeriva:
+    """
+    Histogramas de tramos fijos y momentos de la distribución de entrenamiento.
+
+    Attributes:
+        variables: Variables del modelo, en su orden, y OCTANAJE
+        bordes: Bordes interiores de los tramos de cada variable (el tramo k
+            es bordes[k-1] < x <= bordes[k])
+        proporciones: Proporción de la referencia en cada tramo
+        media, varianza: Momentos de cada variable
+        muestras: Tamaño de la referencia (para el valor crítico de KS)
+        origen: 'entrenamiento' u ORIGEN_ARBOLES
+    """
+
+    def __init__(self, variables, bordes, proporciones, media, varianza, muestras, origen):
+        self.variables = list(variables)
+        self.bordes = [[float(b) for b in bordes_variable] for bordes_variable in bordes]
+        self.proporciones = [[float(p) for p in proporciones_variable] for proporciones_variable in proporciones]
+        self.media = [float(m) for m in media]
+        self.varianza = [float(v) for v in varianza]
+        self.muestras = int(muestras)
+        self.origen = origen
+
+    def a_dict(self):
+        """Representación JSON (metadatos del modelo y cabecera del artefacto)."""
+        return {
+            'variables': self.variables,
+            'bordes': self.bordes,
+            'proporciones': self.proporciones,
+            'media': self.media,
+            'varianza': self.varianza,
+            'muestras': self.muestras,
+            'origen': self.origen
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(**datos)
+
+
+def _bordes_cuantiles(valores, tramos):
+    """Bordes interiores de los cuantiles de `valores`, sin repetir."""
+    import numpy as np
+
+    return np.unique(np.quantile(valores, np.arange(1, tramos) / tramos))
+
+
+def construir_referencia(X, prediccion, variables, origen='entrenamiento', tramos=TRAMOS):
+    """
+    Construye la referencia a partir de las composiciones de entrenamiento.
+
+    Args:
+        X: Matriz (filas x variables) de composiciones de entrenamiento
+        prediccion: Octanaje predicho por el modelo para cada fila
+        variables: Orden de columnas de X (el del modelo)
+        origen: Descripción de la referencia
+        tramos: Tramos de cada histograma (cuantiles de la referencia; los
+            repetidos, p. ej. un oxigenado casi siempre 0, se funden)
+
+    Returns:
+        ReferenciaDeriva
+    """
+    import numpy as np
+
+    Z = np.column_stack([np.asarray(X, dtype=np.float64), np.asarray(prediccion, dtype=np.float64)])
+    bordes, proporciones = [], []
+    for columna in Z.T:
+        bordes_columna = _bordes_cuantiles(columna, tramos)
+        cuentas = np.bincount(np.searchsorted(bordes_columna, columna, side='left'),
+                              minlength=len(bordes_columna) + 1)
+        bordes.append(bordes_columna.tolist())
+        proporciones.append((cuentas / len(columna)).tolist())
+    return ReferenciaDeriva(
+        variables=[*variables, OCTANAJE],
+        bordes=bordes,
+        proporciones=proporciones,
+        media=Z.mean(axis=0).tolist(),
+        varianza=Z.var(axis=0).tolist(),
+        muestras=len(Z),
+        origen=origen
+    )
+
+
+def distribuciones_raices(motor, extremos):
+    """
+    Función de distribución de entrenamiento de cada variable según las raíces de los árboles.
+
+    Args:
+        motor: MotorGB con muestras por nodo
+        extremos: dict variable -> (mínimo, máximo) donde la distribución
+            vale 0 y 1
+
+    Returns:
+        dict variable -> (x, F): puntos de una función de distribución
+        lineal a trozos, crecientes en x y no decrecientes en F
+    """
+    import numpy as np
+
+    raices = motor.raices
+    izquierdos = motor.hijos[2 * raices]
+    internas = izquierdos != raices
+    raices, izquierdos = raices[internas], izquierdos[internas]
+    fraccion = motor.muestras[izquierdos] / motor.muestras[raices]
+
+    distribuciones = {}
+    for j, variable in enumerate(motor.variables):
+        propias = motor.variable[raices] == j
+        umbrales, inversa = np.unique(motor.umbral[raices][propias], return_inverse=True)
+        # Fracción media en cada umbral, ponderada por la submuestra de cada árbol
+        pesos = motor.muestras[raices][propias].astype(np.float64)
+        F = np.bincount(inversa, pesos * fraccion[propias], len(umbrales)) / np.bincount(inversa, pesos, len(umbrales))
+        minimo, maximo = extremos[variable]
+        dentro = (umbrales > minimo) & (umbrales < maximo)
+        x = np.concatenate([[minimo], umbrales[dentro], [maximo]])
+        # Ruido de submuestreo: se fuerza que sea no decreciente y quede en [0, 1]
+        F = np.clip(np.maximum.accumulate(np.concatenate([[0.0], F[dentro], [1.0]])), 0.0, 1.0)
+        distribuciones[variable] = (x, F)
+    return distribuciones
+
+
+def _tramos_conocidos(x, F, tramos):
+    """
+    Bordes y proporciones de tramos en los puntos interiores de (x, F).
+
+    Los bordes son puntos donde el ensemble conoce la distribución (umbrales
+    de las raíces), los más cercanos a cada cuantil. Interpolar entre ellos
+    pondría bordes dentro de un átomo (ETBE es 0 en la mayoría de las
+    muestras de entrenamiento) y daría alertas falsas.
+    """
+    import numpy as np
+
+    interiores, acumulada = x[1:-1], F[1:-1]
+    if not len(interiores):
+        return [], [1.0]
+    cercanos = np.abs(acumulada[None, :] - (np.arange(1, tramos) / tramos)[:, None]).argmin(axis=1)
+    cercanos = np.unique(cercanos)
+    # Un tramo sin referencia (F plana) no aporta nada al KS y dispara el PSI
+    cercanos = cercanos[np.diff(acumulada[cercanos], prepend=0.0) > 0]
+    cercanos = cercanos[acumulada[cercanos] < 1.0]
+    return interiores[cercanos].tolist(), np.diff(acumulada[cercanos], prepend=0.0, append=1.0).tolist()
+
+
+def predicciones_sinteticas(motor, distribuciones, muestras=MUESTRAS_SINTETICAS, semilla=0):
+    """
+    Octanaje predicho por el modelo para composiciones sacadas de `distribuciones`.
+
+    Cada componente se muestrea por separado con la inversa de su función de
+    distribución; Ox es la suma de los oxigenados y sólo se quedan las
+    composiciones cuya suma está en SUMA_PLAUSIBLE, como en
+    dominio_desde_umbrales. Son predicciones, no octanajes medidos: el
+    ensemble encoge hacia la media, y es eso lo que verá el monitor.
+
+    Args:
+        motor: MotorGB
+        distribuciones: dict variable -> (x, F) de distribuciones_raices
+        muestras: Composiciones generadas antes de filtrar
+        semilla: Semilla del generador aleatorio
+
+    Returns:
+        ndarray con las predicciones
+    """
+    import numpy as np
+
+    from octanaje.componentes import COMPONENTES, OXIGENADOS
+    from octanaje.dominio import SUMA_PLAUSIBLE
+
+    rng = np.random.default_rng(semilla)
+    columnas = {c: np.interp(rng.uniform(size=muestras), distribuciones[c][1], distribuciones[c][0])
+                for c in COMPONENTES}
+    columnas['Ox'] = sum(columnas[c] for c in OXIGENADOS)
+    suma = sum(columnas[c] for c in COMPONENTES)
+    dentro = (suma >= SUMA_PLAUSIBLE[0]) & (suma <= SUMA_PLAUSIBLE[1])
+    return motor.predict(np.column_stack([columnas[v][dentro] for v in motor.variables]))
+
+
+def referencia_desde_arboles(motor, tramos=TRAMOS):
+    """
+    Reconstruye la referencia de un modelo sin sus composiciones de entrenamiento.
+
+    Las distribuciones de las variables salen de distribuciones_raices, entre
+    los extremos del rango del dominio del modelo sin su margen (y no por
+    debajo de 0). La del octanaje predicho sale de predicciones_sinteticas.
+    Las variables se muestrean por separado y las composiciones reales están
+    correlacionadas: sus predicciones no tienen por qué repartirse igual, y
+    MonitorDeriva no da alertas de OCTANAJE con esta referencia.
+
+    Args:
+        motor: MotorGB con muestras por nodo y tasa de aprendizaje
+        tramos: Tramos de cada histograma
+
+    Returns:
+        ReferenciaDeriva con origen ORIGEN_ARBOLES
+
+    Raises:
+        ValueError: Si el modelo no tiene muestras por nodo
+    """
+    import numpy as np
+
+    from octanaje.dominio import MARGEN_RANGO, dominio_modelo
+
+    if motor.muestras is None:
+        raise ValueError("El modelo no tiene muestras por nodo: no se puede reconstruir la referencia")
+
+    variables = motor.variables
+    dominio = dominio_modelo(motor, variables)
+    anchura = (dominio.maximo - dominio.minimo) / (1 + 2 * MARGEN_RANGO)
+    extremos = {v: (max(dominio.minimo[j] + MARGEN_RANGO * anchura[j], 0.0),
+                    dominio.maximo[j] - MARGEN_RANGO * anchura[j])
+                for j, v in enumerate(variables)}
+    distribuciones = distribuciones_raices(motor, extremos)
+
+    bordes, proporciones, media, varianza = [], [], [], []
+    for x, F in (distribuciones[v] for v in variables):
+        bordes_variable, proporciones_variable = _tramos_conocidos(x, F, tramos)
+        bordes.append(bordes_variable)
+        proporciones.append(proporciones_variable)
+        # Momentos de la mezcla de uniformes entre puntos consecutivos
+        p, a, b = np.diff(F), x[:-1], x[1:]
+        media.append(float((p * (a + b) / 2).sum()))
+        varianza.append(float((p * (a * a + a * b + b * b) / 3).sum()) - media[-1] ** 2)
+    # El octanaje, con los mismos cuantiles que construir_referencia
+    prediccion = predicciones_sinteticas(motor, distribuciones)
+    bordes_octanaje = _bordes_cuantiles(prediccion, tramos)
+    cuentas = np.bincount(np.searchsorted(bordes_octanaje, prediccion, side='left'),
+                          minlength=len(bordes_octanaje) + 1)
+    bordes.append(bordes_octanaje.tolist())
+    proporciones.append((cuentas / len(prediccion)).tolist())
+    media.append(float(prediccion.mean()))
+    varianza.append(float(prediccion.var()))
+
+    return ReferenciaDeriva(
+        variables=[*variables, OCTANAJE],
+        bordes=bordes,
+        proporciones=proporciones,
+        media=media,
+        varianza=varianza,
+        # Submuestra de cada árbol: las muestras de entrenamiento que vio cada raíz
+        muestras=int(np.median(motor.muestras[motor.raices])),
+        origen=ORIGEN_ARBOLES
+    )
+
+
+def referencia_modelo(modelo, variables=None):
+    """Referencia de un modelo cargado: la de sus metadatos o la reconstruida con referencia_desde_arboles."""
+    metadatos = getattr(modelo, 'metadatos', None) or {}
+    if metadatos.get('deriva'):
+        return ReferenciaDeriva.desde_dict(metadatos['deriva'])
+
+    from octanaje.motor import como_motor
+
+    return referencia_desde_arboles(como_motor(modelo, variables))
+
+
+def valor_critico_ks(n, m, nivel=NIVEL_KS):
+    """Valor crítico asintótico de la prueba KS de dos muestras de tamaños n y m."""
+    return math.sqrt(-math.log(nivel / 2) / 2) * math.sqrt((n + m) / (n * m))
+
+
+class MonitorDeriva:
+    """
+    Estadísticas por ventanas de las muestras puntuadas, en memoria constante.
+
+    Se puede alimentar desde varios hilos (sesiones de Streamlit, hilos del
+    servicio): cada actualización va con cerrojo.
+
+    Args:
+        referencia: ReferenciaDeriva del modelo
+        ventana: Muestras por ventana de comparación
+    """
+
+    def __init__(self, referencia, ventana=VENTANA):
+        self.referencia = referencia
+        self.ventana = int(ventana)
+        self.variables = referencia.variables
+        self.muestras = 0
+        self.ventanas = 0
+        self.ultima = None
+        self.alertas = []
+        self._bordes = referencia.bordes
+        self._cerrojo = threading.Lock()
+        self._reiniciar_ventana()
+        # Acumulado desde el arranque (Welford, combinado al cerrar cada ventana)
+        self._total = 0
+        self._total_media = [0.0] * len(self.variables)
+        self._total_m2 = [0.0] * len(self.variables)
+
+    def _reiniciar_ventana(self):
+        self._n = 0
+        self._cuentas = [[0] * (len(bordes) + 1) for bordes in self._bordes]
+        self._media = [0.0] * len(self.variables)
+        self._m2 = [0.0] * len(self.variables)
+
+    # ── Actualización ──────────────────────────────────────────────────────
+
+    def observar_muestra(self, fila, octanaje):
+        """
+        Añade una muestra: un bisect y una actualización de Welford por variable.
+
+        Args:
+            fila: Valores en el orden de las variables del modelo
+            octanaje: Octanaje predicho
+        """
+        with self._cerrojo:
+            n = self._n = self._n + 1
+            media, m2, cuentas, bordes = self._media, self._m2, self._cuentas, self._bordes
+            j = 0
+            for x in (*fila, octanaje):
+                cuentas[j][bisect.bisect_left(bordes[j], x)] += 1
+                delta = x - media[j]
+                media[j] += delta / n
+                m2[j] += delta * (x - media[j])
+                j += 1
+            self.muestras += 1
+            if n >= self.ventana:
+                self._cerrar_ventana()
+
+    def observar(self, X, predicciones):
+        """
+        Añade un lote: bincount por variable y combinación de momentos (Chan).
+
+        Args:
+            X: Matriz (filas x variables) o lista de filas
+            predicciones: Octanaje predicho de cada fila
+        """
+        import numpy as np
+
+        if len(predicciones) <= 8:
+            for fila, octanaje in zip(X, predicciones):
+                self.observar_muestra(fila, float(octanaje))
+            return
+
+        Z = np.column_stack([np.asarray(X, dtype=np.float64), np.asarray(predicciones, dtype=np.float64)])
+        with self._cerrojo:
+            inicio = 0
+            while inicio < len(Z):
+                bloque = Z[inicio:inicio + self.ventana - self._n]
+                inicio += len(bloque)
+                self._sumar_bloque(bloque)
+                self.muestras += len(bloque)
+                if self._n >= self.ventana:
+                    self._cerrar_ventana()
+
+    def _sumar_bloque(self, bloque):
+        import numpy as np
+
+        for j, bordes in enumerate(self._bordes):
+            cuentas = np.bincount(np.searchsorted(bordes, bloque[:, j], side='left'), minlength=len(bordes) + 1)
+            self._cuentas[j] = [a + b for a, b in zip(self._cuentas[j], cuentas.tolist())]
+        self._n, self._media, self._m2 = _combinar(
+            self._n, self._media, self._m2,
+            len(bloque), bloque.mean(axis=0).tolist(), ((bloque - bloque.mean(axis=0)) ** 2).sum(axis=0).tolist())
+
+    def _cerrar_ventana(self):
+        from octanaje.metricas import METRICAS
+
+        self.ultima = self._evaluar()
+        self.ultima['fecha_hora'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.alertas = [v for v in self.ultima['variables'] if v['alerta']]
+        for variable in self.alertas:
+            for estadistico in ('psi', 'ks'):
+                if variable[f'alerta_{estadistico}']:
+                    METRICAS.contar('octanaje_deriva_alertas_total', variable=variable['variable'],
+                                    estadistico=estadistico)
+        self.ventanas += 1
+        self._total, self._total_media, self._total_m2 = _combinar(
+            self._total, self._total_media, self._total_m2, self._n, self._media, self._m2)
+        self._reiniciar_ventana()
+
+    # ── Evaluación ─────────────────────────────────────────────────────────
+
+    def _evaluar(self):
+        """PSI, KS y momentos de la ventana en curso frente a la referencia."""
+        referencia, n = self.referencia, self._n
+        critico = valor_critico_ks(referencia.muestras, n)
+        # La referencia reconstruida del octanaje es de composiciones independientes: sólo informa
+        sin_alerta = {OCTANAJE} if referencia.origen == ORIGEN_ARBOLES else set()
+        variables = []
+        for j, variable in enumerate(self.variables):
+            psi, ks, acumulado_o, acumulado_r = 0.0, 0.0, 0.0, 0.0
+            for cuenta, r in zip(self._cuentas[j], referencia.proporciones[j]):
+                o = cuenta / n
+                acumulado_o += o
+                acumulado_r += r
+                ks = max(ks, abs(acumulado_o - acumulado_r))
+                o, r = max(o, PROPORCION_MINIMA), max(r, PROPORCION_MINIMA)
+                psi += (o - r) * math.log(o / r)
+            variables.append({
+                'variable': variable,
+                'psi': psi,
+                'ks': ks,
+                'ks_critico': critico,
+                'media': self._media[j],
+                'desviacion': math.sqrt(self._m2[j] / n),
+                'media_referencia': referencia.media[j],
+                'desviacion_referencia': math.sqrt(referencia.varianza[j]),
+                'alerta_psi': psi > UMBRAL_PSI and variable not in sin_alerta,
+                'alerta_ks': ks > critico and variable not in sin_alerta,
+                'alerta': (psi > UMBRAL_PSI or ks > critico) and variable not in sin_alerta
+            })
+        return {'muestras': n, 'variables': variables}
+
+    def estado(self):
+        """
+        Estado del monitor (serializable en JSON).
+
+        Returns:
+            dict con el origen de la referencia, la ventana, las muestras y
+            ventanas vistas, la evaluación de la última ventana cerrada, la
+            de la ventana en curso (si tiene MINIMO_VENTANA muestras), las
+            alertas vigentes y la media y desviación acumuladas por variable
+        """
+        with self._cerrojo:
+            actual = self._evaluar() if self._n >= MINIMO_VENTANA else None
+            total, media, m2 = _combinar(self._total, self._total_media, self._total_m2,
+                                         self._n, self._media, self._m2)
+            return {
+                'origen': self.referencia.origen,
+                'ventana': self.ventana,
+                'muestras': self.muestras,
+                'ventanas': self.ventanas,
+                'ultima': self.ultima,
+                'actual': actual,
+                'alertas': [v['variable'] for v in self.alertas],
+                'acumulado': [
+                    {'variable': v, 'media': media[j], 'desviacion': math.sqrt(m2[j] / total) if total else None}
+                    for j, v in enumerate(self.variables)
+                ]
+            }
+
+
+def _combinar(n_a, media_a, m2_a, n_b, media_b, m2_b):
+    """Combina los momentos de Welford de dos grupos (Chan et al.)."""
+    n = n_a + n_b
+    if n_b == 0:
+        return n_a, list(media_a), list(m2_a)
+    if n_a == 0:
+        return n_b, list(media_b), list(m2_b)
+    media, m2 = [], []
+    for ma, qa, mb, qb in zip(media_a, m2_a, media_b, m2_b):
+        delta = mb - ma
+        media.append(ma + delta * n_b / n)
+        m2.append(qa + qb + delta * delta * n_a * n_b / n)
+    return n, media, m2
+
+
+def monitor_modelo(modelo, variables=None):
+    """
+    Monitor de deriva de un modelo cargado, uno por modelo y proceso.
+
+    Returns:
+        MonitorDeriva, o None si el modelo no trae referencia y no se puede
+        reconstruir (sin muestras por nodo ni tasa de aprendizaje)
+    """
+    try:
+        return _MONITORES[modelo]
+    except KeyError:
+        pass
+    with _CERROJO_MONITORES:
+        if modelo not in _MONITORES:
+            try:
+                _MONITORES[modelo] = MonitorDeriva(referencia_modelo(modelo, variables))
+            except ValueError:
+                _MONITORES[modelo] = None
+        return _MONITORES[modelo]
+
+
+def observar_deriva(modelo, variables, X, predicciones):
+    """
+    Pasa muestras puntuadas al monitor del modelo (si lo tiene).
+
+    Args:
+        modelo: Modelo que las puntuó
+        variables: Orden de columnas de X
+        X: Matriz (filas x variables) o lista de filas
+        predicciones: Octanaje predicho de cada fila
+    """
+    monitor = monitor_modelo(modelo, variables)
+    if monitor is not None:
+        monitor.observar(X, predicciones)
+
+
+def muestras_referencia(referencia, n, rng):
+    """
+    Muestras con la distribución de tramos de la referencia (variables independientes).
+
+    Los tramos son lo único que ven el PSI y el KS: dentro de cada tramo el
+    valor es uniforme, y los tramos extremos se extienden una desviación.
+
+    Returns:
+        ndarray (n x variables de la referencia)
+    """
+    import numpy as np
+
+    columnas = []
+    for bordes, proporciones, varianza in zip(referencia.bordes, referencia.proporciones, referencia.varianza):
+        desviacion = math.sqrt(varianza)
+        extremos = np.array([(bordes[0] if bordes else 0.0) - desviacion, *bordes,
+                             (bordes[-1] if bordes else 0.0) + desviacion])
+        tramo = rng.choice(len(proporciones), size=n, p=np.asarray(proporciones) / sum(proporciones))
+        columnas.append(rng.uniform(extremos[tramo], extremos[tramo + 1]))
+    return np.column_stack(columnas)
+
+
+def medir(repeticiones=20_000, filas_lote=1_000_000, ventanas=40, desplazamiento=3.0):
+    """
+    Mide el coste del monitor y su comportamiento con y sin deriva.
+
+    Returns:
+        dict con microsegundos por observar_muestra(), filas/s de observar(),
+        ventanas con alerta (y alertas) y PSI mediano del octanaje sobre
+        composiciones de la propia referencia con su predicción, y ventana
+        de la primera alerta con AROMATICOS desplazado `desplazamiento` %v/v
+    """
+    import numpy as np
+
+    from octanaje.modelo import modelo_por_defecto
+    from octanaje.motor import como_motor
+
+    modelo, variables = modelo_por_defecto()
+    referencia = referencia_modelo(modelo, variables)
+    motor = como_motor(modelo, variables)
+    rng = np.random.default_rng(0)
+
+    def predichas(Z):
+        # El monitor ve el octanaje predicho, no uno muestreado por separado
+        Z[:, -1] = motor.predict(Z[:, :-1])
+        return Z
+
+    monitor = MonitorDeriva(referencia)
+    filas = muestras_referencia(referencia, repeticiones, rng).tolist()
+    inicio = time.perf_counter()
+    for fila in filas:
+        monitor.observar_muestra(fila[:-1], fila[-1])
+    muestra_us = (time.perf_counter() - inicio) / repeticiones * 1e6
+
+    Z = muestras_referencia(referencia, filas_lote, rng)
+    monitor = MonitorDeriva(referencia)
+    inicio = time.perf_counter()
+    monitor.observar(Z[:, :-1], Z[:, -1])
+    lote_filas_s = filas_lote / (time.perf_counter() - inicio)
+
+    def recorrer(Z):
+        monitor = MonitorDeriva(referencia)
+        con_alerta, alertas, primera, psi = 0, [], None, []
+        for k in range(ventanas):
+            bloque = Z[k * monitor.ventana:(k + 1) * monitor.ventana]
+            monitor.observar(bloque[:, :-1], bloque[:, -1])
+            psi.append(monitor.ultima['variables'][-1]['psi'])
+            if monitor.alertas:
+                con_alerta += 1
+                alertas += [v['variable'] for v in monitor.alertas]
+                primera = k + 1 if primera is None else primera
+        return con_alerta, alertas, primera, float(np.median(psi))
+
+    Z = predichas(muestras_referencia(referencia, ventanas * VENTANA, rng))
+    sin_deriva, alertas_sin_deriva, _, psi_octanaje = recorrer(Z)
+    Z[:, referencia.variables.index('AROMATICOS')] += desplazamiento
+    _, alertas_con_deriva, primera, _ = recorrer(predichas(Z))
+
+    return {
+        'origen': referencia.origen,
+        'muestra_us': muestra_us,
+        'lote_filas_s': lote_filas_s,
+        'ventanas': ventanas,
+        'ventanas_falsa_alerta': sin_deriva,
+        'falsas_alertas': alertas_sin_deriva,
+        'psi_octanaje': psi_octanaje,
+        'desplazamiento': desplazamiento,
+        'primera_alerta': primera,
+        'alertas_deriva': sorted(set(alertas_con_deriva))
+    }
+
+
+def _imprimir_evaluacion(evaluacion):
+    for v in evaluacion['variables']:
+        print(f"  {v['variable']:<13} PSI {v['psi']:6.3f}  KS {v['ks']:5.3f} (crítico {v['ks_critico']:.3f})  "
+              f"media {v['media']:7.2f} (ref. {v['media_referencia']:7.2f})"
+              + ("  ALERTA" if v['alerta'] else ''))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Deriva de las muestras puntuadas frente a las de entrenamiento")
+    parser.add_argument('--modelo', default=None, help="Ruta del modelo (por defecto, el encontrado)")
+    parser.add_argument('--historial', metavar='RUTA', default=None,
+                        help="Reproduce un historial de predicciones por ventanas")
+    parser.add_argument('--ventana', type=int, default=VENTANA, help="Muestras por ventana")
+    parser.add_argument('--medir', action='store_true', help="Medir el coste y las alertas del monitor")
+    argumentos = parser.parse_args(argv)
+
+    if argumentos.medir:
+        r = medir()
+        print(f"referencia          {r['origen']}")
+        print(f"observar_muestra()  {r['muestra_us']:8.1f} µs por muestra")
+        print(f"observar()          {r['lote_filas_s']:,.0f} filas/s")
+        print(f"sin deriva          {r['ventanas_falsa_alerta']} de {r['ventanas']} ventanas con alerta "
+              f"{sorted(set(r['falsas_alertas']))}, PSI mediano de {OCTANAJE} {r['psi_octanaje']:.3f}")
+        print(f"AROMATICOS +{r['desplazamiento']:g}      primera alerta en la ventana {r['primera_alerta']} "
+              f"({', '.join(r['alertas_deriva'])})")
+        return 0
+
+    from octanaje.modelo import cargar_modelo, modelo_por_defecto
+
+    if argumentos.modelo:
+        modelo, variables, _ = cargar_modelo(argumentos.modelo)
+    else:
+        modelo, variables = modelo_por_defecto()
+    try:
+        referencia = referencia_modelo(modelo, variables)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if argumentos.historial is None:
+        print(f"Referencia: {referencia.origen}, {referencia.muestras} muestras")
+        for variable, bordes, media, varianza in zip(referencia.variables, referencia.bordes,
+                                                     referencia.media, referencia.varianza):
+            print(f"  {variable:<13} media {media:7.2f}  desviación {math.sqrt(varianza):5.2f}  "
+                  f"bordes {', '.join(f'{b:.2f}' for b in bordes)}")
+        return 0
+
+    from octanaje.historial import HistorialPredicciones
+
+    monitor = MonitorDeriva(referencia, argumentos.ventana)
+    columnas = [v.lower() for v in variables]
+    for fila in HistorialPredicciones(argumentos.historial).recorrer(ascendente=True):
+        cerradas = monitor.ventanas
+        monitor.observar_muestra([fila[c] for c in columnas], fila['octanaje'])
+        if monitor.ventanas > cerradas:
+            print(f"Ventana {monitor.ventanas} (hasta {fila['fecha_hora']}):")
+            _imprimir_evaluacion(monitor.ultima)
+    estado = monitor.estado()
+    print(f"{estado['muestras']:,} muestras, {estado['ventanas']} ventanas cerradas")
+    if estado['actual'] is not None:
+        print("Ventana en curso:")
+        _imprimir_evaluacion(estado['actual'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
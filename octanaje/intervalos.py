@@ -0,0 +1,252 @@
+"""
+Intervalos de predicción por muestra.
+
+Sustituyen a la banda fija de ±0.5 RON. La semiamplitud de cada fila es
+
+    semiamplitud = escala * factor,  factor = sqrt(soporte) * (1 + extrapolación)
+
+- El factor (factores_intervalo) ensancha el intervalo donde el modelo sabe
+  menos:
+    - El soporte de entrenamiento de la muestra (MotorGB.predecir_con_soporte):
+      las hojas pequeñas tienen medias menos fiables, y la varianza de una
+      media crece como 1/n, por lo que se multiplica por sqrt(soporte relativo)
+    - La extrapolación: por cada componente fuera de RANGOS_TIPICOS, la
+      distancia al rango en unidades de su anchura se suma al factor (los
+      árboles extrapolan en constante)
+- La escala (escala_intervalo) depende de la calibración del modelo
+  (`metadatos['calibracion']`):
+    - Calibrado: si la calibración trae 'residuos', los |y - predicción| /
+      factor de muestras que el modelo no vio (la validación independiente
+      o la validación cruzada anidada de octanaje.entrenamiento), la escala
+      es el de rango ceil((n + 1) * nivel) entre los n: conformal partido
+      normalizado. Si las muestras de calibración y las puntuadas son
+      intercambiables, el intervalo cubre el octanaje real con
+      probabilidad >= nivel.
+    - Sin calibrar: si sólo se conoce el RMSE, la escala es z(nivel) * RMSE.
+      Es una heurística: el nivel no está garantizado. Es el caso del
+      modelo entregado, del que sólo se conoce el RMSE de validación (77
+      muestras, 0.526). Con él la escala es ~0.87 y el factor no baja de
+      ~1.15 (percentil 5; mediana ~1.5) sobre las composiciones de
+      muestras_referencia: la semiamplitud mediana es ~1.3 RON y un límite
+      fiscal cae dentro del intervalo en el ~89 % de ellas. Por eso, sin
+      calibrar, el intervalo sólo se muestra: la zona crítica de
+      clasificar_gasolina sigue siendo la banda de ±0.5 (~62 % de ellas).
+
+El soporte sale de las mismas hojas que la predicción, en el mismo recorrido.
+Medido con `python -m octanaje.intervalos` (1 núcleo, 100.000 filas):
+predicción sola ~320.000 filas/s, con intervalo ~240.000 filas/s (el
+soporte es una lectura más por fila y árbol).
+"""
+
+import functools
+import math
+
+from octanaje.componentes import RANGOS_TIPICOS
+from octanaje.metricas import etapa
+
+# Validación independiente del modelo entregado (ver pestaña Modelo). Sin
+# 'exactitud': con RMSE 0.526 no todas las muestras pueden quedar a ±0.5 RON
+CALIBRACION_POR_DEFECTO = {
+    'rmse': 0.5260,
+    'mae': 0.3774,
+    'r2': 0.8365,
+    'muestras': 77,
+    'origen': 'validación independiente'
+}
+
+# Probabilidad nominal de que el octanaje real quede dentro del intervalo
+NIVEL_POR_DEFECTO = 0.90
+
+
+def calibracion_modelo(modelo):
+    """Calibración guardada en los metadatos del modelo, o la de referencia."""
+    metadatos = getattr(modelo, 'metadatos', None) or {}
+    return metadatos.get('calibracion') or CALIBRACION_POR_DEFECTO
+
+
+def residuos_normalizados(y, predicciones, factores):
+    """
+    Puntuaciones de la calibración conformal: |y - predicción| / factor, ordenadas.
+
+    Args:
+        y: Octanaje medido de las muestras de calibración
+        predicciones: Predicción de un modelo que no las vio
+        factores: Su factor de factores_intervalo
+
+    Returns:
+        Lista de floats en orden creciente (se guarda en
+        calibracion['residuos'])
+    """
+    import numpy as np
+
+    residuos = np.abs(np.asarray(y, dtype=np.float64) - predicciones) / factores
+    return np.sort(residuos).tolist()
+
+
+def escala_intervalo(calibracion, nivel=NIVEL_POR_DEFECTO):
+    """
+    Escala de la semiamplitud para una calibración y un nivel.
+
+    Returns:
+        Tupla (escala, calibrado). calibrado es False si la calibración no
+        trae residuos o son muy pocos para el nivel (n < 1 / (1 - nivel) - 1):
+        entonces la escala es z(nivel) * rmse
+    """
+    residuos = calibracion.get('residuos')
+    if residuos:
+        rango = math.ceil((len(residuos) + 1) * nivel)
+        if rango <= len(residuos):
+            return residuos[rango - 1], True
+    return _cuantil_normal(nivel) * calibracion['rmse'], False
+
+
+def intervalo_calibrado(modelo, nivel=NIVEL_POR_DEFECTO):
+    """True si los intervalos del modelo tienen calibración conformal para `nivel`."""
+    return escala_intervalo(calibracion_modelo(modelo), nivel)[1]
+
+
+@functools.lru_cache(maxsize=None)
+def _rangos(variables):
+    """Mínimos, máximos y anchuras de RANGOS_TIPICOS en el orden de `variables`."""
+    import numpy as np
+
+    # Variables sin rango típico (Ox): rango infinito, nunca extrapolan
+    minimo = np.array([RANGOS_TIPICOS.get(v, (-np.inf, np.inf))[0] for v in variables])
+    maximo = np.array([RANGOS_TIPICOS.get(v, (-np.inf, np.inf))[1] for v in variables])
+    return minimo, maximo, np.where(np.isfinite(maximo - minimo), maximo - minimo, 1.0)
+
+
+@functools.lru_cache(maxsize=None)
+def _cuantil_normal(nivel):
+    from statistics import NormalDist
+    return NormalDist().inv_cdf(0.5 + nivel / 2)
+
+
+def extrapolacion(X, variables):
+    """
+    Distancia de cada fila a los rangos de entrenamiento.
+
+    Args:
+        X: Matriz (filas x variables) en el orden de `variables`
+        variables: Nombres de columna de X
+
+    Returns:
+        ndarray con la suma, sobre los componentes, de la distancia fuera de
+        su rango típico dividida por la anchura del rango (0 dentro de rango)
+    """
+    import numpy as np
+
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    minimo, maximo, anchura = _rangos(tuple(variables))
+    exceso = np.maximum(minimo - X, 0) + np.maximum(X - maximo, 0)
+    return (exceso / anchura).sum(axis=1)
+
+
+def factores_intervalo(modelo, variables, X, por_celdas=False):
+    """
+    Predice y calcula el factor de ensanchamiento de cada fila.
+
+    Args:
+        modelo: MotorGB o modelo sklearn devuelto por cargar_modelo
+        variables: Orden de columnas esperado por el modelo
+        X: Matriz (filas x variables) en ese orden
+        por_celdas: Ver predecir_intervalos
+
+    Returns:
+        Tupla (predicciones, factores): factor = sqrt(soporte) *
+        (1 + extrapolación); sin muestras por nodo, el soporte es 1
+    """
+    import numpy as np
+
+    from octanaje.motor import MotorGB
+    from octanaje.prediccion import predecir_matriz
+
+    if isinstance(modelo, MotorGB) and modelo.muestras is not None:
+        if por_celdas:
+            predicciones, soporte = modelo.predecir_por_celdas(X, soporte=True)
+        else:
+            predicciones, soporte = modelo.predecir_con_soporte(X)
+    else:
+        # Sin muestras por nodo (modelo sklearn de respaldo): sólo la extrapolación
+        predicciones = np.asarray(predecir_matriz(modelo, variables, X), dtype=np.float64)
+        soporte = 1.0
+    return predicciones, np.sqrt(soporte) * (1.0 + extrapolacion(X, variables))
+
+
+def predecir_intervalos(modelo, variables, X, nivel=NIVEL_POR_DEFECTO, por_celdas=False):
+    """
+    Predice el octanaje y su intervalo de predicción para cada fila.
+
+    Args:
+        modelo: MotorGB o modelo sklearn devuelto por cargar_modelo
+        variables: Orden de columnas esperado por el modelo
+        X: Matriz (filas x variables) o DataFrame con esas columnas
+        nivel: Probabilidad de cobertura del intervalo (garantizada sólo si
+            intervalo_calibrado(modelo, nivel))
+        por_celdas: Evaluar una sola vez cada celda de umbrales del MotorGB
+            (MotorGB.predecir_por_celdas); mismo resultado, mucho más rápido
+            en rejillas de puntos próximos
+
+    Returns:
+        Tupla (predicciones, inferior, superior) de ndarrays float64
+    """
+    import numpy as np
+
+    if hasattr(X, 'columns'):
+        X = X[variables].to_numpy(dtype=np.float64)
+
+    with etapa('prediccion'):
+        predicciones, factores = factores_intervalo(modelo, variables, X, por_celdas)
+        escala, _ = escala_intervalo(calibracion_modelo(modelo), nivel)
+        semiamplitud = escala * factores
+    return predicciones, predicciones - semiamplitud, predicciones + semiamplitud
+
+
+def medir(n=100_000, semilla=0):
+    """
+    Compara el rendimiento de la predicción con y sin intervalo.
+
+    Returns:
+        dict con filas/s de ambos caminos, la semiamplitud mediana, la
+        fracción de filas con un límite fiscal dentro del intervalo y si el
+        modelo está calibrado
+    """
+    import time
+
+    import numpy as np
+
+    from octanaje.clasificacion import LIMITES_FISCALES
+    from octanaje.modelo import modelo_por_defecto, muestras_referencia
+
+    motor, variables = modelo_por_defecto()
+    X = muestras_referencia(variables, n=n // 2, semilla=semilla)
+
+    inicio = time.perf_counter()
+    motor.predict(X)
+    tiempo_prediccion = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    _, inferior, superior = predecir_intervalos(motor, variables, X)
+    tiempo_intervalo = time.perf_counter() - inicio
+
+    return {
+        'filas': len(X),
+        'filas_s_prediccion': len(X) / tiempo_prediccion,
+        'filas_s_intervalo': len(X) / tiempo_intervalo,
+        'semiamplitud_mediana': float(np.median(superior - inferior) / 2),
+        'en_limite': float(np.any([(inferior <= limite['valor']) & (limite['valor'] <= superior)
+                                   for limite in LIMITES_FISCALES], axis=0).mean()),
+        'calibrado': intervalo_calibrado(motor)
+    }
+
+
+if __name__ == '__main__':
+    r = medir()
+    print(f"Predicción: {r['filas_s_prediccion']:,.0f} filas/s | "
+          f"Con intervalo: {r['filas_s_intervalo']:,.0f} filas/s "
+          f"({r['filas_s_intervalo'] / r['filas_s_prediccion']:.2f}x)")
+    print(f"Semiamplitud mediana: ±{r['semiamplitud_mediana']:.2f} RON "
+          f"({'calibrada' if r['calibrado'] else 'sin calibrar'}); "
+          f"límite fiscal dentro del intervalo en el {r['en_limite']:.0%} de las filas")
@@ -0,0 +1,531 @@
+"""
+Instrumentación del camino de predicción y exportación en formato Prometheus.
+
+Cada etapa de una predicción se cronometra con `etapa(nombre)` y se acumula
+en un histograma de latencias de buckets fijos, compartido por todo el
+proceso:
+
+    carga_modelo    cargar_modelo
+    entrada         construcción de la matriz o el DataFrame de entrada
+    prediccion      modelo.predict y el intervalo (predecir_intervalos)
+    dominio         comprobación del dominio de aplicabilidad (octanaje.dominio)
+    clasificacion   clasificar_gasolina / clasificar_lote
+    presentacion    dibujo del resultado en la app, JSON en el servicio
+    exportacion     generación de los CSV descargables (en la app, dentro
+                    de presentacion)
+
+Además se cuentan las predicciones por origen y categoría, las advertencias
+de límite fiscal por origen y límite, y la latencia completa por origen.
+
+Exportación, sin dependencias:
+    - GET /metricas del servicio HTTP (octanaje.servicio)
+    - Endpoint propio en un hilo si OCTANAJE_METRICAS_PUERTO está definida
+      (la app Streamlit y la ingesta lo arrancan con iniciar_exportacion)
+    - Archivo .prom reescrito cada 15 s si OCTANAJE_METRICAS_ARCHIVO está
+      definida (textfile collector de node_exporter)
+
+Coste medido con `python -m octanaje.metricas` (1 núcleo): ~1 µs por etapa
+cronometrada y ~0.8 µs por predicción contada; ~5 µs por predicción
+individual, un 3-4% de `octanaje.predecir` sin caché (~150 µs). En el
+servicio son ~4 µs de CPU por petición (de ~65 µs), por debajo del ruido de
+`python -m octanaje.carga --comparar`.
+
+Perfilado opcional: con OCTANAJE_PERFILADO=directorio, cada bloque
+`perfilar(nombre)` (un cálculo de la app, un microlote de la ingesta, una
+petición del servicio) se muestrea cada 5 ms en un hilo aparte y, si dura más
+de OCTANAJE_PERFILADO_UMBRAL_S (1 s por defecto), sus pilas se guardan en
+formato "folded" (flamegraph.pl, speedscope, inferno). Sin la variable,
+`perfilar` no hace nada. Para perfilar el proceso entero desde fuera sigue
+valiendo `py-spy record --pid`.
+"""
+
+import atexit
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+# Variables de entorno de la exportación y del perfilado
+VARIABLE_ENTORNO_PUERTO = 'OCTANAJE_METRICAS_PUERTO'
+VARIABLE_ENTORNO_ARCHIVO = 'OCTANAJE_METRICAS_ARCHIVO'
+VARIABLE_ENTORNO_PERFILADO = 'OCTANAJE_PERFILADO'
+VARIABLE_ENTORNO_UMBRAL = 'OCTANAJE_PERFILADO_UMBRAL_S'
+
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Límites superiores de los buckets de latencia (s): de 50 µs a 10 s
+BUCKETS_SEGUNDOS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+INTERVALO_ARCHIVO_S = 15.0
+INTERVALO_MUESTREO_S = 0.005
+UMBRAL_PERFILADO_S = 1.0
+
+DESCRIPCIONES = {
+    'octanaje_etapa_segundos': ('histogram', "Duración de cada etapa del camino de predicción"),
+    'octanaje_latencia_segundos': ('histogram', "Latencia completa de una predicción por origen"),
+    'octanaje_predicciones_total': ('counter', "Predicciones por origen y categoría fiscal"),
+    'octanaje_advertencias_total': ('counter', "Predicciones con un límite fiscal en el intervalo"),
+    'octanaje_perfiles_total': ('counter', "Perfiles de muestreo guardados por bloque perfilado"),
+    'octanaje_recargas_total': ('counter', "Recargas del modelo por resultado (ok, rechazada, reversion)"),
+    'octanaje_sombra_total': ('counter', "Muestras comparadas con el modelo candidato por origen y resultado"),
+    'octanaje_deriva_alertas_total': ('counter', "Alertas de deriva por variable y estadístico (psi, ks) al cerrar cada ventana"),
+}
+
+
+class Histograma:
+    """
+    Histograma de buckets fijos; `observar` es O(log buckets).
+
+    Sin cerrojo, como los contadores: con el GIL, `lista[i] += 1` no se
+    interrumpe en la práctica, y el cerrojo duplicaría el coste de cada
+    observación. Una pérdida ocasional no falsea una métrica de seguimiento.
+    """
+
+    __slots__ = ('limites', 'cuentas', 'suma')
+
+    def __init__(self, limites=BUCKETS_SEGUNDOS):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+
+    def observar(self, valor):
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+
+    def vaciar(self):
+        self.cuentas = [0] * len(self.cuentas)
+        self.suma = 0.0
+
+
+class _Cronometro:
+    # El reloj arranca al crear el objeto, en la misma sentencia `with`, y
+    # __exit__ repite el cuerpo de Histograma.observar para ahorrar una llamada
+    __slots__ = ('histograma', 'inicio')
+
+    def __init__(self, histograma):
+        self.histograma = histograma
+        self.inicio = _reloj()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        segundos = _reloj() - self.inicio
+        histograma = self.histograma
+        histograma.cuentas[bisect_left(histograma.limites, segundos)] += 1
+        histograma.suma += segundos
+
+
+_reloj = time.perf_counter
+
+
+class RegistroMetricas:
+    """
+    Contadores e histogramas indexados por nombre y etiquetas.
+
+    Las sesiones de Streamlit, el bucle del servicio y sus hilos de
+    predicción comparten el registro METRICAS. La creación de series y la
+    exportación van con cerrojo; las actualizaciones no (ver Histograma).
+    """
+
+    def __init__(self):
+        self._contadores = {}
+        self._histogramas = {}
+        self._cerrojo = threading.Lock()
+
+    def histograma(self, nombre, /, **etiquetas):
+        """Histograma de `nombre` con estas etiquetas (se crea la primera vez)."""
+        clave = (nombre, tuple(etiquetas.items()))
+        histograma = self._histogramas.get(clave)
+        if histograma is None:
+            with self._cerrojo:
+                histograma = self._histogramas.setdefault(clave, Histograma())
+        return histograma
+
+    def observar(self, nombre, valor, /, **etiquetas):
+        self.histograma(nombre, **etiquetas).observar(valor)
+
+    def cronometro(self, nombre, /, **etiquetas):
+        """Context manager que observa en el histograma los segundos del bloque."""
+        return _Cronometro(self.histograma(nombre, **etiquetas))
+
+    def contar(self, nombre, cantidad=1, /, **etiquetas):
+        self.sumar((nombre, tuple(etiquetas.items())), cantidad)
+
+    def sumar(self, clave, cantidad=1):
+        """Suma a un contador dado por su clave (nombre, ((etiqueta, valor), ...))."""
+        contadores = self._contadores
+        if clave in contadores:
+            contadores[clave] += cantidad
+        else:
+            with self._cerrojo:
+                contadores[clave] = contadores.get(clave, 0) + cantidad
+
+    def valor(self, nombre, /, **etiquetas):
+        """Valor de un contador, o número de observaciones de un histograma."""
+        clave = (nombre, tuple(etiquetas.items()))
+        if clave in self._histogramas:
+            return sum(self._histogramas[clave].cuentas)
+        return self._contadores.get(clave, 0)
+
+    def reiniciar(self):
+        """Pone todo a cero (los histogramas se vacían en el sitio)."""
+        with self._cerrojo:
+            self._contadores.clear()
+            histogramas = list(self._histogramas.values())
+        for histograma in histogramas:
+            histograma.vaciar()
+
+    def texto_prometheus(self):
+        """
+        Todas las métricas en el formato de texto de Prometheus (0.0.4).
+
+        Returns:
+            str terminado en salto de línea
+        """
+        with self._cerrojo:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted(self._histogramas.items(), key=lambda e: e[0])
+
+        lineas = []
+        descritos = set()
+
+        def cabecera(nombre, tipo):
+            if nombre not in descritos:
+                descritos.add(nombre)
+                lineas.append(f"# HELP {nombre} {DESCRIPCIONES.get(nombre, (tipo, nombre))[1]}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+
+        for (nombre, etiquetas), valor in contadores:
+            cabecera(nombre, 'counter')
+            lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+
+        for (nombre, etiquetas), histograma in histogramas:
+            cabecera(nombre, 'histogram')
+            cuentas, suma = list(histograma.cuentas), histograma.suma
+            acumulado = 0
+            for limite, cuenta in zip(histograma.limites + (float('inf'),), cuentas):
+                acumulado += cuenta
+                le = '+Inf' if limite == float('inf') else repr(limite)
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', le),))} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {suma!r}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {acumulado}")
+
+        return '\n'.join(lineas) + '\n'
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ''
+    return '{' + ','.join(f'{k}="{_escapar(v)}"' for k, v in etiquetas) + '}'
+
+
+def _escapar(valor):
+    if isinstance(valor, float):
+        valor = f'{valor:g}'
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Registro compartido por todo el proceso
+METRICAS = RegistroMetricas()
+
+
+# Histogramas de METRICAS por etapa y por origen, resueltos una vez
+_HISTOGRAMAS_ETAPA = {}
+_HISTOGRAMAS_LATENCIA = {}
+
+
+def etapa(nombre):
+    """
+    Cronometra un bloque como etapa del camino de predicción.
+
+    Uso:
+        with etapa('prediccion'):
+            modelo.predict(X)
+    """
+    histograma = _HISTOGRAMAS_ETAPA.get(nombre)
+    if histograma is None:
+        histograma = _HISTOGRAMAS_ETAPA[nombre] = METRICAS.histograma('octanaje_etapa_segundos', etapa=nombre)
+    return _Cronometro(histograma)
+
+
+def histograma_latencia(origen):
+    """Histograma de latencia completa de un origen (muestra, servicio, lote, ingesta)."""
+    histograma = _HISTOGRAMAS_LATENCIA.get(origen)
+    if histograma is None:
+        histograma = _HISTOGRAMAS_LATENCIA[origen] = METRICAS.histograma('octanaje_latencia_segundos', origen=origen)
+    return histograma
+
+
+def latencia(origen):
+    """Cronometra una predicción completa como latencia de `origen`."""
+    return _Cronometro(histograma_latencia(origen))
+
+
+def contar_clasificacion(clasificacion, origen):
+    """Cuenta una predicción clasificada con clasificar_gasolina."""
+    METRICAS.sumar(('octanaje_predicciones_total', (('origen', origen), ('categoria', clasificacion['categoria']))))
+    if clasificacion['limite_critico'] is not None:
+        METRICAS.sumar(('octanaje_advertencias_total', (('origen', origen), ('limite', clasificacion['limite_critico']))))
+
+
+def contar_lote(clasificacion, origen):
+    """Cuenta las predicciones de un lote clasificado con clasificar_lote."""
+    import numpy as np
+
+    from octanaje.clasificacion import CATEGORIAS, SIN_CLASIFICAR
+
+    # Índice -1 (fuera del dominio) en la posición 0
+    cuentas = np.bincount(clasificacion['indice_categoria'].astype(np.intp) + 1, minlength=len(CATEGORIAS) + 1)
+    for categoria, n in zip([SIN_CLASIFICAR] + CATEGORIAS, cuentas.tolist()):
+        if n:
+            METRICAS.contar('octanaje_predicciones_total', n, origen=origen, categoria=categoria['categoria'])
+    limites = clasificacion['limite_critico']
+    for limite, n in zip(*np.unique(limites[~np.isnan(limites)], return_counts=True)):
+        METRICAS.contar('octanaje_advertencias_total', int(n), origen=origen, limite=float(limite))
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# EXPORTACIÓN
+# ═══════════════════════════════════════════════════════════════════════════
+
+def escribir_archivo(ruta, registro=METRICAS):
+    """Escribe las métricas en `ruta` de forma atómica (renombrando un temporal)."""
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(registro.texto_prometheus())
+    os.replace(temporal, ruta)
+
+
+def exportar_archivo_periodico(ruta, cada_s=INTERVALO_ARCHIVO_S, registro=METRICAS):
+    """
+    Reescribe el archivo de métricas cada `cada_s` segundos en un hilo demonio
+    y una última vez al salir del proceso.
+    """
+    atexit.register(escribir_archivo, ruta, registro)
+
+    def bucle():
+        while True:
+            try:
+                escribir_archivo(ruta, registro)
+            except OSError:
+                pass
+            time.sleep(cada_s)
+
+    hilo = threading.Thread(target=bucle, name='octanaje-metricas-archivo', daemon=True)
+    hilo.start()
+    return hilo
+
+
+def servidor_metricas(puerto, host='127.0.0.1', registro=METRICAS):
+    """
+    Sirve GET /metricas (y /metrics) en un hilo demonio.
+
+    Returns:
+        ThreadingHTTPServer ya en marcha (server_address tiene el puerto real)
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/metricas', '/metrics'):
+                self.send_error(404)
+                return
+            datos = registro.texto_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', TIPO_CONTENIDO)
+            self.send_header('Content-Length', str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer((host, puerto), Manejador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name='octanaje-metricas-http', daemon=True).start()
+    return servidor
+
+
+_EXPORTACION_INICIADA = False
+
+
+def iniciar_exportacion():
+    """
+    Arranca la exportación configurada en el entorno, una sola vez por proceso.
+
+    OCTANAJE_METRICAS_PUERTO abre el endpoint HTTP; OCTANAJE_METRICAS_ARCHIVO
+    reescribe periódicamente el archivo .prom. Sin ninguna de las dos no hace
+    nada (las métricas se siguen acumulando).
+    """
+    global _EXPORTACION_INICIADA
+    if _EXPORTACION_INICIADA:
+        return
+    _EXPORTACION_INICIADA = True
+    if os.environ.get(VARIABLE_ENTORNO_PUERTO):
+        servidor_metricas(int(os.environ[VARIABLE_ENTORNO_PUERTO]))
+    if os.environ.get(VARIABLE_ENTORNO_ARCHIVO):
+        exportar_archivo_periodico(os.environ[VARIABLE_ENTORNO_ARCHIVO])
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# PERFILADO POR MUESTREO
+# ═══════════════════════════════════════════════════════════════════════════
+
+class PerfilMuestreo:
+    """
+    Perfilador por muestreo de las pilas de todos los hilos del proceso.
+
+    Un hilo aparte toma sys._current_frames() cada `intervalo` segundos y
+    acumula cada pila en formato "folded" (hilo;modulo:funcion;... cuenta).
+    Al salir del bloque, si duró al menos `umbral` segundos, las pilas se
+    guardan en `directorio/<nombre>_<fecha>_<ms>ms.folded`.
+    """
+
+    def __init__(self, nombre, directorio, umbral=UMBRAL_PERFILADO_S, intervalo=INTERVALO_MUESTREO_S):
+        self.nombre = nombre
+        self.directorio = directorio
+        self.umbral = umbral
+        self.intervalo = intervalo
+        self.pilas = {}
+        self.ruta = None
+        self._fin = threading.Event()
+        self._hilo = None
+
+    def _muestrear(self):
+        propio = threading.get_ident()
+        nombres = {}
+        while not self._fin.wait(self.intervalo):
+            for ident, marco in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                if ident not in nombres:
+                    nombres[ident] = next((h.name for h in threading.enumerate() if h.ident == ident), str(ident))
+                pila = []
+                while marco is not None:
+                    codigo = marco.f_code
+                    pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+                    marco = marco.f_back
+                pila.append(nombres[ident])
+                clave = ';'.join(reversed(pila))
+                self.pilas[clave] = self.pilas.get(clave, 0) + 1
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        self._hilo = threading.Thread(target=self._muestrear, name='octanaje-perfil', daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._fin.set()
+        self._hilo.join()
+        duracion = time.perf_counter() - self.inicio
+        if duracion >= self.umbral and self.pilas:
+            os.makedirs(self.directorio, exist_ok=True)
+            fecha = time.strftime('%Y%m%d_%H%M%S')
+            self.ruta = os.path.join(self.directorio, f"{self.nombre}_{fecha}_{duracion * 1e3:.0f}ms.folded")
+            with open(self.ruta, 'w', encoding='utf-8') as f:
+                f.writelines(f"{pila} {n}\n" for pila, n in sorted(self.pilas.items()))
+            METRICAS.contar('octanaje_perfiles_total', bloque=self.nombre)
+
+
+@functools.lru_cache(maxsize=None)
+def configuracion_perfilado():
+    """(directorio, umbral) del perfilado según el entorno, leído una vez por proceso."""
+    return (os.environ.get(VARIABLE_ENTORNO_PERFILADO) or None,
+            float(os.environ.get(VARIABLE_ENTORNO_UMBRAL, UMBRAL_PERFILADO_S)))
+
+
+def perfilar(nombre):
+    """
+    Perfila el bloque por muestreo si OCTANAJE_PERFILADO está definida.
+
+    Sin la variable devuelve un context manager vacío.
+    """
+    directorio, umbral = configuracion_perfilado()
+    if directorio is None:
+        return _SIN_PERFIL
+    return PerfilMuestreo(nombre, directorio, umbral)
+
+
+_SIN_PERFIL = nullcontext()
+
+
+def medir(n=200_000, repeticiones=2000):
+    """
+    Mide el coste de la instrumentación frente al de una predicción individual.
+
+    Returns:
+        dict con microsegundos por etapa cronometrada, por predicción contada,
+        por predicción con octanaje.predecir sin caché y su parte de
+        instrumentación (4 cronómetros y un conteo), y milisegundos de la
+        exportación en texto
+    """
+    # Importadas del paquete: con `python -m` este módulo es __main__ y
+    # tendría su propio registro
+    from octanaje.clasificacion import clasificar_gasolina
+    from octanaje.componentes import EJEMPLO
+    from octanaje.metricas import METRICAS, contar_clasificacion, etapa
+    from octanaje.prediccion import predecir
+
+    inicio = time.perf_counter()
+    for _ in range(n):
+        with etapa('prediccion'):
+            pass
+    etapa_us = (time.perf_counter() - inicio) / n * 1e6
+
+    clasificacion = clasificar_gasolina(96.2, (95.8, 96.6))
+    inicio = time.perf_counter()
+    for _ in range(n):
+        contar_clasificacion(clasificacion, 'muestra')
+    conteo_us = (time.perf_counter() - inicio) / n * 1e6
+    METRICAS.reiniciar()
+
+    predecir(EJEMPLO, cache=None)
+    inicio = time.perf_counter()
+    for i in range(repeticiones):
+        predecir({**EJEMPLO, 'PARAFINAS': 5 + i * 1e-3}, cache=None)
+    prediccion_us = (time.perf_counter() - inicio) / repeticiones * 1e6
+
+    inicio = time.perf_counter()
+    texto = METRICAS.texto_prometheus()
+    exportacion_ms = (time.perf_counter() - inicio) * 1e3
+
+    instrumentacion_us = 4 * etapa_us + conteo_us
+    return {
+        'etapa_us': etapa_us,
+        'conteo_us': conteo_us,
+        'prediccion_us': prediccion_us,
+        'instrumentacion_us': instrumentacion_us,
+        'fraccion': instrumentacion_us / prediccion_us,
+        'exportacion_ms': exportacion_ms,
+        'lineas_exportadas': texto.count('\n'),
+        'texto': texto
+    }
+
+
+def main(argv=None):
+    # argparse (~3 ms) no se importa arriba: este módulo lo importa octanaje.prediccion
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mide el coste de la instrumentación del camino de predicción")
+    parser.add_argument('--texto', action='store_true', help="Mostrar después las métricas en formato Prometheus")
+    argumentos = parser.parse_args(argv)
+
+    r = medir()
+    print(f"Etapa cronometrada:  {r['etapa_us']:.2f} µs")
+    print(f"Predicción contada:  {r['conteo_us']:.2f} µs")
+    print(f"Predicción individual (predecir, sin caché): {r['prediccion_us']:.0f} µs, "
+          f"de ellos {r['instrumentacion_us']:.1f} µs de instrumentación ({r['fraccion']:.1%})")
+    print(f"Exportación: {r['exportacion_ms']:.2f} ms, {r['lineas_exportadas']} líneas")
+    if argumentos.texto:
+        sys.stdout.write(r['texto'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,670 @@
+"""
+Optimización de mezclas: la combinación más barata de corrientes que alcanza una categoría fiscal.
+
+Dadas las corrientes disponibles (composición, coste por m³ y volúmenes
+mínimo y máximo), busca los volúmenes de coste mínimo para un volumen total
+cuyo intervalo de predicción (octanaje.intervalos) cae entero en la
+categoría pedida, a `margen` RON de sus límites (por defecto 0), y dentro
+del dominio del modelo (octanaje.dominio). Con intervalos calibrados es la
+misma condición con la que clasificar_gasolina marca la zona crítica; sin
+calibrar, la zona crítica es la banda de ±TOLERANCIA y la mezcla tiene que
+dejar fuera también esa banda. La mezcla devuelta nunca tiene
+limite_critico.
+
+    >>> from octanaje.mezclas import CORRIENTES_EJEMPLO, optimizar_mezcla
+    >>> mezcla = optimizar_mezcla(CORRIENTES_EJEMPLO, '95', volumen=1000)
+
+Si ninguna mezcla cumple, lanza MezclaImposible con la más próxima de las
+evaluadas: su predicción y cuánto se sale su intervalo de la categoría.
+
+La composición de la mezcla es lineal en los volúmenes, y los árboles sólo
+comparan x <= umbral: entre umbrales consecutivos de cada variable la
+predicción es constante. Cada celda de umbrales (MotorGB.celdas) es una caja
+en el espacio de composiciones, es decir, un poliedro en el de volúmenes, y
+dentro de ella la mezcla más barata es un programa lineal. La búsqueda:
+    1. Muestrea mezclas factibles (combinaciones de vértices del poliedro de
+       volúmenes) y las predice con su intervalo todas de una vez, una
+       predicción por celda (MotorGB.predecir_por_celdas)
+    2. Resuelve el programa lineal de las celdas más baratas que cumplen
+    3. Desde cada óptimo, pasa a las celdas vecinas a través de las caras
+       que lo limitan si su octanaje y su soporte (constantes en la celda)
+       dejan sitio al intervalo, y resuelve su programa lineal, de la más
+       barata a la más cara, hasta agotar MAXIMO_PROGRAMAS. La
+       extrapolación sí cambia dentro de la celda: si ensancha demasiado el
+       intervalo del óptimo, se vuelve a resolver dentro de RANGOS_TIPICOS
+    4. Comprueba las candidatas con predecir_intervalos, dominio y
+       clasificar_gasolina y devuelve la más barata
+
+Los programas lineales se resuelven con scipy.optimize.linprog (HiGHS);
+SciPy se instala con scikit-learn.
+
+Medido con `python -m octanaje.mezclas --medir` (12 corrientes de
+CORRIENTES_EJEMPLO, 1 núcleo):
+    - GASOLINA 95 OCTANOS: ~2 s, 627.72 €/m³, intervalo [95.04, 96.84]
+      (400 programas lineales de ~3 ms y 60.000 muestras)
+    - GASOLINA 98 OCTANOS: ninguna mezcla (~1.5 s hasta MezclaImposible).
+      La más próxima predice ~98.8 RON, y con la semiamplitud sin calibrar
+      del modelo entregado (~1.2) su intervalo se sale ~0.45 RON por debajo
+      de 98
+    - Búsqueda aleatoria con una predicción e intervalo por mezcla, en el
+      mismo tiempo: ~16.000 mezclas, y la mejor cuesta un 4 % más (95)
+    - Un MILP exacto del ensemble (scipy.optimize.milp, 729 variables
+      binarias) no termina en 60 s para GASOLINA 95 OCTANOS, y su mejor
+      solución entonces cuesta un 1 % menos
+"""
+
+import collections
+import heapq
+import math
+import sys
+import time
+
+from octanaje.clasificacion import CATEGORIAS, LIMITES_FISCALES, TOLERANCIA
+from octanaje.componentes import COMPONENTES, OXIGENADOS, RANGOS_TIPICOS
+
+# Corriente disponible para la mezcla: composición en %v/v de los 8
+# componentes, coste por m³ y volúmenes mínimo y máximo (m³)
+Corriente = collections.namedtuple('Corriente', ['nombre', 'composicion', 'coste', 'minimo', 'maximo'],
+                                   defaults=(0.0, math.inf))
+
+# Corrientes típicas de una refinería (composiciones aproximadas, costes en €/m³)
+CORRIENTES_EJEMPLO = [
+    Corriente('Reformado', {'PARAFINAS': 8.0, 'ISOPARAFINAS': 12.0, 'OLEFINAS': 1.0, 'NAFTENICOS': 3.0,
+                            'AROMATICOS': 76.0, 'ETANOL': 0.0, 'MTBE': 0.0, 'ETBE': 0.0}, 720.0, 0.0, 450.0),
+    Corriente('Nafta FCC ligera', {'PARAFINAS': 5.0, 'ISOPARAFINAS': 30.0, 'OLEFINAS': 40.0, 'NAFTENICOS': 8.0,
+                                   'AROMATICOS': 17.0, 'ETANOL': 0.0, 'MTBE': 0.0, 'ETBE': 0.0}, 640.0, 0.0, 300.0),
+    Corriente('Nafta FCC pesada', {'PARAFINAS': 4.0, 'ISOPARAFINAS': 18.0, 'OLEFINAS': 15.0, 'NAFTENICOS': 10.0,
+                                   'AROMATICOS': 53.0, 'ETANOL': 0.0, 'MTBE': 0.0, 'ETBE': 0.0}, 620.0, 0.0, 300.0),
+    Corriente('Isomerizado', {'PARAFINAS': 12.0, 'ISOPARAFINAS': 82.0, 'OLEFINAS': 0.0, 'NAFTENICOS': 6.0,
+                              'AROMATICOS': 0.0, 'ETANOL': 0.0, 'MTBE': 0.0, 'ETBE': 0.0}, 700.0, 0.0, 250.0),
+    Corriente('Alquilato', {'PARAFINAS': 3.0, 'ISOPARAFINAS': 95.0, 'OLEFINAS': 0.5, 'NAFTENICOS': 1.0,
+                            'AROMATICOS': 0.5, 'ETANOL': 0.0, 'MTBE': 0.0, 'ETBE': 0.0}, 780.0, 0.0, 250.0),
+    Corriente('Nafta ligera de destilación', {'PARAFINAS': 45.0, 'ISOPARAFINAS': 35.0, 'OLEFINAS': 0.5,
+                                              'NAFTENICOS': 15.0, 'AROMATICOS': 4.5, 'ETANOL': 0.0, 'MTBE': 0.0,
+                                              'ETBE': 0.0}, 560.0, 0.0, 200.0),
+    Corriente('Nafta hidrotratada', {'PARAFINAS': 30.0, 'ISOPARAFINAS': 25.0, 'OLEFINAS': 0.5, 'NAFTENICOS': 30.0,
+                                     'AROMATICOS': 14.5, 'ETANOL': 0.0, 'MTBE': 0.0, 'ETBE': 0.0}, 580.0, 0.0, 200.0),
+    Corriente('Nafta de coquización', {'PARAFINAS': 25.0, 'ISOPARAFINAS': 20.0, 'OLEFINAS': 30.0, 'NAFTENICOS': 15.0,
+                                       'AROMATICOS': 10.0, 'ETANOL': 0.0, 'MTBE': 0.0, 'ETBE': 0.0}, 540.0, 0.0, 150.0),
+    Corriente('Gasolina de pirólisis', {'PARAFINAS': 2.0, 'ISOPARAFINAS': 5.0, 'OLEFINAS': 3.0, 'NAFTENICOS': 5.0,
+                                        'AROMATICOS': 85.0, 'ETANOL': 0.0, 'MTBE': 0.0, 'ETBE': 0.0}, 600.0, 0.0, 150.0),
+    Corriente('Etanol', {'PARAFINAS': 0.0, 'ISOPARAFINAS': 0.0, 'OLEFINAS': 0.0, 'NAFTENICOS': 0.0,
+                         'AROMATICOS': 0.0, 'ETANOL': 100.0, 'MTBE': 0.0, 'ETBE': 0.0}, 900.0, 0.0, 50.0),
+    Corriente('MTBE', {'PARAFINAS': 0.0, 'ISOPARAFINAS': 0.0, 'OLEFINAS': 0.0, 'NAFTENICOS': 0.0,
+                       'AROMATICOS': 0.0, 'ETANOL': 0.0, 'MTBE': 100.0, 'ETBE': 0.0}, 850.0, 0.0, 150.0),
+    Corriente('ETBE', {'PARAFINAS': 0.0, 'ISOPARAFINAS': 0.0, 'OLEFINAS': 0.0, 'NAFTENICOS': 0.0,
+                       'AROMATICOS': 0.0, 'ETANOL': 0.0, 'MTBE': 0.0, 'ETBE': 100.0}, 880.0, 0.0, 80.0),
+]
+
+# Distancia (RON) del intervalo de predicción a los límites de la categoría.
+# El intervalo ya recoge la incertidumbre de la predicción
+MARGEN_POR_DEFECTO = 0.0
+
+# Mezclas aleatorias de la primera fase
+MUESTRAS_MEZCLA = 20_000
+
+# Vértices del poliedro de volúmenes de los que se combinan las muestras
+VERTICES_MEZCLA = 64
+
+# Rondas de muestreo: tras la primera, las muestras nuevas combinan las
+# MUESTRAS_ELITE más cercanas a la categoría (y más baratas) entre sí y con vértices
+RONDAS_MUESTREO = 3
+MUESTRAS_ELITE = 500
+
+# Celdas con muestras que cumplen desde las que empieza la búsqueda
+CELDAS_INICIALES = 40
+
+# Programas lineales máximos por optimización
+MAXIMO_PROGRAMAS = 400
+
+# Planos tangentes al elipsoide del dominio por programa lineal y fracción de
+# su radio en la que se apoyan
+CORTES_MAXIMOS = 20
+HOLGURA_DISTANCIA = 1e-3
+
+# Distancia (%v/v) que se deja a los umbrales de la celda: el programa lineal
+# acaba en una cara y los árboles comparan en float32
+HOLGURA_UMBRAL = 1e-4
+
+
+class MezclaImposible(ValueError):
+    """
+    Ninguna mezcla de las corrientes alcanza la categoría.
+
+    Attributes:
+        categoria: Nombre completo de la categoría pedida
+        octanaje: Predicción de la mezcla evaluada más próxima (None si
+            ninguna queda dentro del dominio del modelo)
+        intervalo: Su intervalo de predicción (inferior, superior), o None
+        falta: RON que le faltan a su intervalo (o a la banda de
+            ±TOLERANCIA, sin calibrar) para quedar dentro de la categoría a
+            `margen` RON de sus límites
+        margen: Margen pedido
+    """
+
+    def __init__(self, categoria, octanaje=None, intervalo=None, falta=None, margen=MARGEN_POR_DEFECTO):
+        self.categoria = categoria
+        self.octanaje = octanaje
+        self.intervalo = intervalo
+        self.falta = falta
+        self.margen = margen
+        if octanaje is None:
+            mensaje = "Ninguna mezcla de estas corrientes queda dentro del dominio del modelo"
+        else:
+            mensaje = (
+                f"Ninguna mezcla de estas corrientes alcanza {categoria} sin zona crítica"
+                f"{f' (margen {margen:g} RON)' if margen else ''}: la más próxima predice {octanaje:.2f} RON "
+                f"y su intervalo [{intervalo[0]:.2f}, {intervalo[1]:.2f}] se sale {falta:.2f} RON de la categoría"
+            )
+        super().__init__(mensaje)
+
+
+def indice_objetivo(categoria):
+    """
+    Posición en CATEGORIAS de una categoría pedida.
+
+    Args:
+        categoria: Posición, nombre completo ('GASOLINA 98 OCTANOS') o corto
+            ('<95', '95', '98')
+
+    Raises:
+        ValueError: Si no corresponde a ninguna categoría
+    """
+    if isinstance(categoria, int) and 0 <= categoria < len(CATEGORIAS):
+        return categoria
+    texto = str(categoria).strip().upper()
+    for i, c in enumerate(CATEGORIAS):
+        if texto in (c['categoria'], c['categoria'].replace('GASOLINA ', '').replace(' OCTANOS', '')):
+            return i
+    raise ValueError(f"Categoría desconocida: {categoria}")
+
+
+def banda_objetivo(indice, margen=MARGEN_POR_DEFECTO):
+    """
+    Banda (mínimo, máximo) de una categoría con `margen` RON a sus límites.
+
+    El intervalo de predicción de la mezcla tiene que quedar estrictamente
+    dentro: un límite en el borde del intervalo ya es zona crítica.
+    """
+    inferior = LIMITES_FISCALES[indice - 1]['valor'] + margen if indice > 0 else -math.inf
+    superior = LIMITES_FISCALES[indice]['valor'] - margen if indice < len(LIMITES_FISCALES) else math.inf
+    return inferior, superior
+
+
+class _Problema:
+    """Poliedro de fracciones de volumen y matriz fracciones -> composición de la mezcla."""
+
+    def __init__(self, corrientes, volumen, variables, dominio):
+        import numpy as np
+
+        self.corrientes = list(corrientes)
+        self.volumen = float(volumen)
+        self.variables = variables
+        composiciones = []
+        for corriente in self.corrientes:
+            faltan = [c for c in COMPONENTES if c not in corriente.composicion]
+            if faltan:
+                raise ValueError(f"{corriente.nombre}: faltan componentes {', '.join(faltan)}")
+            fila = {c: float(corriente.composicion[c]) for c in COMPONENTES}
+            fila['Ox'] = sum(fila[c] for c in OXIGENADOS)
+            composiciones.append([fila[v] for v in variables])
+        # composicion de la mezcla = fracciones @ matriz
+        self.matriz = np.array(composiciones)
+        self.coste = np.array([c.coste for c in self.corrientes], dtype=np.float64)
+        self.limites = [(c.minimo / self.volumen, min(c.maximo, self.volumen) / self.volumen) for c in self.corrientes]
+        if sum(a for a, _ in self.limites) > 1 + 1e-9 or sum(b for _, b in self.limites) < 1 - 1e-9:
+            raise ValueError(
+                f"Los volúmenes mínimos y máximos de las corrientes no permiten un total de {self.volumen:g} m³")
+        self.dominio = dominio
+        # Rangos del dominio, con la misma holgura que los umbrales
+        self.minimo = dominio.minimo + HOLGURA_UMBRAL
+        self.maximo = dominio.maximo - HOLGURA_UMBRAL
+        # Fracciones -> coordenadas blanqueadas del dominio: z = fracciones @ blanqueo - centro
+        self.blanqueo = self.matriz[:, dominio.columnas] @ dominio.blanqueo
+        self.centro = dominio.media @ dominio.blanqueo
+        self.cortes = np.empty((0, len(self.coste)))
+        self.cotas_cortes = np.empty(0)
+        self.programas = 0
+
+    def resolver(self, minimo, maximo, coste=None, distancia=True):
+        """
+        Fracciones de coste mínimo con la composición en [minimo, maximo] y a
+        distancia de Mahalanobis admitida por el dominio.
+
+        La distancia no es lineal: cada óptimo que se pasa añade un plano
+        tangente al elipsoide del dominio (válido para cualquier celda, así
+        que se conserva entre llamadas) y se vuelve a resolver.
+
+        Args:
+            minimo, maximo: Composición admitida (arrays por variable)
+            coste: Coste por corriente (por defecto, el de las corrientes)
+            distancia: Exigir la distancia del dominio
+
+        Returns:
+            ndarray de fracciones, o None si no hay mezcla factible
+        """
+        import numpy as np
+        from scipy.optimize import linprog
+
+        acotadas = np.flatnonzero(np.isfinite(minimo) | np.isfinite(maximo))
+        A = np.concatenate([self.matriz[:, acotadas].T, -self.matriz[:, acotadas].T])
+        b = np.concatenate([maximo[acotadas], -minimo[acotadas]])
+        finitas = np.isfinite(b)
+        A, b = A[finitas], b[finitas]
+        radio = self.dominio.umbral * (1 - HOLGURA_DISTANCIA)
+        for _ in range(CORTES_MAXIMOS):
+            self.programas += 1
+            resultado = linprog(self.coste if coste is None else coste,
+                                A_ub=np.concatenate([A, self.cortes]), b_ub=np.concatenate([b, self.cotas_cortes]),
+                                A_eq=np.ones((1, len(self.coste))), b_eq=[1.0], bounds=self.limites, method='highs')
+            if resultado.status != 0:
+                return None
+            if not distancia:
+                return resultado.x
+            z = resultado.x @ self.blanqueo - self.centro
+            distancia = float(np.sqrt(z @ z))
+            if distancia <= self.dominio.umbral:
+                return resultado.x
+            # Plano tangente en la proyección radial: (z / |z|) · z <= radio
+            direccion = z / distancia
+            self.cortes = np.vstack([self.cortes, self.blanqueo @ direccion])
+            self.cotas_cortes = np.append(self.cotas_cortes, radio + self.centro @ direccion)
+        return None
+
+    def vertices(self, rng):
+        """
+        Puntos extremos de las mezclas dentro del dominio.
+
+        Son los vértices del poliedro con los rangos del dominio (el más
+        barato, los extremos de cada variable y los de costes aleatorios),
+        acercados en línea recta a la mezcla más barata del dominio hasta
+        quedar dentro del elipsoide: sus combinaciones también quedan dentro.
+        """
+        import numpy as np
+
+        centro = self.resolver(self.minimo, self.maximo)
+        if centro is None:
+            return np.empty((0, len(self.coste)))
+        costes = [self.coste, *self.matriz.T, *-self.matriz.T]
+        costes += list(rng.normal(size=(max(VERTICES_MEZCLA - len(costes), 0), len(self.coste))))
+        vertices = np.array([v for v in (self.resolver(self.minimo, self.maximo, coste, distancia=False)
+                                         for coste in costes) if v is not None])
+
+        # Mayor t en [0, 1] con |a + t d| <= radio, a = z(centro), d = z(vértice) - a
+        radio = self.dominio.umbral * (1 - HOLGURA_DISTANCIA)
+        a = centro @ self.blanqueo - self.centro
+        d = vertices @ self.blanqueo - self.centro - a
+        dd, ad, aa = (d * d).sum(axis=1), d @ a, a @ a
+        t = (-ad + np.sqrt(np.maximum(ad * ad - dd * (aa - radio * radio), 0.0))) / np.maximum(dd, 1e-300)
+        t = np.clip(t, 0.0, 1.0)[:, None]
+        return np.vstack([centro, centro + t * (vertices - centro)])
+
+
+def optimizar_mezcla(corrientes, categoria, volumen=1000.0, margen=MARGEN_POR_DEFECTO, modelo=None,
+                     variables=None, maximo_programas=MAXIMO_PROGRAMAS, semilla=0):
+    """
+    Mezcla más barata cuyo intervalo de predicción cae entero en una categoría fiscal.
+
+    Args:
+        corrientes: Lista de Corriente
+        categoria: Categoría pedida (ver indice_objetivo)
+        volumen: Volumen total de la mezcla (m³, mismas unidades que los
+            mínimos y máximos de las corrientes)
+        margen: Distancia mínima (RON) del intervalo de predicción a los
+            límites fiscales de la categoría
+        modelo, variables: Modelo a usar (por defecto, el del proceso)
+        maximo_programas: Programas lineales máximos de la búsqueda
+        semilla: Semilla del muestreo inicial
+
+    Returns:
+        dict con 'volumenes' y 'fracciones' ({corriente: valor}), 'coste'
+        (total), 'coste_unitario' (por m³), 'composicion' (8 componentes y
+        Ox), 'octanaje', 'intervalo', 'clasificacion' (clasificar_gasolina),
+        'celdas', 'programas' y 'segundos'
+
+    Raises:
+        MezclaImposible: Si ninguna mezcla cumple (con la más próxima de
+            las evaluadas)
+        ValueError: Si la categoría es desconocida, falta algún componente o
+            los volúmenes no permiten el total
+    """
+    import numpy as np
+
+    from octanaje.clasificacion import clasificar_gasolina
+    from octanaje.dominio import dominio_modelo
+    from octanaje.intervalos import calibracion_modelo, escala_intervalo, factores_intervalo, predecir_intervalos
+    from octanaje.metricas import etapa
+    from octanaje.modelo import modelo_por_defecto
+    from octanaje.motor import como_motor
+
+    inicio = time.perf_counter()
+    if modelo is None:
+        modelo, variables = modelo_por_defecto()
+    indice = indice_objetivo(categoria)
+    inferior, superior = banda_objetivo(indice, margen)
+    motor = como_motor(modelo, variables)
+    dominio = dominio_modelo(modelo, variables)
+    problema = _Problema(corrientes, volumen, variables, dominio)
+    umbrales = motor.umbrales
+    escala, calibrado = escala_intervalo(calibracion_modelo(modelo))
+    # Sin calibrar, clasificar_gasolina marca la zona crítica con la banda de ±TOLERANCIA
+    minima = 0.0 if calibrado else TOLERANCIA
+    # Rangos típicos en el orden del modelo (Ox no tiene): dentro, la extrapolación es 0
+    tipico_minimo = np.array([RANGOS_TIPICOS.get(v, (-np.inf, np.inf))[0] for v in variables])
+    tipico_maximo = np.array([RANGOS_TIPICOS.get(v, (-np.inf, np.inf))[1] for v in variables])
+
+    def caja(codigos, tipica=False):
+        """Composiciones (mínimo, máximo) de una celda, recortadas al dominio (y a los rangos típicos)."""
+        minimo, maximo = problema.minimo.copy(), problema.maximo.copy()
+        if tipica:
+            minimo, maximo = np.maximum(minimo, tipico_minimo), np.minimum(maximo, tipico_maximo)
+        for j, (u, k) in enumerate(zip(umbrales, codigos)):
+            if k > 0:
+                minimo[j] = max(minimo[j], u[k - 1] + HOLGURA_UMBRAL)
+            if k < len(u):
+                maximo[j] = min(maximo[j], u[k] - HOLGURA_UMBRAL)
+        return minimo, maximo
+
+    def representante(codigos):
+        """Un punto cualquiera de la celda: todos dan la misma predicción."""
+        punto = []
+        for u, k in zip(umbrales, codigos):
+            if not len(u):
+                punto.append(0.0)
+            elif k == 0:
+                punto.append(u[0] - 1.0)
+            elif k == len(u):
+                punto.append(u[-1] + 1.0)
+            else:
+                punto.append((u[k - 1] + u[k]) / 2)
+        return punto
+
+    def violacion(octanajes, semiamplitudes):
+        """RON que le faltan al intervalo (y a la banda, sin calibrar) para quedar dentro de la categoría (0 si cabe)."""
+        semiamplitudes = np.maximum(semiamplitudes, minima)
+        return np.maximum(np.maximum(inferior - (octanajes - semiamplitudes),
+                                     (octanajes + semiamplitudes) - superior), 0.0)
+
+    def cumple(octanajes, semiamplitudes):
+        # Estricto: un límite en el borde del intervalo es zona crítica (limite_en_intervalo)
+        semiamplitudes = np.maximum(semiamplitudes, minima)
+        return (octanajes - semiamplitudes > inferior) & (octanajes + semiamplitudes < superior)
+
+    def semiamplitudes(X):
+        """Predicción y semiamplitud exactas de cada fila (las de predecir_intervalos)."""
+        octanajes, factores = factores_intervalo(motor, variables, X, por_celdas=True)
+        return octanajes, escala * factores
+
+    def imposible(falta, octanajes, semiamplitudes):
+        """MezclaImposible con la mezcla evaluada más próxima a la categoría."""
+        nombre = CATEGORIAS[indice]['categoria']
+        i = int(np.argmin(falta)) if len(falta) else None
+        if i is None or not np.isfinite(falta[i]):
+            return MezclaImposible(nombre, margen=margen)
+        octanaje, semiamplitud = float(octanajes[i]), float(semiamplitudes[i])
+        return MezclaImposible(nombre, octanaje, (octanaje - semiamplitud, octanaje + semiamplitud),
+                               float(falta[i]), margen)
+
+    with etapa('optimizacion'):
+        # 1. Muestras factibles, una predicción por celda
+        rng = np.random.default_rng(semilla)
+        vertices = problema.vertices(rng)
+        if not len(vertices):
+            raise imposible(np.empty(0), None, None)
+        # Pocos vértices por combinación: muestras repartidas por el poliedro, no sólo en su centro
+        fracciones = rng.dirichlet(np.full(len(vertices), 0.1), size=MUESTRAS_MEZCLA) @ vertices
+        rondas = []
+        for ronda in range(RONDAS_MUESTREO):
+            X = fracciones @ problema.matriz
+            # RON que faltan para que el intervalo entre en la banda; fuera del dominio no vale ninguna
+            predichas, semiamplitud = semiamplitudes(X)
+            falta = violacion(predichas, semiamplitud)
+            falta[dominio.evaluar(X)[0]] = np.inf
+            costes = fracciones @ problema.coste
+            rondas.append((fracciones, falta, costes, predichas, semiamplitud))
+            if ronda + 1 < RONDAS_MUESTREO:
+                elite = fracciones[np.lexsort((costes, falta))[:MUESTRAS_ELITE]]
+                n = MUESTRAS_MEZCLA
+                destinos = np.concatenate([elite[rng.integers(len(elite), size=n // 2)],
+                                           vertices[rng.integers(len(vertices), size=n - n // 2)]])
+                paso = rng.uniform(0.0, 0.5, size=(n, 1))
+                fracciones = (1 - paso) * elite[rng.integers(len(elite), size=n)] + paso * destinos
+        fracciones, falta, costes, predichas, semiamplitud = (np.concatenate(partes) for partes in zip(*rondas))
+        validas = np.flatnonzero(falta == 0)
+        validas = validas[np.argsort(costes[validas], kind='stable')]
+        codigos = motor.celdas((fracciones[validas] @ problema.matriz).astype(np.float32))
+
+        # 2. Celdas más baratas entre las que cumplen
+        vistas, frontera, candidatas = set(), [], []
+        for fila in codigos:
+            clave = tuple(fila.tolist())
+            if clave not in vistas:
+                vistas.add(clave)
+                frontera.append(clave)
+                if len(frontera) == CELDAS_INICIALES:
+                    break
+
+        def explorar(claves):
+            for clave in claves:
+                if problema.programas >= maximo_programas:
+                    return
+                solucion = problema.resolver(*caja(clave))
+                if solucion is not None and not cumple(*semiamplitudes(solucion @ problema.matriz))[0]:
+                    # La extrapolación ensancha el intervalo: sin ella (rangos típicos) puede caber
+                    tipica = problema.resolver(*caja(clave, tipica=True))
+                    solucion = solucion if tipica is None else tipica
+                if solucion is not None:
+                    heapq.heappush(cola, (float(solucion @ problema.coste), clave, solucion))
+
+        cola = []
+        explorar(frontera)
+
+        # 3. De la celda más barata a sus vecinas a través de las caras activas
+        while cola and problema.programas < maximo_programas:
+            coste, clave, solucion = heapq.heappop(cola)
+            candidatas.append(solucion)
+            x = solucion @ problema.matriz
+            minimo, maximo = caja(clave)
+            vecinas = []
+            for j, (u, k) in enumerate(zip(umbrales, clave)):
+                if k > 0 and x[j] <= minimo[j] + 2 * HOLGURA_UMBRAL and minimo[j] > problema.minimo[j]:
+                    vecinas.append(clave[:j] + (k - 1,) + clave[j + 1:])
+                if k < len(u) and x[j] >= maximo[j] - 2 * HOLGURA_UMBRAL and maximo[j] < problema.maximo[j]:
+                    vecinas.append(clave[:j] + (k + 1,) + clave[j + 1:])
+            vecinas = [v for v in vecinas if v not in vistas]
+            if vecinas:
+                vistas.update(vecinas)
+                # Octanaje y soporte son los de la celda; sin extrapolación, el intervalo más estrecho posible
+                puntos = np.array([representante(v) for v in vecinas])
+                if motor.muestras is None:
+                    octanajes, soporte = motor.predict(puntos), 1.0
+                else:
+                    octanajes, soporte = motor.predecir_con_soporte(puntos)
+                sirven = cumple(octanajes, np.maximum(escala * np.sqrt(soporte), minima))
+                explorar([v for v, sirve in zip(vecinas, sirven.tolist()) if sirve])
+        candidatas.extend(solucion for _, _, solucion in cola)
+
+        # 4. Comprobación de las candidatas con el modelo completo
+        if not candidatas:
+            raise imposible(falta, predichas, semiamplitud)
+        candidatas = np.array(candidatas)
+        X = candidatas @ problema.matriz
+        octanajes, inferiores, superiores = predecir_intervalos(modelo, variables, X)
+        fuera = dominio.evaluar(X)[0]
+        validas = ((inferiores > inferior) & (superiores < superior) & ~fuera
+                   & np.array([clasificar_gasolina(o, (a, b), calibrado=calibrado)['limite_critico'] is None
+                               for o, a, b in zip(octanajes, inferiores, superiores)], dtype=bool))
+        if not validas.any():
+            semiamplitudes_candidatas = (superiores - inferiores) / 2
+            falta_candidatas = np.where(fuera, np.inf, violacion(octanajes, semiamplitudes_candidatas))
+            raise imposible(np.concatenate([falta, falta_candidatas]), np.concatenate([predichas, octanajes]),
+                            np.concatenate([semiamplitud, semiamplitudes_candidatas]))
+        mejor = np.flatnonzero(validas)[np.argmin((candidatas @ problema.coste)[validas])]
+
+    fracciones = np.clip(candidatas[mejor], 0.0, None)
+    fracciones /= fracciones.sum()
+    octanaje = float(octanajes[mejor])
+    intervalo = (float(inferiores[mejor]), float(superiores[mejor]))
+    nombres = [c.nombre for c in problema.corrientes]
+    return {
+        'volumenes': dict(zip(nombres, (fracciones * problema.volumen).tolist())),
+        'fracciones': dict(zip(nombres, fracciones.tolist())),
+        'coste': float(fracciones @ problema.coste * problema.volumen),
+        'coste_unitario': float(fracciones @ problema.coste),
+        'composicion': dict(zip(variables, X[mejor].tolist())),
+        'octanaje': octanaje,
+        'intervalo': intervalo,
+        'clasificacion': clasificar_gasolina(octanaje, intervalo, calibrado=calibrado),
+        'celdas': len(vistas),
+        'programas': problema.programas,
+        'segundos': time.perf_counter() - inicio
+    }
+
+
+def tabla_corrientes(corrientes):
+    """DataFrame de corrientes con las columnas de un CSV de leer_corrientes."""
+    import pandas as pd
+
+    return pd.DataFrame([
+        {'NOMBRE': c.nombre, 'COSTE': c.coste, 'MINIMO': c.minimo, 'MAXIMO': c.maximo,
+         **{componente: c.composicion[componente] for componente in COMPONENTES}}
+        for c in corrientes
+    ])
+
+
+def corrientes_tabla(df):
+    """
+    Corrientes de un DataFrame con columnas NOMBRE, COSTE, los 8 componentes
+    y, opcionalmente, MINIMO y MAXIMO (m³). Las filas vacías se ignoran.
+
+    Raises:
+        ValueError: Si falta alguna columna o algún valor
+    """
+    import pandas as pd
+
+    from octanaje.componentes import normalizar_columnas
+
+    df = df.dropna(how='all').copy()
+    df.columns = normalizar_columnas(df.columns)
+    faltan = [c for c in ['NOMBRE', 'COSTE'] + COMPONENTES if c not in df.columns]
+    if faltan:
+        raise ValueError(f"Faltan columnas: {', '.join(faltan)}")
+    numericas = df[['COSTE'] + COMPONENTES].apply(pd.to_numeric, errors='coerce')
+    if numericas.isna().any().any() or df['NOMBRE'].isna().any():
+        filas = df.index[numericas.isna().any(axis=1) | df['NOMBRE'].isna()][:5].tolist()
+        raise ValueError(f"Valores vacíos o no numéricos en las corrientes: {filas}")
+    def limite(columna, defecto):
+        if columna not in df.columns:
+            return [defecto] * len(df)
+        return pd.to_numeric(df[columna], errors='coerce').fillna(defecto).tolist()
+
+    minimo, maximo = limite('MINIMO', 0.0), limite('MAXIMO', math.inf)
+    return [
+        Corriente(str(nombre), {c: float(fila[c]) for c in COMPONENTES}, float(fila['COSTE']), float(a), float(b))
+        for nombre, (_, fila), a, b in zip(df['NOMBRE'], numericas.iterrows(), minimo, maximo)
+    ]
+
+
+def leer_corrientes(ruta):
+    """Lee corrientes de un CSV (ver corrientes_tabla)."""
+    import pandas as pd
+
+    return corrientes_tabla(pd.read_csv(ruta, sep=None, engine='python'))
+
+
+def busqueda_aleatoria(corrientes, categoria, segundos, volumen=1000.0, margen=MARGEN_POR_DEFECTO, semilla=0):
+    """
+    Referencia ingenua para medir: mezclas al azar predichas de una en una,
+    con su intervalo, durante `segundos`.
+
+    Returns:
+        Tupla (coste unitario de la mejor mezcla que cumple o None, mezclas evaluadas)
+    """
+    import numpy as np
+
+    from octanaje.dominio import dominio_modelo
+    from octanaje.intervalos import predecir_intervalos
+    from octanaje.modelo import modelo_por_defecto
+
+    modelo, variables = modelo_por_defecto()
+    dominio = dominio_modelo(modelo, variables)
+    problema = _Problema(corrientes, volumen, variables, dominio)
+    inferior, superior = banda_objetivo(indice_objetivo(categoria), margen)
+    fin = time.perf_counter() + segundos
+    mejor, evaluadas = None, 0
+    rng = np.random.default_rng(semilla + 1)
+    vertices = problema.vertices(rng)
+    for fracciones in rng.dirichlet(np.full(len(vertices), 0.1), size=MUESTRAS_MEZCLA) @ vertices:
+        if time.perf_counter() > fin:
+            break
+        x = (fracciones @ problema.matriz).reshape(1, -1)
+        _, bajo, alto = predecir_intervalos(modelo, variables, x)
+        evaluadas += 1
+        coste = float(fracciones @ problema.coste)
+        cumple = inferior < bajo[0] and alto[0] < superior and not dominio.evaluar(x)[0][0]
+        if cumple and (mejor is None or coste < mejor):
+            mejor = coste
+    return mejor, evaluadas
+
+
+def medir(corrientes=CORRIENTES_EJEMPLO, volumen=1000.0):
+    """
+    Optimiza cada categoría y compara con la búsqueda aleatoria del mismo tiempo.
+
+    Returns:
+        dict {categoria: (segundos, coste unitario óptimo, coste unitario
+        aleatorio, mezclas evaluadas al azar), o el motivo si no hay mezcla}
+    """
+    resultados = {}
+    for categoria in CATEGORIAS[1:]:
+        try:
+            mezcla = optimizar_mezcla(corrientes, categoria['categoria'], volumen)
+        except MezclaImposible as e:
+            resultados[categoria['categoria']] = str(e)
+            continue
+        aleatorio, evaluadas = busqueda_aleatoria(corrientes, categoria['categoria'], mezcla['segundos'], volumen)
+        resultados[categoria['categoria']] = (mezcla['segundos'], mezcla['coste_unitario'], aleatorio, evaluadas)
+    return resultados
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mezcla más barata que alcanza una categoría fiscal")
+    parser.add_argument('categoria', nargs='?', default='95', help="Categoría: <95, 95, 98 o el nombre completo")
+    parser.add_argument('--corrientes', help="CSV de corrientes (por defecto, CORRIENTES_EJEMPLO)")
+    parser.add_argument('--volumen', type=float, default=1000.0, help="Volumen total de la mezcla (m³)")
+    parser.add_argument('--margen', type=float, default=MARGEN_POR_DEFECTO,
+                        help="Distancia del intervalo de predicción a los límites fiscales (RON)")
+    parser.add_argument('--medir', action='store_true', help="Medir frente a una búsqueda aleatoria")
+    argumentos = parser.parse_args(argv)
+
+    if argumentos.medir:
+        for categoria, r in medir().items():
+            if isinstance(r, str):
+                print(f"{categoria}: {r}")
+                continue
+            segundos, optimo, aleatorio, evaluadas = r
+            texto = f"{aleatorio:.2f} €/m³ ({aleatorio / optimo - 1:+.1%})" if aleatorio else "ninguna cumple"
+            print(f"{categoria}: {segundos:.2f} s, {optimo:.2f} €/m³ | al azar en el mismo tiempo: "
+                  f"{evaluadas:,} mezclas, {texto}")
+        return 0
+
+    corrientes = leer_corrientes(argumentos.corrientes) if argumentos.corrientes else CORRIENTES_EJEMPLO
+    try:
+        mezcla = optimizar_mezcla(corrientes, argumentos.categoria, argumentos.volumen, argumentos.margen)
+    except MezclaImposible as e:
+        print(e)
+        return 1
+    for nombre, volumen in mezcla['volumenes'].items():
+        if volumen > 1e-6:
+            print(f"{nombre:<30} {volumen:10.1f} m³  {mezcla['fracciones'][nombre]:6.1%}")
+    print(f"Coste: {mezcla['coste']:,.0f} € ({mezcla['coste_unitario']:.2f} €/m³)")
+    print(f"Octanaje predicho: {mezcla['octanaje']:.2f} RON, intervalo [{mezcla['intervalo'][0]:.2f}, "
+          f"{mezcla['intervalo'][1]:.2f}] -> {mezcla['clasificacion']['categoria']}")
+    print(f"{mezcla['celdas']:,} celdas, {mezcla['programas']} programas lineales, {mezcla['segundos']:.2f} s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
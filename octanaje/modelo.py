@@ -0,0 +1,216 @@
+"""
+Carga del modelo de predicción de octanaje.
+
+NumPy, pickle y sklearn sólo se importan al cargar el modelo, no al importar
+este módulo. Con un artefacto .octgb vigente no se importan ni pickle ni sklearn.
+"""
+
+import functools
+import os
+
+from octanaje.componentes import COMPONENTES, EJEMPLO, RANGOS_TIPICOS
+
+# Variable de entorno con la ruta del modelo (tiene prioridad sobre RUTAS_MODELO)
+VARIABLE_ENTORNO_MODELO = 'OCTANAJE_MODELO'
+
+RUTAS_MODELO = [
+    'modelo_final_gb.pkl',
+    './modelo_final_gb.pkl',
+    'models/modelo_final_gb.pkl',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modelo_final_gb.pkl')
+]
+
+EXTENSION_ARTEFACTO = '.octgb'
+
+# Diferencia máxima admitida entre el motor nativo y modelo.predict
+TOLERANCIA_PARIDAD = 1e-9
+
+
+def buscar_modelo():
+    """
+    Devuelve la primera ruta existente del modelo, o None.
+
+    Para cada ruta de RUTAS_MODELO se prueba el pickle y, si no existe, el
+    artefacto .octgb con el mismo nombre (despliegues sin pickle).
+    """
+    rutas = list(RUTAS_MODELO)
+    if os.environ.get(VARIABLE_ENTORNO_MODELO):
+        rutas.insert(0, os.environ[VARIABLE_ENTORNO_MODELO])
+
+    for ruta in rutas:
+        for candidata in (ruta, os.path.splitext(ruta)[0] + EXTENSION_ARTEFACTO):
+            if os.path.exists(candidata):
+                return candidata
+    return None
+
+
+def artefacto_vigente(ruta_pickle):
+    """
+    Devuelve el artefacto .octgb exportado de este pickle, si existe.
+
+    El artefacto sólo se usa si su cabecera registra el SHA-256 del pickle
+    actual; si el pickle se ha reentrenado sin volver a exportar, se ignora.
+    """
+    import hashlib
+
+    from octanaje.artefacto import ErrorArtefacto, leer_cabecera
+
+    ruta_artefacto = os.path.splitext(ruta_pickle)[0] + EXTENSION_ARTEFACTO
+    if not os.path.exists(ruta_artefacto):
+        return None
+
+    try:
+        with open(ruta_artefacto, 'rb') as f:
+            cabecera, _ = leer_cabecera(f)
+    except (ErrorArtefacto, OSError, ValueError):
+        return None
+
+    with open(ruta_pickle, 'rb') as f:
+        firma_pickle = hashlib.sha256(f.read()).hexdigest()
+    if cabecera['metadatos'].get('origen_sha256') != firma_pickle:
+        return None
+    return ruta_artefacto
+
+
+def muestras_referencia(variables, n=500, semilla=0):
+    """
+    Genera composiciones de referencia para validar el modelo cargado.
+
+    Args:
+        variables: Orden de columnas esperado por el modelo
+        n: Número de composiciones aleatorias de cada tipo
+        semilla: Semilla del generador aleatorio
+
+    Returns:
+        Matriz (filas x variables) con la mezcla de ejemplo, composiciones
+        dentro de los rangos típicos y composiciones aleatorias en todo el
+        rango 0-100 del formulario
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(semilla)
+    tipicas = np.column_stack([rng.uniform(*RANGOS_TIPICOS[c], n) for c in COMPONENTES]).round(1)
+    componentes = np.vstack([
+        [[EJEMPLO[c] for c in COMPONENTES]],
+        tipicas,
+        rng.uniform(0, 100, (n, len(COMPONENTES)))
+    ])
+
+    columnas = dict(zip(COMPONENTES, componentes.T))
+    columnas['Ox'] = columnas['ETANOL'] + columnas['MTBE'] + columnas['ETBE']
+    return np.column_stack([columnas[v] for v in variables])
+
+
+def cargar_modelo(ruta=None):
+    """
+    Carga el modelo de predicción.
+
+    Si existe un artefacto .octgb exportado del pickle (ver octanaje.artefacto)
+    se abre con mmap sin deserializar el pickle ni importar sklearn.
+    Si no, el GradientBoostingRegressor se aplana en un MotorGB que predice
+    sin pasar por pandas ni sklearn; si el motor no reproduce exactamente las
+    predicciones del modelo original se usa el modelo sklearn.
+
+    Args:
+        ruta: Ruta del .pkl o del .octgb (por defecto se busca con buscar_modelo)
+
+    Returns:
+        Tupla (modelo, variables, error). Si la carga falla, modelo y
+        variables son None y error describe el problema.
+    """
+    from octanaje.metricas import etapa
+
+    with etapa('carga_modelo'):
+        return _cargar_modelo(ruta)
+
+
+def _cargar_modelo(ruta):
+    import pickle
+
+    from octanaje.artefacto import abrir_artefacto
+    from octanaje.motor import MotorGB, comprobar_paridad
+
+    try:
+        modelo_path = ruta or buscar_modelo()
+        if modelo_path is None or not os.path.exists(modelo_path):
+            return None, None, "No se encontró el archivo 'modelo_final_gb.pkl'"
+
+        if not modelo_path.endswith(EXTENSION_ARTEFACTO):
+            modelo_path = artefacto_vigente(modelo_path) or modelo_path
+        if modelo_path.endswith(EXTENSION_ARTEFACTO):
+            motor, _ = abrir_artefacto(modelo_path)
+            return motor, motor.variables, None
+
+        with open(modelo_path, 'rb') as f:
+            modelo_info = pickle.load(f)
+
+        modelo, variables = modelo_info['modelo'], modelo_info['variables']
+        try:
+            motor = MotorGB.desde_sklearn(modelo, variables)
+            motor.metadatos.update({k: v for k, v in modelo_info.items() if k not in ('modelo', 'variables')})
+            referencia = muestras_referencia(variables)
+            if comprobar_paridad(motor, modelo, referencia) <= TOLERANCIA_PARIDAD:
+                return motor, variables, None
+        except (AttributeError, IndexError, ValueError):
+            pass  # Modelo no compatible con el motor nativo
+
+        return modelo, variables, None
+
+    except Exception as e:
+        return None, None, f"Error al cargar: {str(e)}"
+
+
+@functools.lru_cache(maxsize=None)
+def modelo_por_defecto():
+    """
+    Carga una sola vez por proceso el modelo encontrado por buscar_modelo.
+
+    Returns:
+        Tupla (modelo, variables)
+
+    Raises:
+        RuntimeError: Si el modelo no se puede cargar
+    """
+    modelo, variables, error = cargar_modelo()
+    if modelo is None:
+        raise RuntimeError(error)
+    return modelo, variables
+
+
+def ficha_modelo(modelo):
+    """
+    Descripción del modelo cargado para la interfaz, leída del propio modelo.
+
+    Args:
+        modelo: MotorGB (metadatos del pickle o del artefacto) o modelo sklearn
+
+    Returns:
+        dict con 'hiperparametros' (n_estimators, max_depth, learning_rate,
+        subsample... los que se conozcan), 'variables', 'metricas' (las de
+        entrenamiento del pickle), 'validacion' (la calibración de
+        octanaje.intervalos: rmse, mae y, si se conocen, r2 y exactitud),
+        'muestras_entrenamiento', 'muestras_validacion', 'rango_octanaje',
+        'fecha_creacion' y 'version' (None si el modelo no los registra)
+    """
+    from octanaje.intervalos import calibracion_modelo
+    from octanaje.motor import HIPERPARAMETROS
+
+    metadatos = getattr(modelo, 'metadatos', None) or {}
+    if 'hiperparametros' in metadatos:
+        hiperparametros = dict(metadatos['hiperparametros'])
+    elif hasattr(modelo, 'get_params'):
+        hiperparametros = {k: modelo.get_params()[k] for k in HIPERPARAMETROS}
+    else:
+        hiperparametros = {'n_estimators': modelo.n_arboles, 'max_depth': modelo.profundidad,
+                           'learning_rate': metadatos.get('tasa_aprendizaje')}
+    return {
+        'hiperparametros': hiperparametros,
+        'variables': list(getattr(modelo, 'variables', None) or getattr(modelo, 'feature_names_in_', [])),
+        'metricas': metadatos.get('metricas', {}),
+        'validacion': calibracion_modelo(modelo),
+        'muestras_entrenamiento': metadatos.get('muestras_entrenamiento'),
+        'muestras_validacion': metadatos.get('muestras_validacion'),
+        'rango_octanaje': metadatos.get('rango_octanaje'),
+        'fecha_creacion': metadatos.get('fecha_creacion'),
+        'version': metadatos.get('version')
+    }
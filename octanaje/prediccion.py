@@ -0,0 +1,102 @@
+"""
+Predicción de octanaje de muestras individuales.
+
+No usa pandas: la fila de entrada se construye directamente en el orden de
+`variables` y se evalúa con el motor nativo.
+"""
+
+from octanaje.cache import CACHE, version_modelo
+from octanaje.clasificacion import clasificar_gasolina
+from octanaje.componentes import completar_muestra
+from octanaje.deriva import observar_deriva
+from octanaje.dominio import comprobar_dominio
+from octanaje.metricas import contar_clasificacion, etapa, latencia
+from octanaje.modelo import modelo_por_defecto
+from octanaje.referencias import VECINOS, referencias_cercanas
+
+
+def predecir_matriz(modelo, variables, X):
+    """
+    Predice una matriz de muestras con un MotorGB o con un modelo sklearn.
+
+    Args:
+        modelo: MotorGB o modelo sklearn devuelto por cargar_modelo
+        variables: Orden de columnas esperado por el modelo
+        X: Matriz (filas x variables) o DataFrame con esas columnas
+
+    Returns:
+        ndarray con una predicción por fila
+    """
+    from octanaje.motor import MotorGB
+
+    if isinstance(modelo, MotorGB) or hasattr(X, 'columns'):
+        return modelo.predict(X)
+
+    import pandas as pd
+    return modelo.predict(pd.DataFrame(X, columns=variables))
+
+
+def predecir(datos, modelo=None, variables=None, cache=CACHE, sombra=None, vecinos=VECINOS):
+    """
+    Predice y clasifica una muestra.
+
+    Args:
+        datos: dict con los 8 componentes medidos (%v/v); Ox se calcula
+        modelo: Modelo devuelto por cargar_modelo (por defecto, el del proceso)
+        variables: Orden de columnas del modelo (obligatorio si se pasa modelo)
+        cache: CachePredicciones a consultar (None para no usar caché)
+        sombra: ModeloSombra que puntúa la misma fila en segundo plano
+            (octanaje.sombra); no cambia el resultado
+        vecinos: Muestras de laboratorio más parecidas que se devuelven
+            (octanaje.referencias; 0 para ninguna)
+
+    Returns:
+        dict con 'octanaje', 'octanaje_redondeado', 'intervalo' (inferior,
+        superior), 'clasificacion' (SIN CLASIFICAR fuera del dominio del
+        modelo, ver octanaje.dominio), 'datos' (la muestra con Ox),
+        'version_modelo' (octanaje.versiones) y 'referencias' (las muestras
+        de laboratorio más parecidas, con distancia y RON medido; None sin
+        índice de referencias)
+    """
+    if modelo is None:
+        modelo, variables = modelo_por_defecto()
+
+    with latencia('muestra'):
+        with etapa('entrada'):
+            muestra = completar_muestra(datos)
+        fila = [[muestra[v] for v in variables]]
+        clave = cache.clave(muestra) if cache is not None else None
+        guardado = cache.obtener(clave, modelo) if clave is not None else None
+
+        if guardado is not None:
+            octanaje, clasificacion = guardado
+        else:
+            from octanaje.intervalos import intervalo_calibrado, predecir_intervalos
+
+            prediccion, inferior, superior = predecir_intervalos(modelo, variables, fila)
+            octanaje = float(prediccion[0])
+            _, motivos = comprobar_dominio(modelo, variables, fila)
+            # Clasificar usando el valor REAL (con decimales), no el redondeado
+            with etapa('clasificacion'):
+                clasificacion = clasificar_gasolina(octanaje, (inferior[0], superior[0]), motivos[0],
+                                                    intervalo_calibrado(modelo))
+            if clave is not None:
+                cache.guardar(clave, modelo, octanaje, clasificacion)
+        # También las respuestas de la caché: el monitor y el candidato ven lo que llega
+        if sombra is not None:
+            sombra.comparar(fila, variables, (octanaje,), (clasificacion['categoria'],), 'formulario',
+                            version_modelo(modelo))
+        observar_deriva(modelo, variables, fila, (octanaje,))
+        with etapa('referencias'):
+            referencias = referencias_cercanas(fila, variables, vecinos)
+    contar_clasificacion(clasificacion, 'muestra')
+
+    return {
+        'octanaje': octanaje,
+        'octanaje_redondeado': round(octanaje),
+        'intervalo': clasificacion['intervalo'],
+        'clasificacion': clasificacion,
+        'datos': muestra,
+        'version_modelo': version_modelo(modelo),
+        'referencias': referencias[0] if referencias is not None else None
+    }
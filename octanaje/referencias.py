@@ -0,0 +1,698 @@
+"""
+Muestras de laboratorio más parecidas a cada predicción (árbol k-d sobre las 9 variables).
+
+Junto a cada predicción se muestran las k muestras de referencia con RON
+medido de composición más cercana: su distancia y su RON real permiten al
+operador contrastar el valor del modelo.
+
+    python -m octanaje.referencias construir laboratorio.csv             # una vez
+    python -m octanaje.referencias buscar --k 5 '{"PARAFINAS": 10.5, ...}'
+    python -m octanaje.referencias --medir
+
+- Distancia: euclídea en %v/v sobre las variables del modelo (los 8
+  componentes y Ox), sin escalar, así que se lee directamente en puntos de
+  composición.
+- Índice: árbol k-d equilibrado implícito. Cada nivel parte cada nodo por la
+  mediana de su variable de mayor recorrido, hasta hojas de TAMANO_HOJA/2 a
+  TAMANO_HOJA muestras. Los puntos quedan ordenados por hoja (cada hoja es un
+  tramo contiguo) y cada nodo guarda la caja que envuelve sus puntos.
+- Búsqueda, vectorizada sobre todas las consultas de un bloque: cada consulta
+  baja a su hoja, cuyas k mejores distancias dan un radio; después se
+  recorre el árbol por niveles descartando los nodos cuya caja queda más
+  lejos que ese radio, y se ordenan las distancias de los puntos de las
+  hojas que sobreviven. El resultado es exacto.
+- Archivo .octref: mismo esquema que el artefacto del modelo (firma,
+  cabecera JSON, arrays alineados y SHA-256 de cabecera y datos,
+  octanaje.artefacto). Se construye una
+  vez y se abre con mmap de sólo lectura: abrirlo no copia los puntos, los
+  procesos y sesiones de la misma máquina comparten sus páginas, y
+  indice_por_defecto lo mantiene abierto mientras el archivo no cambie.
+
+El índice por defecto es el de OCTANAJE_REFERENCIAS o, si no, el primer
+archivo de RUTAS_REFERENCIAS que exista; sin él las predicciones no llevan
+referencias.
+
+Medido con `python -m octanaje.referencias --medir` (1 núcleo, 1 millón de
+referencias sintéticas uniformes en los rangos típicos, k=5):
+    - Construcción: ~3 s; archivo de 66 MB; apertura ~0.05 s (checksum
+      incluido)
+    - Una consulta: ~0.4 ms (mediana; p99 ~1 ms)
+    - Lotes de consultas: ~0.2 ms por muestra
+    - Con 3 millones: construcción ~9 s, 200 MB, consulta ~0.6 ms
+"""
+
+import os
+import sys
+import threading
+import time
+
+FIRMA_MAGICA = b'OCTREF\x00\x00'
+# Versión 2: el SHA-256 cubre también la cabecera, como en el artefacto del modelo
+VERSION_FORMATO = 2
+ALINEACION = 64
+EXTENSION = '.octref'
+
+# Variable de entorno con la ruta del índice (tiene prioridad sobre RUTAS_REFERENCIAS)
+VARIABLE_ENTORNO_REFERENCIAS = 'OCTANAJE_REFERENCIAS'
+
+RUTAS_REFERENCIAS = [
+    'referencias_laboratorio' + EXTENSION,
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'referencias_laboratorio' + EXTENSION)
+]
+
+# Referencias devueltas por predicción
+VECINOS = 3
+
+# Coordenada de los huecos que completan las hojas hasta el mismo ancho
+HUECO = 1e18
+
+# Muestras máximas por hoja del árbol
+TAMANO_HOJA = 64
+
+# Consultas resueltas a la vez (acota la memoria de los candidatos)
+BLOQUE_CONSULTA = 32
+
+# Niveles del árbol que baja cada paso del recorrido por cajas: en lugar de
+# descartar nivel a nivel se comprueban de una vez los 2**SALTO_NIVELES
+# descendientes (menos llamadas a NumPy por consulta)
+SALTO_NIVELES = 4
+
+# Hojas de caja más cercana que se recorren antes de ajustar el radio
+RONDA_HOJAS = 8
+
+# Columnas admitidas como identificador de la muestra de laboratorio
+COLUMNAS_REFERENCIA = ('REFERENCIA', 'MUESTRA', 'ID', 'CODIGO')
+
+# Arrays del índice que se guardan en el archivo, con su tipo en disco
+ARRAYS_INDICE = {
+    'puntos': '<f4',
+    'ron': '<f8',
+    'fila': '<i8',
+    'eje': '<i1',
+    'corte': '<f4',
+    'caja_min': '<f4',
+    'caja_max': '<f4',
+    'etiquetas': '|u1',
+    'desplazamientos': '<i8',
+}
+
+
+def _alinear(n):
+    return (n + ALINEACION - 1) // ALINEACION * ALINEACION
+
+
+def _por_consulta(consultas, valores, q):
+    """
+    Tabla (q x máximo de filas por consulta [x columnas]) con las filas de cada consulta, rellena con inf.
+
+    `consultas` debe estar en orden creciente.
+    """
+    import numpy as np
+
+    rango = np.arange(len(consultas)) - np.searchsorted(consultas, consultas)
+    tabla = np.full((q, int(rango.max(initial=0)) + 1, *valores.shape[1:]), np.inf, dtype=valores.dtype)
+    tabla[consultas, rango] = valores
+    return tabla
+
+
+class IndiceReferencias:
+    """
+    Árbol k-d de muestras de referencia con RON medido.
+
+    Los arrays pueden ser vistas sobre el archivo mapeado (abrir_indice) o
+    arrays en memoria (construir_indice).
+
+    Args:
+        variables: Orden de las columnas de los puntos
+        profundidad: Niveles del árbol; tiene 2**profundidad hojas
+        metadatos: dict con origen, fecha de construcción...
+        **arrays: Los de ARRAYS_INDICE
+    """
+
+    def __init__(self, variables, profundidad, metadatos=None, **arrays):
+        self.variables = list(variables)
+        self.profundidad = int(profundidad)
+        self.metadatos = metadatos or {}
+        for nombre in ARRAYS_INDICE:
+            setattr(self, nombre, arrays[nombre])
+        self.hojas = 2 ** self.profundidad
+        self.ancho_hoja = len(self.puntos) // self.hojas
+        self.n = int(self.metadatos.get('muestras', len(self.puntos)))
+        self._hojas = self.puntos.reshape(self.hojas, self.ancho_hoja, -1)
+
+    def __len__(self):
+        return self.n
+
+    # ── Búsqueda ──
+
+    def buscar(self, X, k=VECINOS, variables=None):
+        """
+        Las k referencias más cercanas a cada fila de X.
+
+        Args:
+            X: Matriz (filas x variables) o una sola fila
+            k: Referencias por fila (se limita al tamaño del índice)
+            variables: Orden de columnas de X (por defecto, el del índice)
+
+        Returns:
+            Tupla (distancias, posiciones): arrays (filas x k) ordenados de
+            la más cercana a la más lejana; las posiciones son las de los
+            puntos del índice (ver vecinos)
+        """
+        import numpy as np
+
+        X = np.asarray(X, dtype=np.float64)
+        X = X.reshape(-1, X.shape[-1] if X.ndim else 1)
+        if variables is not None and list(variables) != self.variables:
+            X = X[:, [list(variables).index(v) for v in self.variables]]
+        k = max(1, min(int(k), self.n))
+        distancias = np.empty((len(X), k))
+        posiciones = np.empty((len(X), k), dtype=np.int64)
+        for inicio in range(0, len(X), BLOQUE_CONSULTA):
+            fin = min(inicio + BLOQUE_CONSULTA, len(X))
+            distancias[inicio:fin], posiciones[inicio:fin] = self._buscar_bloque(X[inicio:fin], k)
+        return distancias, posiciones
+
+    def _distancias_hojas(self, X, consultas, hojas):
+        """Distancias al cuadrado de cada consulta a los puntos de su hoja y sus posiciones."""
+        import numpy as np
+
+        diferencia = self._hojas[hojas] - X[consultas][:, None, :].astype(np.float32)
+        d2 = np.einsum('ijk,ijk->ij', diferencia, diferencia)
+        return d2, hojas[:, None] * self.ancho_hoja + np.arange(self.ancho_hoja)
+
+    def _buscar_bloque(self, X, k):
+        import numpy as np
+
+        q = len(X)
+        consultas = np.arange(q)
+        primera_hoja = self.hojas - 1
+
+        # Hoja de cada consulta: su k-ésima distancia acota la búsqueda
+        nodo = np.zeros(q, dtype=np.int64)
+        for _ in range(self.profundidad):
+            nodo = 2 * nodo + 1 + (X[consultas, self.eje[nodo]] >= self.corte[nodo])
+        d2, _ = self._distancias_hojas(X, consultas, nodo - primera_hoja)
+        if k <= d2.shape[1]:
+            radio2 = np.partition(d2, k - 1, axis=1)[:, k - 1]
+        else:
+            radio2 = np.full(q, np.inf)
+        # Holgura por redondeo entre la distancia a la caja y la de sus puntos
+        radio2 = radio2 * (1 + 1e-6) + 1e-9
+
+        # Recorrido por saltos de SALTO_NIVELES niveles hasta las hojas: se
+        # descartan los nodos cuya caja queda más lejos que el radio
+        nivel = self.profundidad % SALTO_NIVELES or min(SALTO_NIVELES, self.profundidad)
+        ancho = 2 ** nivel
+        consultas = np.repeat(np.arange(q), ancho)
+        nodos = np.tile(np.arange(ancho - 1, 2 * ancho - 1), q)
+        while True:
+            x = X[consultas]
+            exceso = np.maximum(np.maximum(self.caja_min[nodos] - x, x - self.caja_max[nodos]), 0)
+            distancia_caja = np.einsum('ij,ij->i', exceso, exceso)
+            cerca = distancia_caja <= radio2[consultas]
+            consultas, nodos, distancia_caja = consultas[cerca], nodos[cerca], distancia_caja[cerca]
+            if nivel == self.profundidad:
+                break
+            # Descendientes SALTO_NIVELES niveles más abajo
+            hijos = 2 ** SALTO_NIVELES
+            consultas = np.repeat(consultas, hijos)
+            nodos = ((nodos[:, None] + 1) * hijos - 1 + np.arange(hijos)).ravel()
+            nivel += SALTO_NIVELES
+        hojas = nodos - primera_hoja
+
+        # Primera ronda con las RONDA_HOJAS hojas de caja más cercana de cada
+        # consulta: ajusta el radio, y a la segunda sólo pasan las que siguen
+        # dentro. Los pares siguen agrupados por consulta en orden creciente.
+        tabla = _por_consulta(consultas, distancia_caja, q)
+        if tabla.shape[1] > RONDA_HOJAS:
+            primera = distancia_caja <= np.partition(tabla, RONDA_HOJAS - 1, axis=1)[consultas, RONDA_HOJAS - 1]
+        else:
+            primera = np.ones(len(consultas), dtype=bool)
+        d2, posiciones = self._distancias_hojas(X, consultas[primera], hojas[primera])
+        tabla = _por_consulta(consultas[primera], d2, q).reshape(q, -1)
+        if k <= tabla.shape[1]:
+            radio2 = np.minimum(radio2, np.partition(tabla, k - 1, axis=1)[:, k - 1] * (1 + 1e-6) + 1e-9)
+        candidatos = [(consultas[primera], d2, posiciones)]
+        resto = ~primera & (distancia_caja <= radio2[consultas])
+        candidatos.append((consultas[resto], *self._distancias_hojas(X, consultas[resto], hojas[resto])))
+
+        # Las k menores distancias de cada consulta entre los puntos dentro del radio
+        partes = []
+        for consultas, d2, posiciones in candidatos:
+            dentro = d2 <= radio2[consultas, None]
+            partes.append((np.broadcast_to(consultas[:, None], d2.shape)[dentro], d2[dentro], posiciones[dentro]))
+        consultas, d2, posiciones = (np.concatenate(parte) for parte in zip(*partes))
+        orden = np.lexsort((d2, consultas))
+        primeras = np.searchsorted(consultas[orden], np.arange(q))
+        elegidos = orden[primeras[:, None] + np.arange(k)]
+        return np.sqrt(d2[elegidos]), posiciones[elegidos]
+
+    # ── Resultados ──
+
+    def etiqueta(self, posicion):
+        """Identificador de la muestra de laboratorio de una posición del índice."""
+        return bytes(self.etiquetas[self.desplazamientos[posicion]:self.desplazamientos[posicion + 1]]).decode('utf-8')
+
+    def vecinos(self, X, k=VECINOS, variables=None):
+        """
+        Las k referencias más cercanas a cada fila de X, como dicts.
+
+        Returns:
+            Lista (una por fila) de listas de dicts con 'referencia'
+            (identificador de la muestra), 'fila' (fila en el archivo de
+            laboratorio), 'distancia' (%v/v), 'ron' (medido) y 'datos' (su
+            composición)
+        """
+        distancias, posiciones = self.buscar(X, k, variables)
+        return [
+            [{
+                'referencia': self.etiqueta(p),
+                'fila': int(self.fila[p]),
+                'distancia': round(float(d), 3),
+                'ron': round(float(self.ron[p]), 2),
+                'datos': {v: round(float(x), 3) for v, x in zip(self.variables, self.puntos[p])}
+            } for d, p in zip(fila_d, fila_p)]
+            for fila_d, fila_p in zip(distancias.tolist(), posiciones.tolist())
+        ]
+
+    def columnas_lote(self, X, k=VECINOS, variables=None):
+        """
+        Columnas Referencia_i, Distancia_Ref_i y RON_Ref_i (i = 1..k) para un lote.
+
+        Returns:
+            dict nombre -> array, en ese orden
+        """
+        import numpy as np
+
+        distancias, posiciones = self.buscar(X, k, variables)
+        columnas = {}
+        for i in range(distancias.shape[1]):
+            columnas[f'Referencia_{i + 1}'] = np.array([self.etiqueta(p) for p in posiciones[:, i].tolist()],
+                                                       dtype=object)
+            columnas[f'Distancia_Ref_{i + 1}'] = np.round(distancias[:, i], 3)
+            columnas[f'RON_Ref_{i + 1}'] = np.round(self.ron[posiciones[:, i]], 2)
+        return columnas
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# CONSTRUCCIÓN Y ARCHIVO .octref
+# ═══════════════════════════════════════════════════════════════════════════
+
+def construir_indice(X, ron, etiquetas=None, variables=None, tamano_hoja=TAMANO_HOJA, metadatos=None):
+    """
+    Construye el árbol k-d en memoria.
+
+    Args:
+        X: Matriz (muestras x variables) de composiciones
+        ron: RON medido de cada muestra
+        etiquetas: Identificador de cada muestra (por defecto, su número de fila desde 1)
+        variables: Orden de columnas de X (por defecto, el de entrenamiento.VARIABLES)
+        tamano_hoja: Muestras máximas por hoja
+        metadatos: dict añadido a los del índice
+
+    Returns:
+        IndiceReferencias
+
+    Raises:
+        ValueError: Si no hay muestras o hay valores no finitos
+    """
+    import numpy as np
+
+    from octanaje.entrenamiento import VARIABLES
+
+    X = np.asarray(X, dtype=np.float32)
+    ron = np.asarray(ron, dtype=np.float64)
+    n = len(X)
+    if n == 0:
+        raise ValueError("No hay muestras de referencia")
+    if not (np.isfinite(X).all() and np.isfinite(ron).all()):
+        raise ValueError("Las muestras de referencia tienen valores vacíos o no numéricos")
+    variables = list(variables or VARIABLES)
+    profundidad = max(0, int(np.ceil(np.log2(n / tamano_hoja)))) if n > tamano_hoja else 0
+
+    # Cada nodo del nivel se parte por la mediana de su variable de mayor recorrido
+    orden = np.arange(n)
+    eje = np.zeros(2 ** profundidad - 1, dtype=np.int8)
+    corte = np.zeros(2 ** profundidad - 1, dtype=np.float32)
+    for nivel in range(profundidad):
+        nodos = 2 ** nivel
+        for p in range(nodos):
+            inicio, fin = p * n // nodos, (p + 1) * n // nodos
+            mitad = (2 * p + 1) * n // (2 * nodos)
+            tramo = orden[inicio:fin]
+            puntos = X[tramo]
+            j = int(np.argmax(puntos.max(axis=0) - puntos.min(axis=0)))
+            orden[inicio:fin] = tramo[np.argpartition(puntos[:, j], mitad - inicio)]
+            eje[nodos - 1 + p] = j
+            corte[nodos - 1 + p] = X[orden[mitad], j]
+
+    # Las hojas se guardan con el mismo ancho; los huecos quedan a distancia enorme de todo
+    hojas = 2 ** profundidad
+    inicios = np.arange(hojas) * n // hojas
+    ancho = -(-n // hojas)
+    hoja = np.repeat(np.arange(hojas), np.diff(np.append(inicios, n)))
+    ranura = hoja * ancho + np.arange(n) - inicios[hoja]
+    puntos = np.full((hojas * ancho, X.shape[1]), HUECO, dtype=np.float32)
+    puntos[ranura] = X[orden]
+    fila = np.full(hojas * ancho, -1, dtype=np.int64)
+    fila[ranura] = orden
+    ron_hojas = np.full(hojas * ancho, np.nan)
+    ron_hojas[ranura] = ron[orden]
+
+    caja_min = np.empty((2 * hojas - 1, X.shape[1]), dtype=np.float32)
+    caja_max = np.empty_like(caja_min)
+    caja_min[hojas - 1:] = np.minimum.reduceat(X[orden], inicios)
+    caja_max[hojas - 1:] = np.maximum.reduceat(X[orden], inicios)
+    for nivel in range(profundidad - 1, -1, -1):
+        nodos = np.arange(2 ** nivel - 1, 2 ** (nivel + 1) - 1)
+        caja_min[nodos] = np.minimum(caja_min[2 * nodos + 1], caja_min[2 * nodos + 2])
+        caja_max[nodos] = np.maximum(caja_max[2 * nodos + 1], caja_max[2 * nodos + 2])
+
+    if etiquetas is None:
+        codificadas = [str(i + 1).encode('utf-8') if i >= 0 else b'' for i in fila.tolist()]
+    else:
+        etiquetas = list(etiquetas)
+        codificadas = [str(etiquetas[i]).encode('utf-8') if i >= 0 else b'' for i in fila.tolist()]
+    desplazamientos = np.zeros(len(fila) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in codificadas], out=desplazamientos[1:])
+
+    return IndiceReferencias(
+        variables, profundidad,
+        metadatos={
+            'muestras': n,
+            'tamano_hoja': tamano_hoja,
+            'ron': [round(float(ron.min()), 2), round(float(ron.max()), 2)],
+            'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+            **(metadatos or {})
+        },
+        puntos=puntos, ron=ron_hojas, fila=fila, eje=eje, corte=corte,
+        caja_min=caja_min, caja_max=caja_max,
+        etiquetas=np.frombuffer(b''.join(codificadas), dtype=np.uint8), desplazamientos=desplazamientos
+    )
+
+
+def construir_desde_archivo(ruta, tamano_hoja=TAMANO_HOJA):
+    """
+    Construye el índice de un archivo de laboratorio (el mismo formato que octanaje.entrenamiento).
+
+    Args:
+        ruta: CSV o Parquet con los 8 componentes, una columna de
+            entrenamiento.COLUMNAS_RON y, opcionalmente, una de
+            COLUMNAS_REFERENCIA con el identificador de cada muestra
+        tamano_hoja: Muestras máximas por hoja
+
+    Returns:
+        IndiceReferencias
+    """
+    import hashlib
+
+    from octanaje.entrenamiento import datos_laboratorio
+    from octanaje.lotes import leer_archivo_lote
+
+    df = leer_archivo_lote(ruta)
+    X, ron = datos_laboratorio(df)
+    columna = next((c for c in COLUMNAS_REFERENCIA if c in df.columns), None)
+    etiquetas = df[columna].astype(str).tolist() if columna is not None else None
+    with open(ruta, 'rb') as f:
+        origen = hashlib.file_digest(f, 'sha256').hexdigest()
+    return construir_indice(X, ron, etiquetas, tamano_hoja=tamano_hoja,
+                            metadatos={'origen': os.path.basename(ruta), 'origen_sha256': origen})
+
+
+def guardar_indice(indice, ruta):
+    """
+    Escribe un IndiceReferencias en formato .octref (escritura atómica).
+
+    Returns:
+        SHA-256 de la cabecera y la sección de datos (ver octanaje.artefacto.suma_contenido)
+    """
+    import json
+    import struct
+
+    import numpy as np
+
+    from octanaje.artefacto import suma_contenido
+
+    tabla = {}
+    bloques = []
+    posicion = 0
+    for nombre, dtype in ARRAYS_INDICE.items():
+        array = np.ascontiguousarray(getattr(indice, nombre), dtype=dtype)
+        relleno = b'\x00' * (_alinear(posicion) - posicion)
+        posicion += len(relleno)
+        tabla[nombre] = {'dtype': dtype, 'forma': list(array.shape), 'desplazamiento': posicion}
+        bloques += [relleno, memoryview(array).cast('B')]
+        posicion += array.nbytes
+
+    cabecera = json.loads(json.dumps({
+        'version_formato': VERSION_FORMATO,
+        'variables': indice.variables,
+        'profundidad': indice.profundidad,
+        'arrays': tabla,
+        'metadatos': indice.metadatos
+    }, ensure_ascii=False))
+    checksum = cabecera['sha256'] = suma_contenido(cabecera, *bloques)
+    cabecera_json = json.dumps(cabecera, ensure_ascii=False).encode('utf-8')
+    inicio_datos = _alinear(len(FIRMA_MAGICA) + 8 + len(cabecera_json))
+    cabecera_json += b' ' * (inicio_datos - len(FIRMA_MAGICA) - 8 - len(cabecera_json))
+
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'wb') as f:
+        f.write(FIRMA_MAGICA)
+        f.write(struct.pack('<II', VERSION_FORMATO, len(cabecera_json)))
+        f.write(cabecera_json)
+        for bloque in bloques:
+            f.write(bloque)
+    os.replace(temporal, ruta)
+    return checksum
+
+
+def abrir_indice(ruta, verificar=True):
+    """
+    Abre un índice .octref con mmap de sólo lectura (los arrays son vistas, no copias).
+
+    Args:
+        ruta: Ruta del archivo
+        verificar: Comprobar el SHA-256 de la cabecera y la sección de datos
+
+    Returns:
+        IndiceReferencias
+
+    Raises:
+        ErrorArtefacto: Si el archivo está dañado o no es compatible
+    """
+    import json
+    import mmap
+    import struct
+
+    import numpy as np
+
+    from octanaje.artefacto import ErrorArtefacto, suma_contenido
+
+    with open(ruta, 'rb') as f:
+        if f.read(len(FIRMA_MAGICA)) != FIRMA_MAGICA:
+            raise ErrorArtefacto(f"{ruta} no es un índice de referencias {EXTENSION}")
+        version, longitud = struct.unpack('<II', f.read(8))
+        if version != VERSION_FORMATO:
+            raise ErrorArtefacto(f"Versión de formato {version} no soportada (se esperaba {VERSION_FORMATO})")
+        cabecera = json.loads(f.read(longitud).decode('utf-8'))
+        mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    datos = memoryview(mapa)[len(FIRMA_MAGICA) + 8 + longitud:]
+    if verificar and suma_contenido(cabecera, datos) != cabecera.get('sha256'):
+        raise ErrorArtefacto(f"Checksum incorrecto en {ruta}: el archivo está dañado")
+
+    arrays = {}
+    for nombre, info in cabecera['arrays'].items():
+        n = int(np.prod(info['forma']))
+        arrays[nombre] = np.frombuffer(datos, dtype=info['dtype'], count=n,
+                                       offset=info['desplazamiento']).reshape(info['forma'])
+    return IndiceReferencias(cabecera['variables'], cabecera['profundidad'], cabecera['metadatos'], **arrays)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# ÍNDICE POR DEFECTO
+# ═══════════════════════════════════════════════════════════════════════════
+
+_INDICE = {}
+_CERROJO_INDICE = threading.Lock()
+
+
+def buscar_referencias():
+    """Devuelve la ruta del índice (OCTANAJE_REFERENCIAS o la primera de RUTAS_REFERENCIAS que exista), o None."""
+    rutas = list(RUTAS_REFERENCIAS)
+    if os.environ.get(VARIABLE_ENTORNO_REFERENCIAS):
+        rutas.insert(0, os.environ[VARIABLE_ENTORNO_REFERENCIAS])
+    return next((ruta for ruta in rutas if os.path.exists(ruta)), None)
+
+
+def indice_por_defecto():
+    """
+    Índice de referencias del proceso, abierto una vez y reabierto sólo si su archivo cambia.
+
+    Returns:
+        IndiceReferencias, o None si no hay índice o no se puede abrir
+    """
+    ruta = buscar_referencias()
+    if ruta is None:
+        return None
+    try:
+        clave = (os.path.abspath(ruta), os.stat(ruta).st_mtime_ns)
+    except OSError:
+        return None
+    if _INDICE.get('clave') == clave:
+        return _INDICE['indice']
+    from octanaje.artefacto import ErrorArtefacto
+
+    with _CERROJO_INDICE:
+        if _INDICE.get('clave') != clave:
+            try:
+                indice = abrir_indice(ruta)
+            except (OSError, ValueError, ErrorArtefacto):
+                indice = None
+            _INDICE.update(clave=clave, indice=indice)
+        return _INDICE['indice']
+
+
+def referencias_cercanas(X, variables, k=VECINOS, indice=None):
+    """
+    Vecinos de cada fila de X en el índice dado o en el por defecto.
+
+    Returns:
+        Lista de listas de dicts (IndiceReferencias.vecinos), o None si no hay índice
+    """
+    if indice is None:
+        indice = indice_por_defecto()
+    if indice is None or k <= 0:
+        return None
+    return indice.vecinos(X, k, variables)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# MEDICIÓN
+# ═══════════════════════════════════════════════════════════════════════════
+
+def medir(muestras=1_000_000, consultas=2_000, k=5, directorio=None):
+    """
+    Mide construcción, apertura y búsqueda con referencias sintéticas.
+
+    Las consultas son composiciones nuevas dentro de los rangos típicos; una
+    muestra de ellas se comprueba contra la búsqueda por fuerza bruta.
+
+    Returns:
+        dict con muestras, segundos de construcción, MB del archivo,
+        segundos de apertura, ms por consulta individual (mediana y p99),
+        µs por muestra en lote y 'exacto' (coincidencia con la fuerza bruta)
+    """
+    import tempfile
+
+    import numpy as np
+
+    from octanaje.entrenamiento import VARIABLES
+    from octanaje.modelo import muestras_referencia
+
+    rng = np.random.default_rng(0)
+    X = muestras_referencia(VARIABLES, n=muestras, semilla=1)[1:muestras + 1]
+    ron = rng.normal(95.5, 1.5, len(X)).round(1)
+    Q = muestras_referencia(VARIABLES, n=consultas, semilla=2)[1:consultas + 1]
+
+    with tempfile.TemporaryDirectory(dir=directorio) as temporal:
+        ruta = os.path.join(temporal, 'referencias' + EXTENSION)
+        inicio = time.perf_counter()
+        guardar_indice(construir_indice(X, ron), ruta)
+        construccion = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        indice = abrir_indice(ruta)
+        apertura = time.perf_counter() - inicio
+
+        individuales = []
+        for fila in Q[:500]:
+            inicio = time.perf_counter()
+            indice.buscar(fila, k)
+            individuales.append(time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        distancias, posiciones = indice.buscar(Q, k)
+        lote = time.perf_counter() - inicio
+
+        # Fuerza bruta sobre los mismos puntos (float32, como el índice)
+        puntos = np.asarray(indice.puntos, dtype=np.float64)
+        exacto = all(
+            np.allclose(np.sort(np.sqrt(((puntos - Q[i].astype(np.float32)) ** 2).sum(axis=1)))[:k],
+                        distancias[i], rtol=1e-5, atol=1e-5)
+            for i in range(0, consultas, max(1, consultas // 20))
+        )
+        tamano = os.path.getsize(ruta)
+        del indice, puntos
+
+    return {
+        'muestras': muestras,
+        'construccion_s': construccion,
+        'archivo_mb': tamano / 2**20,
+        'apertura_s': apertura,
+        'consulta_ms': float(np.median(individuales)) * 1000,
+        'consulta_p99_ms': float(np.percentile(individuales, 99)) * 1000,
+        'lote_us': lote / consultas * 1e6,
+        'exacto': exacto
+    }
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Muestras de laboratorio más parecidas (índice de referencias)")
+    parser.add_argument('--medir', action='store_true', help="Medir construcción y búsqueda con 1 millón de muestras")
+    subparsers = parser.add_subparsers(dest='orden')
+
+    construir = subparsers.add_parser('construir', help="Construye el índice de un archivo de laboratorio")
+    construir.add_argument('laboratorio', help="CSV o Parquet con los componentes y el RON medido")
+    construir.add_argument('--salida', default=RUTAS_REFERENCIAS[0])
+    construir.add_argument('--hoja', type=int, default=TAMANO_HOJA, help="Muestras máximas por hoja")
+
+    buscar = subparsers.add_parser('buscar', help="Referencias más cercanas a una muestra")
+    buscar.add_argument('muestra', nargs='?', type=json.loads, default=None,
+                        help="Objeto JSON con los 8 componentes (por defecto, el ejemplo)")
+    buscar.add_argument('--k', type=int, default=VECINOS)
+    buscar.add_argument('--indice', default=None, help="Archivo del índice (por defecto, el de OCTANAJE_REFERENCIAS)")
+
+    argumentos = parser.parse_args(argv)
+
+    if argumentos.medir:
+        r = medir()
+        print(f"{r['muestras']:,} referencias: construcción {r['construccion_s']:.1f} s, "
+              f"archivo {r['archivo_mb']:.0f} MB, apertura {r['apertura_s']:.2f} s")
+        print(f"Consulta individual: {r['consulta_ms']:.2f} ms (p99 {r['consulta_p99_ms']:.2f} ms); "
+              f"en lote: {r['lote_us']:.0f} µs por muestra; exacto: {'sí' if r['exacto'] else 'NO'}")
+        return 0
+
+    if argumentos.orden == 'construir':
+        try:
+            indice = construir_desde_archivo(argumentos.laboratorio, argumentos.hoja)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        guardar_indice(indice, argumentos.salida)
+        print(f"Índice de {len(indice):,} referencias ({indice.hojas:,} hojas) escrito en {argumentos.salida}")
+        return 0
+
+    if argumentos.orden == 'buscar':
+        from octanaje.componentes import EJEMPLO, completar_muestra
+
+        ruta = argumentos.indice or buscar_referencias()
+        if ruta is None:
+            print(f"No hay índice de referencias ({VARIABLE_ENTORNO_REFERENCIAS} o {RUTAS_REFERENCIAS[0]})",
+                  file=sys.stderr)
+            return 1
+        indice = abrir_indice(ruta)
+        muestra = completar_muestra(argumentos.muestra or EJEMPLO)
+        for vecino in indice.vecinos([[muestra[v] for v in indice.variables]], argumentos.k)[0]:
+            print(f"{vecino['referencia']:<20} distancia {vecino['distancia']:>7.3f}  RON {vecino['ron']:.1f}")
+        return 0
+
+    parser.print_help()
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+Banco de pruebas de rendimiento con comparación contra una línea base.
+
+Mide las operaciones de las que depende la aplicación y escribe los
+resultados en JSON. Si se indica una línea base, compara cada caso y termina
+con código 1 cuando alguno es más lento que la base por encima del umbral, de
+modo que un reentrenamiento o una actualización de librerías que empeore el
+rendimiento se detecta antes de desplegar.
+
+Casos:
+    carga_fria                 cargar_modelo en un intérprete nuevo (importaciones incluidas)
+    carga_caliente             cargar_modelo en un proceso que ya lo cargó
+    fila_dataframe             modelo.predict con un DataFrame de una fila, como la app original
+    predecir_muestra           octanaje.predecir sin caché (fila + intervalo + clasificación)
+    lote_1 ... lote_1000000    modelo.predict sobre matrices de 1, 100, 10k y 1M filas
+    clasificar_gasolina        clasificación escalar de 10.000 octanajes
+    clasificar_lote            clasificación vectorizada de 1M octanajes
+    app_ejecucion              ejecución completa de streamlit_app.py con AppTest
+    app_prediccion             ejecución tras pulsar "CALCULAR OCTANAJE"
+
+Uso:
+    python -m octanaje.rendimiento --salida resultados.json
+    python -m octanaje.rendimiento --base rendimiento_base.json --umbral 0.25
+    python -m octanaje.rendimiento --guardar-base rendimiento_base.json
+
+La línea base del repositorio (rendimiento_base.json) se midió en 1 núcleo;
+en otra máquina hay que regenerarla antes de usarla como referencia.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from datetime import datetime
+
+from octanaje.componentes import EJEMPLO
+
+# Tamaños de lote medidos por defecto
+TAMANOS_LOTE = [1, 100, 10_000, 1_000_000]
+
+# Repeticiones de cada medición (se compara la mediana)
+REPETICIONES = 5
+
+# Fracción de empeoramiento sobre la base a partir de la cual se avisa
+UMBRAL_REGRESION = 0.25
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_APP = os.path.join(RAIZ, 'streamlit_app.py')
+
+_CODIGO_CARGA_FRIA = '''
+import time
+inicio = time.perf_counter()
+import octanaje
+modelo, variables, error = octanaje.cargar_modelo()
+assert error is None, error
+print(time.perf_counter() - inicio)
+'''
+
+
+def cronometrar(funcion, repeticiones=REPETICIONES):
+    """
+    Mide una función con timeit, ajustando las llamadas por repetición.
+
+    Returns:
+        Lista de segundos por llamada, una entrada por repetición
+    """
+    temporizador = timeit.Timer(funcion)
+    llamadas, _ = temporizador.autorange()
+    return [t / llamadas for t in temporizador.repeat(repeat=repeticiones, number=llamadas)]
+
+
+def _resumen(tiempos, filas=None):
+    resultado = {
+        'segundos': statistics.median(tiempos),
+        'minimo_s': min(tiempos),
+        'repeticiones': len(tiempos)
+    }
+    if filas:
+        resultado['filas'] = filas
+        resultado['filas_s'] = filas / resultado['segundos']
+    return resultado
+
+
+def medir_carga_fria(repeticiones=3):
+    """Tiempo de cargar_modelo en intérpretes nuevos, importaciones incluidas."""
+    entorno = dict(os.environ, PYTHONPATH=RAIZ + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    tiempos = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, '-c', _CODIGO_CARGA_FRIA], cwd=RAIZ, env=entorno,
+                                capture_output=True, text=True, check=True)
+        tiempos.append(float(salida.stdout.split()[-1]))
+    return _resumen(tiempos)
+
+
+def medir_prediccion(tamanos=TAMANOS_LOTE, repeticiones=REPETICIONES):
+    """Carga caliente, predicción de una fila y predicción por lotes."""
+    import numpy as np
+    import pandas as pd
+
+    import octanaje
+    from octanaje.componentes import completar_muestra
+    from octanaje.modelo import muestras_referencia
+
+    resultados = {}
+    modelo, variables, error = octanaje.cargar_modelo()
+    if error:
+        raise RuntimeError(error)
+    resultados['carga_caliente'] = _resumen(cronometrar(octanaje.cargar_modelo, repeticiones))
+
+    muestra = completar_muestra(EJEMPLO)
+    resultados['fila_dataframe'] = _resumen(cronometrar(
+        lambda: modelo.predict(pd.DataFrame([muestra])[variables]), repeticiones
+    ), filas=1)
+    resultados['predecir_muestra'] = _resumen(cronometrar(
+        lambda: octanaje.predecir(EJEMPLO, modelo, variables, cache=None), repeticiones
+    ), filas=1)
+
+    referencia = muestras_referencia(variables, n=5_000)
+    for tamano in tamanos:
+        X = np.resize(referencia, (tamano, referencia.shape[1]))
+        # Los lotes grandes tardan segundos: basta con menos repeticiones
+        n = repeticiones if tamano < 1_000_000 else max(1, repeticiones // 2)
+        resultados[f'lote_{tamano}'] = _resumen(cronometrar(lambda: modelo.predict(X), n), filas=tamano)
+    return resultados
+
+
+def medir_clasificacion(repeticiones=REPETICIONES):
+    """Rendimiento de la clasificación escalar y vectorizada."""
+    import numpy as np
+
+    from octanaje.clasificacion import clasificar_gasolina, clasificar_lote
+
+    octanajes = np.random.default_rng(0).uniform(92.0, 101.0, 1_000_000)
+    escalares = octanajes[:10_000].tolist()
+
+    def clasificar_escalares():
+        for octanaje in escalares:
+            clasificar_gasolina(octanaje)
+
+    return {
+        'clasificar_gasolina': _resumen(cronometrar(clasificar_escalares, repeticiones), filas=len(escalares)),
+        'clasificar_lote': _resumen(cronometrar(lambda: clasificar_lote(octanajes), repeticiones),
+                                    filas=len(octanajes))
+    }
+
+
+def medir_app(repeticiones=REPETICIONES):
+    """
+    Coste de volver a ejecutar streamlit_app.py entero con AppTest.
+
+    Returns:
+        dict de casos, vacío si Streamlit no está instalado
+    """
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return {}
+
+    from octanaje.sesiones import registros_temporales
+
+    # El historial y el registro de sombra de la app, fuera de la raíz del repositorio
+    with registros_temporales():
+        app = AppTest.from_file(RUTA_APP, default_timeout=120).run()
+        if app.exception:
+            raise RuntimeError(f"streamlit_app.py falló: {app.exception[0].message}")
+
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            app.run()
+            tiempos.append(time.perf_counter() - inicio)
+        resultados = {'app_ejecucion': _resumen(tiempos)}
+
+        for componente, valor in EJEMPLO.items():
+            app.number_input(key=componente.lower()).set_value(valor)
+        tiempos = []
+        for _ in range(repeticiones):
+            next(b for b in app.button if 'CALCULAR OCTANAJE' in b.label).click()
+            inicio = time.perf_counter()
+            app.run()
+            tiempos.append(time.perf_counter() - inicio)
+        if app.exception or not any(m.label == 'Categoría' for m in app.metric):
+            raise RuntimeError("streamlit_app.py no mostró el resultado de la predicción")
+        resultados['app_prediccion'] = _resumen(tiempos)
+    return resultados
+
+
+def entorno():
+    """Versiones y máquina en las que se midió."""
+    from importlib import metadata
+
+    versiones = {}
+    for paquete in ('numpy', 'pandas', 'scikit-learn', 'streamlit'):
+        try:
+            versiones[paquete] = metadata.version(paquete)
+        except metadata.PackageNotFoundError:
+            versiones[paquete] = None
+    return {
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'nucleos': os.cpu_count(),
+        **versiones
+    }
+
+
+def ejecutar(tamanos=TAMANOS_LOTE, repeticiones=REPETICIONES, app=True):
+    """
+    Ejecuta todos los casos.
+
+    Returns:
+        dict serializable en JSON con fecha, entorno, firma del modelo y
+        'casos' (nombre -> segundos, minimo_s, repeticiones y filas_s)
+    """
+    from octanaje.modelo import modelo_por_defecto
+
+    casos = {'carga_fria': medir_carga_fria()}
+    casos.update(medir_prediccion(tamanos, repeticiones))
+    casos.update(medir_clasificacion(repeticiones))
+    if app:
+        casos.update(medir_app(repeticiones))
+
+    modelo, _ = modelo_por_defecto()
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': entorno(),
+        'modelo': getattr(modelo, 'firma', None),
+        'casos': casos
+    }
+
+
+def comparar(resultados, base, umbral=UMBRAL_REGRESION):
+    """
+    Compara los tiempos medianos con los de una línea base.
+
+    Args:
+        resultados: Salida de ejecutar
+        base: Salida de ejecutar guardada como referencia
+        umbral: Empeoramiento relativo admitido (0.25 = 25% más lento)
+
+    Returns:
+        Lista de dicts (caso, base_s, actual_s, relacion, regresion) de los
+        casos presentes en ambos
+    """
+    comparacion = []
+    for caso, actual in resultados['casos'].items():
+        referencia = base['casos'].get(caso)
+        if referencia is None:
+            continue
+        relacion = actual['segundos'] / referencia['segundos']
+        comparacion.append({
+            'caso': caso,
+            'base_s': referencia['segundos'],
+            'actual_s': actual['segundos'],
+            'relacion': relacion,
+            'regresion': relacion > 1 + umbral
+        })
+    return comparacion
+
+
+def imprimir_resultados(resultados, comparacion=None):
+    relaciones = {c['caso']: c for c in comparacion or []}
+    print(f"{'caso':<22} {'mediana':>12} {'filas/s':>14} {'vs base':>9}")
+    for caso, r in resultados['casos'].items():
+        filas_s = f"{r['filas_s']:,.0f}" if 'filas_s' in r else '-'
+        if caso in relaciones:
+            c = relaciones[caso]
+            frente_base = f"{c['relacion']:.2f}x" + (' ⚠' if c['regresion'] else '')
+        else:
+            frente_base = '-'
+        print(f"{caso:<22} {_formatear_tiempo(r['segundos']):>12} {filas_s:>14} {frente_base:>9}")
+
+
+def _formatear_tiempo(segundos):
+    if segundos < 1e-3:
+        return f"{segundos * 1e6:.1f} µs"
+    if segundos < 1:
+        return f"{segundos * 1e3:.1f} ms"
+    return f"{segundos:.2f} s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento del modelo de octanaje")
+    parser.add_argument('--salida', help="Archivo JSON donde escribir los resultados")
+    parser.add_argument('--base', help="Línea base JSON con la que comparar")
+    parser.add_argument('--guardar-base', metavar='RUTA', help="Guarda los resultados como línea base")
+    parser.add_argument('--umbral', type=float, default=UMBRAL_REGRESION,
+                        help="Empeoramiento relativo admitido frente a la base (0.25 = 25%%)")
+    parser.add_argument('--repeticiones', type=int, default=REPETICIONES)
+    parser.add_argument('--tamanos', type=int, nargs='+', default=TAMANOS_LOTE,
+                        help="Tamaños de lote a medir")
+    parser.add_argument('--sin-app', action='store_true', help="No medir streamlit_app.py")
+    argumentos = parser.parse_args(argv)
+
+    resultados = ejecutar(argumentos.tamanos, argumentos.repeticiones, app=not argumentos.sin_app)
+
+    comparacion = None
+    if argumentos.base:
+        with open(argumentos.base, encoding='utf-8') as f:
+            comparacion = comparar(resultados, json.load(f), argumentos.umbral)
+        resultados['comparacion'] = {'base': argumentos.base, 'umbral': argumentos.umbral,
+                                     'casos': comparacion}
+
+    for ruta in (argumentos.salida, argumentos.guardar_base):
+        if ruta:
+            with open(ruta, 'w', encoding='utf-8') as f:
+                json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+    imprimir_resultados(resultados, comparacion)
+    regresiones = [c['caso'] for c in comparacion or [] if c['regresion']]
+    if regresiones:
+        print(f"Regresiones por encima del {argumentos.umbral:.0%}: {', '.join(regresiones)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,519 @@
+"""
+Servicio HTTP de predicción de octanaje con agrupación dinámica de peticiones.
+
+Servidor asyncio sin dependencias externas (HTTP/1.1 con keep-alive) para que
+LIMS, control de mezclas y otros sistemas de planta consulten el modelo.
+Las peticiones concurrentes que llegan dentro de una ventana de pocos
+milisegundos se agrupan en una sola llamada a predict.
+
+Uso:
+    python -m octanaje.servicio --puerto 8000 --ventana-ms 2 --lote-max 256
+
+Endpoints:
+    POST /predecir       Una muestra {"PARAFINAS": ..., ...}, una lista de
+                         muestras o {"muestras": [...]}
+    GET  /salud          Estado del servicio
+    GET  /estadisticas   Peticiones, lotes, muestras procesadas y caché
+    GET  /metricas       Métricas en formato de texto de Prometheus
+                         (octanaje.metricas)
+    GET  /modelo         Versiones vigente y anterior del modelo
+    POST /modelo/revertir  Volver a la versión anterior
+    GET  /sombra         Comparaciones con el modelo candidato (con --sombra)
+    GET  /deriva         Deriva de las muestras frente a las de entrenamiento
+                         (octanaje.deriva)
+
+El modelo se recarga en caliente cuando cambia su archivo (octanaje.versiones):
+cada lote se predice entero con la versión vigente al empezarlo, y las
+peticiones en curso no se interrumpen.
+
+Las composiciones repetidas se sirven desde la caché compartida
+(octanaje.cache) sin pasar por el agrupador.
+
+El bucle de eventos sólo lee y escribe las conexiones y consulta la caché:
+la predicción, el dominio, las referencias, la deriva, la sombra y el
+historial de cada lote se hacen en el hilo del agrupador (y los de las
+muestras de la caché, en otro hilo del ejecutor). Las peticiones con un
+Content-Length no numérico o con valores no finitos (NaN, Infinity) se
+rechazan con 400.
+
+Con --historial RUTA cada muestra predicha se guarda además en el historial
+de predicciones (octanaje.historial), escrito en segundo plano.
+
+Con --sombra RUTA un modelo candidato puntúa en segundo plano las mismas
+filas de cada lote (octanaje.sombra). Las respuestas son siempre las de
+producción.
+
+Cada resultado incluye octanaje, octanaje_redondeado, intervalo, categoria,
+codigo_nc, epigrafe, advertencia, limite_critico, fuera_dominio,
+version_modelo y referencias. Las muestras fuera del dominio del modelo
+(octanaje.dominio) llevan en fuera_dominio el motivo y la categoría
+"SIN CLASIFICAR". referencias son las --vecinos muestras de laboratorio más
+parecidas con su RON medido (octanaje.referencias), o null si no hay índice
+de referencias.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+
+from octanaje.cache import CACHE
+from octanaje.clasificacion import clasificar_gasolina
+from octanaje.componentes import completar_muestra
+from octanaje.deriva import monitor_modelo, observar_deriva
+from octanaje.dominio import comprobar_dominio
+from octanaje.intervalos import intervalo_calibrado, predecir_intervalos
+from octanaje.metricas import METRICAS, TIPO_CONTENIDO, contar_clasificacion, etapa, histograma_latencia, perfilar
+from octanaje.referencias import VECINOS, referencias_cercanas
+from octanaje.versiones import RegistroModelos, registro_por_defecto
+
+# Tamaño máximo del cuerpo de una petición (bytes)
+TAMANO_MAXIMO_CUERPO = 10 * 1024 * 1024
+
+MENSAJES_HTTP = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error'
+}
+
+
+class ErrorPeticion(Exception):
+    """Petición inválida; se responde con el código HTTP indicado."""
+
+    def __init__(self, mensaje, codigo=400):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+
+def resultado_servicio(octanaje, clasificacion=None, version=None, referencias=None):
+    """
+    Construye la respuesta de una muestra a partir de su octanaje predicho.
+
+    Args:
+        octanaje: Octanaje predicho con decimales
+        clasificacion: Resultado de clasificar_gasolina (se calcula si falta)
+        version: Versión del modelo que lo predijo (octanaje.versiones)
+        referencias: Muestras de laboratorio más parecidas (octanaje.referencias)
+
+    Returns:
+        dict serializable en JSON con predicción y clasificación fiscal
+    """
+    if clasificacion is None:
+        clasificacion = clasificar_gasolina(octanaje)
+    return {
+        'octanaje': round(octanaje, 4),
+        'octanaje_redondeado': round(octanaje),
+        'intervalo': [round(v, 4) for v in clasificacion['intervalo']],
+        'categoria': clasificacion['categoria'],
+        'codigo_nc': clasificacion['codigo_nc'],
+        'epigrafe': clasificacion['epigrafe'],
+        'advertencia': clasificacion['advertencia'],
+        'limite_critico': clasificacion['limite_critico'],
+        'fuera_dominio': clasificacion.get('fuera_dominio'),
+        'version_modelo': version,
+        'referencias': referencias
+    }
+
+
+class AgrupadorLotes:
+    """
+    Agrupa las muestras de peticiones concurrentes en lotes de predicción.
+
+    La primera petición que llega abre una ventana de `ventana_ms`; todas las
+    que llegan durante la ventana (hasta `lote_max` muestras) se procesan
+    juntas con `procesar(version, filas)` en un hilo aparte, sin bloquear el
+    bucle de eventos, con la versión de `modelos` vigente al empezar el lote.
+    `procesar` devuelve un resultado por fila; por defecto, predecir_filas.
+    Con `ventana_ms=0` y `lote_max=1` cada petición se predice por separado.
+    """
+
+    def __init__(self, modelos, ventana_ms=2.0, lote_max=256, procesar=None):
+        self.modelos = modelos
+        self.ventana = ventana_ms / 1000.0
+        self.lote_max = max(1, int(lote_max))
+        self.procesar = procesar or predecir_filas
+        self.lotes = 0
+        self.muestras = 0
+        self._cola = asyncio.Queue()
+        self._tarea = None
+
+    def iniciar(self):
+        self._tarea = asyncio.get_running_loop().create_task(self._bucle())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+
+    async def predecir(self, filas):
+        """
+        Encola filas de entrada y espera sus predicciones.
+
+        Args:
+            filas: Lista de filas en el orden de `variables`
+
+        Returns:
+            Tupla (resultados, version): lista con el resultado de `procesar`
+            para cada fila y la VersionModelo que los calculó
+        """
+        futuro = asyncio.get_running_loop().create_future()
+        await self._cola.put((filas, futuro))
+        return await futuro
+
+    def _vaciar_cola(self, pendientes, n):
+        while n < self.lote_max and not self._cola.empty():
+            filas, futuro = self._cola.get_nowait()
+            pendientes.append((filas, futuro))
+            n += len(filas)
+        return n
+
+    async def _bucle(self):
+        bucle = asyncio.get_running_loop()
+        while True:
+            filas, futuro = await self._cola.get()
+            pendientes = [(filas, futuro)]
+            n = self._vaciar_cola(pendientes, len(filas))
+            if n < self.lote_max and self.ventana > 0:
+                await asyncio.sleep(self.ventana)
+                n = self._vaciar_cola(pendientes, n)
+
+            matriz = [fila for filas, _ in pendientes for fila in filas]
+            version = self.modelos.actual
+            try:
+                resultados = await bucle.run_in_executor(None, self.procesar, version, matriz)
+            except Exception as e:
+                for _, futuro in pendientes:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                continue
+
+            self.lotes += 1
+            self.muestras += n
+            inicio = 0
+            for filas, futuro in pendientes:
+                fin = inicio + len(filas)
+                if not futuro.done():
+                    futuro.set_result((resultados[inicio:fin], version))
+                inicio = fin
+
+
+def predecir_filas(version, filas):
+    """Octanaje e intervalo de cada fila: lista de tuplas (octanaje, inferior, superior)."""
+    predicciones = predecir_intervalos(version.modelo, version.variables, filas)
+    return list(zip(*(p.tolist() for p in predicciones)))
+
+
+class ServicioOctanaje:
+    """Servidor HTTP mínimo sobre asyncio que atiende las peticiones de predicción."""
+
+    def __init__(self, modelo=None, variables=None, ventana_ms=2.0, lote_max=256, cache=CACHE, historial=None,
+                 modelos=None, sombra=None, vecinos=VECINOS):
+        if modelos is None:
+            modelos = RegistroModelos.fijo(modelo, variables) if modelo is not None else registro_por_defecto()
+        self.modelos = modelos
+        self.cache = cache
+        self.historial = historial
+        self.sombra = sombra
+        self.vecinos = vecinos
+        self.agrupador = AgrupadorLotes(modelos, ventana_ms, lote_max, self._procesar_lote)
+        self.peticiones = 0
+        self._servidor = None
+        self._conexiones = set()
+
+    async def iniciar(self, host='127.0.0.1', puerto=8000):
+        """Arranca el servidor y devuelve el puerto en el que escucha."""
+        self.agrupador.iniciar()
+        self._servidor = await asyncio.start_server(self._atender_conexion, host, puerto)
+        return self._servidor.sockets[0].getsockname()[1]
+
+    async def detener(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            for escritor in list(self._conexiones):
+                escritor.close()
+            await self._servidor.wait_closed()
+        await self.agrupador.detener()
+
+    async def servir(self):
+        async with self._servidor:
+            await self._servidor.serve_forever()
+
+    def _muestras_peticion(self, cuerpo):
+        try:
+            datos = json.loads(cuerpo)
+        except (ValueError, UnicodeDecodeError):
+            raise ErrorPeticion("El cuerpo no es JSON válido")
+
+        if isinstance(datos, dict) and 'muestras' in datos:
+            datos = datos['muestras']
+        individual = isinstance(datos, dict)
+        muestras = [datos] if individual else datos
+        if not isinstance(muestras, list) or not muestras:
+            raise ErrorPeticion("Se esperaba una muestra o una lista de muestras")
+
+        completas = []
+        with etapa('entrada'):
+            for i, muestra in enumerate(muestras):
+                if not isinstance(muestra, dict):
+                    raise ErrorPeticion(f"La muestra {i} no es un objeto JSON")
+                try:
+                    completa = completar_muestra(muestra)
+                except (TypeError, ValueError) as e:
+                    raise ErrorPeticion(f"Muestra {i}: {e}")
+                no_finitos = [c for c, valor in completa.items() if not math.isfinite(valor)]
+                if no_finitos:
+                    raise ErrorPeticion(f"Muestra {i}: valores no finitos en {', '.join(no_finitos)}")
+                completas.append(completa)
+        return completas, individual
+
+    async def _predecir_muestras(self, muestras):
+        """
+        Predice y clasifica muestras, consultando antes la caché compartida.
+
+        En el bucle de eventos sólo se consulta y se llena la caché; el resto
+        (predicción, dominio, referencias, deriva, sombra, métricas e
+        historial) se hace en el hilo del agrupador o, para las muestras de la
+        caché, en otro hilo del ejecutor.
+        """
+        version = self.modelos.actual
+        filas = [[m[v] for v in version.variables] for m in muestras]
+        claves = [self.cache.clave(m) if self.cache is not None else None for m in muestras]
+        guardados = [self.cache.obtener(c, version.modelo) if c is not None else None for c in claves]
+        respuestas = [None] * len(muestras)
+
+        pendientes = [i for i, r in enumerate(guardados) if r is None]
+        if pendientes:
+            # Todas las versiones tienen las variables en el mismo orden (prueba_humo)
+            lote, version_lote = await self.agrupador.predecir([filas[i] for i in pendientes])
+            for i, (octanaje, clasificacion, respuesta) in zip(pendientes, lote):
+                respuestas[i] = respuesta
+                if claves[i] is not None:
+                    self.cache.guardar(claves[i], version_lote.modelo, octanaje, clasificacion)
+        if len(pendientes) < len(muestras):
+            guardadas = [i for i, r in enumerate(guardados) if r is not None]
+            completadas = await asyncio.get_running_loop().run_in_executor(
+                None, self._procesar_guardadas, version, [filas[i] for i in guardadas], [guardados[i] for i in guardadas]
+            )
+            for i, respuesta in zip(guardadas, completadas):
+                respuestas[i] = respuesta
+        return respuestas
+
+    def _procesar_lote(self, version, filas):
+        """
+        Procesa un lote del agrupador (fuera del bucle de eventos).
+
+        Returns:
+            Lista de tuplas (octanaje, clasificacion, respuesta), una por fila
+        """
+        predicciones, inferior, superior = predecir_intervalos(version.modelo, version.variables, filas)
+        _, motivos = comprobar_dominio(version.modelo, version.variables, filas)
+        octanajes = predicciones.tolist()
+        calibrado = intervalo_calibrado(version.modelo)
+        with etapa('clasificacion'):
+            clasificaciones = [clasificar_gasolina(octanaje, (inf, sup), motivo, calibrado)
+                               for octanaje, inf, sup, motivo in zip(
+                                   octanajes, inferior.tolist(), superior.tolist(), motivos)]
+        if self.sombra is not None:
+            self.sombra.comparar(filas, version.variables, predicciones, [c['categoria'] for c in clasificaciones],
+                                 'servicio', version.version)
+        observar_deriva(version.modelo, version.variables, filas, predicciones)
+        respuestas = self._responder(version, filas, octanajes, clasificaciones)
+        return list(zip(octanajes, clasificaciones, respuestas))
+
+    def _procesar_guardadas(self, version, filas, guardados):
+        """Muestras servidas desde la caché: sombra, deriva y respuestas (fuera del bucle de eventos)."""
+        octanajes = [octanaje for octanaje, _ in guardados]
+        clasificaciones = [clasificacion for _, clasificacion in guardados]
+        if self.sombra is not None:
+            self.sombra.comparar(filas, version.variables, octanajes, [c['categoria'] for c in clasificaciones],
+                                 'servicio', version.version)
+        observar_deriva(version.modelo, version.variables, filas, octanajes)
+        return self._responder(version, filas, octanajes, clasificaciones)
+
+    def _responder(self, version, filas, octanajes, clasificaciones):
+        """Referencias, métricas e historial de filas ya clasificadas; devuelve sus respuestas."""
+        with etapa('referencias'):
+            referencias = referencias_cercanas(filas, version.variables, self.vecinos)
+        if referencias is None:
+            referencias = [None] * len(filas)
+        respuestas = []
+        for octanaje, clasificacion, cercanas in zip(octanajes, clasificaciones, referencias):
+            contar_clasificacion(clasificacion, 'servicio')
+            respuestas.append(resultado_servicio(octanaje, clasificacion, version.version, cercanas))
+        if self.historial is not None:
+            for fila, respuesta in zip(filas, respuestas):
+                self.historial.registrar(dict(zip(version.variables, fila)), respuesta, 'servicio')
+        return respuestas
+
+    async def _despachar(self, metodo, ruta, cuerpo):
+        if ruta == '/salud':
+            return 200, {'estado': 'ok'}
+        if ruta == '/estadisticas':
+            return 200, {
+                'peticiones': self.peticiones,
+                'lotes': self.agrupador.lotes,
+                'muestras': self.agrupador.muestras,
+                'modelo': self.modelos.actual.version,
+                'cache': self.cache.estadisticas() if self.cache is not None else None
+            }
+        if ruta == '/metricas':
+            return 200, METRICAS.texto_prometheus()
+        if ruta == '/modelo':
+            return 200, self.modelos.estado()
+        if ruta == '/deriva':
+            version = self.modelos.actual
+            monitor = monitor_modelo(version.modelo, version.variables)
+            if monitor is None:
+                raise ErrorPeticion("El modelo vigente no tiene referencia de deriva", 404)
+            return 200, monitor.estado()
+        if ruta == '/sombra':
+            if self.sombra is None:
+                raise ErrorPeticion("No hay modelo candidato en sombra (--sombra)", 404)
+            return 200, self.sombra.estadisticas()
+        if ruta == '/modelo/revertir':
+            if metodo != 'POST':
+                raise ErrorPeticion("Use POST en /modelo/revertir", 405)
+            try:
+                self.modelos.revertir()
+            except ValueError as e:
+                raise ErrorPeticion(str(e), 409)
+            return 200, self.modelos.estado()
+        if ruta != '/predecir':
+            raise ErrorPeticion(f"Ruta desconocida: {ruta}", 404)
+        if metodo != 'POST':
+            raise ErrorPeticion("Use POST en /predecir", 405)
+
+        with perfilar('servicio'):
+            muestras, individual = self._muestras_peticion(cuerpo)
+            resultados = await self._predecir_muestras(muestras)
+        return 200, resultados[0] if individual else {'resultados': resultados}
+
+    async def _atender_conexion(self, lector, escritor):
+        self._conexiones.add(escritor)
+        try:
+            while True:
+                try:
+                    cabecera = await lector.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                lineas = cabecera.decode('latin-1').split('\r\n')
+                try:
+                    metodo, ruta, version = lineas[0].split(' ', 2)
+                except ValueError:
+                    break
+                cabeceras = {}
+                for linea in lineas[1:]:
+                    if ':' in linea:
+                        nombre, valor = linea.split(':', 1)
+                        cabeceras[nombre.strip().lower()] = valor.strip()
+
+                mantener = cabeceras.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                self.peticiones += 1
+                inicio = time.perf_counter()
+                try:
+                    try:
+                        longitud = int(cabeceras.get('content-length', 0) or 0)
+                    except ValueError:
+                        longitud = -1
+                    if longitud < 0:
+                        # Sin longitud válida no se sabe dónde acaba el cuerpo
+                        mantener = False
+                        raise ErrorPeticion("Content-Length inválido")
+                    if longitud > TAMANO_MAXIMO_CUERPO:
+                        mantener = False
+                        raise ErrorPeticion("Cuerpo demasiado grande", 413)
+                    cuerpo = await lector.readexactly(longitud) if longitud else b''
+                    codigo, respuesta = await self._despachar(metodo, ruta.split('?', 1)[0], cuerpo)
+                except ErrorPeticion as e:
+                    codigo, respuesta = e.codigo, {'error': str(e)}
+                except asyncio.IncompleteReadError:
+                    break
+                except Exception as e:
+                    codigo, respuesta = 500, {'error': f"Error interno: {e}"}
+
+                if isinstance(respuesta, str):
+                    datos, tipo = respuesta.encode('utf-8'), TIPO_CONTENIDO
+                else:
+                    with etapa('presentacion'):
+                        datos = json.dumps(respuesta, ensure_ascii=False).encode('utf-8')
+                    tipo = 'application/json; charset=utf-8'
+                escritor.write(
+                    f"HTTP/1.1 {codigo} {MENSAJES_HTTP[codigo]}\r\n"
+                    f"Content-Type: {tipo}\r\n"
+                    f"Content-Length: {len(datos)}\r\n"
+                    f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n".encode('latin-1')
+                    + datos
+                )
+                await escritor.drain()
+                if ruta.startswith('/predecir') and codigo == 200:
+                    histograma_latencia('servicio').observar(time.perf_counter() - inicio)
+                if not mantener:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._conexiones.discard(escritor)
+            escritor.close()
+
+
+async def _principal(argumentos):
+    historial = None
+    if argumentos.historial:
+        from octanaje.historial import HistorialPredicciones
+
+        historial = HistorialPredicciones(argumentos.historial)
+    sombra = None
+    if argumentos.sombra:
+        from octanaje.sombra import ModeloSombra
+
+        sombra = ModeloSombra(argumentos.sombra)
+    servicio = ServicioOctanaje(ventana_ms=argumentos.ventana_ms, lote_max=argumentos.lote_max, historial=historial,
+                                sombra=sombra, vecinos=argumentos.vecinos)
+    puerto = await servicio.iniciar(argumentos.host, argumentos.puerto)
+    print(f"Servicio de octanaje en http://{argumentos.host}:{puerto} "
+          f"(ventana {argumentos.ventana_ms} ms, lote máximo {argumentos.lote_max}, "
+          f"modelo {servicio.modelos.actual.version}"
+          + (f", candidato en sombra {sombra.version}" if sombra is not None else '') + ")")
+    try:
+        await servicio.servir()
+    finally:
+        if historial is not None:
+            historial.cerrar()
+        if sombra is not None:
+            sombra.cerrar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP de predicción de octanaje")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--ventana-ms', type=float, default=2.0,
+                        help="Tiempo máximo de espera para agrupar peticiones (0 = sin espera)")
+    parser.add_argument('--lote-max', type=int, default=256,
+                        help="Muestras máximas por lote (1 = sin agrupación)")
+    parser.add_argument('--historial', metavar='RUTA', default=None,
+                        help="Guardar las predicciones en este historial SQLite")
+    parser.add_argument('--sombra', metavar='RUTA', default=None,
+                        help="Modelo candidato que puntúa en sombra las mismas peticiones (octanaje.sombra)")
+    parser.add_argument('--vecinos', type=int, default=VECINOS,
+                        help="Muestras de laboratorio más parecidas en cada respuesta (0 = ninguna)")
+    argumentos = parser.parse_args(argv)
+
+    try:
+        asyncio.run(_principal(argumentos))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""
+Simulación de sesiones de operadores contra un servidor Streamlit real.
+
+AppTest ejecuta siempre el script completo, así que no sirve para medir
+formularios ni fragmentos. Este módulo arranca `streamlit run` sin
+navegador, se conecta por websocket como lo haría el navegador y repite el
+recorrido de un operador:
+
+    1. Abrir la aplicación
+    2. Escribir los 8 componentes de la mezcla de ejemplo, uno a uno
+    3. Pulsar "CALCULAR OCTANAJE"
+    4. Pulsar "LIMPIAR RESULTADOS"
+
+El cliente imita al navegador: un cambio en un widget de formulario no envía
+nada hasta que se pulsa el botón de envío, y un widget dentro de un fragmento
+pide la ejecución sólo de ese fragmento. Para cada paso se mide el tiempo
+hasta el fin de la ejecución y el tiempo de CPU consumido por el servidor
+(/proc/<pid>/stat, sólo Linux).
+
+Mientras se mide, el historial de predicciones y el registro de sombra van a
+un directorio temporal (registros_temporales), no a la raíz del
+repositorio: las mediciones no dejan archivos SQLite detrás.
+
+Uso:
+    python -m octanaje.sesiones --sesiones 5
+
+Requiere el paquete `websockets` (dependencia del servidor de Streamlit).
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from octanaje.componentes import EJEMPLO
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_APP = os.path.join(RAIZ, 'streamlit_app.py')
+
+# Estados de fin de ejecución que no cierran la interacción (le sigue otra)
+_FIN_PARCIAL = 'FINISHED_EARLY_FOR_RERUN'
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def registros_temporales():
+    """
+    Lleva el historial y el registro de sombra a un directorio temporal mientras dura el bloque.
+
+    Cambia las variables de entorno de este proceso (los subprocesos las
+    heredan) y las restaura al salir.
+
+    Yields:
+        dict variable de entorno -> ruta
+    """
+    from octanaje.historial import VARIABLE_ENTORNO_HISTORIAL
+    from octanaje.sombra import VARIABLE_ENTORNO_REGISTRO
+
+    with tempfile.TemporaryDirectory(prefix='octanaje-mediciones-') as directorio:
+        rutas = {
+            VARIABLE_ENTORNO_HISTORIAL: os.path.join(directorio, 'historial_predicciones.sqlite3'),
+            VARIABLE_ENTORNO_REGISTRO: os.path.join(directorio, 'comparaciones_sombra.sqlite3')
+        }
+        anteriores = {variable: os.environ.get(variable) for variable in rutas}
+        os.environ.update(rutas)
+        try:
+            yield rutas
+        finally:
+            for variable, valor in anteriores.items():
+                if valor is None:
+                    os.environ.pop(variable, None)
+                else:
+                    os.environ[variable] = valor
+
+
+def cpu_proceso(pid):
+    """Segundos de CPU (usuario + sistema) consumidos por un proceso."""
+    with open(f'/proc/{pid}/stat') as f:
+        campos = f.read().rsplit(')', 1)[1].split()
+    return (int(campos[11]) + int(campos[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class ServidorStreamlit:
+    """`streamlit run` en un subproceso sin navegador y con registros temporales, para las mediciones."""
+
+    def __init__(self, ruta_app=RUTA_APP, puerto=None):
+        self.ruta_app = ruta_app
+        self.puerto = puerto or _puerto_libre()
+        self.proceso = None
+        self._registros = None
+
+    def __enter__(self):
+        self._registros = registros_temporales()
+        self._registros.__enter__()
+        self.proceso = subprocess.Popen(
+            [sys.executable, '-m', 'streamlit', 'run', self.ruta_app,
+             '--server.headless', 'true', '--server.port', str(self.puerto),
+             '--server.enableCORS', 'false', '--server.enableXsrfProtection', 'false',
+             '--browser.gatherUsageStats', 'false', '--server.fileWatcherType', 'none'],
+            cwd=os.path.dirname(self.ruta_app), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        limite = time.monotonic() + 60
+        while time.monotonic() < limite:
+            try:
+                socket.create_connection(('127.0.0.1', self.puerto), timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("El servidor de Streamlit no arrancó")
+
+    def __exit__(self, *exc):
+        if self.proceso is not None:
+            self.proceso.terminate()
+            self.proceso.wait(timeout=30)
+        if self._registros is not None:
+            self._registros.__exit__(None, None, None)
+            self._registros = None
+
+    @property
+    def cpu(self):
+        return cpu_proceso(self.proceso.pid)
+
+
+class SesionNavegador:
+    """
+    Cliente websocket que imita al navegador en una sesión de la aplicación.
+
+    Recuerda los widgets que envía el servidor (id, formulario, fragmento y
+    valor actual) para reconstruir el estado que mandaría el navegador.
+    """
+
+    def __init__(self, puerto):
+        self.url = f'ws://127.0.0.1:{puerto}/_stcore/stream'
+        self.widgets = {}
+        self.valores = {}
+        self.formularios_pendientes = set()
+        self._ws = None
+
+    async def abrir(self):
+        from websockets.asyncio.client import connect
+
+        self._ws = await connect(self.url, subprotocols=['streamlit'], max_size=None)
+        return await self._ejecutar()
+
+    async def cerrar(self):
+        await self._ws.close()
+
+    def _buscar(self, clave=None, etiqueta=None):
+        for widget in self.widgets.values():
+            if (clave and widget['id'].endswith(f'-{clave}')) or (etiqueta and etiqueta in widget['etiqueta']):
+                return widget
+        raise KeyError(clave or etiqueta)
+
+    async def escribir(self, clave, valor):
+        """
+        Cambia un number_input. Dentro de un formulario no se envía nada.
+
+        Returns:
+            dict con 'ejecuto' (bool) y 'segundos'
+        """
+        widget = self._buscar(clave=clave)
+        self.valores[widget['id']] = ('double_value', float(valor))
+        if widget['formulario']:
+            self.formularios_pendientes.add(widget['formulario'])
+            return {'ejecuto': False, 'segundos': 0.0}
+        return await self._ejecutar(fragmento=widget['fragmento'])
+
+    async def pulsar(self, etiqueta):
+        """Pulsa un botón (o el botón de envío de un formulario)."""
+        widget = self._buscar(etiqueta=etiqueta)
+        self.formularios_pendientes.discard(widget['formulario'])
+        return await self._ejecutar(fragmento=widget['fragmento'], disparador=widget['id'])
+
+    async def _ejecutar(self, fragmento='', disparador=None):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        mensaje = BackMsg()
+        estado = mensaje.rerun_script
+        estado.fragment_id = fragmento
+        for id_widget, (campo, valor) in self.valores.items():
+            # Los valores de formularios no enviados se quedan en el navegador
+            if self.widgets.get(id_widget, {}).get('formulario') in self.formularios_pendientes:
+                continue
+            widget = estado.widget_states.widgets.add()
+            widget.id = id_widget
+            setattr(widget, campo, valor)
+        if disparador is not None:
+            widget = estado.widget_states.widgets.add()
+            widget.id = disparador
+            widget.trigger_value = True
+
+        inicio = time.perf_counter()
+        await self._ws.send(mensaje.SerializeToString())
+        while True:
+            recibido = ForwardMsg()
+            recibido.ParseFromString(await self._ws.recv())
+            tipo = recibido.WhichOneof('type')
+            if tipo == 'delta':
+                self._registrar(recibido.delta)
+            elif tipo == 'script_finished':
+                estado_fin = ForwardMsg.ScriptFinishedStatus.Name(recibido.script_finished)
+                if estado_fin != _FIN_PARCIAL:
+                    return {'ejecuto': True, 'segundos': time.perf_counter() - inicio}
+
+    def _registrar(self, delta):
+        if delta.WhichOneof('type') != 'new_element':
+            return
+        elemento = delta.new_element
+        tipo = elemento.WhichOneof('type')
+        if tipo not in ('number_input', 'button'):
+            return
+        widget = getattr(elemento, tipo)
+        self.widgets[widget.id] = {
+            'id': widget.id,
+            'etiqueta': widget.label,
+            'formulario': widget.form_id,
+            'fragmento': delta.fragment_id
+        }
+
+
+async def recorrido_operador(puerto, muestra=EJEMPLO):
+    """
+    Ejecuta el recorrido de un operador y devuelve los tiempos de cada paso.
+
+    Returns:
+        Lista de tuplas (paso, ejecuto, segundos)
+    """
+    sesion = SesionNavegador(puerto)
+    pasos = [('abrir', *(await sesion.abrir()).values())]
+    for componente, valor in muestra.items():
+        r = await sesion.escribir(componente.lower(), valor)
+        pasos.append((f'editar_{componente.lower()}', r['ejecuto'], r['segundos']))
+    r = await sesion.pulsar('CALCULAR OCTANAJE')
+    pasos.append(('calcular', r['ejecuto'], r['segundos']))
+    r = await sesion.pulsar('LIMPIAR RESULTADOS')
+    pasos.append(('limpiar', r['ejecuto'], r['segundos']))
+    await sesion.cerrar()
+    return pasos
+
+
+def medir_sesiones(sesiones=5, ruta_app=RUTA_APP):
+    """
+    Arranca un servidor y ejecuta `sesiones` recorridos de operador seguidos.
+
+    El primer recorrido calienta el servidor (importaciones, modelo, cachés)
+    y no se cuenta.
+
+    Returns:
+        dict con ejecuciones y segundos medianos por paso, ejecuciones del
+        script y CPU del servidor por sesión
+    """
+    with ServidorStreamlit(ruta_app) as servidor:
+        asyncio.run(recorrido_operador(servidor.puerto))
+
+        cpu_inicial = servidor.cpu
+        recorridos = [asyncio.run(recorrido_operador(servidor.puerto)) for _ in range(sesiones)]
+        cpu_total = servidor.cpu - cpu_inicial
+
+    pasos = {}
+    for recorrido in recorridos:
+        for paso, ejecuto, segundos in recorrido:
+            pasos.setdefault(paso, {'ejecuciones': 0, 'tiempos': []})
+            pasos[paso]['ejecuciones'] += ejecuto
+            if ejecuto:
+                pasos[paso]['tiempos'].append(segundos)
+
+    return {
+        'sesiones': sesiones,
+        'pasos': {
+            paso: {
+                'ejecuciones_por_sesion': datos['ejecuciones'] / sesiones,
+                'segundos': statistics.median(datos['tiempos']) if datos['tiempos'] else 0.0
+            }
+            for paso, datos in pasos.items()
+        },
+        'ejecuciones_por_sesion': sum(d['ejecuciones'] for d in pasos.values()) / sesiones,
+        'segundos_por_sesion': sum(sum(d['tiempos']) for d in pasos.values()) / sesiones,
+        'cpu_servidor_por_sesion_s': cpu_total / sesiones
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide reruns y CPU de servidor por sesión de la app")
+    parser.add_argument('--sesiones', type=int, default=5)
+    parser.add_argument('--app', default=RUTA_APP, help="Script de Streamlit a medir")
+    argumentos = parser.parse_args(argv)
+
+    r = medir_sesiones(argumentos.sesiones, argumentos.app)
+    print(f"{'paso':<22} {'ejecuciones':>12} {'mediana':>10}")
+    for paso, datos in r['pasos'].items():
+        print(f"{paso:<22} {datos['ejecuciones_por_sesion']:>12.0f} {datos['segundos'] * 1e3:>7.1f} ms")
+    print(f"Por sesión: {r['ejecuciones_por_sesion']:.0f} ejecuciones, "
+          f"{r['segundos_por_sesion'] * 1e3:.0f} ms de espera, "
+          f"{r['cpu_servidor_por_sesion_s'] * 1e3:.0f} ms de CPU del servidor")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,497 @@
+"""
+Modo sombra: un modelo candidato puntúa el tráfico real junto al de producción.
+
+Antes de sustituir modelo_final_gb.pkl por un reentrenamiento, el candidato
+se carga como ModeloSombra. Cada predicción del formulario, de los lotes,
+del servicio HTTP y de la ingesta le pasa la matriz de entrada que ya ha
+construido para producción (Ox incluido), junto con la predicción y la
+categoría de producción:
+
+    sombra = ModeloSombra('candidato/modelo_final_gb.pkl')
+    octanaje.predecir(datos, sombra=sombra)      # sólo devuelve producción
+
+comparar() sólo encola esas referencias y vuelve: la matriz no se copia ni
+se reconstruye, y el resultado de producción no espera al candidato. Un hilo
+aparte agrupa lo encolado, lo predice con el candidato, comprueba su dominio
+(octanaje.dominio) y lo clasifica con clasificar_lote. Después guarda cada
+muestra en una tabla SQLite con las dos predicciones, las dos categorías y
+si discrepan. El operador sólo ve el resultado de producción.
+
+- La cola es limitada (COLA_MAXIMA). Si el candidato no da abasto, lo que no
+  cabe se descarta y se cuenta; producción nunca espera.
+- Las composiciones servidas desde la caché de predicciones también se
+  comparan (cuesta lo mismo, una inserción en la cola): si no, las
+  composiciones repetidas y las guardadas antes de conectar el candidato no
+  llegarían nunca a él y las estadísticas se sesgarían hacia las nuevas.
+- Las filas se pasan al candidato en su propio orden de variables, que
+  puede diferir del de producción.
+- El candidato no usa etapa(): sus tiempos no se mezclan con los de
+  producción en octanaje_etapa_segundos. Las comparaciones se cuentan en
+  octanaje_sombra_total por origen y resultado (coincide, discrepa,
+  descartada, error).
+
+Uso:
+    OCTANAJE_SOMBRA=candidato.pkl streamlit run streamlit_app.py
+    python -m octanaje.servicio --sombra candidato.pkl
+    python -m octanaje.ingesta CARPETA --sombra candidato.pkl
+    python -m octanaje.sombra                    # resumen y últimas discrepancias
+    python -m octanaje.sombra --medir
+
+Medido con `python -m octanaje.sombra --medir` (1 núcleo, candidato = el
+modelo vigente desplazado 0.3 octanos):
+    - comparar() en el camino del operador: ~7 µs por llamada
+    - 2.000 llamadas seguidas a octanaje.predecir sin caché: p50 de ~210 µs
+      sin sombra y ~235 µs con ella. El p99 sube de ~0.4 ms a ~2-3 ms: con
+      un solo núcleo, el hilo del candidato retiene el GIL hasta el
+      intervalo de cambio (5 ms) mientras procesa un grupo (~8 ms por 250
+      filas, la mitad escribiendo en SQLite). Al ritmo de un operador, o
+      con varios núcleos, no se nota.
+    - puntuar_lote de 100.000 filas: ~1.1 s con o sin sombra. El candidato
+      termina ~2 s después, fuera del camino del operador.
+"""
+
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from octanaje.componentes import COMPONENTES
+
+# Variables de entorno con el modelo candidato y el registro de comparaciones
+VARIABLE_ENTORNO_SOMBRA = 'OCTANAJE_SOMBRA'
+VARIABLE_ENTORNO_REGISTRO = 'OCTANAJE_SOMBRA_REGISTRO'
+
+RUTA_REGISTRO = 'comparaciones_sombra.sqlite3'
+
+# Elementos máximos en cola (una llamada a comparar() es un elemento)
+COLA_MAXIMA = 1_000
+
+# Filas máximas por llamada al candidato
+LOTE_SOMBRA = 10_000
+
+# Segundos que el hilo del candidato espera a que se acumulen más elementos
+# tras el primero: una llamada al candidato y una transacción por grupo en
+# lugar de una por predicción
+ESPERA_S = 0.05
+
+COLUMNAS = (
+    ['fecha_hora', 'origen', 'referencia', 'version_produccion', 'version_candidato']
+    + [c.lower() for c in COMPONENTES]
+    + ['ox', 'octanaje_produccion', 'octanaje_candidato', 'categoria_produccion', 'categoria_candidato',
+       'discrepancia']
+)
+
+_ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS comparaciones (
+    id INTEGER PRIMARY KEY,
+    fecha_hora TEXT NOT NULL,
+    origen TEXT NOT NULL,
+    referencia TEXT,
+    version_produccion TEXT,
+    version_candidato TEXT NOT NULL,
+    {', '.join(f'{c.lower()} REAL NOT NULL' for c in COMPONENTES)},
+    ox REAL NOT NULL,
+    octanaje_produccion REAL NOT NULL,
+    octanaje_candidato REAL NOT NULL,
+    categoria_produccion TEXT NOT NULL,
+    categoria_candidato TEXT NOT NULL,
+    discrepancia INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comparaciones_discrepancia ON comparaciones (discrepancia);
+CREATE INDEX IF NOT EXISTS comparaciones_candidato ON comparaciones (version_candidato);
+"""
+
+_INSERTAR = f"INSERT INTO comparaciones ({', '.join(COLUMNAS)}) VALUES ({', '.join('?' * len(COLUMNAS))})"
+
+# Marca de fin para el hilo del candidato
+_FIN = object()
+
+
+def ruta_registro():
+    return os.environ.get(VARIABLE_ENTORNO_REGISTRO) or RUTA_REGISTRO
+
+
+def _ahora():
+    return datetime.now().isoformat(sep=' ', timespec='milliseconds')
+
+
+def _conectar(ruta):
+    conexion = sqlite3.connect(ruta, timeout=30)
+    conexion.execute('PRAGMA journal_mode=WAL')
+    conexion.execute('PRAGMA synchronous=NORMAL')
+    return conexion
+
+
+class ModeloSombra:
+    """
+    Modelo candidato que puntúa en segundo plano lo mismo que producción.
+
+    Args:
+        ruta: .pkl o .octgb del candidato
+        registro: Archivo SQLite de comparaciones (por defecto,
+            $OCTANAJE_SOMBRA_REGISTRO o RUTA_REGISTRO)
+        modelo, variables: Candidato ya cargado (en lugar de `ruta`)
+        cola_maxima: Elementos máximos en cola antes de descartar
+
+    Raises:
+        RuntimeError: Si el candidato no se puede cargar o no pasa la prueba
+            de humo (octanaje.versiones.prueba_humo, sin comparar con
+            producción: esa comparación es justo lo que se quiere medir)
+    """
+
+    def __init__(self, ruta=None, registro=None, modelo=None, variables=None, cola_maxima=COLA_MAXIMA):
+        from octanaje.cache import version_modelo
+        from octanaje.modelo import cargar_modelo
+        from octanaje.versiones import prueba_humo
+
+        if modelo is None:
+            modelo, variables, error = cargar_modelo(ruta)
+            if modelo is None:
+                raise RuntimeError(f"Modelo candidato: {error}")
+        _, error = prueba_humo(modelo, variables)
+        if error is not None:
+            raise RuntimeError(f"Modelo candidato: {error}")
+
+        self.ruta = ruta
+        self.modelo = modelo
+        self.variables = list(variables)
+        self.version = version_modelo(modelo)
+        self.registro = registro or ruta_registro()
+        self.comparadas = 0
+        self.discrepancias = 0
+        self.descartadas = 0
+        self.errores = 0
+        self.ultimo_error = None
+        self.diferencia_suma = 0.0
+        self.diferencia_maxima = 0.0
+        self.transiciones = Counter()
+        self._ordenes = {}
+        conexion = _conectar(self.registro)
+        with conexion:
+            conexion.executescript(_ESQUEMA)
+        conexion.close()
+        self._cola = queue.Queue(maxsize=cola_maxima)
+        self._hilo = threading.Thread(target=self._comparar_cola, name='octanaje-sombra', daemon=True)
+        self._hilo.start()
+
+    # ── Camino del operador ────────────────────────────────────────────────
+
+    def comparar(self, X, variables, prediccion, categorias, origen, version=None, referencia=None):
+        """
+        Encola una predicción de producción para puntuarla con el candidato.
+
+        No copia nada: X, prediccion y categorias no deben modificarse
+        después.
+
+        Args:
+            X: Matriz (filas x variables) o lista de filas ya construida para
+                producción
+            variables: Orden de columnas de X
+            prediccion: Octanajes de producción, uno por fila
+            categorias: Categoría de producción de cada fila (texto)
+            origen: 'formulario', 'lote', 'servicio', 'ingesta'...
+            version: Versión del modelo de producción
+            referencia: Archivo, lote o identificador
+
+        Returns:
+            False si la cola estaba llena y se ha descartado
+        """
+        try:
+            self._cola.put_nowait((_ahora(), origen, referencia, version, variables, X, prediccion, categorias))
+        except queue.Full:
+            from octanaje.metricas import METRICAS
+
+            self.descartadas += 1
+            METRICAS.contar('octanaje_sombra_total', len(prediccion), origen=origen, resultado='descartada')
+            return False
+        return True
+
+    # ── Hilo del candidato ─────────────────────────────────────────────────
+
+    def _orden(self, variables):
+        """Columnas de X (en orden de `variables`) en el orden del candidato."""
+        clave = tuple(variables)
+        orden = self._ordenes.get(clave)
+        if orden is None:
+            orden = self._ordenes[clave] = [clave.index(v) for v in self.variables]
+        return orden
+
+    def _comparar_cola(self):
+        conexion = _conectar(self.registro)
+        terminar = False
+        while not terminar:
+            elementos = [self._cola.get()]
+            filas = len(elementos[0][6]) if elementos[0] is not _FIN else 0
+            if 0 < filas < LOTE_SOMBRA:
+                time.sleep(ESPERA_S)
+            while filas < LOTE_SOMBRA:
+                try:
+                    elementos.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+                if elementos[-1] is not _FIN:
+                    filas += len(elementos[-1][6])
+
+            pendientes = [e for e in elementos if e is not _FIN]
+            terminar = len(pendientes) < len(elementos)
+            try:
+                if pendientes:
+                    self._comparar(pendientes, conexion)
+            except Exception as e:  # El hilo no debe morir: producción no depende de él
+                from octanaje.metricas import METRICAS
+
+                self.errores += 1
+                self.ultimo_error = str(e)
+                for elemento in pendientes:
+                    METRICAS.contar('octanaje_sombra_total', len(elemento[6]), origen=elemento[1], resultado='error')
+            finally:
+                for _ in elementos:
+                    self._cola.task_done()
+        conexion.close()
+
+    def _comparar(self, elementos, conexion):
+        import numpy as np
+
+        from octanaje.clasificacion import clasificar_lote
+        from octanaje.dominio import dominio_modelo
+        from octanaje.metricas import METRICAS
+        from octanaje.prediccion import predecir_matriz
+
+        # Sin etapa(): los tiempos del candidato no cuentan como de producción
+        X = np.vstack([np.asarray(e[5], dtype=np.float64)[:, self._orden(e[4])] for e in elementos])
+        candidato = np.asarray(predecir_matriz(self.modelo, self.variables, X), dtype=np.float64)
+        fuera, _, _ = dominio_modelo(self.modelo, self.variables).evaluar(X)
+        categorias = clasificar_lote(candidato, fuera_dominio=fuera)['categoria']
+        produccion = np.concatenate([np.asarray(e[6], dtype=np.float64) for e in elementos])
+        categorias_produccion = np.concatenate([np.asarray(e[7], dtype=object) for e in elementos])
+        discrepa = categorias_produccion != categorias
+
+        diferencia = np.abs(candidato - produccion)
+        self.comparadas += len(X)
+        self.discrepancias += int(discrepa.sum())
+        self.diferencia_suma += float(diferencia.sum())
+        self.diferencia_maxima = max(self.diferencia_maxima, float(diferencia.max(initial=0.0)))
+        self.transiciones.update(zip(categorias_produccion[discrepa].tolist(), categorias[discrepa].tolist()))
+
+        inicio = 0
+        for fecha_hora, origen, _, _, _, _, prediccion, _ in elementos:
+            n = len(prediccion)
+            discrepan = int(discrepa[inicio:inicio + n].sum())
+            if discrepan:
+                METRICAS.contar('octanaje_sombra_total', discrepan, origen=origen, resultado='discrepa')
+            if n - discrepan:
+                METRICAS.contar('octanaje_sombra_total', n - discrepan, origen=origen, resultado='coincide')
+            inicio += n
+
+        columnas = dict(zip(self.variables, X.T.tolist()))
+        fijas = [(fecha_hora, origen, referencia, version, self.version)
+                 for fecha_hora, origen, referencia, version, _, _, prediccion, _ in elementos
+                 for _ in range(len(prediccion))]
+        with conexion:
+            conexion.executemany(_INSERTAR, [
+                (*fijas_fila, *valores) for fijas_fila, valores in zip(fijas, zip(
+                    *(columnas[c] for c in COMPONENTES), columnas['Ox'],
+                    produccion.tolist(), candidato.tolist(),
+                    categorias_produccion.tolist(), categorias.tolist(), discrepa.astype(int).tolist()
+                ))
+            ])
+
+    # ── Resultados ─────────────────────────────────────────────────────────
+
+    def vaciar(self):
+        """Espera a que todo lo encolado esté comparado."""
+        self._cola.join()
+
+    def cerrar(self):
+        self._cola.put(_FIN)
+        self._hilo.join()
+
+    def estadisticas(self):
+        """Comparaciones, discrepancias por par de categorías y diferencias (serializable en JSON)."""
+        return {
+            'candidato': self.version,
+            'ruta': self.ruta,
+            'comparadas': self.comparadas,
+            'discrepancias': self.discrepancias,
+            'descartadas': self.descartadas,
+            'errores': self.errores,
+            'ultimo_error': self.ultimo_error,
+            'pendientes': self._cola.qsize(),
+            'diferencia_media': self.diferencia_suma / self.comparadas if self.comparadas else None,
+            'diferencia_maxima': self.diferencia_maxima if self.comparadas else None,
+            'transiciones': [{'produccion': produccion, 'candidato': candidato, 'muestras': n}
+                             for (produccion, candidato), n in self.transiciones.most_common()]
+        }
+
+
+def sombra_entorno():
+    """
+    ModeloSombra del candidato de $OCTANAJE_SOMBRA, o None si no está definida.
+
+    Raises:
+        RuntimeError: Si el candidato no se puede cargar
+    """
+    ruta = os.environ.get(VARIABLE_ENTORNO_SOMBRA)
+    return ModeloSombra(ruta) if ruta else None
+
+
+def resumen_registro(ruta=None, ultimas=20):
+    """
+    Resumen de un registro de comparaciones, por versión del candidato.
+
+    Args:
+        ruta: Archivo SQLite (por defecto, ruta_registro())
+        ultimas: Discrepancias más recientes a devolver
+
+    Returns:
+        Tupla (versiones, discrepancias): una lista de dicts por par de
+        versiones con las muestras, discrepancias y diferencias, y una lista
+        de dicts con las últimas discrepancias
+    """
+    conexion = _conectar(ruta or ruta_registro())
+    conexion.row_factory = sqlite3.Row
+    try:
+        versiones = [dict(fila) for fila in conexion.execute(
+            "SELECT version_produccion, version_candidato, COUNT(*) AS muestras, "
+            "SUM(discrepancia) AS discrepancias, "
+            "AVG(ABS(octanaje_candidato - octanaje_produccion)) AS diferencia_media, "
+            "MAX(ABS(octanaje_candidato - octanaje_produccion)) AS diferencia_maxima "
+            "FROM comparaciones GROUP BY version_produccion, version_candidato ORDER BY MIN(id)"
+        )]
+        discrepancias = [dict(fila) for fila in conexion.execute(
+            f"SELECT id, {', '.join(COLUMNAS)} FROM comparaciones WHERE discrepancia = 1 ORDER BY id DESC LIMIT ?",
+            (ultimas,)
+        )]
+    finally:
+        conexion.close()
+    return versiones, discrepancias
+
+
+def medir(repeticiones=2_000, filas_lote=100_000, directorio=None):
+    """
+    Mide lo que añade el modo sombra al camino del operador.
+
+    El candidato es el modelo vigente desplazado 0.3 octanos, para que haya
+    discrepancias cerca de los límites fiscales.
+
+    Returns:
+        dict con microsegundos por comparar(), p50 y p99 de octanaje.predecir
+        sin y con sombra, segundos de puntuar_lote sin y con sombra, segundos
+        hasta que el candidato termina el lote, y las estadísticas del
+        candidato
+    """
+    import statistics
+    import tempfile
+
+    import numpy as np
+    import pandas as pd
+
+    from octanaje.componentes import EJEMPLO, RANGOS_TIPICOS
+    from octanaje.lotes import puntuar_lote
+    from octanaje.modelo import modelo_por_defecto
+    from octanaje.motor import MotorGB
+    from octanaje.prediccion import predecir
+
+    modelo, variables = modelo_por_defecto()
+    candidato = MotorGB(modelo.variable, modelo.umbral, modelo.hijos, modelo.valor, modelo.raices,
+                        modelo.valor_inicial + 0.3, modelo.profundidad, modelo.variables,
+                        modelo.metadatos, modelo.muestras)
+    rng = np.random.default_rng(0)
+    muestras = [{c: round(float(rng.uniform(*RANGOS_TIPICOS[c])), 1) for c in COMPONENTES}
+                for _ in range(repeticiones)]
+    df = pd.DataFrame({c: rng.uniform(*RANGOS_TIPICOS[c], filas_lote) for c in COMPONENTES})
+
+    def percentiles(tiempos):
+        cuantiles = statistics.quantiles(tiempos, n=100)
+        return cuantiles[49], cuantiles[98]
+
+    with tempfile.TemporaryDirectory(dir=directorio) as temporal:
+        prueba = ModeloSombra(registro=os.path.join(temporal, 'prueba.sqlite3'), modelo=candidato,
+                              variables=variables, cola_maxima=repeticiones)
+        fila = [[1.0] * len(variables)]
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            prueba.comparar(fila, variables, [95.0], ['GASOLINA 95 OCTANOS'], 'medicion')
+        comparar_us = (time.perf_counter() - inicio) / repeticiones * 1e6
+        prueba.cerrar()
+
+        sombra = ModeloSombra(registro=os.path.join(temporal, 'sombra.sqlite3'), modelo=candidato,
+                              variables=variables)
+        predecir(EJEMPLO, modelo, variables, cache=None)
+        puntuar_lote(df, modelo, variables)
+
+        tiempos = {}
+        for nombre, con_sombra in (('sin', None), ('con', sombra)):
+            tiempos[nombre] = []
+            for datos in muestras:
+                inicio = time.perf_counter()
+                predecir(datos, modelo, variables, cache=None, sombra=con_sombra)
+                tiempos[nombre].append(time.perf_counter() - inicio)
+            sombra.vaciar()
+
+        inicio = time.perf_counter()
+        puntuar_lote(df, modelo, variables)
+        lote_sin_s = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        puntuar_lote(df, modelo, variables, sombra=sombra)
+        lote_con_s = time.perf_counter() - inicio
+        sombra.vaciar()
+        candidato_s = time.perf_counter() - inicio - lote_con_s
+        sombra.cerrar()
+
+    return {
+        'comparar_us': comparar_us,
+        'muestra_sin_s': percentiles(tiempos['sin']),
+        'muestra_con_s': percentiles(tiempos['con']),
+        'lote_filas': filas_lote,
+        'lote_sin_s': lote_sin_s,
+        'lote_con_s': lote_con_s,
+        'candidato_lote_s': candidato_s,
+        'estadisticas': sombra.estadisticas()
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Comparaciones del modelo candidato en modo sombra")
+    parser.add_argument('--registro', default=None, help="Archivo SQLite de comparaciones")
+    parser.add_argument('--ultimas', type=int, default=20, help="Discrepancias recientes a mostrar")
+    parser.add_argument('--medir', action='store_true', help="Medir la latencia añadida al camino del operador")
+    argumentos = parser.parse_args(argv)
+
+    if argumentos.medir:
+        r = medir()
+        print(f"comparar()        {r['comparar_us']:8.1f} µs por llamada")
+        for nombre in ('sin', 'con'):
+            p50, p99 = r[f'muestra_{nombre}_s']
+            print(f"predecir {nombre} sombra  p50 {p50 * 1e6:6.0f} µs  p99 {p99 * 1e6:6.0f} µs")
+        print(f"lote {r['lote_filas']:,} filas  {r['lote_sin_s']:.2f} s sin sombra, {r['lote_con_s']:.2f} s con ella; "
+              f"el candidato termina {r['candidato_lote_s']:.2f} s después")
+        e = r['estadisticas']
+        print(f"candidato         {e['comparadas']:,} comparadas, {e['discrepancias']:,} discrepancias, "
+              f"{e['descartadas']} descartadas, diferencia media {e['diferencia_media']:.3f}")
+        return 0
+
+    ruta = argumentos.registro or ruta_registro()
+    if not os.path.exists(ruta):
+        print(f"No hay comparaciones en {ruta}", file=sys.stderr)
+        return 1
+    versiones, discrepancias = resumen_registro(ruta, argumentos.ultimas)
+    for v in versiones:
+        print(f"producción {v['version_produccion']} / candidato {v['version_candidato']}: "
+              f"{v['muestras']:,} muestras, {v['discrepancias']:,} discrepancias "
+              f"({v['discrepancias'] / v['muestras']:.2%}), diferencia media {v['diferencia_media']:.3f}, "
+              f"máxima {v['diferencia_maxima']:.3f}")
+    for fila in discrepancias:
+        print(f"{fila['fecha_hora']}  {fila['origen']:<10} {fila['octanaje_produccion']:6.2f} -> "
+              f"{fila['octanaje_candidato']:6.2f}  {fila['categoria_produccion']} -> {fila['categoria_candidato']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
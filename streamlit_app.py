@@ -9,10 +9,30 @@ Versión: 2.0 - CORREGIDA
 """
 
 import streamlit as st
-import pickle
 import pandas as pd
+import time
 from datetime import datetime
 import os
+import shutil
+import tempfile
+
+import octanaje
+from octanaje import COMPONENTES, EJEMPLO, RANGOS_TIPICOS
+from octanaje.clasificacion import CATEGORIAS, LIMITES_FISCALES, SIN_CLASIFICAR, TOLERANCIA
+from octanaje.deriva import UMBRAL_PSI, monitor_modelo
+from octanaje.explicaciones import explicar_muestra, importancia_historial
+from octanaje.historial import COLUMNAS as COLUMNAS_HISTORIAL, TAMANO_PAGINA, HistorialPredicciones
+from octanaje.informes import generar_informe, trozos_historial
+from octanaje.intervalos import NIVEL_POR_DEFECTO, intervalo_calibrado
+from octanaje.lotes import leer_archivo_lote, puntuar_lote
+from octanaje.metricas import etapa, iniciar_exportacion, perfilar
+from octanaje.mezclas import (CORRIENTES_EJEMPLO, MARGEN_POR_DEFECTO, MezclaImposible, corrientes_tabla,
+                              optimizar_mezcla, tabla_corrientes)
+from octanaje.modelo import ficha_modelo
+from octanaje.referencias import VECINOS, indice_por_defecto
+from octanaje.sensibilidad import barrido, cambios_categoria, mapa
+from octanaje.sombra import sombra_entorno
+from octanaje.versiones import RegistroModelos
 
 # ═══════════════════════════════════════════════════════════════════════════
 # CONFIGURACIÓN DE LA PÁGINA
@@ -24,7 +44,7 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded",
     menu_items={
-        'About': "Sistema de predicción de octanaje con ML | Precisión: 100% (±0.5)"
+        'About': "Sistema de predicción de octanaje con ML y clasificación fiscal automática"
     }
 )
 
@@ -32,6 +52,10 @@ st.set_page_config(
 if 'resultado' not in st.session_state:
     st.session_state.resultado = None
 
+# Valores del formulario (las claves de los number_input son los componentes en minúsculas)
+for componente in COMPONENTES:
+    st.session_state.setdefault(componente.lower(), 0.0)
+
 # ═══════════════════════════════════════════════════════════════════════════
 # CSS PERSONALIZADO
 # ═══════════════════════════════════════════════════════════════════════════
@@ -94,6 +118,11 @@ st.markdown("""
         color: white;
     }
     
+    .result-fuera {
+        background: linear-gradient(135deg, #dfe6e9 0%, #b2bec3 100%);
+        color: #2d3436;
+    }
+    
     .octanaje-value {
         font-size: 4rem;
         font-weight: bold;
@@ -129,6 +158,11 @@ st.markdown("""
         border-color: #a855f7;
     }
     
+    .categoria-fuera {
+        background: #eceff1;
+        border-color: #78909c;
+    }
+    
     /* Botones */
     .stButton > button {
         border-radius: 10px;
@@ -150,109 +184,89 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ═══════════════════════════════════════════════════════════════════════════
-# FUNCIONES DE CLASIFICACIÓN
+# CARGA DEL MODELO
 # ═══════════════════════════════════════════════════════════════════════════
 
-def clasificar_gasolina(octanaje_real):
+@st.cache_resource
+def registro_modelos():
     """
-    Clasifica la gasolina según normativa fiscal española.
-    
-    Args:
-        octanaje_real: Octanaje predicho con decimales (valor real sin redondear)
-        
-    Returns:
-        dict con información de clasificación y advertencias
+    Versiones del modelo, una por proceso (ver octanaje.versiones).
+
+    Un hilo vigila el archivo del modelo y pone en servicio cada versión nueva
+    validada; cada predicción toma `.actual` al empezar. Si la carga inicial
+    falla se lanza RuntimeError y, como no se cachea, se reintenta en la
+    siguiente ejecución.
     """
-    # IMPORTANTE: Clasificar con el valor REAL, no con el redondeado
-    
-    # Detectar si está en zona crítica (límite ± tolerancia 0.5)
-    advertencia = None
-    limite_critico = None
-    
-    # Límite crítico en 95.0 (rango de advertencia: 94.5 - 95.5)
-    if 94.5 <= octanaje_real <= 95.5:
-        limite_critico = 95.0
-        if octanaje_real < 95:
-            advertencia = f"⚠️ ADVERTENCIA: Octanaje {octanaje_real:.1f} está muy cerca del límite inferior (95.0). Dentro de tolerancia industrial (±0.5), podría reclasificarse."
-        else:
-            advertencia = f"⚠️ ADVERTENCIA: Octanaje {octanaje_real:.1f} está muy cerca del límite superior (95.0). Dentro de tolerancia industrial (±0.5), podría reclasificarse."
-    
-    # Límite crítico en 98.0 (rango de advertencia: 97.5 - 98.5)
-    elif 97.5 <= octanaje_real <= 98.5:
-        limite_critico = 98.0
-        if octanaje_real <= 98:
-            advertencia = f"⚠️ ADVERTENCIA: Octanaje {octanaje_real:.1f} está muy cerca del límite superior (98.0). Dentro de tolerancia industrial (±0.5), podría reclasificarse."
-        else:
-            advertencia = f"⚠️ ADVERTENCIA: Octanaje {octanaje_real:.1f} está muy cerca del límite inferior (98.0). Dentro de tolerancia industrial (±0.5), podría reclasificarse."
-    
-    # Clasificación
-    if octanaje_real < 95:
-        return {
-            'categoria': 'GASOLINA <95 OCTANOS',
-            'codigo_nc': '2710.12.41',
-            'epigrafe': '1.2.2',
-            'descripcion': 'Inferior a 95 octanos',
-            'emoji': '⚡',
-            'clase': 'result-regular',
-            'imagen': '94.png',
-            'advertencia': advertencia,
-            'limite_critico': limite_critico
-        }
-    elif octanaje_real <= 98:
-        return {
-            'categoria': 'GASOLINA 95 OCTANOS',
-            'codigo_nc': '2710.12.45',
-            'epigrafe': '1.2.2',
-            'descripcion': '95 a 98 octanos',
-            'emoji': '🚗',
-            'clase': 'result-premium',
-            'imagen': '95.png',
-            'advertencia': advertencia,
-            'limite_critico': limite_critico
-        }
-    else:  # > 98
-        return {
-            'categoria': 'GASOLINA 98 OCTANOS',
-            'codigo_nc': '2710.12.49',
-            'epigrafe': '1.2.1',
-            'descripcion': 'Superior a 98 octanos',
-            'emoji': '🏎️',
-            'clase': 'result-super',
-            'imagen': '98.png',
-            'advertencia': advertencia,
-            'limite_critico': limite_critico
-        }
+    return RegistroModelos()
+
+@st.cache_resource
+def modelo_sombra():
+    """
+    Modelo candidato de $OCTANAJE_SOMBRA que puntúa en segundo plano las mismas
+    muestras (octanaje.sombra), o None. La app sólo muestra producción.
+    """
+    try:
+        return sombra_entorno()
+    except RuntimeError:
+        return None
+
+@st.cache_resource
+def historial():
+    """Historial persistente de predicciones (un hilo escritor por proceso), o None si no se puede abrir."""
+    try:
+        return HistorialPredicciones()
+    except Exception:
+        return None
 
 # ═══════════════════════════════════════════════════════════════════════════
-# CARGA DEL MODELO
+# CONTENIDO ESTÁTICO (CON CACHÉ POR PROCESO)
 # ═══════════════════════════════════════════════════════════════════════════
 
+# Ancho máximo del contenido de Streamlit (px): st.image reduce a este ancho lo que lo supera
+ANCHO_MAXIMO_IMAGEN = 1460
+
 @st.cache_resource
-def cargar_modelo():
-    """Carga el modelo de predicción (con caché)."""
-    try:
-        # Buscar el modelo en varias ubicaciones
-        rutas_posibles = [
-            'modelo_final_gb.pkl',
-            './modelo_final_gb.pkl',
-            'models/modelo_final_gb.pkl'
-        ]
-        
-        modelo_path = None
-        for ruta in rutas_posibles:
-            if os.path.exists(ruta):
-                modelo_path = ruta
-                break
-        
-        if modelo_path is None:
-            return None, None, "No se encontró el archivo 'modelo_final_gb.pkl'"
-        
-        with open(modelo_path, 'rb') as f:
-            modelo_info = pickle.load(f)
-            return modelo_info['modelo'], modelo_info['variables'], None
-    
-    except Exception as e:
-        return None, None, f"Error al cargar: {str(e)}"
+def leer_imagen(ruta, ancho=ANCHO_MAXIMO_IMAGEN):
+    """
+    Bytes PNG de una imagen ya reducida al ancho con el que se muestra.
+
+    Se lee y se reduce una vez por proceso; si st.image recibe una imagen más
+    ancha que su `width`, la decodifica y la reescala en cada ejecución. Hay
+    que mostrarla con output_format='PNG': con 'auto' una imagen sin canal
+    alfa se recodifica a JPEG en cada ejecución.
+    """
+    from io import BytesIO
+    from PIL import Image
+
+    imagen = Image.open(ruta)
+    if imagen.width > ancho:
+        imagen = imagen.resize((ancho, round(imagen.height * ancho / imagen.width)), resample=Image.BILINEAR)
+    salida = BytesIO()
+    imagen.save(salida, format='PNG')
+    return salida.getvalue()
+
+@st.cache_resource
+def html_categorias():
+    """HTML de las cajas de categorías fiscales del panel lateral."""
+    return "".join(f"""
+        <div class="categoria-box {cat['clase_categoria']}">
+            <strong>{cat['emoji']} {cat['categoria']}</strong><br>
+            <small>{cat['rango'].replace('<', '&lt;')} octanos</small><br>
+            <strong>Código NC:</strong> {cat['codigo_nc']}<br>
+            <strong>Epígrafe:</strong> {cat['epigrafe']}
+        </div>
+        """ for cat in CATEGORIAS)
+
+def revertir_modelo():
+    """Vuelve a la versión anterior del modelo para todas las sesiones (callback del panel lateral)."""
+    registro_modelos().revertir()
+
+def cargar_ejemplo():
+    """Rellena el formulario con la mezcla de ejemplo (callback del panel lateral)."""
+    for componente, valor in EJEMPLO.items():
+        st.session_state[componente.lower()] = valor
+    st.session_state.resultado = None
+    st.session_state.ejemplo_cargado = True
 
 # ═══════════════════════════════════════════════════════════════════════════
 # HEADER DE LA APLICACIÓN
@@ -260,25 +274,39 @@ def cargar_modelo():
 
 # Banner superior
 try:
-    st.image('banner.png', use_column_width=True)
+    st.image(leer_imagen('banner.png'), width='stretch', output_format='PNG')
 except:
     # Si no encuentra la imagen, muestra el título normal
     st.markdown('<p class="main-header">🤖 Predictor de Octanaje ⛽</p>', unsafe_allow_html=True)
 
-st.markdown('<p class="subtitle">Sistema de predicción con clasificación fiscal automática | Precisión: 100% (±0.5)</p>', unsafe_allow_html=True)
-
 # ═══════════════════════════════════════════════════════════════════════════
 # CARGAR MODELO
 # ═══════════════════════════════════════════════════════════════════════════
 
-modelo, variables, error = cargar_modelo()
-
-if modelo is None:
+try:
+    modelos = registro_modelos()
+except RuntimeError as e:
     st.error(f"❌ **Error al cargar el modelo**")
-    st.error(error)
+    st.error(str(e))
     st.info("💡 Asegúrate de que el archivo 'modelo_final_gb.pkl' está en el repositorio.")
     st.stop()
 
+# Endpoint o archivo de métricas Prometheus, si el entorno lo pide (una vez por proceso)
+iniciar_exportacion()
+
+# Hiperparámetros y métricas del modelo vigente, leídos del pickle o del artefacto
+ficha = ficha_modelo(modelos.actual.modelo)
+hiperparametros, validacion = ficha['hiperparametros'], ficha['validacion']
+# Sin residuos de calibración el intervalo es heurístico: no se le atribuye un nivel
+nivel_intervalo = f"{NIVEL_POR_DEFECTO:.0%}" if intervalo_calibrado(modelos.actual.modelo) else "sin calibrar"
+
+def texto_metrica(valor, formato='{:.4f}'):
+    """Métrica de la ficha del modelo con formato, o '—' si el modelo no la registra."""
+    return '—' if valor is None else formato.format(valor)
+
+st.markdown('<p class="subtitle">Sistema de predicción con clasificación fiscal automática</p>',
+            unsafe_allow_html=True)
+
 # ═══════════════════════════════════════════════════════════════════════════
 # SIDEBAR CON INFORMACIÓN
 # ═══════════════════════════════════════════════════════════════════════════
@@ -288,179 +316,92 @@ with st.sidebar:
     
     st.markdown("### 📋 Categorías Fiscales")
     
-    # Categoría 1
-    st.markdown("""
-    <div class="categoria-box categoria-regular">
-        <strong>⚡ GASOLINA <95 OCTANOS</strong><br>
-        <small>< 95 octanos</small><br>
-        <strong>Código NC:</strong> 2710.12.41<br>
-        <strong>Epígrafe:</strong> 1.2.2
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # Categoría 2
-    st.markdown("""
-    <div class="categoria-box categoria-premium">
-        <strong>🚗 GASOLINA 95 OCTANOS</strong><br>
-        <small>95 - 98 octanos</small><br>
-        <strong>Código NC:</strong> 2710.12.45<br>
-        <strong>Epígrafe:</strong> 1.2.2
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # Categoría 3
-    st.markdown("""
-    <div class="categoria-box categoria-super">
-        <strong>🏎️ GASOLINA 98 OCTANOS</strong><br>
-        <small>> 98 octanos</small><br>
-        <strong>Código NC:</strong> 2710.12.49<br>
-        <strong>Epígrafe:</strong> 1.2.1
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(html_categorias(), unsafe_allow_html=True)
     
     st.divider()
     
     st.markdown("### 🎯 Especificaciones del Modelo")
-    st.markdown("""
+    st.markdown(f"""
     - **Algoritmo:** Gradient Boosting
-    - **Árboles:** 200 secuenciales
-    - **R² validación:** 0.8365
-    - **MAE:** 0.3774
-    - **Precisión:** 100% (±0.5)
+    - **Árboles:** {hiperparametros['n_estimators']} secuenciales
+    - **R² {validacion['origen']}:** {texto_metrica(validacion.get('r2'))}
+    - **MAE:** {texto_metrica(validacion['mae'])}
+    - **RMSE:** {texto_metrica(validacion['rmse'])} RON
+    - **Intervalo de predicción:** {nivel_intervalo}
     """)
+    st.caption(f"🔖 Versión del modelo: `{modelos.actual.version}` (cargada {modelos.actual.cargada})")
+    if modelos.ultimo_error:
+        st.caption(f"⚠️ Última versión rechazada: {modelos.ultimo_error}")
+    if modelos.anterior is not None:
+        st.button(f"↩️ Volver a la versión {modelos.anterior.version}", width='stretch',
+                  on_click=revertir_modelo)
+    indice_referencias = indice_por_defecto()
+    if indice_referencias is not None:
+        st.caption(f"🧪 Referencias de laboratorio: {len(indice_referencias):,} muestras con RON medido"
+                   + (f" (`{indice_referencias.metadatos['origen']}`)" if indice_referencias.metadatos.get('origen') else ''))
+    monitor_deriva = monitor_modelo(modelos.actual.modelo, modelos.actual.variables)
+    if monitor_deriva is not None and monitor_deriva.alertas:
+        st.warning(f"📉 **Deriva de los datos** en la última ventana de {monitor_deriva.ventana} muestras: "
+                   f"{', '.join(v['variable'] for v in monitor_deriva.alertas)} (ver pestaña Modelo)")
     
     st.divider()
     
     # Botón de ejemplo
-    if st.button("💡 Cargar Datos de Ejemplo", use_container_width=True):
-        st.session_state.cargar_ejemplo = True
-        st.session_state.resultado = None
-        st.rerun()
+    st.button("💡 Cargar Datos de Ejemplo", width='stretch', on_click=cargar_ejemplo)
 
 # ═══════════════════════════════════════════════════════════════════════════
 # TABS PRINCIPALES
 # ═══════════════════════════════════════════════════════════════════════════
 
-tab1, tab2, tab3 = st.tabs(["🎯 Predicción", "📊 Modelo", "📖 Guía de Uso"])
+tab1, tab_sensibilidad, tab_mezclas, tab_lotes, tab_historial, tab2, tab3 = st.tabs([
+    "🎯 Predicción", "🔬 Sensibilidad", "⚗️ Mezclas", "📂 Predicción por Lotes", "📜 Historial", "📊 Modelo",
+    "📖 Guía de Uso"
+])
 
 # ═══════════════════════════════════════════════════════════════════════════
 # TAB 1: PREDICCIÓN
 # ═══════════════════════════════════════════════════════════════════════════
 
-with tab1:
-    st.markdown("## 📊 Análisis Cromatográfico")
-    st.markdown("Introduce los valores obtenidos del análisis cromatográfico:")
-    
-    # Determinar valores iniciales (ejemplo o cero)
-    if 'cargar_ejemplo' in st.session_state and st.session_state.cargar_ejemplo:
-        valores = {
-            'PARAFINAS': 10.5,
-            'ISOPARAFINAS': 32.0,
-            'OLEFINAS': 8.5,
-            'NAFTENICOS': 6.2,
-            'AROMATICOS': 38.0,
-            'ETANOL': 4.8,
-            'MTBE': 0.0,
-            'ETBE': 0.0
-        }
-        st.session_state.cargar_ejemplo = False
-        st.success("✅ Datos de ejemplo cargados")
-    else:
-        valores = {key: 0.0 for key in ['PARAFINAS', 'ISOPARAFINAS', 'OLEFINAS', 
-                                         'NAFTENICOS', 'AROMATICOS', 'ETANOL', 'MTBE', 'ETBE']}
-    
-    # Formulario en 2 columnas
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("#### 🧪 Componentes Principales")
-        parafinas = st.number_input(
-            "**PARAFINAS** (%v/v)", 
-            min_value=0.0, 
-            max_value=100.0, 
-            value=valores['PARAFINAS'], 
-            step=0.1,
-            help="Rango típico: 5.5 - 16.2",
-            key="parafinas"
-        )
-        
-        isoparafinas = st.number_input(
-            "**ISOPARAFINAS** (%v/v)", 
-            min_value=0.0, 
-            max_value=100.0, 
-            value=valores['ISOPARAFINAS'], 
-            step=0.1,
-            help="Rango típico: 22.5 - 43.9",
-            key="isoparafinas"
-        )
-        
-        olefinas = st.number_input(
-            "**OLEFINAS** (%v/v)", 
-            min_value=0.0, 
-            max_value=100.0, 
-            value=valores['OLEFINAS'], 
-            step=0.1,
-            help="Rango típico: 2.3 - 13.8",
-            key="olefinas"
-        )
-        
-        naftenicos = st.number_input(
-            "**NAFTÉNICOS** (%v/v)", 
-            min_value=0.0, 
-            max_value=100.0, 
-            value=valores['NAFTENICOS'], 
-            step=0.1,
-            help="Rango típico: 2.0 - 14.5",
-            key="naftenicos"
-        )
-    
-    with col2:
-        st.markdown("#### 🧪 Aromáticos y Oxigenados")
-        aromaticos = st.number_input(
-            "**AROMÁTICOS** (%v/v)", 
-            min_value=0.0, 
-            max_value=100.0, 
-            value=valores['AROMATICOS'], 
-            step=0.1,
-            help="Rango típico: 26.5 - 48.9",
-            key="aromaticos"
-        )
-        
-        etanol = st.number_input(
-            "**ETANOL** (%v/v)", 
-            min_value=0.0, 
-            max_value=100.0, 
-            value=valores['ETANOL'], 
-            step=0.1,
-            help="Rango típico: 0.0 - 4.9",
-            key="etanol"
-        )
-        
-        mtbe = st.number_input(
-            "**MTBE** (%v/v)", 
-            min_value=0.0, 
-            max_value=100.0, 
-            value=valores['MTBE'], 
-            step=0.1,
-            help="Rango típico: 0.0 - 14.3",
-            key="mtbe"
-        )
-        
-        etbe = st.number_input(
-            "**ETBE** (%v/v)", 
-            min_value=0.0, 
-            max_value=100.0, 
-            value=valores['ETBE'], 
-            step=0.1,
-            help="Rango típico: 0.0 - 7.9",
-            key="etbe"
-        )
-    
-    # Calcular Ox y suma total
-    ox = etanol + mtbe + etbe
-    suma_total = parafinas + isoparafinas + olefinas + naftenicos + aromaticos + ox
+def campo_componente(componente, etiqueta):
+    """number_input de un componente; su valor vive en st.session_state[componente.lower()]."""
+    minimo, maximo = RANGOS_TIPICOS[componente]
+    return st.number_input(
+        f"**{etiqueta}** (%v/v)",
+        min_value=0.0,
+        max_value=100.0,
+        step=0.1,
+        help=f"Rango típico: {minimo} - {maximo}",
+        key=componente.lower()
+    )
+
+def grafico_contribuciones(explicacion):
+    """Barras horizontales con la contribución (RON) de cada variable, de mayor a menor efecto."""
+    import altair as alt
+
+    tabla = pd.DataFrame({
+        'Variable': list(explicacion['contribuciones']),
+        'Contribucion': list(explicacion['contribuciones'].values())
+    })
+    tabla['Efecto'] = tabla['Contribucion'].map(lambda c: 'Sube' if c >= 0 else 'Baja')
+    tabla['Magnitud'] = tabla['Contribucion'].abs()
+    return alt.Chart(tabla).mark_bar().encode(
+        alt.X('Contribucion:Q', title="Contribución (RON)"),
+        alt.Y('Variable:N', sort=alt.EncodingSortField('Magnitud', order='descending'), title=None),
+        alt.Color('Efecto:N', scale=alt.Scale(domain=['Sube', 'Baja'], range=['#2e7d32', '#c62828']), legend=None),
+        tooltip=['Variable', alt.Tooltip('Contribucion:Q', format='+.3f')]
+    )
+
+def mostrar_resultado(resultado):
+    """Dibuja el resultado guardado en st.session_state.resultado."""
+    octanaje_predicho = resultado['octanaje']
+    octanaje_redondeado = resultado['octanaje_redondeado']
+    clasificacion = resultado['clasificacion']
+    intervalo = clasificacion['intervalo']
+    datos_prediccion = resultado['datos']
+    ox = datos_prediccion['Ox']
+    suma_total = resultado['suma_total']
     
-    # Mostrar resumen antes de calcular
+    # Resumen de los componentes enviados
     st.markdown("### 📈 Resumen de Componentes")
     col1, col2, col3 = st.columns(3)
     
@@ -479,162 +420,720 @@ with tab1:
         st.warning(f"⚠️ **Advertencia:** La suma de componentes es {suma_total:.1f}% (debería estar cerca de 100%)")
     
     st.markdown("---")
+    st.markdown("## ✨ RESULTADO DE LA PREDICCIÓN")
+    
+    # Mostrar imagen del coche correspondiente (MÁS PEQUEÑA)
+    try:
+        col_img1, col_img2, col_img3 = st.columns([1, 2, 1])
+        with col_img2:
+            st.image(leer_imagen(clasificacion['imagen'], 400), width=400, output_format='PNG')  # ← IMAGEN MÁS PEQUEÑA
+    except:
+        pass  # Si no encuentra la imagen, continúa sin ella
+    
+    # Caja de resultado con estilo según categoría
+    resultado_html = f"""
+    <div class="result-box {clasificacion['clase']}">
+        <div class="emoji-large">{clasificacion['emoji']}</div>
+        <div class="octanaje-value">{octanaje_predicho:.1f} RON</div>
+        <div style="font-size: 1.3rem; margin-bottom: 1rem; opacity: 0.9;">
+            (Redondeado: {octanaje_redondeado} RON)
+        </div>
+        <div style="font-size: 1.1rem; opacity: 0.85;">
+            Intervalo de predicción ({nivel_intervalo}): [{intervalo[0]:.1f}, {intervalo[1]:.1f}] RON
+        </div>
+    </div>
+    """
+    st.markdown(resultado_html, unsafe_allow_html=True)
+    
+    # Clasificación Fiscal
+    st.markdown("### 📋 Clasificación Fiscal")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("Categoría", clasificacion['categoria'])
+    
+    with col2:
+        st.metric("Código NC", clasificacion['codigo_nc'])
+    
+    with col3:
+        st.metric("Epígrafe Fiscal", clasificacion['epigrafe'])
+    
+    st.info(f"📝 **Descripción:** {clasificacion['descripcion']}")
+    
+    # Fuera del dominio del modelo no hay categoría automática; si no, advertir del límite crítico
+    if clasificacion.get('fuera_dominio'):
+        st.error(clasificacion['advertencia'])
+    elif clasificacion['advertencia']:
+        st.warning(clasificacion['advertencia'])
+    
+    # Contribución de cada variable (TreeSHAP exacto sobre el modelo)
+    explicacion = resultado.get('explicacion')
+    if explicacion is not None:
+        st.markdown("### 🔍 ¿Por qué este octanaje?")
+        st.altair_chart(grafico_contribuciones(explicacion), width='stretch')
+        st.caption(
+            f"Valor base del modelo {explicacion['valor_base']:.2f} RON (media del entrenamiento) "
+            f"+ contribuciones = {octanaje_predicho:.2f} RON. Las barras verdes suben el octanaje "
+            "y las rojas lo bajan."
+        )
+    
+    # Muestras de laboratorio de composición más cercana (octanaje.referencias)
+    referencias = resultado.get('referencias')
+    if referencias:
+        st.markdown("### 🧪 Muestras de laboratorio más parecidas")
+        st.dataframe(pd.DataFrame([{
+            'Referencia': r['referencia'],
+            'Distancia (%v/v)': r['distancia'],
+            'RON medido': r['ron'],
+            'Medido - predicho': round(r['ron'] - octanaje_predicho, 2),
+            **r['datos']
+        } for r in referencias]), width='stretch', hide_index=True)
+        st.caption("Distancia euclídea entre composiciones, en puntos de %v/v sobre las variables del modelo.")
+    
+    # Información adicional
+    st.markdown("### 💡 Información Adicional")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        principales = datos_prediccion['PARAFINAS'] + datos_prediccion['ISOPARAFINAS'] + datos_prediccion['AROMATICOS']
+        st.metric("Componentes Principales", f"{principales:.1f}%")
+    
+    with col2:
+        st.metric("Oxigenados Totales", f"{ox:.2f}%")
+    
+    with col3:
+        st.metric("Suma Total", f"{suma_total:.1f}%")
     
-    # Botones de calcular y limpiar
-    col_btn1, col_btn2 = st.columns(2)
+    # Timestamp y versión del modelo
+    st.caption(f"🕐 Predicción realizada: {resultado['fecha_hora']} | 🔖 Modelo: {resultado['version_modelo']}")
     
-    with col_btn1:
-        calcular = st.button("🎯 CALCULAR OCTANAJE", type="primary", use_container_width=True)
+    # Opción de descargar datos
+    st.markdown("### 💾 Exportar Resultado")
     
-    with col_btn2:
-        if st.button("🔄 LIMPIAR RESULTADOS", use_container_width=True):
-            st.session_state.resultado = None
-            st.rerun()
+    with etapa('exportacion'):
+        datos_exportar = {
+            'Fecha_Hora': [resultado['fecha_hora']],
+            **{componente: [datos_prediccion[componente]] for componente in COMPONENTES},
+            'Ox': [ox],
+            'Octanaje_Predicho': [octanaje_predicho],
+            'Octanaje_Redondeado': [octanaje_redondeado],
+            'Categoria': [clasificacion['categoria']],
+            'Codigo_NC': [clasificacion['codigo_nc']],
+            'Epigrafe': [clasificacion['epigrafe']],
+            'Version_Modelo': [resultado['version_modelo']]
+        }
+        if explicacion is not None:
+            datos_exportar.update({
+                f'Contribucion_{variable}': [round(aporte, 3)]
+                for variable, aporte in explicacion['contribuciones'].items()
+            })
+        for i, r in enumerate(referencias or [], start=1):
+            datos_exportar.update({
+                f'Referencia_{i}': [r['referencia']],
+                f'Distancia_Ref_{i}': [r['distancia']],
+                f'RON_Ref_{i}': [r['ron']]
+            })
+        
+        df_exportar = pd.DataFrame(datos_exportar)
+        
+        csv = df_exportar.to_csv(index=False).encode('utf-8')
+    
+    # on_click="ignore": descargar no vuelve a ejecutar el script
+    st.download_button(
+        label="📥 Descargar resultado en CSV",
+        data=csv,
+        file_name=f'prediccion_octanaje_{resultado["fecha_hora"].replace("-", "").replace(":", "").replace(" ", "_")}.csv',
+        mime='text/csv',
+        width='stretch',
+        on_click="ignore"
+    )
+
+@st.fragment
+def panel_prediccion():
+    """
+    Formulario de la muestra y su resultado.
+
+    Los campos están en un formulario, así que editarlos no ejecuta nada hasta
+    pulsar CALCULAR. El panel es un fragmento: calcular o limpiar sólo vuelve a
+    ejecutar este panel, y el resultado sólo se dibuja de nuevo cuando cambia
+    st.session_state.resultado.
+    """
+    st.markdown("## 📊 Análisis Cromatográfico")
+    st.markdown("Introduce los valores obtenidos del análisis cromatográfico:")
+    
+    if st.session_state.pop('ejemplo_cargado', False):
+        st.success("✅ Datos de ejemplo cargados")
+    
+    with st.form("formulario_muestra", border=False):
+        # Formulario en 2 columnas
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown("#### 🧪 Componentes Principales")
+            campo_componente('PARAFINAS', 'PARAFINAS')
+            campo_componente('ISOPARAFINAS', 'ISOPARAFINAS')
+            campo_componente('OLEFINAS', 'OLEFINAS')
+            campo_componente('NAFTENICOS', 'NAFTÉNICOS')
+        
+        with col2:
+            st.markdown("#### 🧪 Aromáticos y Oxigenados")
+            campo_componente('AROMATICOS', 'AROMÁTICOS')
+            campo_componente('ETANOL', 'ETANOL')
+            campo_componente('MTBE', 'MTBE')
+            campo_componente('ETBE', 'ETBE')
+        
+        st.markdown("---")
+        calcular = st.form_submit_button("🎯 CALCULAR OCTANAJE", type="primary", width='stretch')
+    
+    if st.button("🔄 LIMPIAR RESULTADOS", width='stretch'):
+        st.session_state.resultado = None
     
     # PROCESAR CÁLCULO
     if calcular:
         # Preparar datos para predicción
-        datos_prediccion = {
-            'PARAFINAS': parafinas,
-            'ISOPARAFINAS': isoparafinas,
-            'OLEFINAS': olefinas,
-            'NAFTENICOS': naftenicos,
-            'AROMATICOS': aromaticos,
-            'ETANOL': etanol,
-            'MTBE': mtbe,
-            'ETBE': etbe,
-            'Ox': ox
-        }
-        
-        # Crear DataFrame
-        df_input = pd.DataFrame([datos_prediccion])[variables]
+        datos_prediccion = {componente: st.session_state[componente.lower()] for componente in COMPONENTES}
         
-        # PREDECIR
-        with st.spinner("🔮 Calculando octanaje..."):
-            octanaje_predicho = float(modelo.predict(df_input)[0])
-            octanaje_redondeado = round(octanaje_predicho)
+        # PREDECIR (Ox se calcula y la clasificación usa el valor REAL)
+        # (con la versión del modelo vigente ahora: el panel es un fragmento)
+        version = modelos.actual
+        with st.spinner("🔮 Calculando octanaje..."), perfilar('formulario'):
+            resultado = octanaje.predecir(datos_prediccion, version.modelo, version.variables, sombra=modelo_sombra())
+            try:
+                explicacion = explicar_muestra(datos_prediccion, version.modelo, version.variables)
+            except ValueError:
+                explicacion = None  # Modelo sin muestras por nodo: no se puede explicar
         
-        # Clasificar usando el valor REAL (con decimales), no el redondeado
-        clasificacion = clasificar_gasolina(octanaje_predicho)
+        # Guardar en el historial (se escribe en segundo plano)
+        if historial() is not None:
+            historial().registrar(resultado['datos'], resultado, 'formulario')
         
         # Guardar en session_state
         st.session_state.resultado = {
-            'octanaje': octanaje_predicho,
-            'octanaje_redondeado': octanaje_redondeado,
-            'clasificacion': clasificacion,
-            'datos': datos_prediccion,
-            'suma_total': suma_total
+            **resultado,
+            'suma_total': sum(resultado['datos'][c] for c in COMPONENTES),
+            'fecha_hora': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'explicacion': explicacion
         }
     
     # MOSTRAR RESULTADO si existe
     if st.session_state.resultado is not None:
-        resultado = st.session_state.resultado
-        octanaje_predicho = resultado['octanaje']
-        octanaje_redondeado = resultado['octanaje_redondeado']
-        clasificacion = resultado['clasificacion']
-        datos_prediccion = resultado['datos']
-        suma_total = resultado['suma_total']
-        
-        st.markdown("---")
-        st.markdown("## ✨ RESULTADO DE LA PREDICCIÓN")
-        
-        # Mostrar imagen del coche correspondiente (MÁS PEQUEÑA)
-        try:
-            col_img1, col_img2, col_img3 = st.columns([1, 2, 1])
-            with col_img2:
-                st.image(clasificacion['imagen'], width=400)  # ← IMAGEN MÁS PEQUEÑA
-        except:
-            pass  # Si no encuentra la imagen, continúa sin ella
-        
-        # Caja de resultado con estilo según categoría
-        resultado_html = f"""
-        <div class="result-box {clasificacion['clase']}">
-            <div class="emoji-large">{clasificacion['emoji']}</div>
-            <div class="octanaje-value">{octanaje_predicho:.1f} RON</div>
-            <div style="font-size: 1.3rem; margin-bottom: 1rem; opacity: 0.9;">
-                (Redondeado: {octanaje_redondeado} RON)
-            </div>
-            <div style="font-size: 1.1rem; opacity: 0.85;">
-                Intervalo de confianza: [{octanaje_predicho - 0.5:.1f}, {octanaje_predicho + 0.5:.1f}] RON
-            </div>
-        </div>
-        """
-        st.markdown(resultado_html, unsafe_allow_html=True)
-        
-        # Clasificación Fiscal
-        st.markdown("### 📋 Clasificación Fiscal")
-        
-        col1, col2, col3 = st.columns(3)
-        
+        with etapa('presentacion'):
+            mostrar_resultado(st.session_state.resultado)
+
+with tab1:
+    panel_prediccion()
+
+# ═══════════════════════════════════════════════════════════════════════════
+# TAB SENSIBILIDAD: CURVAS Y MAPAS "¿Y SI...?"
+# ═══════════════════════════════════════════════════════════════════════════
+
+TIPOS_SENSIBILIDAD = ["📈 Curvas (un componente cada vez)", "🗺️ Mapa 2-D (dos componentes)"]
+
+def grafico_curvas(tabla):
+    """Curvas de RON con su intervalo frente a la variación de cada componente, con los límites fiscales."""
+    import altair as alt
+
+    eje_x = alt.X('Variacion:Q', title="Variación respecto a la base (%v/v)")
+    color = alt.Color('Componente:N')
+    banda = alt.Chart(tabla).mark_area(opacity=0.15).encode(
+        eje_x, alt.Y('Intervalo_Inferior:Q'), alt.Y2('Intervalo_Superior:Q'), color
+    )
+    linea = alt.Chart(tabla).mark_line().encode(
+        eje_x, alt.Y('Octanaje_Predicho:Q', title="RON", scale=alt.Scale(zero=False)), color,
+        tooltip=['Componente', 'Valor', alt.Tooltip('Octanaje_Predicho:Q', format='.2f'), 'Categoria']
+    )
+    limites = alt.Chart(pd.DataFrame({'Limite': [l['valor'] for l in LIMITES_FISCALES]})).mark_rule(
+        color='red', strokeDash=[6, 4]
+    ).encode(y='Limite:Q')
+    return banda + linea + limites
+
+def grafico_mapa(tabla, componente_x, componente_y, base):
+    """Mapa de calor del RON con la frontera entre categorías y la composición base marcadas."""
+    import altair as alt
+
+    datos = tabla[[componente_x, componente_y, 'Octanaje_Predicho', 'Categoria', 'Frontera']].copy()
+    for componente in (componente_x, componente_y):
+        valores = datos[componente].unique()
+        medio_paso = (valores.max() - valores.min()) / max(len(valores) - 1, 1) / 2
+        datos[f'{componente}_0'] = datos[componente] - medio_paso
+        datos[f'{componente}_1'] = datos[componente] + medio_paso
+
+    calor = alt.Chart(datos).mark_rect().encode(
+        alt.X(f'{componente_x}_0:Q', title=f"{componente_x} (%v/v)", scale=alt.Scale(nice=False)),
+        alt.X2(f'{componente_x}_1:Q'),
+        alt.Y(f'{componente_y}_0:Q', title=f"{componente_y} (%v/v)", scale=alt.Scale(nice=False)),
+        alt.Y2(f'{componente_y}_1:Q'),
+        alt.Color('Octanaje_Predicho:Q', title="RON", scale=alt.Scale(scheme='viridis')),
+        tooltip=[componente_x, componente_y, alt.Tooltip('Octanaje_Predicho:Q', format='.2f'), 'Categoria']
+    )
+    frontera = alt.Chart(datos[datos['Frontera']]).mark_square(size=6, color='white', opacity=0.9).encode(
+        x=f'{componente_x}:Q', y=f'{componente_y}:Q'
+    )
+    punto_base = alt.Chart(pd.DataFrame([base])).mark_point(shape='cross', size=200, color='red', filled=True).encode(
+        x=f'{componente_x}:Q', y=f'{componente_y}:Q'
+    )
+    return calor + frontera + punto_base
+
+def mostrar_sensibilidad(sensibilidad):
+    """Dibuja las curvas o el mapa guardados en st.session_state.sensibilidad."""
+    tabla = sensibilidad['tabla']
+    st.caption(
+        f"⚡ {len(tabla):,} puntos en {sensibilidad['segundos'] * 1000:.0f} ms | 🔖 Modelo: {sensibilidad['version']}"
+    )
+    limites = " y ".join(f"{l['valor']:.0f}" for l in LIMITES_FISCALES)
+    if sensibilidad['tipo'] == TIPOS_SENSIBILIDAD[0]:
+        st.altair_chart(grafico_curvas(tabla), width='stretch')
+        st.caption(f"Líneas discontinuas: límites fiscales de {limites} RON. Banda: intervalo de predicción.")
+        cambios = cambios_categoria(tabla)
+        if len(cambios):
+            st.markdown("#### 🔀 Cambios de categoría")
+            st.dataframe(cambios, width='stretch', hide_index=True)
+        else:
+            st.info("Ningún componente cambia la categoría fiscal dentro de los rangos barridos")
+    else:
+        componente_x, componente_y = sensibilidad['ejes']
+        st.altair_chart(grafico_mapa(tabla, componente_x, componente_y, sensibilidad['base']),
+                        width='stretch')
+        st.caption(f"Puntos blancos: frontera entre categorías (límites de {limites} RON). Cruz roja: composición base.")
+        st.bar_chart(tabla['Categoria'].value_counts())
+
+    def csv():
+        # Se genera al pulsar el botón: un mapa de 90.000 puntos tarda ~1 s en pasar a CSV
+        with etapa('exportacion'):
+            return tabla.to_csv(index=False).encode('utf-8')
+
+    st.download_button(
+        label="📥 Descargar puntos en CSV",
+        data=csv,
+        file_name=f'sensibilidad_octanaje_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        mime='text/csv',
+        width='stretch',
+        on_click="ignore"
+    )
+
+@st.fragment
+def panel_sensibilidad():
+    """
+    Curvas y mapas de respuesta alrededor de la última muestra calculada.
+
+    Las opciones están en un formulario y el panel es un fragmento: sólo se
+    calcula al pulsar CALCULAR, y calcular no vuelve a ejecutar el resto de
+    la página.
+    """
+    st.markdown("## 🔬 Sensibilidad")
+    resultado = st.session_state.resultado
+    base = {c: resultado['datos'][c] for c in COMPONENTES} if resultado is not None else dict(EJEMPLO)
+    st.markdown(
+        "Cómo cambian el RON y la categoría fiscal al variar uno o dos componentes (el Ox se recalcula). "
+        + ("Base: la última muestra calculada en la pestaña Predicción." if resultado is not None
+           else "Base: la mezcla de ejemplo (calcula una muestra para usarla como base).")
+    )
+
+    with st.form("formulario_sensibilidad", border=False):
+        tipo = st.radio("Tipo de análisis", TIPOS_SENSIBILIDAD, horizontal=True)
+        col1, col2 = st.columns(2)
         with col1:
-            st.metric("Categoría", clasificacion['categoria'])
-        
+            componentes_curvas = st.multiselect("Componentes de las curvas", COMPONENTES,
+                                                default=['PARAFINAS', 'MTBE'])
         with col2:
-            st.metric("Código NC", clasificacion['codigo_nc'])
-        
-        with col3:
-            st.metric("Epígrafe Fiscal", clasificacion['epigrafe'])
-        
-        st.info(f"📝 **Descripción:** {clasificacion['descripcion']}")
-        
-        # Mostrar advertencia si está en límite crítico
-        if clasificacion['advertencia']:
-            st.warning(clasificacion['advertencia'])
-        
-        # Información adicional
-        st.markdown("### 💡 Información Adicional")
-        
+            componente_x = st.selectbox("Eje X del mapa", COMPONENTES, index=COMPONENTES.index('PARAFINAS'))
+            componente_y = st.selectbox("Eje Y del mapa", COMPONENTES, index=COMPONENTES.index('NAFTENICOS'))
+        puntos = st.select_slider("Resolución del mapa (puntos por eje)", [51, 101, 151, 201, 301], value=151)
+        compensar = st.checkbox("Compensar: lo que se añade de un componente desplaza al resto (la suma no cambia)")
+        calcular = st.form_submit_button("🔬 CALCULAR", type="primary", width='stretch')
+
+    if calcular:
+        version = modelos.actual
+        inicio = time.perf_counter()
+        try:
+            with st.spinner("🔮 Calculando..."), perfilar('sensibilidad'):
+                if tipo == TIPOS_SENSIBILIDAD[0]:
+                    if not componentes_curvas:
+                        raise ValueError("Elige al menos un componente")
+                    tabla = barrido(base, componentes_curvas, compensar=compensar,
+                                    modelo=version.modelo, variables=version.variables)
+                else:
+                    tabla = mapa(base, componente_x, componente_y, puntos=puntos, compensar=compensar,
+                                 modelo=version.modelo, variables=version.variables)
+        except ValueError as e:
+            st.error(f"❌ {str(e)}")
+        else:
+            st.session_state.sensibilidad = {
+                'tipo': tipo,
+                'tabla': tabla,
+                'ejes': (componente_x, componente_y),
+                'base': base,
+                'segundos': time.perf_counter() - inicio,
+                'version': version.version
+            }
+
+    sensibilidad = st.session_state.get('sensibilidad')
+    if sensibilidad is not None:
+        with etapa('presentacion'):
+            mostrar_sensibilidad(sensibilidad)
+
+with tab_sensibilidad:
+    panel_sensibilidad()
+
+# ═══════════════════════════════════════════════════════════════════════════
+# TAB MEZCLAS: OPTIMIZACIÓN DE MEZCLAS
+# ═══════════════════════════════════════════════════════════════════════════
+
+def cargar_mezcla(composicion):
+    """Lleva la composición de la mezcla óptima al formulario de predicción (callback)."""
+    for componente in COMPONENTES:
+        st.session_state[componente.lower()] = round(composicion[componente], 2)
+    st.session_state.resultado = None
+
+def mostrar_mezcla(guardada):
+    """Dibuja la mezcla guardada en st.session_state.mezcla."""
+    mezcla = guardada['mezcla']
+    if mezcla is None:
+        st.warning(f"⚠️ {guardada['motivo']}")
+        return
+
+    clasificacion = mezcla['clasificacion']
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Coste", f"{mezcla['coste_unitario']:.2f} €/m³")
+    with col2:
+        st.metric("Coste total", f"{mezcla['coste']:,.0f} €")
+    with col3:
+        st.metric("RON predicho", f"{mezcla['octanaje']:.2f}")
+    with col4:
+        st.metric("Categoría", clasificacion['categoria'])
+    st.caption(
+        f"Intervalo de predicción ({nivel_intervalo}): [{mezcla['intervalo'][0]:.2f}, "
+        f"{mezcla['intervalo'][1]:.2f}] RON | ⚡ {mezcla['celdas']:,} celdas, {mezcla['programas']} programas "
+        f"lineales en {mezcla['segundos']:.2f} s | 🔖 Modelo: {guardada['version']}"
+    )
+    if clasificacion['advertencia']:
+        st.warning(clasificacion['advertencia'])
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("#### 🛢️ Volúmenes")
+        volumenes = pd.DataFrame({
+            'Corriente': list(mezcla['volumenes']),
+            'Volumen (m³)': list(mezcla['volumenes'].values()),
+            'Fracción (%)': [100 * f for f in mezcla['fracciones'].values()]
+        })
+        st.dataframe(volumenes[volumenes['Volumen (m³)'] > 0.05].round(2), width='stretch', hide_index=True)
+    with col2:
+        st.markdown("#### 🧪 Composición de la mezcla")
+        st.dataframe(pd.DataFrame({'Variable': list(mezcla['composicion']),
+                                   '%v/v': list(mezcla['composicion'].values())}).round(2),
+                     width='stretch', hide_index=True)
+    st.button("📝 Llevar la mezcla al formulario de Predicción", width='stretch',
+              on_click=cargar_mezcla, args=(mezcla['composicion'],))
+
+@st.fragment
+def panel_mezclas():
+    """
+    Mezcla más barata de las corrientes editadas que alcanza una categoría.
+
+    Como la sensibilidad, es un fragmento con formulario: sólo se optimiza
+    al pulsar OPTIMIZAR.
+    """
+    st.markdown("## ⚗️ Optimización de Mezclas")
+    st.markdown(
+        "La mezcla más barata de las corrientes disponibles cuyo intervalo de predicción cae entero en la "
+        "categoría elegida (sin zona crítica) y dentro del dominio del modelo. Edita la tabla: composición "
+        "(%v/v), coste (€/m³) y volúmenes mínimo y máximo disponibles (m³)."
+    )
+
+    with st.form("formulario_mezclas", border=False):
+        tabla = st.data_editor(tabla_corrientes(CORRIENTES_EJEMPLO), num_rows="dynamic", hide_index=True,
+                               width='stretch', key="corrientes")
         col1, col2, col3 = st.columns(3)
-        
         with col1:
-            st.metric("Componentes Principales", f"{parafinas + isoparafinas + aromaticos:.1f}%")
-        
+            categoria = st.selectbox("Categoría objetivo", [c['categoria'] for c in CATEGORIAS], index=1)
         with col2:
-            st.metric("Oxigenados Totales", f"{ox:.2f}%")
-        
+            volumen = st.number_input("Volumen total (m³)", min_value=1.0, value=1000.0, step=100.0)
         with col3:
-            st.metric("Suma Total", f"{suma_total:.1f}%")
-        
-        # Timestamp
-        st.caption(f"🕐 Predicción realizada: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # Opción de descargar datos
-        st.markdown("### 💾 Exportar Resultado")
-        
-        datos_exportar = {
-            'Fecha_Hora': [datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
-            'PARAFINAS': [parafinas],
-            'ISOPARAFINAS': [isoparafinas],
-            'OLEFINAS': [olefinas],
-            'NAFTENICOS': [naftenicos],
-            'AROMATICOS': [aromaticos],
-            'ETANOL': [etanol],
-            'MTBE': [mtbe],
-            'ETBE': [etbe],
-            'Ox': [ox],
-            'Octanaje_Predicho': [round(octanaje_predicho, 1)],
-            'Octanaje_Redondeado': [octanaje_redondeado],
-            'Categoria': [clasificacion['categoria']],
-            'Codigo_NC': [clasificacion['codigo_nc']],
-            'Epigrafe': [clasificacion['epigrafe']]
-        }
-        
-        df_exportar = pd.DataFrame(datos_exportar)
-        
-        csv = df_exportar.to_csv(index=False).encode('utf-8')
-        
-        st.download_button(
-            label="📥 Descargar resultado en CSV",
-            data=csv,
-            file_name=f'prediccion_octanaje_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-            mime='text/csv',
-            use_container_width=True
+            margen = st.number_input("Margen del intervalo a los límites (RON)", min_value=0.0, max_value=2.0,
+                                     value=MARGEN_POR_DEFECTO, step=0.1)
+        optimizar = st.form_submit_button("⚗️ OPTIMIZAR MEZCLA", type="primary", width='stretch')
+
+    if optimizar:
+        version = modelos.actual
+        mezcla, motivo = None, None
+        try:
+            with st.spinner("🔮 Buscando la mezcla más barata..."), perfilar('mezcla'):
+                mezcla = optimizar_mezcla(corrientes_tabla(tabla), categoria, volumen, margen,
+                                          modelo=version.modelo, variables=version.variables)
+        except MezclaImposible as e:
+            motivo = str(e)
+        except ValueError as e:
+            st.error(f"❌ {str(e)}")
+        if mezcla is not None or motivo is not None:
+            st.session_state.mezcla = {
+                'mezcla': mezcla,
+                'motivo': motivo,
+                'categoria': categoria,
+                'margen': margen,
+                'version': version.version
+            }
+
+    guardada = st.session_state.get('mezcla')
+    if guardada is not None:
+        with etapa('presentacion'):
+            mostrar_mezcla(guardada)
+
+with tab_mezclas:
+    panel_mezclas()
+
+# ═══════════════════════════════════════════════════════════════════════════
+# TAB LOTES: PREDICCIÓN POR LOTES
+# ═══════════════════════════════════════════════════════════════════════════
+
+def mostrar_resultado_lote(resultado_lote):
+    """Dibuja el resumen, la tabla y la descarga del último lote calculado."""
+    df_resultado = resultado_lote['datos']
+    duracion = resultado_lote['duracion']
+
+    st.markdown("### 📋 Resumen del Lote")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Muestras", f"{len(df_resultado):,}")
+    with col2:
+        st.metric("Tiempo de cálculo", f"{duracion:.2f} s")
+    with col3:
+        st.metric("Velocidad", f"{len(df_resultado) / max(duracion, 1e-9):,.0f} filas/s")
+
+    st.bar_chart(df_resultado['Categoria'].value_counts())
+
+    fuera_dominio = int(df_resultado['Fuera_Dominio'].sum())
+    if fuera_dominio:
+        st.error(
+            f"🔬 {fuera_dominio:,} muestras están fuera del dominio del modelo (columna Fuera_Dominio): "
+            "quedan SIN CLASIFICAR y requieren ensayo de laboratorio"
         )
 
+    en_limite = int(df_resultado['Limite_Critico'].notna().sum())
+    if en_limite:
+        zona = ("dentro de su intervalo de predicción" if intervalo_calibrado(modelos.actual.modelo)
+                else f"a {TOLERANCIA} RON o menos")
+        st.warning(f"⚠️ {en_limite:,} muestras tienen un límite fiscal {zona}")
+
+    # Redondeado sólo al mostrarlo: la tabla descargada lleva el valor con el que se clasificó
+    st.dataframe(df_resultado.head(1000), width='stretch',
+                 column_config={'Octanaje_Predicho': st.column_config.NumberColumn(format='%.1f')})
+
+    nombre_base = os.path.splitext(resultado_lote['nombre'])[0]
+    with etapa('exportacion'):
+        csv = df_resultado.to_csv(index=False).encode('utf-8')
+    st.download_button(
+        label="📥 Descargar resultados en CSV",
+        data=csv,
+        file_name=f'{nombre_base}_octanaje_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        mime='text/csv',
+        width='stretch',
+        on_click="ignore"
+    )
+
+@st.fragment
+def panel_lotes():
+    """
+    Subida, cálculo y resultados de un lote.
+
+    Es un fragmento: subir un archivo o calcular el lote no vuelve a ejecutar
+    la pestaña de predicción individual ni el resto de la página.
+    """
+    st.markdown("## 📂 Predicción por Lotes")
+    st.markdown(
+        "Sube un archivo **CSV** o **Parquet** con una fila por análisis y las columnas "
+        f"`{', '.join(COMPONENTES)}`. El Ox se calcula automáticamente para cada fila."
+    )
+
+    archivo_lote = st.file_uploader(
+        "Archivo de resultados cromatográficos",
+        type=['csv', 'parquet'],
+        key="archivo_lote"
+    )
+
+    if archivo_lote is not None:
+        try:
+            df_lote = leer_archivo_lote(archivo_lote)
+        except Exception as e:
+            st.error(f"❌ No se pudo leer el archivo: {str(e)}")
+            df_lote = None
+
+        if df_lote is not None:
+            st.caption(f"📄 {len(df_lote):,} muestras leídas")
+            explicar_lote = st.checkbox(
+                "🔍 Añadir la contribución de cada variable (columnas Contribucion_*)",
+                help="Valores SHAP exactos de cada fila; unas 30.000 filas/s además de la predicción",
+                key="explicar_lote"
+            )
+            vecinos_lote = 0
+            if indice_por_defecto() is not None:
+                vecinos_lote = VECINOS if st.checkbox(
+                    f"🧪 Añadir las {VECINOS} muestras de laboratorio más parecidas (columnas *_Ref_*)",
+                    value=True, help="Referencia, distancia y RON medido de las muestras de composición más cercana",
+                    key="referencias_lote"
+                ) else 0
+
+            if st.button("🎯 CALCULAR LOTE", type="primary", width='stretch'):
+                barra = st.progress(0.0, text="🔮 Calculando octanaje...")
+                try:
+                    inicio = time.perf_counter()
+                    version = modelos.actual
+                    with perfilar('lote'):
+                        df_resultado = puntuar_lote(
+                            df_lote, version.modelo, version.variables,
+                            progreso=lambda f: barra.progress(f, text=f"🔮 Calculando octanaje... {f:.0%}"),
+                            explicaciones=explicar_lote, sombra=modelo_sombra(), referencia=archivo_lote.name,
+                            vecinos=vecinos_lote
+                        )
+                    duracion = time.perf_counter() - inicio
+                except ValueError as e:
+                    barra.empty()
+                    st.error(f"❌ {str(e)}")
+                else:
+                    barra.empty()
+                    if historial() is not None:
+                        historial().registrar_lote(df_resultado, referencia=archivo_lote.name)
+                    st.session_state.resultado_lote = {
+                        'datos': df_resultado,
+                        'duracion': duracion,
+                        'nombre': archivo_lote.name
+                    }
+
+    resultado_lote = st.session_state.get('resultado_lote')
+    if resultado_lote is not None:
+        with etapa('presentacion'):
+            mostrar_resultado_lote(resultado_lote)
+
+with tab_lotes:
+    panel_lotes()
+
+# ═══════════════════════════════════════════════════════════════════════════
+# TAB HISTORIAL: PREDICCIONES GUARDADAS
+# ═══════════════════════════════════════════════════════════════════════════
+
+FILTROS_ZONA = {
+    "Todas": {},
+    "En zona crítica": {'critico': True},
+    **{f"Cerca del límite {limite['valor']:.0f}": {'limite': limite['valor']} for limite in LIMITES_FISCALES}
+}
+
+def pagina_anterior():
+    if len(st.session_state.historial_cursores) > 1:
+        st.session_state.historial_cursores.pop()
+
+def pagina_siguiente(cursor):
+    st.session_state.historial_cursores.append(cursor)
+
+@st.fragment
+def panel_historial():
+    """
+    Historial de predicciones con filtros, página a página.
+
+    Cada página es una consulta por clave sobre el índice del filtro: sólo las
+    filas de la página se leen y se guardan en memoria.
+    """
+    st.markdown("## 📜 Historial de Predicciones")
+
+    almacen = historial()
+    if almacen is None:
+        st.info("El historial de predicciones no está disponible en este despliegue.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        desde = st.date_input("Desde", value=None, key="historial_desde")
+    with col2:
+        hasta = st.date_input("Hasta", value=None, key="historial_hasta")
+    with col3:
+        categoria = st.selectbox("Categoría", ["Todas"] + [cat['categoria'] for cat in CATEGORIAS + [SIN_CLASIFICAR]],
+                                 key="historial_categoria")
+    with col4:
+        zona = st.selectbox("Zona crítica", list(FILTROS_ZONA), key="historial_zona")
+
+    filtros = {'desde': desde, 'hasta': hasta, **FILTROS_ZONA[zona]}
+    if categoria != "Todas":
+        filtros['categoria'] = categoria
+
+    # Un cambio de filtros vuelve a la primera página
+    if st.session_state.get('historial_filtros') != filtros:
+        st.session_state.historial_filtros = filtros
+        st.session_state.historial_cursores = [None]
+    cursores = st.session_state.historial_cursores
+
+    filas, siguiente = almacen.pagina(TAMANO_PAGINA, cursores[-1], **filtros)
+    st.caption(f"🗂️ {almacen.contar(**filtros):,} predicciones | Página {len(cursores)}")
+    if almacen.perdidas:
+        st.caption(f"⚠️ {almacen.perdidas:,} predicciones no se han podido guardar. Último error: {almacen.ultimo_error}")
+    st.dataframe(pd.DataFrame(filas, columns=['id', *COLUMNAS_HISTORIAL]), width='stretch', hide_index=True,
+                 column_config={'octanaje': st.column_config.NumberColumn(format='%.1f')})
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("⬅️ Más recientes", width='stretch', disabled=len(cursores) == 1,
+                  on_click=pagina_anterior)
+    with col2:
+        st.button("Más antiguas ➡️", width='stretch', disabled=siguiente is None,
+                  on_click=pagina_siguiente, args=(siguiente,))
+
+    with st.expander("🧾 Informe fiscal"):
+        periodo = f"{desde or 'inicio'} a {hasta or 'hoy'}"
+        st.caption(f"Todas las predicciones de {periodo} (filtros de fecha de arriba): resumen por categoría, "
+                   f"código NC y epígrafe, muestras en las bandas críticas (límite ± {TOLERANCIA} RON) y "
+                   "filas de todas las muestras. Para meses muy grandes: `python -m octanaje.informes --mes AAAA-MM`.")
+        if st.button("🧾 Generar informe", width='stretch'):
+            # Un directorio temporal por informe; el anterior se borra
+            anterior = st.session_state.pop('informe_fiscal', None)
+            if anterior is not None:
+                shutil.rmtree(anterior['directorio'], ignore_errors=True)
+            directorio = tempfile.mkdtemp(prefix='informe_octanaje_')
+            almacen.vaciar()
+            with st.spinner("🧾 Generando el informe..."):
+                informe = generar_informe(trozos_historial(almacen, desde=desde, hasta=hasta),
+                                          os.path.join(directorio, 'informe_fiscal'), periodo, "historial de predicciones")
+            st.session_state.informe_fiscal = {**informe, 'directorio': directorio, 'periodo': periodo}
+
+        informe = st.session_state.get('informe_fiscal')
+        if informe is not None:
+            st.success(f"✅ {informe['periodo']}: {informe['muestras']:,} muestras, "
+                       f"{informe['zona_critica']:,} en zona crítica, {informe['grupos']} grupos "
+                       f"({informe['segundos']:.1f} s)")
+            nombre_base = f"informe_fiscal_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            col1, col2 = st.columns(2)
+            with col1:
+                with open(informe['xlsx'], 'rb') as f:
+                    st.download_button("📥 Descargar hoja de cálculo (XLSX)", data=f, file_name=f"{nombre_base}.xlsx",
+                                       mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                                       width='stretch', on_click="ignore")
+            with col2:
+                with open(informe['zip'], 'rb') as f:
+                    st.download_button("📥 Descargar CSV (ZIP)", data=f, file_name=f"{nombre_base}.zip",
+                                       mime='application/zip', width='stretch', on_click="ignore")
+
+with tab_historial:
+    panel_historial()
+
 # ═══════════════════════════════════════════════════════════════════════════
 # TAB 2: INFORMACIÓN DEL MODELO
 # ═══════════════════════════════════════════════════════════════════════════
 
+@st.cache_data(ttl=300, show_spinner="🔍 Calculando la importancia sobre el historial...")
+def importancia_variables(version, escrito):
+    """
+    Importancia global (octanaje.explicaciones.importancia_historial) sobre
+    las predicciones más recientes del historial, o None si no hay historial.
+
+    `version` y `escrito` (este proceso ya ha guardado alguna predicción) sólo
+    forman parte de la clave de la caché: se recalcula al cambiar el modelo,
+    tras la primera predicción guardada (un historial vacío no se queda en
+    caché 5 minutos) y, si no, cada 5 minutos.
+    """
+    if historial() is None:
+        return None
+    return importancia_historial(historial(), modelos.actual.modelo, modelos.actual.variables)
+
 with tab2:
     st.markdown("## 📊 Información del Modelo")
     
@@ -642,20 +1141,23 @@ with tab2:
     
     with col1:
         st.markdown("### 🎯 Especificaciones Técnicas")
-        st.markdown("""
+        subsample = hiperparametros.get('subsample')
+        st.markdown(f"""
         - **Algoritmo:** Gradient Boosting Regressor
-        - **Número de árboles:** 200 secuenciales
-        - **Profundidad máxima:** 4 niveles
-        - **Learning rate:** 0.05
-        - **Subsample:** 0.8 (80% de datos)
-        - **Variables de entrada:** 9 (8 medidas + Ox calculado)
+        - **Número de árboles:** {hiperparametros['n_estimators']} secuenciales
+        - **Profundidad máxima:** {hiperparametros['max_depth']} niveles
+        - **Learning rate:** {texto_metrica(hiperparametros.get('learning_rate'), '{:g}')}
+        - **Subsample:** {texto_metrica(subsample, '{:g}')}{f' ({subsample:.0%} de datos)' if subsample else ''}
+        - **Variables de entrada:** {len(ficha['variables'])} (8 medidas + Ox calculado)
+        - **Versión:** {ficha['version'] or '—'} ({ficha['fecha_creacion'] or 'sin fecha'})
         """)
         
         st.markdown("### 📈 Datos de Entrenamiento")
-        st.markdown("""
-        - **Muestras de entrenamiento:** 90
-        - **Muestras de validación:** 77 (independientes)
-        - **Rango de octanaje:** 92.9 - 99.0 RON
+        rango = ficha['rango_octanaje']
+        st.markdown(f"""
+        - **Muestras de entrenamiento:** {texto_metrica(ficha['muestras_entrenamiento'], '{}')}
+        - **Muestras de validación:** {validacion['muestras']} ({validacion['origen']})
+        - **Rango de octanaje:** {f'{rango[0]:.1f} - {rango[1]:.1f} RON' if rango else '—'}
         """)
     
     with col2:
@@ -664,32 +1166,80 @@ with tab2:
         metricas_col1, metricas_col2 = st.columns(2)
         
         with metricas_col1:
-            st.metric("R² Entrenamiento", "99.96%")
-            st.metric("R² Validación", "83.65%")
+            st.metric("R² Entrenamiento", texto_metrica(ficha['metricas'].get('r2_train'), '{:.2%}'))
+            st.metric("R² Validación", texto_metrica(validacion.get('r2'), '{:.2%}'))
         
         with metricas_col2:
-            st.metric("MAE", "0.3774")
-            st.metric("RMSE", "0.5260")
+            st.metric("MAE", texto_metrica(validacion['mae']))
+            st.metric("RMSE", texto_metrica(validacion['rmse']))
         
-        st.success("✅ **Exactitud clasificación:** 100% (criterio industrial ±0.5)")
+        if validacion.get('exactitud') is not None:
+            st.success(f"✅ **Exactitud clasificación:** {validacion['exactitud']:.0%} "
+                       f"(criterio industrial ±{TOLERANCIA})")
+        st.caption(f"Métricas de validación: {validacion['origen']}, {validacion['muestras']} muestras.")
     
     st.markdown("---")
     
     st.markdown("### 🔝 Importancia de Variables")
     
-    st.markdown("""
-    Las variables están ordenadas por su contribución a la predicción del octanaje.
-    Las 3 primeras explican el **89.2%** del comportamiento total.
+    try:
+        importancia = importancia_variables(modelos.actual.version, historial() is not None and historial().escritas > 0)
+    except ValueError:
+        importancia = None  # Modelo sin muestras por nodo: no se puede explicar
+    if importancia is None or not importancia['muestras']:
+        st.info("La importancia se calcula con las predicciones guardadas en el historial, y todavía no hay ninguna.")
+    else:
+        principales = list(importancia['importancia'].values())[:3]
+        st.markdown(f"""
+    Media del valor absoluto de la contribución de cada variable (valores SHAP exactos) sobre las
+    **{importancia['muestras']:,}** predicciones más recientes del historial.
+    Las 3 primeras explican el **{sum(principales):.1f}%** del total.
     """)
-    
-    # Gráfico de importancia
-    importancia_data = pd.DataFrame({
-        'Variable': ['PARAFINAS', 'Ox (Oxigenados)', 'NAFTÉNICOS', 'OLEFINAS', 
-                     'AROMÁTICOS', 'ISOPARAFINAS', 'ETANOL', 'MTBE', 'ETBE'],
-        'Importancia (%)': [40.3, 32.1, 16.8, 4.0, 3.1, 1.6, 1.2, 0.7, 0.2]
-    })
-    
-    st.bar_chart(importancia_data.set_index('Variable')['Importancia (%)'])
+        
+        # Gráfico de importancia
+        st.bar_chart(pd.Series(importancia['importancia'], name='Importancia (%)').rename_axis('Variable'))
+        st.caption(f"Calculada en {importancia['segundos']:.2f} s; se actualiza cada 5 minutos.")
+
+    with st.expander("📉 Deriva de los datos", expanded=bool(monitor_deriva is not None and monitor_deriva.alertas)):
+        estado_deriva = monitor_deriva.estado() if monitor_deriva is not None else None
+        evaluacion = estado_deriva and (estado_deriva['ultima'] or estado_deriva['actual'])
+        if estado_deriva is None:
+            st.info("El modelo vigente no tiene referencia de entrenamiento para vigilar la deriva.")
+        elif evaluacion is None:
+            st.info(f"Se compara cada ventana de {estado_deriva['ventana']} muestras puntuadas con las de "
+                    f"entrenamiento; de momento hay {estado_deriva['muestras']:,}.")
+        else:
+            st.dataframe(pd.DataFrame([{
+                'Variable': v['variable'],
+                'PSI': round(v['psi'], 3),
+                'KS': round(v['ks'], 3),
+                'KS crítico': round(v['ks_critico'], 3),
+                'Media': round(v['media'], 2),
+                'Media entrenamiento': round(v['media_referencia'], 2),
+                'Alerta': '⚠️' if v['alerta'] else ''
+            } for v in evaluacion['variables']]), hide_index=True, width='stretch')
+            st.caption(
+                (f"Última ventana cerrada ({estado_deriva['ultima']['fecha_hora']}), " if estado_deriva['ultima']
+                 else "Ventana en curso, ")
+                + f"{evaluacion['muestras']:,} muestras de {estado_deriva['muestras']:,} puntuadas. "
+                f"Referencia: {estado_deriva['origen']}. Alerta si PSI > {UMBRAL_PSI} o KS supera su valor crítico."
+            )
+
+    with st.expander("⚡ Caché de predicciones"):
+        estadisticas_cache = octanaje.CACHE.estadisticas()
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Entradas", f"{estadisticas_cache['entradas']:,} / {estadisticas_cache['capacidad']:,}")
+        with col2:
+            st.metric("Aciertos", f"{estadisticas_cache['aciertos']:,}")
+        with col3:
+            st.metric("Fallos", f"{estadisticas_cache['fallos']:,}")
+        with col4:
+            st.metric("Desalojos", f"{estadisticas_cache['desalojos']:,}")
+        st.caption(
+            f"Tasa de aciertos: {estadisticas_cache['tasa_aciertos']:.1%} | "
+            f"Invalidaciones por cambio de modelo: {estadisticas_cache['invalidaciones']}"
+        )
 
 # ═══════════════════════════════════════════════════════════════════════════
 # TAB 3: GUÍA DE USO
@@ -708,24 +1258,84 @@ with tab3:
     
     💡 **Tip:** Puedes usar el botón "Cargar Datos de Ejemplo" en el panel lateral para ver un ejemplo.
     """)
+
+    st.markdown("### 🔬 Sensibilidad")
+
+    st.markdown("""
+    Para ver qué pasaría al cambiar la mezcla, usa la pestaña "Sensibilidad" después de calcular una muestra:
+
+    - **Curvas:** el RON (con su intervalo) al variar cada componente elegido por separado, con los
+      límites de 95 y 98 marcados y la lista de los valores en los que cambia la categoría
+    - **Mapa 2-D:** el RON al variar dos componentes a la vez (por ejemplo PARAFINAS frente a NAFTÉNICOS),
+      con la frontera entre categorías y la muestra base marcadas
+
+    Con "Compensar", lo que se añade de un componente se descuenta del resto en proporción.
+    """)
+
+    st.markdown("### ⚗️ Mezclas")
+
+    st.markdown(f"""
+    Para decidir cuánto mezclar de cada corriente, usa la pestaña "Mezclas":
+
+    - Edita las corrientes disponibles: composición, coste por m³ y volúmenes mínimo y máximo
+    - Elige la categoría objetivo, el volumen total y, si quieres, un margen extra entre el intervalo
+      de predicción y los límites fiscales (por defecto {MARGEN_POR_DEFECTO:g} RON)
+    - El resultado es la mezcla más barata cuyo intervalo de predicción cae entero en la categoría, así que
+      no queda en zona crítica, y dentro del dominio del modelo; con "Llevar la mezcla al formulario"
+      puedes comprobarla en "Predicción"
+    """)
+
+    st.markdown("### 📂 Predicción por Lotes")
+
+    st.markdown("""
+    Para puntuar muchas muestras a la vez, usa la pestaña "Predicción por Lotes":
+
+    1. **Prepara un CSV o Parquet** con una fila por muestra y las columnas
+       PARAFINAS, ISOPARAFINAS, OLEFINAS, NAFTENICOS, AROMATICOS, ETANOL, MTBE y ETBE
+    2. **Sube el archivo** y haz clic en "CALCULAR LOTE"
+    3. **Descarga el CSV** con octanaje, categoría, Código NC y Epígrafe de cada fila
+       (y, si lo marcas, la contribución de cada variable)
+
+    El lote se predice en bloques de 10.000 filas (del orden de cientos de miles de filas por segundo).
+    """)
+
+    st.markdown("### 📜 Historial")
+
+    st.markdown("""
+    Todas las predicciones (individuales y por lotes) se guardan en el historial del servidor.
+    En la pestaña "Historial" puedes filtrarlas por fechas, categoría o zona crítica
+    (por ejemplo, las muestras cerca del límite de 95 del último mes) y recorrerlas página a página.
+    """)
     
     st.markdown("### 📋 Interpretación de Resultados")
     
-    st.markdown("""
+    texto_intervalo = (
+        f"Rango que contiene el octanaje real con un {NIVEL_POR_DEFECTO:.0%} de probabilidad (calibración conformal "
+        f"con {validacion['muestras']} muestras de {validacion['origen']})"
+        if intervalo_calibrado(modelos.actual.modelo) else
+        f"Rango orientativo sin calibrar, construido con el RMSE de {validacion['origen']}: no garantiza "
+        f"ninguna cobertura, así que la zona crítica sigue siendo la banda de ±{TOLERANCIA} RON"
+    )
+    filas_categorias = "\n".join(
+        f"    | {cat['rango']} | {cat['categoria']} {cat['emoji']} | {cat['codigo_nc']} | {cat['epigrafe']} |"
+        for cat in CATEGORIAS
+    )
+    st.markdown(f"""
     El modelo proporciona:
     
-    - **Octanaje predicho:** Valor con 1 decimal (ej: 96.2 RON)
-    - **Octanaje redondeado:** Valor entero usado para clasificación (ej: 96 RON)
-    - **Intervalo de confianza:** Rango ±0.5 unidades (tolerancia industrial)
+    - **Octanaje predicho:** Se muestra con 1 decimal (ej: 96.2 RON); la clasificación, la zona crítica y las descargas usan el valor sin redondear
+    - **Octanaje redondeado:** Valor entero orientativo (ej: 96 RON); no se usa para clasificar
+    - **Intervalo de predicción:** {texto_intervalo}; se ensancha para composiciones poco representadas o fuera de los rangos de entrenamiento
     - **Clasificación fiscal:** Categoría, Código NC y Epígrafe automáticos
+    - **Fuera del dominio del modelo:** Si una variable se sale del rango de entrenamiento o la combinación de componentes es atípica, la predicción es una extrapolación: se muestra el motivo y la muestra queda {SIN_CLASIFICAR['categoria']} {SIN_CLASIFICAR['emoji']}, pendiente de ensayo de laboratorio
+    - **¿Por qué este octanaje?:** Cuántos RON suma o resta cada variable respecto al valor base del modelo (valores SHAP exactos); la suma de todas da la predicción
+    - **Muestras de laboratorio más parecidas:** Si hay índice de referencias, las {VECINOS} muestras con RON medido de composición más cercana, con su distancia en %v/v
     
-    Las 3 categorías fiscales son:
+    Las {len(CATEGORIAS)} categorías fiscales son:
     
     | Octanaje | Categoría | Código NC | Epígrafe |
     |----------|-----------|-----------|----------|
-    | < 95 | GASOLINA <95 OCTANOS ⚡ | 2710.12.41 | 1.2.2 |
-    | 95-98 | GASOLINA 95 OCTANOS 🚗 | 2710.12.45 | 1.2.2 |
-    | > 98 | GASOLINA 98 OCTANOS 🏎️ | 2710.12.49 | 1.2.1 |
+{filas_categorias}
     """)
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -733,10 +1343,10 @@ with tab3:
 # ═══════════════════════════════════════════════════════════════════════════
 
 st.markdown("---")
-st.markdown("""
+st.markdown(f"""
 <div style='text-align: center; color: #666; padding: 20px;'>
     <p><strong>🤖 Sistema de Predicción de Octanaje con Machine Learning</strong></p>
-    <p>Modelo: Gradient Boosting Regressor | R² = 0.8365 | Precisión: 100% (±0.5)</p>
+    <p>Modelo: Gradient Boosting Regressor | R² = {texto_metrica(validacion.get('r2'))} | RMSE = {texto_metrica(validacion['rmse'])} RON</p>
     <p style='font-size: 0.9rem; margin-top: 10px;'>
         Desarrollado para clasificación fiscal de gasolina según normativa española
     </p>
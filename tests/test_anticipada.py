@@ -0,0 +1,74 @@
+"""Parada anticipada: misma categoría, zona crítica e intervalo que el camino completo."""
+
+import copy
+
+import numpy as np
+import pytest
+
+from octanaje.anticipada import clasificar_anticipado, clasificar_muestra_anticipada
+from octanaje.clasificacion import clasificar_lote
+from octanaje.componentes import COMPONENTES, EJEMPLO
+from octanaje.dominio import dominio_modelo
+from octanaje.intervalos import factores_intervalo, intervalo_calibrado, predecir_intervalos, residuos_normalizados
+from octanaje.modelo import cargar_modelo, muestras_referencia
+from octanaje.prediccion import predecir
+
+
+@pytest.fixture(scope='module')
+def motor():
+    modelo, _, error = cargar_modelo()
+    if modelo is None or not hasattr(modelo, 'firma'):
+        pytest.skip(error or "El modelo no es un MotorGB")
+    return modelo
+
+
+@pytest.fixture(scope='module')
+def calibrado(motor):
+    # El mismo motor con residuos de calibración: la zona crítica es el intervalo
+    rng = np.random.default_rng(0)
+    X = muestras_referencia(motor.variables, n=200)
+    prediccion, factores = factores_intervalo(motor, motor.variables, X)
+    y = prediccion + rng.normal(0, 0.4, len(X)) * factores
+    modelo = copy.copy(motor)
+    modelo.metadatos = {**motor.metadatos,
+                        'calibracion': {'rmse': 0.4, 'residuos': residuos_normalizados(y, prediccion, factores)}}
+    assert intervalo_calibrado(modelo)
+    return modelo
+
+
+@pytest.mark.parametrize('calibracion', ['sin_calibrar', 'calibrado'])
+def test_igual_que_el_camino_completo(motor, calibrado, calibracion):
+    modelo = motor if calibracion == 'sin_calibrar' else calibrado
+    X = muestras_referencia(modelo.variables, n=3000)
+    prediccion, inferior, superior = predecir_intervalos(modelo, modelo.variables, X)
+    fuera = dominio_modelo(modelo, modelo.variables).evaluar(X)[0]
+    completo = clasificar_lote(prediccion, inferior, superior, fuera, intervalo_calibrado(modelo))
+
+    anticipado = clasificar_anticipado(modelo, X)
+    for campo in ('indice_categoria', 'en_zona_critica', 'fuera_dominio'):
+        np.testing.assert_array_equal(anticipado[campo], completo[campo])
+    np.testing.assert_array_equal(anticipado['limite_critico'], completo['limite_critico'])
+    assert (anticipado['arboles_evaluados'] < modelo.n_arboles).mean() > 0.5
+
+    # Las filas completas dan la predicción y el intervalo exactos; las demás, cotas que los contienen
+    completas = anticipado['arboles_evaluados'] == modelo.n_arboles
+    assert completo['en_zona_critica'][~fuera].any() and completas[completo['en_zona_critica']].all()
+    for campo, valores in (('octanaje', prediccion), ('inferior', inferior), ('superior', superior)):
+        np.testing.assert_array_equal(anticipado[campo][completas], valores[completas])
+    detenidas = ~completas & ~fuera
+    assert np.all(anticipado['cota_inferior'][detenidas] <= prediccion[detenidas])
+    assert np.all(prediccion[detenidas] <= anticipado['cota_superior'][detenidas])
+
+
+def test_muestra_igual_que_predecir(motor):
+    # Dentro del dominio lejos del límite, en zona crítica y fuera del dominio
+    datos = [EJEMPLO, {**EJEMPLO, 'PARAFINAS': EJEMPLO['PARAFINAS'] + 2.0}, {c: 50.0 for c in COMPONENTES}]
+    for muestra in datos:
+        anticipada = clasificar_muestra_anticipada(muestra, motor)
+        completa = predecir(muestra, motor, motor.variables, cache=None, vecinos=0)['clasificacion']
+        for campo in ('categoria', 'advertencia', 'limite_critico', 'fuera_dominio'):
+            assert anticipada[campo] == completa[campo]
+        if anticipada['octanaje'] is not None:
+            assert anticipada['intervalo'] == completa['intervalo']
+    assert clasificar_muestra_anticipada(datos[0], motor)['arboles_evaluados'] < motor.n_arboles
+    assert clasificar_muestra_anticipada(datos[1], motor)['limite_critico'] == 95.0
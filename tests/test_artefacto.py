@@ -0,0 +1,87 @@
+"""Integridad del artefacto .octgb: el checksum cubre cabecera y datos."""
+
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from octanaje.artefacto import FIRMA_MAGICA, ErrorArtefacto, abrir_artefacto, guardar_artefacto
+from octanaje.modelo import buscar_modelo, cargar_modelo, muestras_referencia
+
+
+@pytest.fixture(scope='module')
+def motor():
+    modelo, _, error = cargar_modelo()
+    if modelo is None or not hasattr(modelo, 'firma'):
+        pytest.skip(error or "El modelo no es un MotorGB")
+    return modelo
+
+
+@pytest.fixture
+def ruta(motor, tmp_path):
+    ruta = str(tmp_path / 'modelo.octgb')
+    guardar_artefacto(motor, ruta, {'version': 'prueba', 'dominio': {'centro': [1.5, 2.5]}})
+    return ruta
+
+
+def _sustituir(ruta, antes, despues):
+    """Cambia bytes del archivo conservando su longitud."""
+    assert len(antes) == len(despues)
+    with open(ruta, 'rb') as f:
+        contenido = f.read()
+    assert contenido.count(antes) == 1
+    with open(ruta, 'wb') as f:
+        f.write(contenido.replace(antes, despues))
+
+
+def test_ida_y_vuelta(motor, ruta):
+    abierto, metadatos = abrir_artefacto(ruta)
+    assert abierto.firma == motor.firma
+    assert metadatos == {'version': 'prueba', 'dominio': {'centro': [1.5, 2.5]}}
+    X = muestras_referencia(motor.variables, n=100)
+    assert np.array_equal(abierto.predict(X), motor.predict(X))
+
+
+@pytest.mark.parametrize('antes, despues', [
+    (b'"PARAFINAS", "ISOPARAFINAS"', b'"ISOPARAFINAS", "PARAFINAS"'),  # orden de las variables
+    (b'"centro": [1.5, 2.5]', b'"centro": [1.5, 2.6]'),                # metadatos
+    (b'"version": "prueba"', b'"version": "pruebo"'),
+])
+def test_cabecera_alterada(ruta, antes, despues):
+    _sustituir(ruta, antes, despues)
+    with pytest.raises(ErrorArtefacto, match='Checksum'):
+        abrir_artefacto(ruta)
+
+
+def test_valor_inicial_alterado(motor, ruta):
+    texto = repr(motor.valor_inicial).encode('utf-8')
+    _sustituir(ruta, b'"valor_inicial": ' + texto, b'"valor_inicial": ' + texto[:-1] + (b'1' if texto[-1:] != b'1' else b'2'))
+    with pytest.raises(ErrorArtefacto, match='Checksum'):
+        abrir_artefacto(ruta)
+
+
+def test_datos_alterados(ruta):
+    with open(ruta, 'r+b') as f:
+        f.seek(-8, os.SEEK_END)
+        f.write(b'\xff' * 8)
+    with pytest.raises(ErrorArtefacto, match='Checksum'):
+        abrir_artefacto(ruta)
+
+
+def test_version_anterior(ruta):
+    with open(ruta, 'r+b') as f:
+        f.seek(len(FIRMA_MAGICA))
+        f.write(struct.pack('<I', 2))
+    with pytest.raises(ErrorArtefacto, match='Versión'):
+        abrir_artefacto(ruta)
+
+
+def test_artefacto_del_repositorio():
+    ruta = buscar_modelo()
+    if ruta is None:
+        pytest.skip("No hay modelo")
+    artefacto = os.path.splitext(ruta)[0] + '.octgb'
+    if not os.path.exists(artefacto):
+        pytest.skip("No hay artefacto .octgb")
+    abrir_artefacto(artefacto)
@@ -0,0 +1,56 @@
+"""clasificar_lote da lo mismo que clasificar_gasolina, también en los bordes fiscales."""
+
+import numpy as np
+import pytest
+
+from octanaje.clasificacion import CATEGORIAS, clasificar_gasolina, clasificar_lote
+
+BORDES = [94.5, 95.0, 95.5, 97.5, 98.0, 98.5]
+
+
+def _con_vecinos(valores):
+    valores = np.asarray(valores, dtype=np.float64)
+    return np.concatenate([np.nextafter(valores, -np.inf), valores, np.nextafter(valores, np.inf), [np.nan]])
+
+
+def _cadena_original(octanaje):
+    """El if/elif que clasificar_gasolina sustituyó: 95.0 y 98.0 exactos son 95; NaN cae en el else."""
+    if octanaje < 95.0:
+        categoria = 'GASOLINA <95 OCTANOS'
+    elif octanaje <= 98.0:
+        categoria = 'GASOLINA 95 OCTANOS'
+    else:
+        categoria = 'GASOLINA 98 OCTANOS'
+    if 94.5 <= octanaje <= 95.5:
+        return categoria, 95.0
+    if 97.5 <= octanaje <= 98.5:
+        return categoria, 98.0
+    return categoria, None
+
+
+def test_lote_igual_que_muestra_en_los_bordes():
+    octanajes = _con_vecinos(BORDES)
+    lote = clasificar_lote(octanajes)
+    for i, octanaje in enumerate(octanajes.tolist()):
+        muestra = clasificar_gasolina(octanaje)
+        assert (muestra['categoria'], muestra['limite_critico']) == _cadena_original(octanaje), octanaje
+        assert lote['categoria'][i] == muestra['categoria'], octanaje
+        assert CATEGORIAS[lote['indice_categoria'][i]]['categoria'] == muestra['categoria'], octanaje
+        assert lote['en_zona_critica'][i] == (muestra['limite_critico'] is not None), octanaje
+        limite = lote['limite_critico'][i]
+        assert (None if np.isnan(limite) else limite) == muestra['limite_critico'], octanaje
+
+
+@pytest.mark.parametrize('calibrado', [True, False])
+def test_lote_igual_que_muestra_con_intervalos(calibrado):
+    # Intervalos con un extremo en cada borde, en sus vecinos y en los límites exactos
+    octanajes = _con_vecinos(BORDES + [96.0, 99.0])
+    extremos = _con_vecinos([95.0, 98.0])
+    rng = np.random.default_rng(0)
+    inferior = np.minimum(octanajes, rng.choice(extremos[:-1], len(octanajes)))
+    superior = np.maximum(octanajes, rng.choice(extremos[:-1], len(octanajes)))
+    lote = clasificar_lote(octanajes, inferior, superior, calibrado=calibrado)
+    for i, (octanaje, a, b) in enumerate(zip(octanajes.tolist(), inferior.tolist(), superior.tolist())):
+        muestra = clasificar_gasolina(octanaje, (a, b), calibrado=calibrado)
+        assert lote['categoria'][i] == muestra['categoria'], (octanaje, a, b)
+        assert lote['en_zona_critica'][i] == (muestra['limite_critico'] is not None), (octanaje, a, b)
@@ -0,0 +1,66 @@
+"""Referencia de deriva reconstruida del ensemble: el octanaje es el predicho."""
+
+import numpy as np
+import pytest
+
+from octanaje.deriva import (OCTANAJE, ORIGEN_ARBOLES, VENTANA, MonitorDeriva, construir_referencia,
+                             muestras_referencia, referencia_desde_arboles)
+from octanaje.modelo import cargar_modelo
+
+
+@pytest.fixture(scope='module')
+def motor():
+    modelo, _, error = cargar_modelo()
+    if modelo is None or not hasattr(modelo, 'firma'):
+        pytest.skip(error or "El modelo no es un MotorGB")
+    return modelo
+
+
+@pytest.fixture(scope='module')
+def referencia(motor):
+    return referencia_desde_arboles(motor)
+
+
+def _ventanas(referencia, motor, ventanas=10, desplazar=None):
+    rng = np.random.default_rng(1)
+    Z = muestras_referencia(referencia, ventanas * VENTANA, rng)
+    if desplazar:
+        Z[:, referencia.variables.index(desplazar[0])] += desplazar[1]
+    Z[:, -1] = motor.predict(Z[:, :-1])
+    monitor = MonitorDeriva(referencia)
+    evaluaciones = []
+    for k in range(ventanas):
+        bloque = Z[k * VENTANA:(k + 1) * VENTANA]
+        monitor.observar(bloque[:, :-1], bloque[:, -1])
+        evaluaciones.append(monitor.ultima)
+    return evaluaciones
+
+
+def test_octanaje_de_predicciones(motor, referencia):
+    # Las predicciones encogen: la referencia no puede tener la dispersión del octanaje medido
+    assert referencia.variables[-1] == OCTANAJE
+    assert referencia.origen == ORIGEN_ARBOLES
+    assert np.sqrt(referencia.varianza[-1]) < 1.1
+
+
+def test_sin_alertas_con_la_propia_referencia(motor, referencia):
+    for evaluacion in _ventanas(referencia, motor):
+        octanaje = evaluacion['variables'][-1]
+        assert octanaje['psi'] < 0.25
+        assert not any(v['alerta'] for v in evaluacion['variables'])
+
+
+def test_deriva_de_una_variable(motor, referencia):
+    evaluacion = _ventanas(referencia, motor, ventanas=1, desplazar=('AROMATICOS', 3.0))[0]
+    assert [v['variable'] for v in evaluacion['variables'] if v['alerta']] == ['AROMATICOS']
+
+
+def test_octanaje_alerta_con_referencia_de_entrenamiento(motor, referencia):
+    # Con composiciones reales de entrenamiento el octanaje sí alerta
+    rng = np.random.default_rng(2)
+    X = muestras_referencia(referencia, 2000, rng)[:, :-1]
+    propia = construir_referencia(X, motor.predict(X), motor.variables)
+    monitor = MonitorDeriva(propia)
+    Y = muestras_referencia(referencia, VENTANA, rng)[:, :-1]
+    monitor.observar(Y, motor.predict(Y) + 2.0)
+    assert OCTANAJE in [v['variable'] for v in monitor.alertas]
@@ -0,0 +1,77 @@
+"""TreeSHAP vectorizado: valores de Shapley exactos y aditivos."""
+
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+from octanaje.componentes import EJEMPLO
+from octanaje.explicaciones import contribuciones, explicar_muestra
+from octanaje.modelo import cargar_modelo
+from octanaje.prediccion import predecir
+
+VARIABLES = ['A', 'B', 'C', 'D']
+
+
+@pytest.fixture(scope='module')
+def pequeno():
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    # Profundidad 4 con 4 variables: caminos con variables repetidas
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 1, (300, len(VARIABLES))).astype(np.float32).astype(np.float64)
+    y = 3 * X[:, 0] - 2 * X[:, 1] * X[:, 2] + np.sin(6 * X[:, 3]) + rng.normal(0, 0.1, len(X))
+    modelo = GradientBoostingRegressor(n_estimators=15, max_depth=4, learning_rate=0.2, random_state=0)
+    return modelo.fit(X, y), X[:25]
+
+
+def _esperanza(arbol, x, conocidas, nodo=0):
+    """E[f(x) | x_S] con las muestras de entrenamiento de cada nodo como distribución (path-dependent)."""
+    izquierdo, derecho = arbol.children_left[nodo], arbol.children_right[nodo]
+    if izquierdo == -1:
+        return arbol.value[nodo, 0, 0]
+    variable = arbol.feature[nodo]
+    if variable in conocidas:
+        return _esperanza(arbol, x, conocidas, izquierdo if x[variable] <= arbol.threshold[nodo] else derecho)
+    total = arbol.n_node_samples[nodo]
+    return (arbol.n_node_samples[izquierdo] * _esperanza(arbol, x, conocidas, izquierdo)
+            + arbol.n_node_samples[derecho] * _esperanza(arbol, x, conocidas, derecho)) / total
+
+
+def _shapley(modelo, x):
+    """Valores de Shapley por enumeración de todas las coaliciones."""
+    m = len(x)
+
+    def valor(conocidas):
+        return sum(modelo.learning_rate * _esperanza(estimador.tree_, x, set(conocidas))
+                   for estimador in modelo.estimators_[:, 0])
+
+    shapley = np.zeros(m)
+    for i in range(m):
+        resto = [j for j in range(m) if j != i]
+        for tamano in range(m):
+            peso = math.factorial(tamano) * math.factorial(m - tamano - 1) / math.factorial(m)
+            for coalicion in itertools.combinations(resto, tamano):
+                shapley[i] += peso * (valor(coalicion + (i,)) - valor(coalicion))
+    return shapley
+
+
+def test_igual_que_shapley_por_fuerza_bruta(pequeno):
+    modelo, X = pequeno
+    valor_base, aportes = contribuciones(modelo, VARIABLES, X)
+    for fila, aporte in zip(X, aportes):
+        np.testing.assert_allclose(aporte, _shapley(modelo, fila.astype(np.float32)), rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(valor_base + aportes.sum(axis=1), modelo.predict(X), rtol=0, atol=1e-9)
+
+
+def test_suma_igual_a_predecir():
+    modelo, variables, error = cargar_modelo()
+    if modelo is None:
+        pytest.skip(error)
+    for muestra in (EJEMPLO, {**EJEMPLO, 'AROMATICOS': 45.0, 'MTBE': 6.0}):
+        explicacion = explicar_muestra(muestra, modelo, variables)
+        prediccion = predecir(muestra, modelo, variables, cache=None, vecinos=0)['octanaje']
+        total = explicacion['valor_base'] + sum(explicacion['contribuciones'].values())
+        assert total == pytest.approx(prediccion, abs=1e-9)
+        assert explicacion['octanaje'] == pytest.approx(prediccion, abs=1e-9)
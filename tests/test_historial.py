@@ -0,0 +1,116 @@
+"""Historial de predicciones: el octanaje con el que se clasificó y el instante de registro."""
+
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from octanaje.componentes import COMPONENTES, EJEMPLO
+from octanaje.historial import HistorialPredicciones
+from octanaje.informes import BANDAS, AgregadoFiscal, columnas_informe, trozos_historial
+from octanaje.lotes import predecir_lote, preparar_lote, puntuar_lote
+from octanaje.modelo import cargar_modelo
+
+
+@pytest.fixture(scope='module')
+def lote():
+    modelo, variables, error = cargar_modelo()
+    if modelo is None:
+        pytest.skip(error)
+    # Barrido fino de parafinas que cruza 95.0 y el borde de banda 95.5
+    df = pd.DataFrame([EJEMPLO] * 2000)
+    df['PARAFINAS'] = EJEMPLO['PARAFINAS'] + np.linspace(-6, 6, len(df))
+    return puntuar_lote(df, modelo, variables), predecir_lote(modelo, preparar_lote(df, variables))
+
+
+def _en_bandas(octanaje):
+    return [int(((octanaje >= inferior) & (octanaje <= superior)).sum()) for _, inferior, superior in BANDAS]
+
+
+def test_lote_sin_redondear(lote):
+    resultado, predicciones = lote
+    np.testing.assert_array_equal(resultado['Octanaje_Predicho'].to_numpy(), predicciones)
+    # Con una décima, algunas filas cambiarían de banda respecto a su categoría
+    assert _en_bandas(np.round(predicciones, 1)) != _en_bandas(predicciones)
+
+
+def test_informe_del_historial_con_el_mismo_valor(lote, tmp_path):
+    resultado, predicciones = lote
+    historial = HistorialPredicciones(str(tmp_path / 'historial.sqlite'))
+    try:
+        historial.registrar_lote(resultado, referencia='barrido.csv', modelo='prueba')
+        historial.vaciar()
+        assert historial.perdidas == 0
+        trozos = list(trozos_historial(historial, tamano=700))
+    finally:
+        historial.cerrar()
+
+    guardado = pd.concat(trozos, ignore_index=True)
+    np.testing.assert_array_equal(guardado['octanaje'].to_numpy(), predicciones)
+    assert (guardado['categoria'] == resultado['Categoria']).all()
+    agregado = AgregadoFiscal()
+    for trozo in trozos:
+        agregado.sumar(trozo, columnas_informe(trozo.columns))
+    assert agregado.bandas == _en_bandas(predicciones)
+
+
+def test_filtro_de_fechas_por_instante(tmp_path):
+    from octanaje.prediccion import predecir
+
+    resultado = predecir(EJEMPLO, cache=None, vecinos=0)
+    # Cambio de hora de otoño: la muestra de las 02:30 (+02:00) llega después que la de las 02:10 (+01:00)
+    clasificadas = ['2026-10-25T02:10:00.000+01:00', '2026-10-25T02:30:00.000+02:00', '2026-10-25T03:00:00.000+01:00']
+    historial = HistorialPredicciones(str(tmp_path / 'historial.sqlite'))
+    try:
+        historial.escribir([{**resultado, 'archivo': 'cambio_hora.csv', 'muestra': i, 'clasificado': clasificado}
+                            for i, clasificado in enumerate(clasificadas)])
+        historial.vaciar()
+        assert historial.perdidas == 0
+
+        def muestras(**filtros):
+            return sorted(int(f['referencia'].split('#')[1]) for f in historial.recorrer(**filtros))
+
+        assert muestras(desde=datetime.fromisoformat('2026-10-25T02:00+02:00'),
+                        hasta=datetime.fromisoformat('2026-10-25T01:15+00:00')) == [0, 1]
+        assert muestras(desde='2026-10-25T01:20+00:00') == [2]
+        assert muestras(hasta='2026-10-25T00:45+00:00') == [1]
+        assert historial.contar(desde='2026-10-25T01:05+00:00', hasta='2026-10-25T01:15+00:00') == 1
+    finally:
+        historial.cerrar()
+
+
+def test_historial_anterior_recibe_el_instante(tmp_path):
+    from octanaje.historial import _ESQUEMA
+
+    ruta = str(tmp_path / 'anterior.sqlite')
+    anterior = (_ESQUEMA.replace('    registrado REAL NOT NULL,\n', '')
+                .replace('CREATE INDEX IF NOT EXISTS predicciones_registrado ON predicciones (registrado);', ''))
+    conexion = sqlite3.connect(ruta)
+    conexion.executescript(anterior)
+    with conexion:
+        conexion.execute(
+            "INSERT INTO predicciones (fecha_hora, origen, "
+            + ', '.join(c.lower() for c in COMPONENTES)
+            + ", ox, octanaje, octanaje_redondeado, categoria, codigo_nc, epigrafe, critico) VALUES "
+            + f"('2026-09-15 10:30:00.000', 'formulario', {', '.join('1.0' for _ in COMPONENTES)},"
+            + " 2.0, 96.0, 96, 'GASOLINA 95 OCTANOS', '2710 12 45', '1.2.1', 0)"
+        )
+    conexion.close()
+
+    for _ in range(2):  # La segunda apertura ya no migra
+        historial = HistorialPredicciones(ruta)
+        try:
+            assert historial.contar(desde='2026-09-15', hasta='2026-09-15') == 1
+            assert historial.contar(desde='2026-09-16') == 0
+        finally:
+            historial.cerrar()
+    conexion = sqlite3.connect(ruta)
+    try:
+        registrado, = conexion.execute('SELECT registrado FROM predicciones').fetchone()
+        assert registrado == pytest.approx(datetime(2026, 9, 15, 10, 30).timestamp(), abs=1e-3)
+        with pytest.raises(sqlite3.IntegrityError, match='sólo inserción'):
+            conexion.execute('UPDATE predicciones SET octanaje = 0')
+    finally:
+        conexion.close()
@@ -0,0 +1,67 @@
+"""Escala de los intervalos: conformal con residuos, heurística sin ellos."""
+
+import numpy as np
+import pytest
+
+from octanaje.clasificacion import clasificar_lote
+from octanaje.intervalos import (CALIBRACION_POR_DEFECTO, escala_intervalo, factores_intervalo, intervalo_calibrado,
+                                 predecir_intervalos, residuos_normalizados)
+from octanaje.modelo import cargar_modelo, muestras_referencia
+
+
+@pytest.fixture(scope='module')
+def motor():
+    modelo, _, error = cargar_modelo()
+    if modelo is None or not hasattr(modelo, 'firma'):
+        pytest.skip(error or "El modelo no es un MotorGB")
+    return modelo
+
+
+def test_rango_conformal():
+    residuos = residuos_normalizados(np.zeros(19), -np.arange(1.0, 20.0), np.ones(19))
+    assert residuos == sorted(residuos)
+    # ceil(20 * 0.9) = 18: el residuo 18.º de 19
+    assert escala_intervalo({'residuos': residuos, 'rmse': 1.0}, 0.90) == (18.0, True)
+
+
+def test_pocos_residuos_no_calibran():
+    # Con 8 residuos, ceil(9 * 0.9) = 9 > 8: no hay rango conformal al 90 %
+    escala, calibrado = escala_intervalo({'residuos': [0.1] * 8, 'rmse': 0.5}, 0.90)
+    assert not calibrado
+    assert escala == pytest.approx(1.6449 * 0.5, rel=1e-4)
+
+
+def test_modelo_entregado_sin_calibrar(motor):
+    assert 'residuos' not in CALIBRACION_POR_DEFECTO
+    assert not intervalo_calibrado(motor)
+
+
+def test_sin_calibrar_la_zona_critica_es_la_banda(motor):
+    # El intervalo heurístico se muestra, pero no decide la advertencia
+    X = muestras_referencia(motor.variables, n=2000)
+    prediccion, inferior, superior = predecir_intervalos(motor, motor.variables, X)
+    con_intervalo = clasificar_lote(prediccion, inferior, superior, calibrado=intervalo_calibrado(motor))
+    np.testing.assert_array_equal(con_intervalo['en_zona_critica'], clasificar_lote(prediccion)['en_zona_critica'])
+    assert con_intervalo['en_zona_critica'].mean() < clasificar_lote(prediccion, inferior, superior)['en_zona_critica'].mean()
+
+
+def test_semiamplitud_es_escala_por_factor(motor):
+    X = muestras_referencia(motor.variables, n=200)
+    prediccion, inferior, superior = predecir_intervalos(motor, motor.variables, X)
+    prediccion_factor, factores = factores_intervalo(motor, motor.variables, X)
+    escala, _ = escala_intervalo(CALIBRACION_POR_DEFECTO)
+    np.testing.assert_array_equal(prediccion, prediccion_factor)
+    np.testing.assert_allclose((superior - inferior) / 2, escala * factores)
+
+
+def test_cobertura_conformal(motor):
+    # Residuos intercambiables: calibrar con 200 y comprobar con el resto
+    rng = np.random.default_rng(0)
+    X = muestras_referencia(motor.variables, n=2000)
+    prediccion, factores = factores_intervalo(motor, motor.variables, X)
+    y = prediccion + rng.normal(0, 0.4, len(X)) * factores
+    residuos = residuos_normalizados(y[:200], prediccion[:200], factores[:200])
+    escala, calibrado = escala_intervalo({'residuos': residuos, 'rmse': 0.4})
+    assert calibrado
+    cubiertas = np.abs(y[200:] - prediccion[200:]) <= escala * factores[200:]
+    assert 0.85 <= cubiertas.mean() <= 0.95
@@ -0,0 +1,44 @@
+"""Mezcla óptima: su intervalo de predicción cae entero en la categoría pedida."""
+
+import pytest
+
+from octanaje.clasificacion import limite_en_intervalo
+from octanaje.mezclas import CORRIENTES_EJEMPLO, MezclaImposible, banda_objetivo, indice_objetivo, optimizar_mezcla
+from octanaje.modelo import cargar_modelo
+
+
+@pytest.fixture(scope='module')
+def modelo():
+    modelo, variables, error = cargar_modelo()
+    if modelo is None:
+        pytest.skip(error)
+    return modelo, variables
+
+
+@pytest.mark.parametrize('categoria', ['<95', '95'])
+def test_mezcla_sin_zona_critica(modelo, categoria):
+    mezcla = optimizar_mezcla(CORRIENTES_EJEMPLO, categoria, modelo=modelo[0], variables=modelo[1],
+                              maximo_programas=150)
+    inferior, superior = mezcla['intervalo']
+    assert limite_en_intervalo(inferior, superior) is None
+    assert mezcla['clasificacion']['limite_critico'] is None
+    assert mezcla['clasificacion']['categoria'].endswith(categoria + ' OCTANOS')
+
+
+def test_margen_sobre_el_intervalo(modelo):
+    mezcla = optimizar_mezcla(CORRIENTES_EJEMPLO, '95', margen=0.3, modelo=modelo[0], variables=modelo[1],
+                              maximo_programas=150)
+    assert mezcla is not None
+    minimo, maximo = banda_objetivo(indice_objetivo('95'), 0.3)
+    assert minimo < mezcla['intervalo'][0] and mezcla['intervalo'][1] < maximo
+
+
+def test_98_imposible_con_el_modelo_entregado(modelo):
+    # Sin calibrar, la semiamplitud (~1.2) no cabe por encima de 98 dentro del dominio
+    with pytest.raises(MezclaImposible, match="Ninguna mezcla de estas corrientes alcanza GASOLINA 98 OCTANOS") as error:
+        optimizar_mezcla(CORRIENTES_EJEMPLO, '98', modelo=modelo[0], variables=modelo[1], maximo_programas=150)
+    imposible = error.value
+    assert imposible.categoria == 'GASOLINA 98 OCTANOS'
+    assert imposible.octanaje > 98.0 and imposible.intervalo[0] < 98.0 < imposible.intervalo[1]
+    assert imposible.falta == pytest.approx(98.0 - imposible.intervalo[0])
+    assert f"predice {imposible.octanaje:.2f} RON" in str(imposible)
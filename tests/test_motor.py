@@ -0,0 +1,124 @@
+"""
+Paridad del motor nativo con el modelo sklearn y del artefacto .octgb con el pickle.
+
+    python -m pytest -q tests
+"""
+
+import os
+import pickle
+import warnings
+
+import numpy as np
+import pytest
+
+from octanaje.artefacto import abrir_artefacto
+from octanaje.modelo import artefacto_vigente, muestras_referencia
+from octanaje.motor import MotorGB
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_PICKLE = os.path.join(RAIZ, 'modelo_final_gb.pkl')
+
+
+@pytest.fixture(scope='module')
+def modelo_pickle():
+    pytest.importorskip('sklearn')
+    if not os.path.exists(RUTA_PICKLE):
+        pytest.skip("No está el modelo_final_gb.pkl")
+    with open(RUTA_PICKLE, 'rb') as f:
+        modelo_info = pickle.load(f)
+    return modelo_info['modelo'], modelo_info['variables']
+
+
+@pytest.fixture(scope='module')
+def motor(modelo_pickle):
+    return MotorGB.desde_sklearn(*modelo_pickle)
+
+
+@pytest.fixture(scope='module')
+def artefacto(modelo_pickle):
+    ruta = artefacto_vigente(RUTA_PICKLE)
+    if ruta is None:
+        pytest.skip("El .octgb no corresponde al pickle actual")
+    return abrir_artefacto(ruta)[0]
+
+
+def _predecir_sklearn(modelo, X):
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='X does not have valid feature names')
+        return modelo.predict(X)
+
+
+def muestras_borde(motor):
+    """Filas sobre los umbrales, en el float32 anterior y siguiente, y en los extremos."""
+    rng = np.random.default_rng(1)
+    base = muestras_referencia(motor.variables, n=50)
+    filas = []
+    for j, umbrales in enumerate(motor.umbrales):
+        for umbral in umbrales[rng.choice(len(umbrales), min(len(umbrales), 20), replace=False)]:
+            umbral32 = np.float32(umbral)
+            for valor in (umbral, umbral32, np.nextafter(umbral32, np.float32(-np.inf)),
+                          np.nextafter(umbral32, np.float32(np.inf))):
+                fila = base[rng.integers(len(base))].copy()
+                fila[j] = valor
+                filas.append(fila)
+    filas.append(np.zeros(len(motor.variables)))
+    filas.append(np.full(len(motor.variables), 100.0))
+    filas.append(np.full(len(motor.variables), -1e30))
+    filas.append(np.full(len(motor.variables), 1e30))
+    return np.vstack([base, filas])
+
+
+def muestras_no_finitas(motor):
+    """Filas con NaN e ±inf (sklearn las rechaza; el motor las manda a la derecha, como sklearn)."""
+    filas = np.repeat(muestras_referencia(motor.variables, n=5), 3, axis=0)
+    for i, valor in enumerate((np.nan, np.inf, -np.inf)):
+        filas[i::3, i % filas.shape[1]] = valor
+    filas[0] = np.nan
+    return filas
+
+
+def test_motor_igual_a_sklearn(modelo_pickle, motor):
+    X = np.vstack([muestras_referencia(motor.variables, n=2000, semilla=3), muestras_borde(motor)])
+    assert np.array_equal(motor.predict(X), _predecir_sklearn(modelo_pickle[0], X))
+
+
+def test_motor_igual_a_sklearn_en_bloques(modelo_pickle, motor):
+    X = muestras_referencia(motor.variables, n=700, semilla=4)[:1001]
+    esperado = _predecir_sklearn(modelo_pickle[0], X)
+    for n in (1, 2, 127, 128, 129, 1001):
+        assert np.array_equal(motor.predict(X[:n]), esperado[:n])
+
+
+def test_hojas_por_celdas_igual_al_recorrido(motor):
+    X = np.vstack([muestras_borde(motor), muestras_no_finitas(motor)]).astype(np.float32)
+    assert motor.tablas_celdas is not None
+    assert np.array_equal(motor.hojas(X), motor.recorrer(X))
+    assert np.array_equal(motor.hojas(X, 50, 120), motor.recorrer(X, 50, 120))
+
+
+def test_no_finitos_como_recorrido(motor):
+    X = muestras_no_finitas(motor)
+    hojas = motor.recorrer(X.astype(np.float32))
+    esperado = np.cumsum(np.column_stack([np.full(len(X), motor.valor_inicial), motor.valor.take(hojas)]), axis=1)[:, -1]
+    assert np.array_equal(motor.predict(X), esperado)
+
+
+def test_soporte_no_cambia_la_prediccion(motor):
+    X = np.vstack([muestras_borde(motor), muestras_no_finitas(motor)])
+    predicciones, soporte = motor.predecir_con_soporte(X)
+    assert np.array_equal(predicciones, motor.predict(X))
+    assert np.all(np.isfinite(soporte) & (soporte > 0))
+
+
+def test_por_celdas_igual_a_predict(motor):
+    X = muestras_borde(motor)
+    assert np.array_equal(motor.predecir_por_celdas(X), motor.predict(X))
+
+
+def test_artefacto_igual_al_pickle(modelo_pickle, motor, artefacto):
+    assert artefacto.variables == motor.variables
+    assert artefacto.firma == motor.firma
+    X = np.vstack([muestras_referencia(motor.variables, n=2000, semilla=5), muestras_borde(motor)])
+    assert np.array_equal(artefacto.predict(X), _predecir_sklearn(modelo_pickle[0], X))
+    X = muestras_no_finitas(motor)
+    assert np.array_equal(artefacto.predict(X), motor.predict(X))
@@ -0,0 +1,80 @@
+"""Árbol k-d de referencias: k vecinos exactos frente a la búsqueda por fuerza bruta."""
+
+import numpy as np
+import pytest
+
+from octanaje.entrenamiento import VARIABLES
+from octanaje.referencias import abrir_indice, construir_indice, guardar_indice
+
+
+@pytest.fixture(scope='module')
+def datos():
+    # Muestras repetidas (empates de distancia) y consultas en los propios puntos y al azar
+    rng = np.random.default_rng(0)
+    distintas = rng.uniform(0, 40, (300, len(VARIABLES))).astype(np.float32)
+    X = np.vstack([distintas, distintas[rng.integers(len(distintas), size=200)]])
+    ron = rng.uniform(90, 100, len(X))
+    consultas = np.vstack([X[:40], rng.uniform(-5, 45, (60, len(VARIABLES)))])
+    return X, ron, consultas
+
+
+def _fuerza_bruta(X, consultas):
+    """Distancias (consultas x muestras) en float64 sobre los mismos puntos float32."""
+    diferencia = consultas[:, None, :].astype(np.float32).astype(np.float64) - X[None, :, :].astype(np.float64)
+    return np.sqrt((diferencia ** 2).sum(axis=2))
+
+
+def _comprobar(indice, X, consultas, k):
+    distancias, posiciones = indice.buscar(consultas, k)
+    esperadas = _fuerza_bruta(X, consultas)
+    k = min(k, len(X))
+    assert distancias.shape == posiciones.shape == (len(consultas), k)
+    filas = indice.fila[posiciones]
+    assert (filas >= 0).all()
+    # Sin repetir muestras, con las distancias devueltas y, salvo empates, las k más cercanas
+    assert all(len(set(f)) == k for f in filas.tolist())
+    reales = np.take_along_axis(esperadas, filas, axis=1)
+    np.testing.assert_allclose(distancias, reales, rtol=1e-5, atol=1e-4)
+    np.testing.assert_allclose(reales, np.sort(esperadas, axis=1)[:, :k], rtol=1e-5, atol=1e-4)
+    assert (np.diff(distancias, axis=1) >= 0).all()
+    return distancias, posiciones
+
+
+@pytest.mark.parametrize('k', [1, 5, 70])
+def test_igual_que_fuerza_bruta(datos, k):
+    X, ron, consultas = datos
+    indice = construir_indice(X, ron, tamano_hoja=16)
+    assert indice.profundidad > 0
+    distancias, _ = _comprobar(indice, X, consultas, k)
+    # Una consulta sobre una muestra la encuentra a distancia 0, y dos veces si está repetida
+    assert (distancias[:40, 0] == 0).all()
+    repetidas = (X[None, :40] == X[:, None]).all(axis=2).sum(axis=0) > 1
+    assert repetidas.any()
+    if k > 1:
+        assert (distancias[:40][repetidas, 1] == 0).all()
+
+
+def test_k_mayor_que_las_muestras(datos):
+    X, ron, consultas = datos
+    pocas = X[:10]
+    indice = construir_indice(pocas, ron[:10], tamano_hoja=4)
+    _, posiciones = _comprobar(indice, pocas, consultas, 25)
+    assert sorted(indice.fila[posiciones[0]].tolist()) == list(range(10))
+
+
+def test_ida_y_vuelta_por_archivo(datos, tmp_path):
+    X, ron, consultas = datos
+    etiquetas = [f"LAB-{i}" for i in range(len(X))]
+    indice = construir_indice(X, ron, etiquetas, tamano_hoja=16)
+    ruta = tmp_path / 'referencias.octref'
+    guardar_indice(indice, str(ruta))
+    abierto = abrir_indice(str(ruta))
+
+    assert len(abierto) == len(indice) and abierto.variables == indice.variables
+    distancias, posiciones = _comprobar(abierto, X, consultas, 5)
+    esperadas, esperadas_posiciones = indice.buscar(consultas, 5)
+    np.testing.assert_array_equal(distancias, esperadas)
+    np.testing.assert_array_equal(posiciones, esperadas_posiciones)
+    vecino = abierto.vecinos(consultas[:1], 1)[0][0]
+    assert vecino['referencia'] == etiquetas[vecino['fila']]
+    assert vecino['ron'] == round(float(ron[vecino['fila']]), 2)
@@ -0,0 +1,81 @@
+"""Respuestas del servicio HTTP a peticiones válidas e inválidas."""
+
+import asyncio
+import json
+
+import pytest
+
+from octanaje.cache import CachePredicciones
+from octanaje.componentes import EJEMPLO
+from octanaje.modelo import cargar_modelo
+from octanaje.servicio import ServicioOctanaje
+
+
+@pytest.fixture(scope='module')
+def modelo():
+    modelo, variables, error = cargar_modelo()
+    if modelo is None:
+        pytest.skip(error)
+    return modelo, variables
+
+
+async def _enviar(puerto, cuerpo, cabeceras):
+    lector, escritor = await asyncio.open_connection('127.0.0.1', puerto)
+    escritor.write(f"POST /predecir HTTP/1.1\r\n{cabeceras}Connection: close\r\n\r\n".encode('latin-1') + cuerpo)
+    await escritor.drain()
+    respuesta = await asyncio.wait_for(lector.read(), 10)
+    escritor.close()
+    cabecera, _, datos = respuesta.partition(b'\r\n\r\n')
+    return int(cabecera.split(b' ')[1]), json.loads(datos)
+
+
+def peticiones(modelo, casos):
+    """Envía (cuerpo, cabeceras) a un servicio recién arrancado; devuelve (código, JSON) de cada una."""
+    async def enviar_todas():
+        servicio = ServicioOctanaje(*modelo, cache=CachePredicciones())
+        puerto = await servicio.iniciar(puerto=0)
+        try:
+            return [await _enviar(puerto, cuerpo, cabeceras) for cuerpo, cabeceras in casos]
+        finally:
+            await servicio.detener()
+
+    return asyncio.run(enviar_todas())
+
+
+def _cuerpo(muestra):
+    return json.dumps(muestra).encode('utf-8')
+
+
+def test_prediccion_y_cache(modelo):
+    cuerpo = _cuerpo(EJEMPLO)
+    (codigo, primera), (_, segunda) = peticiones(modelo, [(cuerpo, f"Content-Length: {len(cuerpo)}\r\n")] * 2)
+    assert codigo == 200
+    assert primera == segunda
+    assert primera['categoria'] and primera['intervalo'][0] <= primera['octanaje'] <= primera['intervalo'][1]
+
+
+@pytest.mark.parametrize('longitud', ['abc', '-5', '1.5'])
+def test_content_length_invalido(modelo, longitud):
+    [(codigo, respuesta)] = peticiones(modelo, [(_cuerpo(EJEMPLO), f"Content-Length: {longitud}\r\n")])
+    assert codigo == 400
+    assert 'Content-Length' in respuesta['error']
+
+
+@pytest.mark.parametrize('valor', ['NaN', 'Infinity', '-Infinity', '"nan"'])
+def test_valores_no_finitos(modelo, valor):
+    cuerpo = _cuerpo(EJEMPLO).replace(b'38.0', valor.encode('utf-8'))
+    [(codigo, respuesta)] = peticiones(modelo, [(cuerpo, f"Content-Length: {len(cuerpo)}\r\n")])
+    assert codigo == 400
+    assert 'AROMATICOS' in respuesta['error']
+
+
+@pytest.mark.parametrize('valor', [float('nan'), float('inf'), float('-inf')])
+def test_no_finitos_sin_cache_en_predecir(modelo, valor):
+    from octanaje.prediccion import predecir
+
+    cache = CachePredicciones()
+    muestra = {**EJEMPLO, 'AROMATICOS': valor}
+    assert cache.clave(muestra) is None
+    resultado = predecir(muestra, *modelo, cache=cache, vecinos=0)
+    assert resultado['clasificacion']['fuera_dominio']
+    assert cache.estadisticas()['entradas'] == 0